@@ -0,0 +1,102 @@
+"""Benchmarks for the linearization of arc moves.
+
+Run from the repository root with ``python benchmarks/bench_arc_expander.py``.
+"""
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.arc_expander import ArcExpander, expand_program  # noqa: E402
+from gpc_hardware.utils.gcode_parser import GcodeParser  # noqa: E402
+
+
+def make_program(n_arcs: int) -> list:
+    """Create a program of quarter arcs with a radius of 2 to 20 mm."""
+    lines = ["G0 X0 Y0"]
+    x = y = 0.0
+    for i in range(n_arcs):
+        radius = 2 + (i * 7) % 19
+        angle = (i % 4) * math.pi / 2
+        cx, cy = x - radius * math.cos(angle), y - radius * math.sin(angle)
+        i_offset, j_offset = cx - x, cy - y
+        x = cx + radius * math.cos(angle + math.pi / 2)
+        y = cy + radius * math.sin(angle + math.pi / 2)
+        lines.append(
+            "G3 X{:.4f} Y{:.4f} I{:.4f} J{:.4f}".format(x, y, i_offset, j_offset)
+        )
+    return lines
+
+
+def linear_lines(program) -> list:
+    """Write an expanded program as G0 lines, like a CAM post without arcs."""
+    lines = []
+    for _, commands in program.to_dicts():
+        for command, values in commands.items():
+            words = " ".join("{}{:.4f}".format(k, v) for k, v in values.items())
+            lines.append("{} {}".format(command, words))
+    return lines
+
+
+def best_time(func, repeat: int = 3) -> float:
+    """Return the best time of a few runs of func."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_arc_expander(n_arcs: int = 20000, tolerance: float = 0.002) -> dict:
+    """Return the file sizes, parse times and expansion rates."""
+    arc_lines = make_program(n_arcs)
+    program = GcodeParser.compile_program(arc_lines)
+    expanded, n_moves = expand_program(program, tolerance)
+    g0_lines = linear_lines(expanded)
+
+    parsed = list(GcodeParser.parse_stream(arc_lines))
+
+    def stream():
+        for _ in ArcExpander(tolerance).expand(parsed):
+            pass
+
+    return {
+        "arcs": n_arcs,
+        "moves": n_moves,
+        "arc bytes": sum(len(line) + 1 for line in arc_lines),
+        "g0 bytes": sum(len(line) + 1 for line in g0_lines),
+        "arc compile": best_time(lambda: GcodeParser.compile_program(arc_lines)),
+        "g0 compile": best_time(lambda: GcodeParser.compile_program(g0_lines)),
+        "batch": best_time(lambda: expand_program(program, tolerance)),
+        "streaming": best_time(stream),
+    }
+
+
+if __name__ == "__main__":
+    result = bench_arc_expander()
+    print(
+        "{:,} arcs -> {:,} moves".format(result["arcs"], result["moves"])
+    )
+    print(
+        "file size:  {:,} bytes with arcs, {:,} bytes with G0".format(
+            result["arc bytes"], result["g0 bytes"]
+        )
+    )
+    print(
+        "compile:    {:.3f} s with arcs, {:.3f} s with G0".format(
+            result["arc compile"], result["g0 compile"]
+        )
+    )
+    print(
+        "batch:      {:.3f} s ({:,.0f} arcs/s)".format(
+            result["batch"], result["arcs"] / result["batch"]
+        )
+    )
+    print(
+        "streaming:  {:.3f} s ({:,.0f} arcs/s)".format(
+            result["streaming"], result["arcs"] / result["streaming"]
+        )
+    )
@@ -0,0 +1,91 @@
+"""Benchmarks for dispatching parsed gcode commands to handlers.
+
+Run from the repository root with ``python benchmarks/bench_gcode_dispatch.py``.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.accepted_gcode import ACCEPTED_COMMANDS  # noqa: E402
+from gpc_hardware.utils.gcode_dispatch import GcodeDispatcher  # noqa: E402
+
+
+def handler(**values):
+    return values
+
+
+def dispatch_if_chain(command: str, values: dict) -> dict:
+    """Dispatch with a chain of if checks, like the glue code it replaces."""
+    if command == "G0":
+        return handler(**values)
+    elif command == "G1":
+        return handler(**values)
+    elif command == "G28":
+        return handler(**values)
+    elif command == "G90":
+        return handler(**values)
+    elif command == "G91":
+        return handler(**values)
+    elif command == "M92":
+        return handler(**values)
+    elif command == "M105":
+        return handler(**values)
+    elif command == "M114":
+        return handler(**values)
+    elif command == "M140":
+        return handler(**values)
+    elif command == "M999":
+        return handler(**values)
+    raise KeyError(command)
+
+
+def make_commands(n_commands: int) -> list:
+    """Create a mix of commands, mostly moves with a few machine commands."""
+    mix = [
+        ("G0", {"X": 1.5, "Y": 2}),
+        ("G1", {"L": 3}),
+        ("M140", {"S": 0.5, "I": 1}),
+        ("M999", {"S": True}),
+    ]
+    return [mix[i % len(mix)] for i in range(n_commands)]
+
+
+def best_time(func, repeat: int = 3) -> float:
+    """Return the fastest run time of func in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(dispatch, commands: list) -> ...:
+    for command, values in commands:
+        dispatch(command, values)
+
+
+def bench_dispatch(n_commands: int = 1000000) -> dict:
+    """Return the commands per second of the if chain and the dispatcher."""
+    commands = make_commands(n_commands)
+    results = {}
+
+    results["if chain"] = n_commands / best_time(
+        lambda: run(dispatch_if_chain, commands)
+    )
+
+    for measure in (False, True):
+        dispatcher = GcodeDispatcher(measure_latency=measure)
+        for command in ACCEPTED_COMMANDS:
+            dispatcher.register(command, handler)
+        dispatch = dispatcher.build().dispatch
+        name = "dispatcher (latency {})".format("on" if measure else "off")
+        results[name] = n_commands / best_time(lambda: run(dispatch, commands))
+    return results
+
+
+if __name__ == "__main__":
+    for name, rate in bench_dispatch().items():
+        print("{:26s} {:>12,.0f} commands/s".format(name, rate))
@@ -0,0 +1,49 @@
+"""Benchmarks for the Marlin forms of gcode lines.
+
+Run from the repository root with ``python benchmarks/bench_gcode_lexer.py``.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.gcode_parser import GcodeParser  # noqa: E402
+
+
+LINE = "G0 X1.5 Y2 Z3.25 H4 J5.5 K6"
+LINES = {
+    "plain": LINE,
+    "spaceless": LINE.replace(" ", ""),
+    "tabs": LINE.replace(" ", "\t"),
+    "comment": LINE + " ; move to the next hole",
+    "inline comment": LINE.replace(" Y2", " (next hole) Y2"),
+    "numbered": GcodeParser.frame_line(LINE, 1234),
+}
+
+
+def bench_lexer(number: int = 20000, repeat: int = 5) -> dict:
+    """Return the best lines/second of parse_gcode_line per line form."""
+    results = {}
+    for name, line in LINES.items():
+        for kind, value in (("str", line), ("bytes", line.encode())):
+            best = min(
+                timeit.repeat(
+                    lambda: GcodeParser.parse_gcode_line(value),
+                    number=number,
+                    repeat=repeat,
+                )
+            )
+            results[name, kind] = number / best
+    return results
+
+
+if __name__ == "__main__":
+    results = bench_lexer()
+    print("form                 str lines/s   bytes lines/s")
+    for name in LINES:
+        print(
+            "{:<16} {:>15,.0f} {:>15,.0f}".format(
+                name, results[name, "str"], results[name, "bytes"]
+            )
+        )
@@ -0,0 +1,70 @@
+"""Benchmarks for the whole program gcode validation.
+
+Run from the repository root with ``python benchmarks/bench_gcode_lint.py``.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.gcode_parser import (  # noqa: E402
+    GcodeParser,
+    GcodeAttributeError,
+    GcodeParsingError,
+)
+
+VALID = ["G0 X1.5 Y2 Z3.25", "M140 S0.6 I-2", "G1 L-5"]
+INVALID = ["G0 X1 X1", "G0 Q1 Y2", "G28 X0.0", "M999 S2", "G0 Xa Yb", "S1 M140"]
+
+
+def make_program(n_lines: int, invalid_ratio: float) -> list:
+    """Create a program where a part of the lines is invalid."""
+    step = max(1, round(1 / invalid_ratio)) if invalid_ratio else None
+    lines = []
+    for i in range(n_lines):
+        if step and i % step == 0:
+            lines.append(INVALID[i % len(INVALID)])
+        else:
+            lines.append(VALID[i % len(VALID)])
+    return lines
+
+
+def parse_catching(lines: list) -> list:
+    """Collect the invalid lines by catching the parser exceptions per line."""
+    errors = []
+    for line_number, line in enumerate(lines, 1):
+        try:
+            GcodeParser.parse_gcode_line(line)
+        except (GcodeAttributeError, GcodeParsingError, ValueError) as e:
+            errors.append((line_number, str(e)))
+    return errors
+
+
+def best_time(func, repeat: int = 3) -> float:
+    """Return the fastest run time of func in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_validate(n_lines: int = 200000) -> list:
+    """Return lines/second of validate and of catching exceptions per line."""
+    results = []
+    for ratio in (0.0, 0.5, 1.0):
+        lines = make_program(n_lines, ratio)
+        catching = n_lines / best_time(lambda: parse_catching(lines))
+        validate = n_lines / best_time(lambda: GcodeParser.validate(lines))
+        results.append((ratio, catching, validate))
+    return results
+
+
+if __name__ == "__main__":
+    for ratio, catching, validate in bench_validate():
+        print(
+            "{:>4.0%} invalid: catching {:>10,.0f} lines/s, "
+            "validate {:>10,.0f} lines/s".format(ratio, catching, validate)
+        )
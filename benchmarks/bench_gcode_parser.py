@@ -0,0 +1,162 @@
+"""Benchmarks for the gcode parser.
+
+Run from the repository root with ``python benchmarks/bench_gcode_parser.py``.
+"""
+import os
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.gcode_parser import GcodeParser  # noqa: E402
+
+
+LINES = {
+    "short": "M105",
+    "attribute": "M140 S0.6 I-2",
+    "linear": "G0 X5 Y0 Z5.7",
+    "multi-axis": "M92 X1.5 Y2 Z3.25 H4 J5.5 K6 L7 N8.125 O9 P10",
+    "multi-command": "G0 X1.5 Y2 Z3.25 H4 J5.5 K6 G1 L7 M811 X1 Y2 Z3 H4 J5 K6 L7 N8 O9 P10",
+}
+
+
+def bench_parse_gcode_line(number: int = 20000, repeat: int = 5) -> dict:
+    """Return the best lines/second of ``parse_gcode_line`` per line type."""
+    results = {}
+    for name, line in LINES.items():
+        best = min(
+            timeit.repeat(
+                lambda: GcodeParser.parse_gcode_line(line), number=number, repeat=repeat
+            )
+        )
+        results[name] = number / best
+    return results
+
+
+def bench_parse_stream(n_lines: int = 200000) -> dict:
+    """Return the time to the first command, lines/second and peak memory."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "program.gcode")
+        with open(path, "w") as f:
+            for i in range(n_lines):
+                f.write(LINES["linear"] + "\n" if i % 2 else LINES["multi-axis"] + "\n")
+
+        start = time.perf_counter()
+        stream = GcodeParser.parse_stream(path)
+        next(stream)
+        first = time.perf_counter() - start
+        count = 1 + sum(1 for _ in stream)
+        total = time.perf_counter() - start
+
+        # Separate pass, tracemalloc slows down the parsing.
+        tracemalloc.start()
+        for _ in GcodeParser.parse_stream(path):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {"first_line_s": first, "lines_per_s": count / total, "peak_bytes": peak}
+
+
+def bench_parse_cache(n_lines: int = 100000, maxsize: int = 256) -> dict:
+    """Return lines/second with and without the parse cache on repeated lines."""
+    program = [list(LINES.values())[i % len(LINES)] for i in range(n_lines)]
+
+    def run():
+        start = time.perf_counter()
+        for line in program:
+            GcodeParser.parse_gcode_line(line)
+        return n_lines / (time.perf_counter() - start)
+
+    uncached = run()
+    cache = GcodeParser.enable_cache(maxsize)
+    try:
+        cached = run()
+    finally:
+        GcodeParser.disable_cache()
+    return {"uncached": uncached, "cached": cached, "info": cache.info()}
+
+
+def bench_parse_buffer(n_lines: int = 1000000) -> dict:
+    """Return lines/second of decode-then-parse and of the bytes path on a buffer."""
+    lines = list(LINES.values())
+    buffer = b"".join(
+        (lines[i % len(lines)] + "\n").encode() for i in range(n_lines)
+    )
+
+    start = time.perf_counter()
+    for raw in buffer.splitlines():
+        GcodeParser.parse_gcode_line(raw.decode("utf-8"))
+    decoded = n_lines / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in GcodeParser.parse_buffer(buffer):
+        pass
+    native = n_lines / (time.perf_counter() - start)
+    return {"decode_then_parse": decoded, "parse_buffer": native}
+
+
+def bench_parse_parallel(n_lines: int = 500000, workers: int = None) -> dict:
+    """Return the seconds to parse and compile a file serially and in parallel."""
+    workers = workers or os.cpu_count()
+    lines = list(LINES.values())
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "program.gcode")
+        with open(path, "w") as f:
+            for i in range(n_lines):
+                f.write(lines[i % len(lines)] + "\n")
+
+        results = {"workers": workers}
+        for name, func in (
+            ("parse", GcodeParser.parse_parallel),
+            ("compile", lambda p, workers: GcodeParser.compile_program(p, workers)),
+        ):
+            start = time.perf_counter()
+            func(path, workers=1)
+            results[name + "_serial_s"] = time.perf_counter() - start
+            start = time.perf_counter()
+            func(path, workers=workers)
+            results[name + "_parallel_s"] = time.perf_counter() - start
+    return results
+
+
+if __name__ == "__main__":
+    for name, rate in bench_parse_gcode_line().items():
+        print("{:<15} {:>12,.0f} lines/s".format(name, rate))
+
+    result = bench_parse_stream()
+    print(
+        "parse_stream    {:>12,.0f} lines/s, first line after {:.1f} us, "
+        "peak memory {:,} bytes".format(
+            result["lines_per_s"], result["first_line_s"] * 1e6, result["peak_bytes"]
+        )
+    )
+
+    result = bench_parse_cache()
+    print(
+        "parse cache     {:>12,.0f} lines/s uncached, {:,.0f} lines/s cached, "
+        "{}".format(result["uncached"], result["cached"], result["info"])
+    )
+
+    result = bench_parse_buffer()
+    print(
+        "1M line buffer  {:>12,.0f} lines/s decode then parse, "
+        "{:,.0f} lines/s parse_buffer".format(
+            result["decode_then_parse"], result["parse_buffer"]
+        )
+    )
+
+    result = bench_parse_parallel()
+    for name in ("parse", "compile"):
+        print(
+            "{:<7} 500k     {:.2f} s serial, {:.2f} s with {} workers ({:.1f}x)".format(
+                name,
+                result[name + "_serial_s"],
+                result[name + "_parallel_s"],
+                result["workers"],
+                result[name + "_serial_s"] / result[name + "_parallel_s"],
+            )
+        )
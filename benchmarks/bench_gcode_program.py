@@ -0,0 +1,66 @@
+"""Benchmarks for compiled gcode programs.
+
+Run from the repository root with ``python benchmarks/bench_gcode_program.py``.
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.gcode_parser import GcodeParser  # noqa: E402
+
+
+def make_program(n_lines: int) -> list:
+    """Create a program of moves with a machine command every 100 lines."""
+    lines = []
+    for i in range(n_lines):
+        if i % 100 == 0:
+            lines.append("M140 S{}.5 I{}".format(i % 50, i % 3))
+        else:
+            lines.append("G0 X{:.3f} Y{:.3f} Z{:.2f}".format(i * 0.01, i * 0.02, i % 7))
+    return lines
+
+
+def bench_compile_program(n_lines: int = 100000) -> dict:
+    """Return the memory of the dict form and the compiled form and timings."""
+    lines = make_program(n_lines)
+
+    tracemalloc.start()
+    parsed = list(GcodeParser.parse_stream(lines))
+    dict_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del parsed
+
+    start = time.perf_counter()
+    program = GcodeParser.compile_program(lines)
+    compile_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    moves = program.select("G0")
+    select_s = time.perf_counter() - start
+
+    return {
+        "dict_bytes": dict_bytes,
+        "program_bytes": program.nbytes,
+        "compile_lines_per_s": n_lines / compile_s,
+        "select_s": select_s,
+        "moves": len(moves),
+    }
+
+
+if __name__ == "__main__":
+    result = bench_compile_program()
+    print(
+        "dict form {:,} bytes, compiled {:,} bytes ({:.1%})".format(
+            result["dict_bytes"],
+            result["program_bytes"],
+            result["program_bytes"] / result["dict_bytes"],
+        )
+    )
+    print(
+        "compile {:,.0f} lines/s, select G0 ({:,} rows) in {:.2f} ms".format(
+            result["compile_lines_per_s"], result["moves"], result["select_s"] * 1e3
+        )
+    )
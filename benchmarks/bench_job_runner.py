@@ -0,0 +1,92 @@
+"""Benchmarks for resuming interrupted jobs.
+
+Run from the repository root with ``python benchmarks/bench_job_runner.py``.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.job_runner import GcodeJobRunner  # noqa: E402
+
+
+def write_program(path: str, n_lines: int) -> ...:
+    """Write a program of relative and absolute moves."""
+    with open(path, "w") as f:
+        f.write("M92 X80 Y80 Z400\n")
+        for i in range(n_lines):
+            if i % 1000 == 0:
+                f.write("G91\n" if i % 2000 == 0 else "G90\n")
+            f.write("G0 X{:.3f} Y{:.3f}\n".format(i % 300 / 7, i % 170 / 3))
+
+
+def best_time(func, repeat: int = 3) -> float:
+    """Return the best time of a few runs of func."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_job_runner(n_lines: int = 1000000, fractions=(0.01, 0.5, 0.99)) -> dict:
+    """Return the resume times at a few places in the job."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "job.gcode")
+        write_program(path, n_lines)
+
+        start = time.perf_counter()
+        runner = GcodeJobRunner(path, checkpoint_lines=1000)
+        lines = runner.run()
+        run_time = time.perf_counter() - start
+
+        resumes = []
+        for fraction in fractions:
+            runner = GcodeJobRunner(path)
+            runner.run(max_lines=int(n_lines * fraction))
+            checkpoint = runner.checkpoint_path
+
+            def resume():
+                # Resume and run the first line after the checkpoint.
+                GcodeJobRunner.resume(checkpoint).run(max_lines=1)
+
+            def replay():
+                # Parse and run the lines before the checkpoint again.
+                GcodeJobRunner(path).run(max_lines=runner.line)
+
+            resumes.append(
+                {
+                    "fraction": fraction,
+                    "line": runner.line,
+                    "resume": best_time(resume),
+                    "replay": best_time(replay, 1),
+                }
+            )
+
+        checkpoint_time = best_time(runner.checkpoint, 20)
+    return {
+        "lines": lines,
+        "run": run_time,
+        "checkpoint": checkpoint_time,
+        "resumes": resumes,
+    }
+
+
+if __name__ == "__main__":
+    result = bench_job_runner()
+    print(
+        "{:,} lines run in {:.2f} s with a checkpoint every 1,000 lines".format(
+            result["lines"], result["run"]
+        )
+    )
+    print("checkpoint write: {:.2f} ms".format(result["checkpoint"] * 1e3))
+    print("   line       resume    replay prefix")
+    for resume in result["resumes"]:
+        print(
+            "{:>9,}   {:>7.2f} ms   {:>8.3f} s".format(
+                resume["line"], resume["resume"] * 1e3, resume["replay"]
+            )
+        )
@@ -0,0 +1,87 @@
+"""Benchmarks for the latency instrumentation of the stream server.
+
+Run from the repository root with ``python benchmarks/bench_latency.py``.
+"""
+import asyncio
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.gcode_dispatch import GcodeDispatcher  # noqa: E402
+from gpc_hardware.utils.latency import PipelineLatency  # noqa: E402
+from gpc_hardware.utils.stream_server import GcodeStreamServer  # noqa: E402
+
+
+def make_dispatcher() -> GcodeDispatcher:
+    """Create a dispatcher with handlers that return at once."""
+    dispatcher = GcodeDispatcher(measure_latency=False)
+    for command in ("G0", "G1"):
+        dispatcher.register(command, lambda **values: None)
+    return dispatcher.build()
+
+
+async def stream(latency, n_lines: int, n_clients: int = 4) -> float:
+    """Return the lines/second streamed to a server by a few clients."""
+    server = GcodeStreamServer(make_dispatcher(), queue_size=64, latency=latency)
+    await server.start_tcp()
+    port = server.sockets[0].getsockname()[1]
+    lines = b"".join(b"G0 X%d Y%d\n" % (i % 300, i % 170) for i in range(n_lines))
+
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(lines)
+        for _ in range(n_lines):
+            await reader.readline()
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(n_clients)))
+    await server.join()
+    elapsed = time.perf_counter() - start
+    await server.close()
+    return n_clients * n_lines / elapsed
+
+
+def bench_server(n_lines: int = 2500, repeat: int = 5) -> dict:
+    """Return the best lines/second without, with disabled and with latency."""
+    disabled = PipelineLatency()
+    disabled.enabled = False
+    results = {}
+    for name, make in (
+        ("none", lambda: None),
+        ("disabled", lambda: disabled),
+        ("enabled", PipelineLatency),
+    ):
+        results[name] = max(asyncio.run(stream(make(), n_lines)) for _ in range(repeat))
+    return results
+
+
+def bench_record(number: int = 200000) -> dict:
+    """Return the time per line of the instrumentation itself."""
+    latency = PipelineLatency()
+    disabled = PipelineLatency()
+    disabled.enabled = False
+
+    def check():
+        # The only work per line when the recorder is disabled.
+        return disabled is not None and disabled.enabled
+
+    def record():
+        latency.record_line(0, 20000, 25000, 90000, 160000)
+        latency.record_command("G0", 60000)
+
+    return {
+        "disabled check": min(timeit.repeat(check, number=number, repeat=5)) / number,
+        "record line": min(timeit.repeat(record, number=number, repeat=5)) / number,
+    }
+
+
+if __name__ == "__main__":
+    for name, seconds in bench_record().items():
+        print("{:<16} {:>8.0f} ns per line".format(name, seconds * 1e9))
+    print("stream server, 4 clients:")
+    for name, rate in bench_server().items():
+        print("  latency {:<10} {:>10,.0f} lines/s".format(name, rate))
@@ -0,0 +1,69 @@
+"""Benchmarks for converting gcode moves to absolute step targets.
+
+Run from the repository root with ``python benchmarks/bench_machine_state.py``.
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.accepted_gcode import ACCEPTED_COMMANDS  # noqa: E402
+from gpc_hardware.utils.gcode_program import (  # noqa: E402
+    ATTRIBUTE_DTYPE,
+    GcodeProgram,
+    command_dtype,
+)
+from gpc_hardware.utils.machine_state import GcodeMachineState  # noqa: E402
+
+
+def make_program(n_moves: int) -> GcodeProgram:
+    """Create a relative program of G0 moves with G90/G91 every 1000 rows."""
+    names = tuple(ACCEPTED_COMMANDS)
+    rng = np.random.default_rng(0)
+    table = np.zeros(n_moves, dtype=command_dtype())
+    table["command"] = names.index("G0")
+    table["line"] = np.arange(1, n_moves + 1)
+    for axis in table.dtype.names[2:]:
+        table[axis] = np.nan
+    table["X"] = rng.uniform(-1, 1, n_moves).round(3)
+    table["Y"] = rng.uniform(-1, 1, n_moves).round(3)
+    table["Z"] = rng.uniform(0, 0.1, n_moves).round(3)
+    table["command"][0] = names.index("M92")
+    table["X"][0] = table["Y"][0] = table["Z"][0] = 80
+    table["command"][1::1000] = names.index("G91")
+    table["command"][501::1000] = names.index("G90")
+    table[["X", "Y", "Z"]][1::500] = (np.nan, np.nan, np.nan)
+    return GcodeProgram(table, np.empty(0, dtype=ATTRIBUTE_DTYPE), names)
+
+
+def bench_machine_state(n_moves: int = 1000000) -> dict:
+    """Return the moves per second of the command loop and run_program."""
+    program = make_program(n_moves)
+    names = program.command_names
+    commands = [
+        (names[row[0]], {axis: row[i + 2] for i, axis in enumerate("XYZ")})
+        for row in program.commands[["command", "line", "X", "Y", "Z"]].tolist()
+    ]
+
+    state = GcodeMachineState()
+    start = time.perf_counter()
+    targets = []
+    for command, values in commands:
+        if command in ("G0", "G1"):
+            state.execute(command, values)
+            targets.append(state.steps)
+        else:
+            state.execute(command, {k: v for k, v in values.items() if v == v})
+    loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    GcodeMachineState().run_program(program)
+    batch = time.perf_counter() - start
+    return {"loop": n_moves / loop, "run_program": n_moves / batch}
+
+
+if __name__ == "__main__":
+    for name, rate in bench_machine_state().items():
+        print("{:12s} {:>14,.0f} moves/s".format(name, rate))
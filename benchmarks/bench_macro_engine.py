@@ -0,0 +1,71 @@
+"""Benchmarks for the expansion of macro calls.
+
+Run from the repository root with ``python benchmarks/bench_macro_engine.py``.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.gcode_parser import GcodeParser  # noqa: E402
+from gpc_hardware.utils.macro_engine import MacroEngine  # noqa: E402
+
+
+def make_macro(n_lines: int) -> list:
+    """Create a macro lowering Z by the S parameter followed by moves."""
+    lines = ["G91", "G0 Z{S}", "G90"]
+    lines += ["G0 X{} Y{}".format(i % 50, i % 30) for i in range(n_lines - 3)]
+    return lines
+
+
+def time_per_call(func, n_calls: int) -> float:
+    """Return the best time per call of a few runs of n_calls calls."""
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            func()
+        times.append((time.perf_counter() - start) / n_calls)
+    return min(times)
+
+
+def bench_macro_engine(sizes: tuple = (3, 10, 100, 1000, 10000)) -> list:
+    """Return the time of a macro call for macros of different lengths."""
+    results = []
+    for n_lines in sizes:
+        lines = make_macro(n_lines)
+        macros = MacroEngine({"M814": lines})
+        call = GcodeParser.parse_gcode_line("M814 S-2")
+        n_calls = max(10, 100000 // n_lines)
+
+        def reparse():
+            text = [line.replace("{S}", "-2") for line in lines]
+            return [GcodeParser.parse_gcode_line(line) for line in text]
+
+        def run():
+            for _ in macros.expand_line(call):
+                pass
+
+        results.append(
+            {
+                "lines": n_lines,
+                "expand": time_per_call(lambda: macros.expand_line(call), 100000),
+                "run": time_per_call(run, n_calls),
+                "reparse": time_per_call(reparse, n_calls),
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    print("   lines   expand call   iterate lines   parse text per call")
+    for result in bench_macro_engine():
+        print(
+            "{:>8,}   {:>8.2f} us   {:>10.1f} us   {:>14.1f} us".format(
+                result["lines"],
+                result["expand"] * 1e6,
+                result["run"] * 1e6,
+                result["reparse"] * 1e6,
+            )
+        )
@@ -0,0 +1,80 @@
+"""Benchmarks for the look-ahead motion planner.
+
+Run from the repository root with ``python benchmarks/bench_motion_planner.py``.
+"""
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.gcode_parser import GcodeParser  # noqa: E402
+from gpc_hardware.utils.machine_state import GcodeMachineState  # noqa: E402
+from gpc_hardware.utils.motion_planner import MotionPlanner  # noqa: E402
+
+
+def make_program(n_moves: int) -> list:
+    """Create a program of circles approximated by short moves and zigzags."""
+    lines = ["M92 X80 Y80 Z400"]
+    i = 0
+    while len(lines) <= n_moves:
+        if i % 2 == 0:  # A circle of 72 moves
+            for k in range(73):
+                angle = 2 * math.pi * k / 72
+                lines.append(
+                    "G0 X{:.3f} Y{:.3f}".format(
+                        20 + 10 * math.cos(angle), 20 + 10 * math.sin(angle)
+                    )
+                )
+        else:  # A zigzag of 40 moves
+            for k in range(40):
+                lines.append("G0 X{:.3f} Y{:.3f}".format(k * 1.0, 5.0 * (k % 2)))
+        i += 1
+    return lines[: n_moves + 1]
+
+
+def bench_motion_planner(n_moves: int = 20000, look_ahead: int = 16) -> dict:
+    """Return the job times and the planning time per move."""
+    program = GcodeParser.compile_program(make_program(n_moves))
+    moves = GcodeMachineState().run_program(program)
+    planner = MotionPlanner(look_ahead=look_ahead)
+
+    planned = planner.plan(moves)
+    batch_time = planner.planning_time["per_move"]
+
+    streaming = MotionPlanner(look_ahead=look_ahead)
+    for position, steps in zip(moves.positions.tolist(), moves.steps.tolist()):
+        streaming.add_move(position, steps)
+    streaming.flush()
+
+    start = time.perf_counter()
+    commands = planner.commands(planned)
+    command_time = time.perf_counter() - start
+    return {
+        "moves": len(planned.lengths),
+        "planned job time": planned.times.sum(),
+        "stop-to-stop job time": planner.stop_to_stop_times(planned).sum(),
+        "batch planning per move": batch_time,
+        "streaming planning per move": streaming.planning_time["per_move"],
+        "commands": len(commands),
+        "commands per move": command_time / len(planned.lengths),
+    }
+
+
+if __name__ == "__main__":
+    result = bench_motion_planner()
+    print("moves:                 {:,}".format(result["moves"]))
+    print("stop-to-stop job time: {:.1f} s".format(result["stop-to-stop job time"]))
+    print("planned job time:      {:.1f} s".format(result["planned job time"]))
+    print(
+        "planning per move:     {:.1f} us batch, {:.1f} us streaming".format(
+            result["batch planning per move"] * 1e6,
+            result["streaming planning per move"] * 1e6,
+        )
+    )
+    print(
+        "commands:              {:,} ({:.1f} us per move)".format(
+            result["commands"], result["commands per move"] * 1e6
+        )
+    )
@@ -0,0 +1,75 @@
+"""Benchmarks for merging the moves of CAM like gcode programs.
+
+Run from the repository root with ``python benchmarks/bench_move_simplifier.py``.
+"""
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.gcode_parser import GcodeParser  # noqa: E402
+from gpc_hardware.utils.move_simplifier import (  # noqa: E402
+    MoveSimplifier,
+    simplify_program,
+)
+
+
+def make_program(n_moves: int) -> list:
+    """Create lines split in tiny moves and finely approximated arcs."""
+    lines = []
+    x = y = 0.0
+    i = 0
+    while len(lines) < n_moves:
+        if i % 2 == 0:  # A straight line in 0.05 mm pieces with rounding noise
+            dx, dy = math.cos(i), math.sin(i)
+            for _ in range(200):
+                x, y = x + 0.05 * dx, y + 0.05 * dy
+                lines.append("G0 X{:.4f} Y{:.4f}".format(x, y))
+        else:  # A quarter arc in 0.5 degree pieces
+            cx, cy = x - 5, y
+            for k in range(1, 181):
+                angle = math.radians(k / 2)
+                x, y = cx + 5 * math.cos(angle), cy + 5 * math.sin(angle)
+                lines.append("G0 X{:.4f} Y{:.4f}".format(x, y))
+        i += 1
+    return lines[:n_moves]
+
+
+def bench_move_simplifier(n_moves: int = 200000, tolerance: float = 0.005) -> dict:
+    """Return the moves eliminated and the moves per second of both modes."""
+    lines = make_program(n_moves)
+    program = GcodeParser.compile_program(lines)
+    parsed = list(GcodeParser.parse_stream(lines))
+
+    start = time.perf_counter()
+    _, removed = simplify_program(program, tolerance)
+    batch = time.perf_counter() - start
+
+    simplifier = MoveSimplifier(tolerance, look_ahead=64)
+    start = time.perf_counter()
+    for _ in simplifier.simplify(parsed):
+        pass
+    streaming = time.perf_counter() - start
+    return {
+        "moves": n_moves,
+        "batch removed": removed,
+        "streaming removed": simplifier.removed,
+        "batch": n_moves / batch,
+        "streaming": n_moves / streaming,
+    }
+
+
+if __name__ == "__main__":
+    result = bench_move_simplifier()
+    print(
+        "batch:     {:,} of {:,} moves eliminated, {:,.0f} moves/s".format(
+            result["batch removed"], result["moves"], result["batch"]
+        )
+    )
+    print(
+        "streaming: {:,} of {:,} moves eliminated, {:,.0f} moves/s".format(
+            result["streaming removed"], result["moves"], result["streaming"]
+        )
+    )
@@ -0,0 +1,200 @@
+"""Benchmarks for the sweep loop of the oscilloscope.
+
+Compares the interrupt driven sweep with the former GPIO polling loop on a
+simulated DAQC2, no Pi-Plate is needed. Run from the repository root with
+``python benchmarks/bench_oscilloscope.py``.
+"""
+import os
+import sys
+import threading
+import time
+import timeit
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+class SimulatedGPIO:
+    """The interrupt line of the DAQC2, low while a trace is ready."""
+
+    FALLING = "falling"
+
+    def __init__(self) -> None:
+        self.level = 1
+        self.asserted = 0.0
+        self._changed = threading.Condition()
+
+    def input(self, pin: int) -> int:
+        return self.level
+
+    def wait_for_edge(self, pin: int, edge: str, timeout: int = None) -> ...:
+        # Like RPi.GPIO the wait sleeps outside the GIL.
+        with self._changed:
+            self._changed.wait_for(lambda: self.level == 0, timeout / 1000)
+
+    def set_level(self, level: int) -> ...:
+        with self._changed:
+            if level == 0:
+                self.asserted = time.perf_counter()
+            self.level = level
+            self._changed.notify_all()
+
+
+def simulated_daqc2() -> types.ModuleType:
+    """Create a DAQC2plate module recording the trace latency."""
+    daqc2 = types.ModuleType("piplates.DAQC2plate")
+    daqc2.GPIO = SimulatedGPIO()
+    daqc2.trace1 = [0] * 1024
+    daqc2.trace2 = [0] * 1024
+    daqc2.latencies = []
+    daqc2.VerifyADDR = lambda address: True
+    for name in ("startOSC", "stopOSC", "setOSCchannel", "setOSCtrigger",
+                 "setOSCsweep", "intEnabled", "runOSC"):
+        setattr(daqc2, name, lambda *args, **kwargs: None)
+    daqc2.getINTflags = lambda address: daqc2.GPIO.set_level(1)
+    daqc2.getOSCtraces = lambda address: daqc2.latencies.append(
+        time.perf_counter() - daqc2.GPIO.asserted
+    )
+    return daqc2
+
+
+DAQC2 = simulated_daqc2()
+sys.modules["piplates"] = types.ModuleType("piplates")
+sys.modules["piplates"].DAQC2plate = DAQC2
+sys.modules["piplates.DAQC2plate"] = DAQC2
+
+from gpc_hardware.apps.oscilloscope import Oscilloscope  # noqa: E402
+
+
+class PollingOscilloscope(Oscilloscope):
+    """The oscilloscope with the former busy polling sweep loop."""
+
+    def _sweep(self, stop_event: threading.Event) -> ...:
+        DAQC2.intEnabled(self._address)
+        DAQC2.runOSC(self._address)
+        while not stop_event.is_set():
+            data_ready = 0
+            while not data_ready and not stop_event.is_set():
+                if DAQC2.GPIO.input(22) == 0:
+                    data_ready = 1
+                    DAQC2.getINTflags(self._address)
+            DAQC2.getOSCtraces(self._address)
+
+
+def bench_sweep(
+    scope_class, control: bool, duration: float = 2.0, period: float = 0.002
+) -> dict:
+    """Sweep for a while with a trace every period, return the costs."""
+    DAQC2.latencies.clear()
+    DAQC2.GPIO.set_level(1)
+    stop = threading.Event()
+    work = [0]
+
+    def control_loop():
+        # A Python thread competing for the GIL, like the control loops.
+        while not stop.is_set():
+            for _ in range(1000):
+                pass
+            work[0] += 1
+
+    def interrupts():
+        next_time = time.perf_counter()
+        while not stop.is_set():
+            next_time += period
+            if stop.wait(max(0.0, next_time - time.perf_counter())):
+                break
+            DAQC2.GPIO.set_level(0)
+
+    scope = scope_class(0)
+    threads = [threading.Thread(target=interrupts)]
+    if control:
+        threads.append(threading.Thread(target=control_loop))
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    scope.enable()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    disable_start = time.perf_counter()
+    scope.disable()
+    disable_time = time.perf_counter() - disable_start
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    latencies = sorted(DAQC2.latencies[:-1])  # The last one can be the stop
+    return {
+        "traces": len(latencies),
+        "cpu": cpu / elapsed,
+        "control": work[0] / elapsed,
+        "median": latencies[len(latencies) // 2],
+        "p99": latencies[int(len(latencies) * 0.99)],
+        "disable": disable_time,
+    }
+
+
+def bench_ring_buffer(buffer_size: int = 64, number: int = 2000) -> dict:
+    """Return the time to record a sweep and to fetch the latest sweeps."""
+    scope = Oscilloscope(0, buffer_size=buffer_size)
+    DAQC2.trace1[:] = list(range(1024))
+    DAQC2.trace2[:] = list(range(1024, 0, -1))
+    record = min(timeit.repeat(scope._record_sweep, number=number, repeat=5))
+    fetch = min(
+        timeit.repeat(
+            lambda: scope.latest_sweeps(buffer_size - 1), number=number, repeat=5
+        )
+    )
+    read = min(
+        timeit.repeat(lambda: scope.latest_trace.trace1, number=number, repeat=5)
+    )
+    copy = min(
+        timeit.repeat(lambda: list(DAQC2.trace1), number=number, repeat=5)
+    )
+    return {
+        "record": record / number,
+        "fetch": fetch / number,
+        "read": read / number,
+        "copy": copy / number,
+        "bytes": scope.latest_sweeps(1).traces.base.nbytes,
+        "dropped": scope.dropped_sweeps,
+    }
+
+
+if __name__ == "__main__":
+    result = bench_ring_buffer()
+    print(
+        "ring buffer of 64 sweeps ({:,} bytes): record {:.1f} us per sweep, "
+        "fetch 64 sweeps {:.1f} us".format(
+            result["bytes"], result["record"] * 1e6, result["fetch"] * 1e6
+        )
+    )
+    print(
+        "latest trace: {:.0f} ns per read, copying the trace list {:.1f} us".format(
+            result["read"] * 1e9, result["copy"] * 1e6
+        )
+    )
+
+    print("A trace every 2 ms for 2 s, with and without a Python control loop")
+    print("sweep loop  control   traces   cpu (cores)   control loops/s   "
+          "median latency   p99 latency   disable")
+    for control in (False, True):
+        for name, scope_class in (
+            ("interrupt", Oscilloscope),
+            ("polling", PollingOscilloscope),
+        ):
+            result = bench_sweep(scope_class, control)
+            print(
+                "{:<10} {:>8} {:>8} {:>13.2f} {:>17,.0f} {:>13.0f} us {:>10.0f} us "
+                "{:>6.0f} ms".format(
+                    name,
+                    "yes" if control else "no",
+                    result["traces"],
+                    result["cpu"],
+                    result["control"],
+                    result["median"] * 1e6,
+                    result["p99"] * 1e6,
+                    result["disable"] * 1e3,
+                )
+            )
@@ -0,0 +1,70 @@
+"""Benchmarks for the compact ParsedCommand form.
+
+Run from the repository root with ``python benchmarks/bench_parsed_command.py``.
+"""
+import os
+import pickle
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.gcode_parser import GcodeParser  # noqa: E402
+from gpc_hardware.utils.parsed_command import ParsedCommand  # noqa: E402
+
+
+def make_program(n_lines: int) -> list:
+    """Create a program of moves with a machine command every 100 lines."""
+    lines = []
+    for i in range(n_lines):
+        if i % 100 == 0:
+            lines.append("M140 S{}.5 I{}".format(i % 50, i % 3))
+        else:
+            lines.append("G0 X{:.3f} Y{:.3f} Z{:.2f}".format(i * 0.01, i * 0.02, i % 7))
+    return lines
+
+
+def measure(build) -> tuple:
+    """Return the retained memory of the result of build and the result."""
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def bench_parsed_command(n_lines: int = 100000) -> dict:
+    """Return the memory and pickle size of the dict and ParsedCommand forms."""
+    lines = make_program(n_lines)
+    dict_bytes, dicts = measure(
+        lambda: [GcodeParser.parse_gcode_line(line) for line in lines]
+    )
+    object_bytes, objects = measure(
+        lambda: [
+            ParsedCommand.from_words(command, words)
+            for commands in dicts
+            for command, words in commands.items()
+        ]
+    )
+    return {
+        "commands": len(objects),
+        "dict_bytes": dict_bytes,
+        "object_bytes": object_bytes,
+        "dict_pickle": len(pickle.dumps(dicts, protocol=pickle.HIGHEST_PROTOCOL)),
+        "object_pickle": len(pickle.dumps(objects, protocol=pickle.HIGHEST_PROTOCOL)),
+    }
+
+
+if __name__ == "__main__":
+    result = bench_parsed_command()
+    n = result["commands"]
+    print(
+        "memory per command: dict {:.0f} bytes, ParsedCommand {:.0f} bytes".format(
+            result["dict_bytes"] / n, result["object_bytes"] / n
+        )
+    )
+    print(
+        "pickle size: dict {:,} bytes, ParsedCommand {:,} bytes".format(
+            result["dict_pickle"], result["object_pickle"]
+        )
+    )
@@ -0,0 +1,68 @@
+"""Benchmarks for the pre-flight check of large programs.
+
+Run from the repository root with ``python benchmarks/bench_preflight.py``.
+"""
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.gcode_parser import GcodeParser  # noqa: E402
+from gpc_hardware.utils.preflight import preflight  # noqa: E402
+
+
+def make_program(n_moves: int) -> list:
+    """Create a program of circles and zigzags, a few moves leave the travel."""
+    lines = ["M92 X80 Y80 Z400"]
+    i = 0
+    while len(lines) <= n_moves:
+        if i % 2 == 0:  # A circle of 72 moves
+            for k in range(73):
+                angle = 2 * math.pi * k / 72
+                lines.append(
+                    "G0 X{:.3f} Y{:.3f}".format(
+                        150 + 10 * math.cos(angle), 150 + 10 * math.sin(angle)
+                    )
+                )
+        else:  # A zigzag of 40 moves, every 50th zigzag goes beyond X300
+            width = 8.0 if i % 100 == 1 else 3.0
+            for k in range(40):
+                lines.append("G0 X{:.3f} Y{:.3f}".format(k * width, 5.0 * (k % 2)))
+        i += 1
+    return lines[: n_moves + 1]
+
+
+def bench_preflight(n_moves: int = 1000000) -> dict:
+    """Return the compile and check times of a program."""
+    lines = make_program(n_moves)
+    start = time.perf_counter()
+    program = GcodeParser.compile_program(lines)
+    compile_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    report = preflight(program)
+    check_time = time.perf_counter() - start
+    return {
+        "moves": report.moves,
+        "issues": len(report.issues),
+        "job time": report.job_time,
+        "compile": compile_time,
+        "check": check_time,
+    }
+
+
+if __name__ == "__main__":
+    result = bench_preflight()
+    print(
+        "{:,} moves, {:,} issues, estimated job time {:.0f} s".format(
+            result["moves"], result["issues"], result["job time"]
+        )
+    )
+    print("compile:   {:.2f} s".format(result["compile"]))
+    print(
+        "preflight: {:.2f} s ({:,.0f} moves/s)".format(
+            result["check"], result["moves"] / result["check"]
+        )
+    )
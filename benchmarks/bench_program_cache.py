@@ -0,0 +1,90 @@
+"""Benchmarks for the on-disk cache of compiled programs.
+
+Run from the repository root with ``python benchmarks/bench_program_cache.py``.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.gcode_parser import GcodeParser  # noqa: E402
+from gpc_hardware.utils.program_cache import GcodeProgramCache  # noqa: E402
+
+
+def make_program(n_lines: int) -> str:
+    """Create a program of moves and a few machine commands."""
+    lines = []
+    for i in range(n_lines):
+        if i % 100 == 0:
+            lines.append("M140 S0.{} I-2".format(i % 10))
+        else:
+            lines.append("G0 X{:.3f} Y{:.3f} Z{:.2f}".format(i % 300, i % 170, i % 7))
+    return "\n".join(lines) + "\n"
+
+
+def best_time(func, repeat: int = 3) -> float:
+    """Return the best time of a few runs of func."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_program_cache(n_lines: int = 1000000) -> dict:
+    """Return the compile, store, key and load times of a program."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "program.gcode")
+        with open(path, "w") as f:
+            f.write(make_program(n_lines))
+        cache = GcodeProgramCache(os.path.join(tmp, "cache"), max_bytes=1 << 30)
+
+        start = time.perf_counter()
+        program = cache.compile(path)
+        miss = time.perf_counter() - start
+        key = cache.key(path)
+
+        def first_move():
+            return cache.compile(path).axis("X")[0]
+
+        def full_pass():
+            return cache.compile(path).axis("X").sum()
+
+        result = {
+            "lines": n_lines,
+            "rows": len(program),
+            "source bytes": os.path.getsize(path),
+            "cache bytes": cache.info()["bytes"],
+            "compile": best_time(lambda: GcodeParser.compile_program(path), 1),
+            "miss": miss,
+            "key": best_time(lambda: cache.key(path)),
+            "get": best_time(lambda: cache.get(key)),
+            "first move": best_time(first_move),
+            "full pass": best_time(full_pass),
+        }
+        result["info"] = cache.info()
+    return result
+
+
+if __name__ == "__main__":
+    result = bench_program_cache()
+    print(
+        "{:,} lines, {:,} rows, {:,} bytes of gcode, {:,} bytes cached".format(
+            result["lines"],
+            result["rows"],
+            result["source bytes"],
+            result["cache bytes"],
+        )
+    )
+    print("compile:          {:.3f} s".format(result["compile"]))
+    print("miss (+ store):   {:.3f} s".format(result["miss"]))
+    print("hash the source:  {:.4f} s".format(result["key"]))
+    print("get (memory map): {:.5f} s".format(result["get"]))
+    print("hit + first move: {:.4f} s".format(result["first move"]))
+    print("hit + X column:   {:.4f} s".format(result["full pass"]))
+    print(
+        "hits {hits}, misses {misses}, evictions {evictions}".format(**result["info"])
+    )
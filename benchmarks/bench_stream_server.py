@@ -0,0 +1,66 @@
+"""Benchmarks for streaming gcode to the stream server.
+
+Run from the repository root with ``python benchmarks/bench_stream_server.py``.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.utils.stream_server import GcodeStreamServer  # noqa: E402
+
+
+async def stream(n_clients: int, n_lines: int, queue_size: int, wait_ok: bool) -> float:
+    """Return the lines/second of n_clients clients sending n_lines lines each."""
+    server = GcodeStreamServer(queue_size=queue_size)
+    await server.start_tcp()
+    port = server.sockets[0].getsockname()[1]
+    lines = [b"G0 X%d Y%d\n" % (i % 300, i % 170) for i in range(n_lines)]
+
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        if wait_ok:
+            # Send the next line after the ok of the previous line.
+            for line in lines:
+                writer.write(line)
+                await reader.readline()
+        else:
+            writer.write(b"".join(lines))
+            for _ in lines:
+                await reader.readline()
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(n_clients)))
+    await server.join()
+    elapsed = time.perf_counter() - start
+    await server.close()
+    return n_clients * n_lines / elapsed
+
+
+def bench_stream_server(n_lines: int = 5000) -> list:
+    """Return the lines/second for a few numbers of clients."""
+    results = []
+    for n_clients in (1, 4, 16):
+        for wait_ok in (True, False):
+            results.append(
+                {
+                    "clients": n_clients,
+                    "wait_ok": wait_ok,
+                    "rate": asyncio.run(
+                        stream(n_clients, n_lines // n_clients, 16, wait_ok)
+                    ),
+                }
+            )
+    return results
+
+
+if __name__ == "__main__":
+    print("clients   mode             lines/s")
+    for result in bench_stream_server():
+        mode = "wait for ok" if result["wait_ok"] else "stream"
+        print(
+            "{:>7}   {:<12} {:>11,.0f}".format(result["clients"], mode, result["rate"])
+        )
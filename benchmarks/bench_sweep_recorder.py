@@ -0,0 +1,82 @@
+"""Benchmarks for recording oscilloscope sweeps to disk.
+
+Records sweeps of a simulated DAQC2 as fast as they can be made, no Pi-Plate
+is needed. The files are written to a temporary directory, set TMPDIR to
+measure another disk. Run from the repository root with
+``python benchmarks/bench_sweep_recorder.py``.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+DAQC2 = types.ModuleType("piplates.DAQC2plate")
+DAQC2.trace1 = list(range(1024))
+DAQC2.trace2 = list(range(1024, 0, -1))
+DAQC2.VerifyADDR = lambda address: True
+sys.modules["piplates"] = types.ModuleType("piplates")
+sys.modules["piplates"].DAQC2plate = DAQC2
+sys.modules["piplates.DAQC2plate"] = DAQC2
+
+from gpc_hardware.apps.oscilloscope import Oscilloscope  # noqa: E402
+from gpc_hardware.apps.sweep_recorder import SweepRecorder  # noqa: E402
+
+
+def bench_record(n_sweeps: int, block: bool, **kwargs) -> dict:
+    """Record sweeps back to back, return the rates and the sweep thread cost."""
+    directory = tempfile.mkdtemp()
+    try:
+        scope = Oscilloscope(0)
+        for _ in range(100):  # Warm up the ring buffer
+            scope._record_sweep()
+        plain = time.perf_counter()
+        for _ in range(n_sweeps):
+            scope._record_sweep()
+        plain = time.perf_counter() - plain
+
+        recorder = SweepRecorder(directory, block=block, **kwargs)
+        recorder.attach(scope)
+        start = time.perf_counter()
+        for _ in range(n_sweeps):
+            scope._record_sweep()
+        sweep_thread = time.perf_counter() - start
+        recorder.detach()
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(path) for paths in recorder.files for path in paths)
+        return {
+            "sweeps/s": recorder.written_sweeps / elapsed,
+            "MB/s": size / elapsed / 1e6,
+            "overhead": (sweep_thread - plain) / n_sweeps,
+            "written": recorder.written_sweeps,
+            "dropped": recorder.dropped_sweeps,
+            "files": len(recorder.files),
+        }
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    print("Recording 20,000 sweeps (82 MB) to {}".format(tempfile.gettempdir()))
+    print("mode                    sweeps/s      MB/s   sweep thread cost   "
+          "written   dropped   files")
+    for name, block, kwargs in (
+        ("block", True, {}),
+        ("block, 16 MB files", True, {"max_bytes": 16 * 2**20}),
+        ("drop", False, {}),
+    ):
+        result = bench_record(20000, block, **kwargs)
+        print(
+            "{:<20} {:>11,.0f} {:>9.0f} {:>14.1f} us {:>9} {:>9} {:>7}".format(
+                name,
+                result["sweeps/s"],
+                result["MB/s"],
+                result["overhead"] * 1e6,
+                result["written"],
+                result["dropped"],
+                result["files"],
+            )
+        )
@@ -0,0 +1,76 @@
+"""Benchmarks for the waveform measurements of oscilloscope traces.
+
+Compares measure_waveforms on one sweep and on batches of sweeps with the
+Python loops over the trace lists it replaces. Run from the repository root
+with ``python benchmarks/bench_waveform_measurements.py``.
+"""
+import math
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gpc_hardware.apps.waveform_measurements import measure_waveforms  # noqa: E402
+
+SCALE = 12 / 4095
+
+
+def python_measure(trace: list, sample_period: float) -> dict:
+    """Measure a trace list with Python loops, without the rise time."""
+    low, high = min(trace), max(trace)
+    mean = sum(trace) / len(trace)
+    rms = math.sqrt(sum(value * value for value in trace) / len(trace))
+    middle = (low + high) / 2
+    edges = [
+        i for i in range(1, len(trace)) if trace[i - 1] < middle <= trace[i]
+    ]
+    above = sum(1 for value in trace[edges[0]:edges[-1]] if value >= middle)
+    period = (edges[-1] - edges[0]) / (len(edges) - 1) * sample_period
+    return {
+        "vpp": (high - low) * SCALE,
+        "mean": mean * SCALE,
+        "rms": rms * SCALE,
+        "frequency": 1 / period,
+        "duty_cycle": above / (edges[-1] - edges[0]),
+    }
+
+
+def make_sweeps(n_sweeps: int) -> np.ndarray:
+    """Noisy square and sine waves, shape (sweeps, 2, 1024) like measure uses."""
+    rng = np.random.default_rng(0)
+    t = np.arange(1024)
+    square = np.where((t % 40) < 12, 3500, 500)
+    sine = 2000 + 1500 * np.sin(2 * np.pi * t / 97)
+    sweeps = np.stack([square, sine])[None] + rng.normal(0, 20, (n_sweeps, 2, 1024))
+    return np.clip(sweeps, 0, 4095).astype(np.int16)
+
+
+def bench(number: int = 200) -> dict:
+    """Return the time per sweep of both channels."""
+    results = {}
+    one = make_sweeps(1)
+    lists = [one[0, 0].tolist(), one[0, 1].tolist()]
+    results["python loops"] = min(
+        timeit.repeat(
+            lambda: [python_measure(trace, 1e-6) for trace in lists],
+            number=number,
+            repeat=5,
+        )
+    ) / number
+    for n_sweeps in (1, 16, 64):
+        sweeps = make_sweeps(n_sweeps)
+        results["numpy, {} sweeps".format(n_sweeps)] = min(
+            timeit.repeat(
+                lambda: measure_waveforms(sweeps, 1e-6, SCALE), number=number, repeat=5
+            )
+        ) / number / n_sweeps
+    return results
+
+
+if __name__ == "__main__":
+    print("Measuring both channels of a sweep (2 x 1024 samples)")
+    for name, seconds in bench().items():
+        print("{:<20} {:>8.1f} us per sweep".format(name, seconds * 1e6))
@@ -14,6 +14,9 @@ class AppException(Exception):
 class BaseApp(ABC):
     """Base class for a GPC app."""
 
+    # The gcode commands executed by the app, see GcodeDispatcher.register_app.
+    gcode_commands = ()
+
     @property
     @abstractmethod
     def name(self) -> str:
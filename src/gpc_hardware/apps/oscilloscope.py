@@ -1,6 +1,36 @@
 import piplates.DAQC2plate as DAQC2
-from typing import Union
+from typing import Callable, Union, NamedTuple
 from threading import Thread, Event
+from time import monotonic_ns
+import numpy as np
+from .waveform_measurements import WaveformMeasurements, measure_waveforms
+
+
+TRACE_LENGTH = 1024  # Samples per channel in a sweep
+
+
+class OscilloscopeSweeps(NamedTuple):
+    """Consecutive sweeps in the ring buffer, the oldest sweep first."""
+
+    sequence: np.ndarray
+    """The sequence number of every sweep, counting from 0."""
+    timestamps: np.ndarray
+    """The time.monotonic_ns timestamp of every sweep."""
+    traces: np.ndarray
+    """The samples, shape (sweeps, 1024, 2) with channel one and two."""
+
+
+class OscilloscopeTrace(NamedTuple):
+    """The latest complete sweep, the traces are read only views."""
+
+    sequence: int
+    """The sequence number of the sweep, -1 before the first sweep."""
+    timestamp: int
+    """The time.monotonic_ns timestamp of the sweep."""
+    trace1: np.ndarray
+    """The 1024 samples of channel one."""
+    trace2: np.ndarray
+    """The 1024 samples of channel two."""
 
 
 class Oscilloscope:
@@ -30,8 +60,15 @@ class Oscilloscope:
     """
     _trigger_range = (0, 4095)  # Trigger range in mV
     _trigger_voltage_scale_factor = 12/4095  # 12V / 4095mV
-
-    def __init__(self, address: int = 0) -> ...:
+    # Samples per second of every sweep rate
+    _sample_rates = (
+        100, 200, 500, 1_000, 2_000, 5_000, 10_000, 20_000, 50_000, 100_000,
+        200_000, 500_000, 1_000_000,
+    )
+    _interrupt_pin = 22  # GPIO pin of the DAQC2 interrupt line, low when set
+    _interrupt_timeout = 50  # Longest wait for the interrupt in ms
+
+    def __init__(self, address: int = 0, buffer_size: int = 64) -> ...:
         """Initialize the PiPlateScope object
 
         To use this class ADC pin 0 and 4 on the DAQC2 must be free and
@@ -41,9 +78,16 @@ class Oscilloscope:
         ----------
         address : int
             The address of the Pi-Plate DAQC2
+        buffer_size : int
+            The number of sweeps kept in the ring buffer, at least 2 so the
+            sweep thread never writes into the latest sweep
         """
         if not isinstance(address, int):
             raise TypeError(f"Invalid address type: {type(address)}")
+        if not isinstance(buffer_size, int):
+            raise TypeError(f"Invalid buffer size type: {type(buffer_size)}")
+        if buffer_size < 2:
+            raise ValueError(f"Invalid buffer size: {buffer_size}")
         if not DAQC2.VerifyADDR(address):
             raise ValueError(f"Invalid address: {address}")
 
@@ -57,12 +101,35 @@ class Oscilloscope:
         self._channel_one_active = False
         self._channel_two_active = False
 
-        # Placeholders used during sweeping
-        self._channel_one_trace = DAQC2.trace1
-        self._channel_two_trace = DAQC2.trace2
         self._sweep_thread = None
         self._stop_event = Event()
 
+        # Ring buffer of the sweeps. Every sweep is stored twice, at i and
+        # i + buffer_size, so the latest sweeps are always one contiguous
+        # slice and are returned as views without copying.
+        self._buffer_size = buffer_size
+        self._traces = np.zeros((2 * buffer_size, TRACE_LENGTH, 2), dtype=np.int16)
+        self._sequence = np.full(2 * buffer_size, -1, dtype=np.int64)
+        self._timestamps = np.zeros(2 * buffer_size, dtype=np.int64)
+        self._sweep_count = 0
+        self._next_unread = 0
+        self._dropped_sweeps = 0
+
+        # Read only views of the channels of every slot, made once so reading
+        # the latest trace does not allocate. The sweep thread fills the next
+        # slot and then swaps in the trace of that slot.
+        self._slot_views = []
+        for traces in self._traces[:buffer_size]:
+            views = traces[:, 0], traces[:, 1]
+            for view in views:
+                view.flags.writeable = False
+            self._slot_views.append(views)
+        self._latest_trace = OscilloscopeTrace(-1, 0, *self._slot_views[-1])
+        # Replaced instead of changed, so the sweep thread never iterates a
+        # tuple that is being changed.
+        self._sweep_listeners = ()
+        self._listener_errors = 0
+
     # DUNDER METHODS
     def __repr__(self) -> str:
         return f"PiPlateScope(address={self._address})"
@@ -71,7 +138,8 @@ class Oscilloscope:
         return f"PiPlateScope at address {self._address}"
 
     def __del__(self) -> ...:
-        self.disable()
+        if hasattr(self, "_sweep_thread"):  # Not set if __init__ raised
+            self.disable()
 
     # PROPERTIES
     @property
@@ -276,26 +344,157 @@ class Oscilloscope:
         self._trig_edge = edge
 
     @property
-    def channel_one_trace(self) -> int:
-        """Get the current trace of channel one"""
-        return self._channel_one_trace
-    
+    def latest_trace(self) -> OscilloscopeTrace:
+        """Get the latest complete sweep with its sequence number
+
+        The traces are read only views that are not written by the sweep
+        thread until buffer_size - 1 newer sweeps are recorded. Use this
+        instead of trace1 and trace2 to get both channels of the same sweep.
+        """
+        return self._latest_trace
+
+    @property
+    def channel_one_trace(self) -> np.ndarray:
+        """Get the latest trace of channel one, a read only view"""
+        return self._latest_trace.trace1
+
+    @property
+    def trace1(self) -> np.ndarray:
+        """Get the latest trace of channel one, a read only view"""
+        return self._latest_trace.trace1
+
+    @property
+    def channel_two_trace(self) -> np.ndarray:
+        """Get the latest trace of channel two, a read only view"""
+        return self._latest_trace.trace2
+
+    @property
+    def trace2(self) -> np.ndarray:
+        """Get the latest trace of channel two, a read only view"""
+        return self._latest_trace.trace2
+
+    @property
+    def sample_period(self) -> float:
+        """Get the time between two samples in s at the current sweep rate"""
+        return 1 / self._sample_rates[self._sweep_rate]
+
+    @property
+    def buffer_size(self) -> int:
+        """Get the number of sweeps kept in the ring buffer"""
+        return self._buffer_size
+
     @property
-    def trace1(self) -> int:
-        """Get the current trace of channel one"""
-        return self._channel_one_trace
+    def sweep_count(self) -> int:
+        """Get the number of sweeps recorded since the object was created"""
+        return self._sweep_count
 
     @property
-    def channel_two_trace(self) -> int:
-        """Get the current trace of channel two"""
-        return self._channel_two_trace
-    
+    def dropped_sweeps(self) -> int:
+        """Get the number of sweeps overwritten before they were fetched
+
+        A fetch with latest_sweeps counts every sweep up to the latest one as
+        fetched.
+        """
+        return self._dropped_sweeps
+
     @property
-    def trace2(self) -> int:
-        """Get the current trace of channel two"""
-        return self._channel_two_trace
+    def listener_errors(self) -> int:
+        """Get the number of sweep listener calls that raised an exception
+
+        The exceptions are not raised in the sweep thread, so a failing
+        listener does not stop the acquisition.
+        """
+        return self._listener_errors
 
     # PUBLIC FUNCTIONS
+    def latest_sweeps(self, n: int = 1) -> OscilloscopeSweeps:
+        """Get the latest sweeps from the ring buffer
+
+        The arrays are read only views on the ring buffer, no samples are
+        copied. The sweep thread writes the next sweep in the slot of the
+        sweep buffer_size - 1 sweeps before the latest one, so at most
+        buffer_size - 1 sweeps are returned and none of them is overwritten
+        by the next sweep. Copy the arrays to keep them longer.
+
+        Parameters
+        ----------
+        n : int
+            The number of sweeps, at most buffer_size - 1
+
+        Returns
+        -------
+        OscilloscopeSweeps
+            The sequence numbers, timestamps and samples of the latest
+            sweeps, fewer than n sweeps if fewer were recorded
+        """
+        if not isinstance(n, int):
+            raise TypeError(f"Invalid number of sweeps type: {type(n)}")
+        if n not in range(1, self._buffer_size):
+            raise ValueError(f"Invalid number of sweeps: {n}")
+        count = self._sweep_count
+        end = (count - 1) % self._buffer_size + self._buffer_size + 1
+        start = end - min(n, count)
+        self._next_unread = max(self._next_unread, count)
+        sweeps = OscilloscopeSweeps(
+            self._sequence[start:end],
+            self._timestamps[start:end],
+            self._traces[start:end],
+        )
+        for array in sweeps:
+            array.flags.writeable = False
+        return sweeps
+
+    def measure(self, n: int = 1) -> WaveformMeasurements:
+        """Measure both channels of the latest sweeps
+
+        Vpp, mean, RMS, frequency, period, duty cycle and rise time are
+        computed for all sweeps at once, see measure_waveforms. The sample
+        period is taken from the current sweep rate.
+
+        Parameters
+        ----------
+        n : int
+            The number of sweeps, at most buffer_size - 1
+
+        Returns
+        -------
+        WaveformMeasurements
+            The measurements in V and s, every field of shape (sweeps, 2)
+            with channel one and two
+        """
+        traces = self.latest_sweeps(n).traces
+        return measure_waveforms(
+            np.moveaxis(traces, -1, -2),
+            self.sample_period,
+            self._trigger_voltage_scale_factor,
+        )
+
+    def add_sweep_listener(self, listener: Callable[[OscilloscopeTrace], None]) -> ...:
+        """Call a function with every recorded sweep
+
+        The listener is called in the sweep thread with the latest trace,
+        right after it is recorded. It must return quickly, every moment it
+        takes delays the next sweep. The traces are views on the ring
+        buffer, copy them to keep them. An exception of the listener is
+        counted in listener_errors instead of stopping the sweep thread.
+
+        Parameters
+        ----------
+        listener : callable
+            Called with the OscilloscopeTrace of every sweep
+        """
+        if not callable(listener):
+            raise TypeError(f"Invalid sweep listener type: {type(listener)}")
+        self._sweep_listeners = self._sweep_listeners + (listener,)
+
+    def remove_sweep_listener(
+        self, listener: Callable[[OscilloscopeTrace], None]
+    ) -> ...:
+        """Stop calling a function added with add_sweep_listener"""
+        listeners = list(self._sweep_listeners)
+        listeners.remove(listener)
+        self._sweep_listeners = tuple(listeners)
+
     def enable(self) -> ...:
         """Start sweeping the oscilloscope with the current settings"""
         DAQC2.startOSC(self._address)
@@ -306,9 +505,16 @@ class Oscilloscope:
         self._sweep_thread.start()
 
     def disable(self) -> ...:
-        """Stop sweeping the oscilloscope"""
+        """Stop sweeping the oscilloscope
+
+        Returns within the interrupt timeout (50 ms) when the sweep thread
+        is waiting for a trace.
+        """
+        if self._sweep_thread is None:
+            return
         self._stop_event.set()
         self._sweep_thread.join()
+        self._sweep_thread = None
         self._stop_event.clear()
         DAQC2.stopOSC(self._address)
 
@@ -316,17 +522,57 @@ class Oscilloscope:
     def _sweep(self, stop_event: Event) -> ...:
         """Sweep the active channels.
 
-        Keeps sweeping the oscilloscope until the stop event is set.
+        Keeps sweeping the oscilloscope until the stop event is set. The
+        thread sleeps until the interrupt line signals a trace, instead of
+        polling the line and keeping a core busy.
         """
         DAQC2.intEnabled(self._address)
         DAQC2.runOSC(self._address)
-        while not stop_event.is_set():
-            data_ready = 0
-            while not data_ready and not stop_event.is_set():
-                if DAQC2.GPIO.input(22)==0:
-                    data_ready = 1
-                    DAQC2.getINTflags(self._address)
+        while self._wait_for_trace(stop_event):
+            DAQC2.getINTflags(self._address)
             DAQC2.getOSCtraces(self._address)
+            self._record_sweep()
+
+    def _record_sweep(self) -> ...:
+        """Copy the traces of the last sweep into the ring buffer"""
+        sequence = self._sweep_count
+        index = sequence % self._buffer_size
+        mirror = index + self._buffer_size
+        if sequence - self._buffer_size >= self._next_unread:
+            self._dropped_sweeps += 1  # The overwritten sweep was not fetched
+
+        self._traces[index, :, 0] = DAQC2.trace1
+        self._traces[index, :, 1] = DAQC2.trace2
+        self._traces[mirror] = self._traces[index]
+        self._sequence[index] = self._sequence[mirror] = sequence
+        timestamp = monotonic_ns()
+        self._timestamps[index] = self._timestamps[mirror] = timestamp
+        # Publish the sweep, a single assignment swaps in the complete trace
+        self._latest_trace = trace = OscilloscopeTrace(
+            sequence, timestamp, *self._slot_views[index]
+        )
+        self._sweep_count = sequence + 1
+        for listener in self._sweep_listeners:
+            try:
+                listener(trace)
+            except Exception:
+                self._listener_errors += 1
+
+    def _wait_for_trace(self, stop_event: Event) -> bool:
+        """Wait for the interrupt of a trace, False if the stop event is set.
+
+        The line stays low until the interrupt flags are read, so an edge
+        before the wait is seen by the level check. The wait times out to
+        check the stop event, it releases the GIL while waiting.
+        """
+        gpio = DAQC2.GPIO
+        while not stop_event.is_set():
+            if gpio.input(self._interrupt_pin) == 0:
+                return True
+            gpio.wait_for_edge(
+                self._interrupt_pin, gpio.FALLING, timeout=self._interrupt_timeout
+            )
+        return False
 
     def _reset_trigger(self) -> ...:
         DAQC2.setOSCtrigger(
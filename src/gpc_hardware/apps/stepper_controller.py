@@ -54,7 +54,7 @@ class DAQCStepper:
     def stop_motor(self, channel: int) -> ...:
         """Stop the specified motor (does not remove power)."""
         self._verify_motor(channel)
-        DAQC2.motorSTOP(self._address, self._channel)
+        DAQC2.motorSTOP(self._address, channel)
 
     def move(self, steps: int, channel: int) -> ...:
         """Move the motor a specified number of steps."""
@@ -63,7 +63,7 @@ class DAQCStepper:
                 "steps must be an integer, not type {}".format(type(steps))
             )
         self._verify_motor(channel)
-        DAQC2.stepperMOVE(self._address, self._channel, steps)
+        DAQC2.stepperMOVE(self._address, channel, steps)
 
     def jog(self, channel: int) -> ...:
         """Jog the motor in the specified direction.
@@ -77,7 +77,7 @@ class DAQCStepper:
         self._verify_motor(channel)
         DAQC2.stepperJOG(
             self._address,
-            self._channel,
+            channel,
             self._directions[channel],
         )
 
@@ -111,6 +111,29 @@ class DAQCStepper:
         self._verify_motor(channel)
         DAQC2.stepperRATE(self._address, channel, speed)
 
+    def run_commands(self, commands, channels: dict) -> ...:
+        """
+        Execute stepper commands of the motion planner.
+
+        Parameters
+        ----------
+        commands : iterable of StepperCommand
+            The commands returned by MotionPlanner.commands.
+        channels : dict
+            The channel of the motor of every axis, commands of axes that
+            are not in the dict are skipped.
+        """
+        for function, axis, value in commands:
+            channel = channels.get(axis)
+            if channel is None:
+                continue
+            if function == "stepperRATE":
+                self.set_speed(value, channel)
+            elif function == "stepperMOVE":
+                self.move(value, channel)
+            else:
+                raise ValueError("Unknown stepper function: {}".format(function))
+
     def _verify_motor(self, channel: int) -> ...:
         """Verify the motor is connected."""
         if not isinstance(channel, int):
@@ -0,0 +1,385 @@
+import os
+from queue import Empty, Full, Queue
+from threading import Thread
+from time import monotonic
+from typing import List, Optional, Tuple
+import numpy as np
+
+
+NPY_HEADER_SIZE = 512  # Fixed header size, rewritten in place as a file grows
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+# The sweep samples, channel one and two, like OscilloscopeSweeps.traces
+SWEEP_DTYPE = np.dtype("<i2")
+SWEEP_SHAPE = (1024, 2)
+
+# A row of the sidecar index, the sweep and the settings it was taken with
+INDEX_DTYPE = np.dtype([
+    ("sequence", "<i8"),
+    ("timestamp", "<i8"),
+    ("sweep_rate", "u1"),
+    ("trigger_source", "u1"),
+    ("trigger_type", "u1"),
+    ("trigger_edge", "u1"),
+    ("trigger_level", "<f8"),
+    ("channel_one_active", "?"),
+    ("channel_two_active", "?"),
+])
+
+
+class SweepRecorder:
+    """Class for streaming oscilloscope sweeps to memory mapped files
+
+    The recorder listens to the sweep thread of an Oscilloscope. Every sweep
+    is copied into a bounded queue and a writer thread appends it to a
+    memory mapped file, so the sweep thread never waits for the disk.
+
+    Every file is a standard .npy file with shape (sweeps, 1024, 2), next to
+    a .index.npy sidecar with a row of INDEX_DTYPE per sweep (sequence
+    number, timestamp and the oscilloscope settings). Both are read with
+    ``np.load(path, mmap_mode="r")``. The files grow in steps of grow_sweeps
+    sweeps, their headers are updated every flush_seconds, so after a crash
+    the sweeps up to the last flush are readable.
+
+    When the disk falls behind and the queue is full, a sweep is dropped and
+    counted in dropped_sweeps, or with block the sweep thread waits for the
+    writer. The gaps are visible in the sequence numbers of the index.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        prefix: str = "sweeps",
+        queue_size: int = 256,
+        block: bool = False,
+        max_bytes: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+        grow_sweeps: int = 256,
+        flush_seconds: float = 1.0,
+    ) -> ...:
+        """Initialize the recorder, nothing is written until attached
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the files, created if it does not exist
+        prefix : str
+            The files are named <prefix>_0000.npy, <prefix>_0001.npy, ...
+        queue_size : int
+            The number of sweeps waiting for the writer
+        block : bool
+            Wait for space in the queue instead of dropping the sweep, this
+            delays the sweep thread
+        max_bytes : int, optional
+            Start a new file before a file grows beyond this size
+        max_seconds : float, optional
+            Start a new file when its first sweep is this much older than
+            the next sweep
+        grow_sweeps : int
+            The number of sweeps a file grows by at a time
+        flush_seconds : float
+            The longest time between flushes of the files to the disk
+        """
+        if not isinstance(queue_size, int):
+            raise TypeError(f"Invalid queue size type: {type(queue_size)}")
+        if queue_size < 1:
+            raise ValueError(f"Invalid queue size: {queue_size}")
+        if not isinstance(grow_sweeps, int):
+            raise TypeError(f"Invalid grow sweeps type: {type(grow_sweeps)}")
+        if grow_sweeps < 1:
+            raise ValueError(f"Invalid grow sweeps: {grow_sweeps}")
+        sweep_bytes = SWEEP_DTYPE.itemsize * SWEEP_SHAPE[0] * SWEEP_SHAPE[1]
+        if max_bytes is not None and max_bytes < NPY_HEADER_SIZE + sweep_bytes:
+            raise ValueError(f"Invalid max bytes: {max_bytes}")
+        if max_seconds is not None and max_seconds <= 0:
+            raise ValueError(f"Invalid max seconds: {max_seconds}")
+
+        self._directory = directory
+        self._prefix = prefix
+        self._queue = Queue(queue_size)
+        self._block = block
+        self._max_sweeps = (
+            None if max_bytes is None else (max_bytes - NPY_HEADER_SIZE) // sweep_bytes
+        )
+        self._max_ns = None if max_seconds is None else int(max_seconds * 1e9)
+        self._grow_sweeps = grow_sweeps
+        self._flush_seconds = flush_seconds
+
+        self._scope = None
+        self._writer = None
+        self._error = None
+        self._files = []
+        self._written_sweeps = 0
+        self._dropped_sweeps = 0  # Counted by the sweep thread
+        self._writer_dropped_sweeps = 0  # Counted by the writer thread
+        self._max_queue_depth = 0
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return f"SweepRecorder(directory={self._directory!r}, prefix={self._prefix!r})"
+
+    def __str__(self) -> str:
+        return f"SweepRecorder writing to {self._directory}"
+
+    # PROPERTIES
+    @property
+    def recording(self) -> bool:
+        """Get whether the recorder is attached to an oscilloscope"""
+        return self._scope is not None
+
+    @property
+    def files(self) -> List[Tuple[str, str]]:
+        """Get the paths of the sweep and index files written, oldest first"""
+        return list(self._files)
+
+    @property
+    def written_sweeps(self) -> int:
+        """Get the number of sweeps written to the files"""
+        return self._written_sweeps
+
+    @property
+    def dropped_sweeps(self) -> int:
+        """Get the number of sweeps dropped because the queue was full
+
+        Sweeps are also dropped after the writer failed, see detach.
+        """
+        return self._dropped_sweeps + self._writer_dropped_sweeps
+
+    @property
+    def queue_depth(self) -> int:
+        """Get the number of sweeps waiting for the writer"""
+        return self._queue.qsize()
+
+    @property
+    def max_queue_depth(self) -> int:
+        """Get the largest number of sweeps that waited for the writer
+
+        Close to queue_size means the disk is barely keeping up.
+        """
+        return self._max_queue_depth
+
+    # PUBLIC FUNCTIONS
+    def attach(self, scope) -> ...:
+        """Start recording the sweeps of an oscilloscope
+
+        Parameters
+        ----------
+        scope : Oscilloscope
+            The oscilloscope, it can already be enabled
+        """
+        if self._scope is not None:
+            raise RuntimeError("The recorder is already attached")
+        os.makedirs(self._directory, exist_ok=True)
+        self._error = None
+        self._writer = Thread(target=self._write, name="SweepRecorder", daemon=True)
+        self._writer.start()
+        self._scope = scope
+        scope.add_sweep_listener(self._on_sweep)
+
+    def detach(self) -> ...:
+        """Stop recording, write the queued sweeps and close the files
+
+        Raises
+        ------
+        Exception
+            The error of the writer if writing a file failed, f.e. an
+            OSError, the sweeps after the failure are counted as dropped
+        """
+        if self._scope is None:
+            return
+        self._scope.remove_sweep_listener(self._on_sweep)
+        self._scope = None
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    # PRIVATE FUNCTIONS
+    def _on_sweep(self, trace) -> ...:
+        """Queue a copy of a sweep, called in the sweep thread"""
+        if self._error is not None:
+            self._dropped_sweeps += 1
+            return
+        scope = self._scope
+        if scope is None:  # Detached while the sweep was recorded
+            return
+        traces = np.empty(SWEEP_SHAPE, dtype=SWEEP_DTYPE)
+        traces[:, 0] = trace.trace1
+        traces[:, 1] = trace.trace2
+        row = (
+            trace.sequence,
+            trace.timestamp,
+            scope.sweep_rate,
+            scope.trigger_source,
+            scope.trigger_type,
+            scope.trigger_edge,
+            scope.trigger_level,
+            scope.channel_one_active,
+            scope.channel_two_active,
+        )
+        try:
+            self._queue.put((traces, row), block=self._block)
+        except Full:
+            self._dropped_sweeps += 1
+            return
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+
+    def _write(self) -> ...:
+        """Write the queued sweeps until the None is queued by detach"""
+        sweeps = index = None
+        first_timestamp = 0
+        last_flush = monotonic()
+        stopped = False
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self._flush_seconds)
+                except Empty:
+                    item = ()
+                if sweeps is not None and (
+                    not item or monotonic() - last_flush >= self._flush_seconds
+                ):
+                    sweeps.flush()
+                    index.flush()
+                    last_flush = monotonic()
+                if item is None:
+                    stopped = True
+                    break
+                if not item:
+                    continue
+
+                traces, row = item
+                if sweeps is not None and (
+                    (self._max_sweeps is not None and len(sweeps) >= self._max_sweeps)
+                    or (
+                        self._max_ns is not None
+                        and row[1] - first_timestamp >= self._max_ns
+                    )
+                ):
+                    sweeps.close()
+                    index.close()
+                    sweeps = index = None
+                if sweeps is None:
+                    paths = self._next_paths()
+                    sweeps = _GrowableNpy(
+                        paths[0], SWEEP_DTYPE, SWEEP_SHAPE, self._max_sweeps
+                    )
+                    index = _GrowableNpy(paths[1], INDEX_DTYPE, (), self._max_sweeps)
+                    self._files.append(paths)
+                    first_timestamp = row[1]
+                sweeps.append(traces, self._grow_sweeps)
+                index.append(row, self._grow_sweeps)
+                self._written_sweeps += 1
+        except Exception as e:
+            self._error = e
+        finally:
+            for file in (sweeps, index):
+                if file is not None:
+                    try:
+                        file.close()
+                    except Exception as e:
+                        self._error = self._error or e
+        if not stopped:
+            # Drain the queue so a blocking sweep thread does not wait forever
+            while self._queue.get() is not None:
+                self._writer_dropped_sweeps += 1
+
+    def _next_paths(self) -> Tuple[str, str]:
+        """Get the paths of the next sweep and index file, skip existing files"""
+        number = len(self._files)
+        while True:
+            base = os.path.join(self._directory, f"{self._prefix}_{number:04d}")
+            paths = f"{base}.npy", f"{base}.index.npy"
+            if not any(os.path.exists(path) for path in paths):
+                return paths
+            number += 1
+
+
+class _GrowableNpy:
+    """An .npy file of a growing number of rows, appended via a memory map
+
+    The header has a fixed size, so the shape is rewritten in place. The
+    file is extended in steps, up to max_rows rows, and truncated to the
+    written rows on close.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dtype: np.dtype,
+        shape: tuple = (),
+        max_rows: Optional[int] = None,
+    ) -> ...:
+        self._dtype = dtype
+        self._shape = shape
+        self._max_rows = max_rows
+        self._row_bytes = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+        self._file = open(path, "w+b")
+        self._array = None
+        self._capacity = 0
+        self._length = 0
+        self._write_header()
+        self._file.flush()  # Readable as an empty array before the first flush
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, row, grow: int) -> ...:
+        """Write a row, extend the file by grow rows when it is full"""
+        if self._length == self._capacity:
+            capacity = self._capacity + grow
+            if self._max_rows is not None:
+                capacity = min(capacity, self._max_rows)
+            self._resize(capacity)
+        self._array[self._length] = row
+        self._length += 1
+
+    def flush(self) -> ...:
+        """Write the mapped rows and the header with the written rows"""
+        if self._array is not None:
+            self._array.flush()
+        self._write_header()
+        self._file.flush()
+
+    def close(self) -> ...:
+        """Flush, then truncate the file to the written rows and close it"""
+        if self._file.closed:
+            return
+        try:
+            self.flush()
+            self._array = None
+            self._file.truncate(NPY_HEADER_SIZE + self._length * self._row_bytes)
+        finally:
+            self._file.close()
+
+    def _resize(self, capacity: int) -> ...:
+        if self._array is not None:
+            self._array.flush()
+            self._array = None  # Unmap before the file changes size
+        self._file.truncate(NPY_HEADER_SIZE + capacity * self._row_bytes)
+        self._array = np.memmap(
+            self._file,
+            dtype=self._dtype,
+            mode="r+",
+            offset=NPY_HEADER_SIZE,
+            shape=(capacity,) + self._shape,
+        )
+        self._capacity = capacity
+        self._write_header()
+
+    def _write_header(self) -> ...:
+        header = repr({
+            "descr": np.lib.format.dtype_to_descr(self._dtype),
+            "fortran_order": False,
+            "shape": (self._length,) + self._shape,
+        }).encode("latin1")
+        padding = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - len(header) - 1
+        if padding < 0:
+            raise ValueError(f"The .npy header is longer than {NPY_HEADER_SIZE} bytes")
+        header += b" " * padding + b"\n"
+        self._file.seek(0)
+        self._file.write(NPY_MAGIC + len(header).to_bytes(2, "little") + header)
@@ -0,0 +1,139 @@
+from typing import NamedTuple
+import numpy as np
+
+
+class WaveformMeasurements(NamedTuple):
+    """Measurements of traces, every field has the shape of the batch
+
+    Frequency, period, duty cycle and rise time are NaN for traces with
+    fewer than two rising edges (one rising edge for the rise time).
+    """
+
+    minimum: np.ndarray
+    """The lowest sample in V."""
+    maximum: np.ndarray
+    """The highest sample in V."""
+    vpp: np.ndarray
+    """The peak to peak voltage in V."""
+    mean: np.ndarray
+    """The mean voltage in V."""
+    rms: np.ndarray
+    """The root mean square voltage in V, including the mean."""
+    frequency: np.ndarray
+    """The frequency in Hz."""
+    period: np.ndarray
+    """The period in s, the mean over the whole periods in the trace."""
+    duty_cycle: np.ndarray
+    """The part of the whole periods above the middle level, 0 to 1."""
+    rise_time: np.ndarray
+    """The mean time in s from 10% to 90% of the rising edges."""
+
+
+def measure_waveforms(
+    samples: np.ndarray, sample_period: float, scale: float = 1.0
+) -> WaveformMeasurements:
+    """Measure a trace or a batch of traces in a few vectorized passes
+
+    The edges are found with a Schmitt trigger between 10% and 90% of the
+    peak to peak range of every trace, so noise smaller than 80% of the
+    range does not count as an edge. A rising edge starts at the last
+    sample at or below 10% and ends at the first sample at or above 90%,
+    both crossings are interpolated linearly between samples. The period
+    is the time between the 90% crossings of the first and last rising
+    edge divided by the number of periods between them.
+
+    Parameters
+    ----------
+    samples : np.ndarray
+        The samples in ADC counts, shape (..., samples) with the samples of
+        a trace on the last axis, f.e. (sweeps, channels, 1024)
+    sample_period : float
+        The time between two samples in s
+    scale : float
+        The voltage of one ADC count, see Oscilloscope.measure
+
+    Returns
+    -------
+    WaveformMeasurements
+        The measurements, every field of shape samples.shape[:-1]
+    """
+    x = np.asarray(samples, dtype=np.float64, order="C")
+    if x.ndim < 1 or x.shape[-1] < 2:
+        raise ValueError(f"Invalid samples shape: {x.shape}")
+    batch, n = x.shape[:-1], x.shape[-1]
+    rows = x.reshape(-1, n)
+    minimum = rows.min(axis=1)
+    maximum = rows.max(axis=1)
+    vpp = maximum - minimum
+    total = rows.sum(axis=1)
+    squares = np.einsum("ij,ij->i", rows, rows)
+
+    # Schmitt trigger events, 1 at or above the high level and -1 at or below
+    # the low level. A flat trace is both, so it has no events. Only the
+    # events are visited further, in the flat order of all rows.
+    low = minimum + 0.1 * vpp
+    high = minimum + 0.9 * vpp
+    state = (rows >= high[:, None]).view(np.int8)
+    state -= (rows <= low[:, None]).view(np.int8)
+    events = np.flatnonzero(state)
+    kinds = state.ravel()[events]
+    event_rows = events // n
+    # A rising edge is a low event followed by a high event in the same row,
+    # the samples between them are between the levels
+    edge = np.flatnonzero(
+        (kinds[:-1] < 0) & (kinds[1:] > 0) & (event_rows[:-1] == event_rows[1:])
+    )
+    start = events[edge]
+    end = events[edge + 1]
+    edge_rows = event_rows[edge]
+    flat = rows.ravel()
+    high_crossing = end - 1 + (high[edge_rows] - flat[end - 1]) / (
+        flat[end] - flat[end - 1]
+    )
+    low_crossing = start + (low[edge_rows] - flat[start]) / (
+        flat[start + 1] - flat[start]
+    )
+    edges = np.bincount(edge_rows, minlength=len(rows))
+    rise = np.bincount(edge_rows, high_crossing - low_crossing, minlength=len(rows))
+
+    # The first and last edge of every row, the edges are in flat order
+    last = np.cumsum(edges) - 1
+    first = last - edges + 1
+    periodic = edges > 1
+    last = np.where(periodic, last, 0)
+    first = np.where(periodic, first, 0)
+    high_crossing = np.append(high_crossing, np.nan)  # Index 0 without edges
+    end = np.append(end, 0)
+    row_start = np.arange(len(rows)) * n
+    first_end = end[first] - row_start
+    last_end = end[last] - row_start
+
+    # Samples above the middle level in the whole periods, from the sample
+    # ending the first rising edge up to the one ending the last
+    index = np.arange(n)
+    above = np.count_nonzero(
+        (rows >= (minimum + 0.5 * vpp)[:, None])
+        & (index >= first_end[:, None])
+        & (index < last_end[:, None]),
+        axis=1,
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        period = np.where(
+            periodic,
+            (high_crossing[last] - high_crossing[first]) / (edges - 1),
+            np.nan,
+        )
+        duty_cycle = np.where(periodic, above / (last_end - first_end), np.nan)
+        rise = np.where(edges > 0, rise / edges, np.nan)
+
+    return WaveformMeasurements(
+        minimum=(minimum * scale).reshape(batch),
+        maximum=(maximum * scale).reshape(batch),
+        vpp=(vpp * scale).reshape(batch),
+        mean=(total / n * scale).reshape(batch),
+        rms=(np.sqrt(squares / n) * scale).reshape(batch),
+        frequency=(1 / (period * sample_period)).reshape(batch),
+        period=(period * sample_period).reshape(batch),
+        duty_cycle=duty_cycle.reshape(batch),
+        rise_time=(rise * sample_period).reshape(batch),
+    )
@@ -0,0 +1,78 @@
+from collections import Counter
+import click
+from .utils.gcode_lint import iter_issues
+from .utils.gcode_parser import GcodeParser
+from .utils.preflight import preflight as preflight_program
+from .utils.program_cache import GcodeProgramCache
+
+
+@click.group()
+def gcode():
+    """G-code command group."""
+    pass
+
+
+@gcode.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--max-issues", type=int, default=None, help="Stop after N issues.")
+@click.option("--quiet/--no-quiet", default=False, help="Only print the summary.")
+def validate(path: str, max_issues: int, quiet: bool):
+    """Check a G-code program and exit non-zero if it has problems."""
+    reasons = Counter()
+    lines = set()
+    for issue in iter_issues(path):
+        if not quiet:
+            click.echo(f"{path}:{issue}")
+        reasons[issue.reason] += 1
+        lines.add(issue.line)
+        if max_issues is not None and sum(reasons.values()) >= max_issues:
+            break
+
+    if not reasons:
+        click.echo(f"{path}: no issues found")
+        return
+
+    click.echo(
+        f"{path}: {sum(reasons.values())} issues on {len(lines)} lines", err=True
+    )
+    for reason, count in reasons.most_common():
+        click.echo(f"  {count:>8}  {reason}", err=True)
+    raise SystemExit(1)
+
+
+@gcode.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--quiet/--no-quiet", default=False, help="Only print the summary.")
+@click.option(
+    "--cache",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Keep the compiled program in this cache directory.",
+)
+def preflight(path: str, quiet: bool, cache: str):
+    """Check a G-code program against the soft limits and maximum speeds."""
+    if cache is None:
+        program = GcodeParser.compile_program(path)
+    else:
+        program_cache = GcodeProgramCache(cache)
+        program = program_cache.compile(path)
+        click.echo(f"{path}: cache {'hit' if program_cache.hits else 'miss'}")
+    report = preflight_program(program)
+    if not quiet:
+        for issue in report.issues:
+            click.echo(f"{path}:{issue}")
+
+    click.echo(
+        f"{path}: {report.moves} moves, estimated job time {report.job_time:.1f} s"
+    )
+    for axis, (low, high) in report.bounds.items():
+        if low != high:
+            click.echo(f"  {axis}  {low:>10.3f} .. {high:.3f}")
+    if not report.ok:
+        lines = len(set(issue.line for issue in report.issues))
+        click.echo(f"{path}: {len(report.issues)} issues on {lines} lines", err=True)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    gcode()
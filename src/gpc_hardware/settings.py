@@ -32,7 +32,8 @@ class Settings:
 
         # Create the path to file
         self._filename = filename
-        path = os.path.dirname(os.path.abspath(__file__)) + "\\" + self._filename
+        directory = os.path.dirname(os.path.abspath(__file__))
+        path = os.path.join(directory, self._filename)
 
         # Check if the file exists
         if not self._file_exists(path):
@@ -142,7 +143,7 @@ class Settings:
         """Save the settings to the file."""
         if filename is None:
             filename = self._filename
-        path = os.path.dirname(os.path.abspath(__file__)) + "\\" + filename
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
         with open(path, "w") as configfile:
             self._config.write(configfile)
 
@@ -10,7 +10,12 @@ When a new command is added to the system the command should be added to this di
 it will not be allowed by the Gcode parser.
 
 Only movement commands and attributes are allowed to have a symbol that is one single letter.
-Movement commands are not allowed to have attributes
+Movement commands are not allowed to have attributes, except for the arc moves (G2, G3)
+which take the arc center offset (I, J) or the radius (R) after their axes. The J of an
+arc is parsed as an attribute of the arc even though J is also a movement axis.
+
+The macro commands in MACRO_COMMANDS are expanded into the gcode lines defined in the
+settings, their attributes are the parameters of the macro (see macro_engine.py).
 
 """
 
@@ -18,9 +23,19 @@ ACCEPTED_ATTRIBUTES = ('S', 'I', 'R', 'A')
 ACCEPTED_AXES = ('X', 'Y', 'Z', 'H', 'J', 'K', 'L', 'N', 'O', 'P')
 ACCEPTED_LINEAR_AXES = ('X', 'Y', 'Z', 'H', 'J', 'K',)
 ACCEPTED_ROTATIONAL_AXES = ('L',)
+ACCEPTED_ARC_AXES = ('X', 'Y', 'Z')
+MACRO_COMMANDS = ('M814', 'M815')
 ACCEPTED_COMMANDS = {
     'G0' : {'ACCEPTED_AXES': ACCEPTED_LINEAR_AXES},
     'G1' : {'ACCEPTED_AXES': ACCEPTED_ROTATIONAL_AXES},
+    'G2' : {'ACCEPTED_AXES': ACCEPTED_ARC_AXES,
+            'I': [int, float],
+            'J': [int, float],
+            'R': [int, float]},
+    'G3' : {'ACCEPTED_AXES': ACCEPTED_ARC_AXES,
+            'I': [int, float],
+            'J': [int, float],
+            'R': [int, float]},
     'G28' : {},
     'G90' : {},
     'G91' : {},
@@ -37,8 +52,14 @@ ACCEPTED_COMMANDS = {
     'M811' : {'ACCEPTED_AXES': ACCEPTED_AXES},
     'M812' : {'ACCEPTED_AXES': ACCEPTED_AXES},
     'M813' : {'ACCEPTED_AXES': ACCEPTED_AXES},
-    'M814' : {'S': {int}},
-    'M815' : {'S': {int}},  # Free for new macro commands
+    'M814' : {'S': [int, float],
+              'I': [int, float],
+              'R': [int, float],
+              'A': [int, float]},
+    'M815' : {'S': [int, float],
+              'I': [int, float],
+              'R': [int, float],
+              'A': [int, float]},  # Free for new macro commands
     # 'M816' : {},
     # 'M817' : {},
     # 'M818' : {},
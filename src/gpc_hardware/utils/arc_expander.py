@@ -0,0 +1,482 @@
+"""
+Linearization of arc moves (G2 clockwise, G3 counterclockwise).
+
+An arc lies in the XY plane and is given by its end position and either the
+offset of the center from the start (I, J) or the radius (R, negative for
+arcs of more than half a turn). A Z value turns the arc into a helix. Every
+arc is replaced by G0 moves along chords of the arc, the number of chords is
+the smallest number that keeps every chord within the chord tolerance of the
+arc. The radius changes linearly along the arc when the end is not on the
+circle through the start, the last chord always ends at the exact end.
+
+Programs are expanded in batch with expand_program, which computes the
+points of all arcs of the program at once. Parsed lines are expanded while
+streaming with ArcExpander, which computes the points of one arc at a time.
+"""
+import copy
+from typing import Iterable, Iterator, Optional, Tuple
+import numpy as np
+
+try:
+    from .accepted_gcode import ACCEPTED_ARC_AXES
+    from .gcode_program import GcodeProgram
+    from .machine_state import ARC_COMMANDS, GcodeMachineState, move_starts
+except ImportError:
+    from .accepted_gcode import ACCEPTED_ARC_AXES
+    from .gcode_program import GcodeProgram
+    from .machine_state import ARC_COMMANDS, GcodeMachineState, move_starts
+
+
+LINE_COMMAND = "G0"
+
+
+def linearize_arc(
+    start: Iterable[float],
+    end: Iterable[float],
+    tolerance: float,
+    clockwise: bool = True,
+    offset: Optional[Tuple[float, float]] = None,
+    radius: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Get the points of the chords of a single arc.
+
+    Parameters
+    ----------
+    start : iterable of float
+        The X, Y and Z position before the arc.
+    end : iterable of float
+        The absolute X, Y and Z position at the end of the arc.
+    tolerance : float
+        The maximum distance between a chord and the arc.
+    clockwise : bool
+        True for G2, False for G3.
+    offset : tuple of float, optional
+        The offset of the center from the start (I, J).
+    radius : float, optional
+        The radius of the arc (R), negative for arcs of more than half a turn.
+
+    Raises
+    ------
+    ValueError:
+        If the arc is not valid, see expand_program.
+
+    Returns
+    -------
+    np.ndarray
+        The end point of every chord, shape (chords, 3).
+
+    """
+    _check_tolerance(tolerance)
+    starts = np.array([start], dtype=float)
+    ends = np.array([end], dtype=float)
+    offsets = np.array([offset if offset is not None else (np.nan, np.nan)], float)
+    radii = np.array([radius if radius is not None else np.nan], dtype=float)
+    geometry = _arc_geometry(starts[:, :2], ends[:, :2], offsets, radii, [clockwise])
+    return _arc_points(starts, ends, geometry, tolerance)[1]
+
+
+def expand_program(
+    program: GcodeProgram,
+    tolerance: float,
+    state: Optional[GcodeMachineState] = None,
+) -> Tuple[GcodeProgram, int]:
+    """
+    Replace the arcs of a compiled program by G0 moves.
+
+    The moves of an arc keep the line number and the positioning mode of the
+    arc: absolute positions in absolute mode, the moves from point to point
+    in relative mode. They give X and Y, and Z if the arc gives Z.
+
+    Parameters
+    ----------
+    program : GcodeProgram
+        The compiled program.
+    tolerance : float
+        The maximum distance between a chord and the arc.
+    state : GcodeMachineState, optional
+        The state of the machine before the program (not changed), a new
+        state if not given.
+
+    Raises
+    ------
+    KeyError:
+        If the state has no position for one of the arc axes.
+    ValueError:
+        If an arc gives both or neither of the center offset and the radius,
+        has no radius or can not reach its end with the given radius.
+
+    Returns
+    -------
+    tuple
+        The expanded program and the number of moves that replace the arcs.
+
+    """
+    _check_tolerance(tolerance)
+    state = GcodeMachineState() if state is None else copy.deepcopy(state)
+    initial = state.position_vector
+    moves = state.run_program(program)
+    codes = np.ascontiguousarray(program.commands["command"])[moves.rows]
+    clockwise = _rows_of(program, codes, "G2")
+    is_arc = clockwise | _rows_of(program, codes, "G3")
+    if not is_arc.any():
+        return program, 0
+
+    columns = _arc_columns(state)
+    arc_moves = np.flatnonzero(is_arc)
+    arc_rows = moves.rows[arc_moves]
+    starts = move_starts(program, moves, initial)[arc_moves][:, columns]
+    ends = moves.positions[arc_moves][:, columns]
+    offsets = np.column_stack(
+        (_word(program, "I")[arc_rows], _word(program, "J")[arc_rows])
+    )
+    radii = _word(program, "R")[arc_rows]
+    lines = program.lines[arc_rows]
+    geometry = _arc_geometry(
+        starts[:, :2], ends[:, :2], offsets, radii, clockwise[arc_moves], lines
+    )
+    counts, points = _arc_points(starts, ends, geometry, tolerance)
+
+    # Every arc row is repeated once per chord, the other rows are kept.
+    repeats = np.ones(len(program), dtype=np.int64)
+    repeats[arc_rows] = counts
+    new_first = np.cumsum(repeats) - repeats
+    first = np.cumsum(counts) - counts
+    arc_of_point = np.repeat(np.arange(len(counts)), counts)
+    point_rows = new_first[arc_rows][arc_of_point] + (
+        np.arange(len(points)) - first[arc_of_point]
+    )
+
+    table = np.repeat(program.commands, repeats)
+    table["command"][point_rows] = program.command_code(LINE_COMMAND)
+    for axis in program.axes:
+        table[axis][point_rows] = np.nan
+    previous = np.empty_like(points)
+    previous[1:] = points[:-1]
+    previous[first] = starts
+    absolute = moves.absolute[arc_moves][arc_of_point]
+    values = np.where(absolute[:, None], points, points - previous)
+    for i, axis in enumerate(ACCEPTED_ARC_AXES):
+        if axis not in program.axes:
+            continue
+        if i < 2:
+            table[axis][point_rows] = values[:, i]
+        else:
+            given = ~np.isnan(program.axis(axis)[arc_rows])[arc_of_point]
+            table[axis][point_rows[given]] = values[given, i]
+
+    # The I, J and R words of the arcs are dropped.
+    replaced = np.zeros(len(program), dtype=bool)
+    replaced[arc_rows] = True
+    attributes = program.attributes[~replaced[program.attributes["row"]]]
+    attributes["row"] = new_first[attributes["row"]]
+    result = GcodeProgram(table, attributes, program.command_names, program.axes)
+    return result, len(points)
+
+
+class ArcExpander:
+    """
+    Streaming expander of the arcs in parsed gcode lines.
+
+    Every arc is replaced by G0 moves as soon as it is fed, all other
+    commands are passed through unchanged.
+
+    Examples
+    --------
+    >>> expander = ArcExpander(tolerance=0.01)
+    >>> for line_number, commands in expander.expand(
+    ...     GcodeParser.parse_stream('part.gcode')
+    ... ):
+    ...     ...
+
+    """
+
+    def __init__(
+        self, tolerance: float, state: Optional[GcodeMachineState] = None
+    ) -> None:
+        """
+        Initialize the expander.
+
+        Parameters
+        ----------
+        tolerance : float
+            The maximum distance between a chord and the arc.
+        state : GcodeMachineState, optional
+            The state of the machine before the first line, it is updated
+            while expanding. A new state if not given.
+
+        Raises
+        ------
+        KeyError:
+            If the state has no position for one of the arc axes.
+
+        """
+        _check_tolerance(tolerance)
+        self._tolerance = tolerance
+        self._state = GcodeMachineState() if state is None else state
+        self._columns = _arc_columns(self._state)
+        self._arcs = 0
+        self._moves = 0
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return "ArcExpander(tolerance={}, arcs={}, moves={})".format(
+            self._tolerance, self._arcs, self._moves
+        )
+
+    # PROPERTIES
+    @property
+    def tolerance(self) -> float:
+        """The maximum distance between a chord and the arc."""
+        return self._tolerance
+
+    @property
+    def arcs(self) -> int:
+        """The number of expanded arcs."""
+        return self._arcs
+
+    @property
+    def moves(self) -> int:
+        """The number of moves that replaced the arcs."""
+        return self._moves
+
+    # PUBLIC FUNCTIONS
+    def feed(self, line_number: int, commands: dict) -> list:
+        """
+        Add the parsed commands of a line.
+
+        Parameters
+        ----------
+        line_number : int
+            The line number of the commands.
+        commands : dict
+            The parsed commands, f.e. from GcodeParser.parse_gcode_line.
+
+        Raises
+        ------
+        ValueError:
+            If an arc is not valid, see expand_program.
+
+        Returns
+        -------
+        list
+            The line number and a dict with a single command of every
+            resulting command, in program order.
+
+        """
+        out = []
+        state = self._state
+        for command, values in commands.items():
+            if command not in ARC_COMMANDS:
+                state.execute(command, values)
+                out.append((line_number, {command: values}))
+                continue
+
+            start = state.position_vector[self._columns]
+            state.execute(command, values)
+            end = state.position_vector[self._columns]
+            offset = (values.get("I", np.nan), values.get("J", np.nan))
+            radius = values.get("R", np.nan)
+            geometry = _arc_geometry(
+                start[None, :2],
+                end[None, :2],
+                np.array([offset], dtype=float),
+                np.array([radius], dtype=float),
+                [command == "G2"],
+                [line_number],
+            )
+            points = _arc_points(start[None], end[None], geometry, self._tolerance)[1]
+            if not state.absolute:
+                points = np.diff(np.vstack((start, points)), axis=0)
+            if "Z" in values:
+                out.extend(
+                    [
+                        (line_number, {LINE_COMMAND: {"X": x, "Y": y, "Z": z}})
+                        for x, y, z in points.tolist()
+                    ]
+                )
+            else:
+                out.extend(
+                    [
+                        (line_number, {LINE_COMMAND: {"X": x, "Y": y}})
+                        for x, y, _ in points.tolist()
+                    ]
+                )
+            self._arcs += 1
+            self._moves += len(points)
+        return out
+
+    def expand(self, parsed: Iterable[tuple]) -> Iterator[tuple]:
+        """
+        Expand the arcs in parsed lines.
+
+        Parameters
+        ----------
+        parsed : iterable
+            Tuples starting with the line number and ending with the dict of
+            parsed commands, f.e. the output of GcodeParser.parse_stream.
+
+        Yields
+        ------
+        tuple
+            The line number and a dict with a single command.
+
+        """
+        for item in parsed:
+            yield from self.feed(item[0], item[-1])
+
+
+def _check_tolerance(tolerance: float) -> ...:
+    """Check the chord tolerance."""
+    if not tolerance > 0:
+        raise ValueError("tolerance must be positive.")
+
+
+def _arc_columns(state: GcodeMachineState) -> list:
+    """Get the index of the arc axes in the position of a state."""
+    missing = [axis for axis in ACCEPTED_ARC_AXES if axis not in state.axes]
+    if missing:
+        raise KeyError("Axis {} has no position.".format(missing[0]))
+    return [state.axes.index(axis) for axis in ACCEPTED_ARC_AXES]
+
+
+def _rows_of(program: GcodeProgram, codes: np.ndarray, command: str) -> np.ndarray:
+    """Get a mask of the codes of a command."""
+    if command not in program.command_names:
+        return np.zeros(len(codes), dtype=bool)
+    return codes == program.command_code(command)
+
+
+def _word(program: GcodeProgram, word: str) -> np.ndarray:
+    """Get the values of a word per row, J of arcs is stored in the J column."""
+    if word in program.axes:
+        return np.ascontiguousarray(program.axis(word))
+    return program.attribute(word)
+
+
+def _arc_geometry(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    offsets: np.ndarray,
+    radii: np.ndarray,
+    clockwise: Iterable[bool],
+    lines: Optional[Iterable[int]] = None,
+) -> tuple:
+    """
+    Get the center, radii and angles of arcs in the XY plane.
+
+    Parameters
+    ----------
+    starts, ends : np.ndarray
+        The XY position before and after every arc, shape (arcs, 2).
+    offsets : np.ndarray
+        The I and J of every arc, NaN where not given, shape (arcs, 2).
+    radii : np.ndarray
+        The R of every arc, NaN where not given.
+    clockwise : iterable of bool
+        True for the G2 arcs.
+    lines : iterable of int, optional
+        The line number of every arc, used in the error messages.
+
+    Raises
+    ------
+    ValueError:
+        If an arc is not valid, see expand_program.
+
+    Returns
+    -------
+    tuple
+        The centers, the start radii, the end radii, the start angles and
+        the signed sweep angles of the arcs.
+
+    """
+    clockwise = np.asarray(clockwise, dtype=bool)
+    has_offset = ~np.all(np.isnan(offsets), axis=1)
+    has_radius = ~np.isnan(radii)
+    _check_arcs(has_offset == has_radius, lines, "needs either I and J or R")
+    centers = starts + np.where(np.isnan(offsets), 0.0, offsets)
+
+    if has_radius.any():
+        # The center is on the perpendicular bisector of the chord, on the
+        # right side of the chord for clockwise arcs of less than half a turn.
+        radius = radii[has_radius]
+        chord = ends[has_radius] - starts[has_radius]
+        length = np.hypot(chord[:, 0], chord[:, 1])
+        missing = np.zeros(len(radii), dtype=bool)
+        missing[has_radius] = length == 0
+        _check_arcs(missing, lines, "with R can not end at its start")
+        height2 = radius ** 2 - (length / 2) ** 2
+        too_short = np.zeros(len(radii), dtype=bool)
+        too_short[has_radius] = height2 < -1e-9 * radius ** 2
+        _check_arcs(too_short, lines, "radius is smaller than half its length")
+        side = np.where(clockwise[has_radius], 1.0, -1.0) * np.sign(radius)
+        scale = side * np.sqrt(np.maximum(height2, 0)) / length
+        centers[has_radius] = (
+            starts[has_radius]
+            + chord / 2
+            + scale[:, None] * np.column_stack((chord[:, 1], -chord[:, 0]))
+        )
+
+    start_vectors = starts - centers
+    end_vectors = ends - centers
+    start_radii = np.hypot(start_vectors[:, 0], start_vectors[:, 1])
+    _check_arcs(start_radii == 0, lines, "has no radius")
+    end_radii = np.hypot(end_vectors[:, 0], end_vectors[:, 1])
+    start_angles = np.arctan2(start_vectors[:, 1], start_vectors[:, 0])
+    sweeps = np.arctan2(end_vectors[:, 1], end_vectors[:, 0]) - start_angles
+    # An arc ending at its start is a full circle.
+    sweeps = np.where(clockwise & (sweeps >= 0), sweeps - 2 * np.pi, sweeps)
+    sweeps = np.where(~clockwise & (sweeps <= 0), sweeps + 2 * np.pi, sweeps)
+    return centers, start_radii, end_radii, start_angles, sweeps
+
+
+def _check_arcs(
+    invalid: np.ndarray, lines: Optional[Iterable[int]], reason: str
+) -> ...:
+    """Raise a ValueError for the first invalid arc."""
+    if invalid.any():
+        first = int(np.argmax(invalid))
+        if lines is None:
+            raise ValueError("The arc {}.".format(reason))
+        raise ValueError("Line {}: the arc {}.".format(int(lines[first]), reason))
+
+
+def _arc_points(
+    starts: np.ndarray, ends: np.ndarray, geometry: tuple, tolerance: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the chord end points of arcs.
+
+    Parameters
+    ----------
+    starts, ends : np.ndarray
+        The XYZ position before and after every arc, shape (arcs, 3).
+    geometry : tuple
+        The geometry of the arcs from _arc_geometry.
+    tolerance : float
+        The maximum distance between a chord and the arc.
+
+    Returns
+    -------
+    tuple
+        The number of chords of every arc and the chord end points of all
+        arcs in order, shape (chords, 3).
+
+    """
+    centers, start_radii, end_radii, start_angles, sweeps = geometry
+    # A chord spanning angle a is at most r * (1 - cos(a / 2)) from the arc.
+    radii = np.maximum(start_radii, end_radii)
+    max_angle = 2 * np.arccos(np.clip(1 - tolerance / radii, -1, 1))
+    counts = np.maximum(np.ceil(np.abs(sweeps) / max_angle), 1).astype(np.int64)
+
+    arc = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    fraction = (np.arange(len(arc)) - first[arc] + 1) / counts[arc]
+    angles = start_angles[arc] + sweeps[arc] * fraction
+    radius = start_radii[arc] + (end_radii - start_radii)[arc] * fraction
+    points = np.empty((len(arc), 3))
+    points[:, 0] = centers[arc, 0] + radius * np.cos(angles)
+    points[:, 1] = centers[arc, 1] + radius * np.sin(angles)
+    points[:, 2] = starts[arc, 2] + (ends - starts)[arc, 2] * fraction
+    points[first + counts - 1] = ends
+    return counts, points
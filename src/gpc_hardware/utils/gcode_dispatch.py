@@ -0,0 +1,323 @@
+"""
+Dispatch of parsed gcode commands to their handlers.
+
+The dispatcher maps every command id of accepted_gcode.py to a handler and an
+optional argument converter. Handlers are registered at startup, after which
+the table is built once. Executing a command is then a single dict lookup
+and a single call. Mistakes in the registrations (unknown or duplicate
+command ids) are raised while registering instead of while running a job.
+"""
+import functools
+from time import perf_counter_ns
+from typing import Union, Callable, Iterable, Optional
+
+try:
+    from . import accepted_gcode
+    from .gcode_parser import GcodeParser
+except ImportError:
+    from . import accepted_gcode
+    from .gcode_parser import GcodeParser
+
+
+class GcodeDispatchError(Exception):
+    """Exception raised when a command can not be registered or dispatched."""
+
+    def __init__(self, msg):
+        self._msg = msg
+
+
+class GcodeDispatcher:
+    """
+    Table mapping gcode command ids to their handlers.
+
+    A handler is called with the axis and attribute values of the command as
+    keyword arguments, f.e. ``G0 X5 Y1`` calls ``handler(X=5, Y=1)``. When a
+    converter is registered the keyword arguments are the dict returned by
+    the converter instead.
+
+    Examples
+    --------
+    >>> dispatcher = GcodeDispatcher()
+    >>> dispatcher.register('G0', move)
+    >>> dispatcher.register_app(app, ('M140', 'M105'))
+    >>> dispatcher.build()
+    >>> dispatcher.execute_line('G0 X5 M105')
+
+    """
+
+    def __init__(
+        self, accepted_commands: Optional[dict] = None, measure_latency: bool = True
+    ) -> None:
+        """
+        Initialize an empty dispatcher.
+
+        Parameters
+        ----------
+        accepted_commands : dict, optional
+            The commands that can get a handler, the ACCEPTED_COMMANDS of
+            accepted_gcode.py if not given.
+        measure_latency : bool
+            Measure the time of every dispatched command, see latency.
+
+        """
+        if accepted_commands is None:
+            accepted_commands = accepted_gcode.ACCEPTED_COMMANDS
+        self._accepted_commands = accepted_commands
+        self._measure_latency = measure_latency
+        self._handlers = {}
+        self._table = {}
+        self._built = False
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return "GcodeDispatcher(handlers={}, built={})".format(
+            len(self._handlers), self._built
+        )
+
+    def __len__(self) -> int:
+        return len(self._handlers)
+
+    def __contains__(self, command: str) -> bool:
+        return command in self._handlers
+
+    # PROPERTIES
+    @property
+    def built(self) -> bool:
+        """True when the dispatch table is built and no handlers can be added."""
+        return self._built
+
+    @property
+    def commands(self) -> tuple:
+        """The command ids with a handler."""
+        return tuple(self._handlers)
+
+    # PUBLIC FUNCTIONS
+    def register(
+        self,
+        command: str,
+        handler: Callable,
+        converter: Optional[Callable[[dict], dict]] = None,
+    ) -> ...:
+        """
+        Register the handler of a command.
+
+        Parameters
+        ----------
+        command : str
+            The command id, f.e. 'G0'.
+        handler : callable
+            Called with the values of the command as keyword arguments.
+        converter : callable, optional
+            Called with the dict of values of the command, the returned dict
+            is passed to the handler as keyword arguments.
+
+        Raises
+        ------
+        GcodeDispatchError:
+            If the table is already built, the command is not an accepted
+            command or the command already has a handler.
+
+        """
+        if self._built:
+            raise GcodeDispatchError(
+                "Can not register {}, the dispatch table is already built.".format(
+                    command
+                )
+            )
+        if command not in self._accepted_commands:
+            raise GcodeDispatchError(
+                "Can not register {}, it is not an accepted command.".format(command)
+            )
+        if command in self._handlers:
+            raise GcodeDispatchError(
+                "Command {} already has the handler {!r}.".format(
+                    command, self._handlers[command][0]
+                )
+            )
+        if not callable(handler):
+            raise TypeError("handler must be callable, not {}".format(type(handler)))
+        if converter is not None and not callable(converter):
+            raise TypeError(
+                "converter must be callable, not {}".format(type(converter))
+            )
+        self._handlers[command] = (handler, converter)
+
+    def handles(
+        self, *commands: str, converter: Optional[Callable[[dict], dict]] = None
+    ) -> Callable:
+        """
+        Decorator registering a function as handler of the given commands.
+
+        Examples
+        --------
+        >>> @dispatcher.handles('G90', 'G91')
+        ... def set_positioning(): ...
+
+        """
+
+        def decorator(handler):
+            for command in commands:
+                self.register(command, handler, converter)
+            return handler
+
+        return decorator
+
+    def register_app(self, app, commands: Optional[Iterable[str]] = None) -> ...:
+        """
+        Register an app as handler of commands.
+
+        The commands are dispatched to ``app.execute_command(command, **values)``.
+
+        Parameters
+        ----------
+        app : BaseApp
+            The app executing the commands.
+        commands : iterable of str, optional
+            The command ids handled by the app, the gcode_commands attribute
+            of the app if not given.
+
+        """
+        if commands is None:
+            commands = getattr(app, "gcode_commands", ())
+        for command in commands:
+            self.register(command, functools.partial(app.execute_command, command))
+
+    def build(self, require_all: bool = False) -> "GcodeDispatcher":
+        """
+        Build the dispatch table, no handlers can be added afterwards.
+
+        Parameters
+        ----------
+        require_all : bool
+            Require a handler for every accepted command.
+
+        Raises
+        ------
+        GcodeDispatchError:
+            If require_all is set and an accepted command has no handler.
+
+        Returns
+        -------
+        GcodeDispatcher
+            The dispatcher itself.
+
+        """
+        if require_all:
+            missing = [c for c in self._accepted_commands if c not in self._handlers]
+            if missing:
+                raise GcodeDispatchError(
+                    "No handler for the commands {}.".format(", ".join(missing))
+                )
+        # One entry per command so dispatching needs a single lookup, the
+        # latency counters are mutated in place: [count, total ns, max ns].
+        self._table = {
+            command: (handler, converter, [0, 0, 0])
+            for command, (handler, converter) in self._handlers.items()
+        }
+        self._built = True
+        return self
+
+    def dispatch(self, command: str, values: Optional[dict] = None) -> object:
+        """
+        Execute a single command.
+
+        Parameters
+        ----------
+        command : str
+            The command id.
+        values : dict, optional
+            The axis and attribute values of the command.
+
+        Raises
+        ------
+        GcodeDispatchError:
+            If the command has no handler or the table is not built.
+
+        Returns
+        -------
+        object
+            The return value of the handler.
+
+        """
+        try:
+            handler, converter, stats = self._table[command]
+        except KeyError:
+            raise self._dispatch_error(command) from None
+        if values is None:
+            values = {}
+        if converter is not None:
+            values = converter(values)
+
+        if not self._measure_latency:
+            return handler(**values)
+        start = perf_counter_ns()
+        result = handler(**values)
+        elapsed = perf_counter_ns() - start
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+        return result
+
+    def execute(self, commands: dict) -> list:
+        """
+        Execute the commands of a parsed line in order.
+
+        Parameters
+        ----------
+        commands : dict
+            The parsed commands, f.e. the output of
+            GcodeParser.parse_gcode_line.
+
+        Returns
+        -------
+        list
+            The return value of every handler.
+
+        """
+        dispatch = self.dispatch
+        return [dispatch(command, values) for command, values in commands.items()]
+
+    def execute_line(self, line: Union[str, bytes]) -> list:
+        """Parse a gcode line and execute its commands, see execute."""
+        return self.execute(GcodeParser.parse_gcode_line(line))
+
+    def latency(self) -> dict:
+        """
+        Get the measured latency of the dispatched commands.
+
+        The latency is the time from the start of the handler call until it
+        returns, the lookup and conversion are not included.
+
+        Returns
+        -------
+        dict
+            Per dispatched command id a dict with the number of calls and
+            the mean and maximum latency in seconds.
+
+        """
+        return {
+            command: {
+                "count": stats[0],
+                "mean": stats[1] / stats[0] * 1e-9,
+                "max": stats[2] * 1e-9,
+            }
+            for command, (_, _, stats) in self._table.items()
+            if stats[0]
+        }
+
+    def reset_latency(self) -> ...:
+        """Reset the latency measurements."""
+        for _, _, stats in self._table.values():
+            stats[:] = [0, 0, 0]
+
+    # PRIVATE FUNCTIONS
+    def _dispatch_error(self, command: str) -> GcodeDispatchError:
+        """Get the error for a command that is not in the dispatch table."""
+        if not self._built:
+            return GcodeDispatchError(
+                "Can not dispatch {}, the dispatch table is not built.".format(command)
+            )
+        if command in self._accepted_commands:
+            return GcodeDispatchError("Command {} has no handler.".format(command))
+        return GcodeDispatchError("Command {} is not known.".format(command))
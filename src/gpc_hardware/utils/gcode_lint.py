@@ -0,0 +1,330 @@
+"""
+Whole program validation of gcode.
+
+Instead of stopping at the first invalid entry like the parser, the linter
+walks through the complete program and collects every problem with its
+line, column, entry and reason. No exceptions are raised or caught for
+invalid entries, the numbers are checked with precompiled patterns. Lines
+using the Marlin forms (no spaces between the words, comments, N line numbers
+and checksums) are split with the lexer of the parser.
+"""
+import os
+import re
+from typing import Union, Iterable, Iterator, NamedTuple, Optional
+
+try:
+    from .gcode_parser import GcodeParser, GcodeParsingError, _AXIS, _ATTRIBUTE
+    from .gcode_parser import GcodeChecksumError, _TEXT_LEXER
+except ImportError:
+    from .gcode_parser import GcodeParser, GcodeParsingError, _AXIS, _ATTRIBUTE
+    from .gcode_parser import GcodeChecksumError, _TEXT_LEXER
+
+
+# Reasons of the issues
+UNKNOWN_COMMAND = "unknown command"
+EMPTY_ENTRY = "empty entry"
+BAD_NUMBER = "bad number"
+BAD_BOOLEAN = "bad boolean"
+ATTRIBUTE_NOT_ALLOWED = "attribute not allowed for command"
+AXIS_NOT_ALLOWED = "axis not allowed for command"
+MOVEMENT_NOT_ALLOWED = "command does not allow movement"
+MOVEMENT_AFTER_ATTRIBUTE = "movement after attribute"
+DUPLICATE_AXIS = "duplicate axis"
+MISSING_COMMAND = "entry before any command"
+UNSUPPORTED_TYPE = "unsupported attribute type"
+BAD_CHECKSUM = "bad checksum"
+UNCLOSED_COMMENT = "comment not closed"
+
+# Values accepted by int() and float() (without the rarely used underscores).
+_NUMBER = re.compile(
+    r"[+-]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|inf|infinity|nan)", re.IGNORECASE
+)
+_INTEGER = re.compile(r"[+-]?\d+")
+_BOOLEANS = frozenset(("0", "1", "true", "false"))
+# Lines the split on single spaces does not handle, these go through the lexer.
+_NEEDS_LEXER = re.compile(r"[;(*\t]|\s\s|^\s|\s$|[\d.][A-DF-Z]|^N")
+
+# Kinds of attribute values
+_FLOAT = 1
+_INT = 2
+_BOOL = 3
+_BYTES = 4
+_UNSUPPORTED = 5
+
+
+class GcodeIssue(NamedTuple):
+    """A problem found in a gcode program."""
+
+    line: int
+    column: int
+    token: str
+    reason: str
+
+    def __str__(self) -> str:
+        return "{}:{}: {} '{}'".format(self.line, self.column, self.reason, self.token)
+
+
+# Faster than GcodeIssue(...), which goes through a Python level __new__.
+_new_issue = tuple.__new__
+
+
+def _attribute_kind(types) -> int:
+    """Get the kind of value of an attribute from its allowed types."""
+    if float in types:
+        return _FLOAT
+    if int in types:
+        return _INT
+    if bool in types:
+        return _BOOL
+    if bytes in types:
+        return _BYTES
+    return _UNSUPPORTED
+
+
+class _LintTables:
+    """Lookup tables of the linter, built from the accepted commands."""
+
+    __slots__ = ("source", "commands")
+
+    def __init__(self, accepted_commands: dict) -> None:
+        self.source = accepted_commands
+        self.commands = {}
+        for command, spec in accepted_commands.items():
+            axes = spec.get("ACCEPTED_AXES")
+            kinds = {
+                attr: _attribute_kind(types)
+                for attr, types in spec.items()
+                if attr != "ACCEPTED_AXES"
+            }
+            self.commands[command] = (
+                frozenset(axes) if axes is not None else None,
+                kinds,
+            )
+
+
+_tables = None
+
+
+def _get_tables() -> _LintTables:
+    """Get the lint tables for the grammar currently used by the parser."""
+    global _tables
+    source = GcodeParser._grammar.source
+    if _tables is None or _tables.source is not source:
+        _tables = _LintTables(source)
+    return _tables
+
+
+def lint_line(line: str, line_number: int = 1, column: int = 1) -> list:
+    """
+    Collect all problems in a single gcode line.
+
+    Parameters
+    ----------
+    line : str
+        The gcode line without line ending.
+    line_number : int
+        The line number used in the issues.
+    column : int
+        The column of the first character of the line.
+
+    Returns
+    -------
+    list of GcodeIssue
+        The problems in the line, empty if the line is valid.
+
+    """
+    issues = []
+    _lint(line, line_number, column, _get_tables().commands, issues)
+    return issues
+
+
+def _lint(
+    line: str, line_number: int, column: int, commands: dict, issues: list
+) -> ...:
+    """Add the problems in a line to issues, see lint_line."""
+    heads = GcodeParser._grammar.heads
+    number = _NUMBER.fullmatch
+    integer = _INTEGER.fullmatch
+
+    current = None
+    allowed_axes = None
+    kinds = None
+    seen_axes = None  # Axes per command, only needed for repeated commands
+    axes = None
+    has_attribute = False
+
+    tokens = line.split(" ")
+    columns = None
+    if _NEEDS_LEXER.search(line) is not None:
+        try:
+            _, tokens, starts = _TEXT_LEXER.lex(line)
+        except GcodeParsingError as e:
+            token = line[e.column:].strip()
+            if isinstance(e, GcodeChecksumError) or token[:1] == "*":
+                reason = BAD_CHECKSUM
+            else:
+                reason = UNCLOSED_COMMENT
+            issues.append(
+                _new_issue(GcodeIssue, (line_number, column + e.column, token, reason))
+            )
+            return
+        columns = iter([column + start for start in starts])
+
+    for token in tokens:
+        if columns is None:
+            token_column = column
+            column += len(token) + 1
+        else:
+            token_column = next(columns)
+
+        spec = commands.get(token)
+        if spec is not None:
+            if current is not None:
+                if seen_axes is None:
+                    seen_axes = {}
+                seen_axes[current] = axes
+            current = token
+            allowed_axes, kinds = spec
+            axes = seen_axes.get(token) if seen_axes is not None else None
+            has_attribute = False
+            continue
+
+        head_spec = heads.get(token[:1])
+        if head_spec is None or len(token) < 2:
+            reason = EMPTY_ENTRY if not token else UNKNOWN_COMMAND
+            issues.append(
+                _new_issue(GcodeIssue, (line_number, token_column, token, reason))
+            )
+            continue
+
+        kind, head, _ = head_spec
+        data = token[1:]
+        reason = None
+        if (
+            kind == _AXIS
+            and (has_attribute or allowed_axes is None or head not in allowed_axes)
+            and current is not None
+            and head in kinds
+        ):
+            # The letter is an attribute of this command (f.e. J of G2).
+            kind = _ATTRIBUTE
+        if kind == _AXIS:
+            if not data.isdigit() and number(data) is None:
+                reason = BAD_NUMBER
+            elif current is None:
+                reason = MISSING_COMMAND
+            elif has_attribute:
+                reason = MOVEMENT_AFTER_ATTRIBUTE
+            elif allowed_axes is None:
+                reason = MOVEMENT_NOT_ALLOWED
+            elif head not in allowed_axes:
+                reason = AXIS_NOT_ALLOWED
+            elif axes is None:
+                axes = {head}
+            elif head in axes:
+                reason = DUPLICATE_AXIS
+            else:
+                axes.add(head)
+
+        elif current is None:  # Attribute before any command
+            reason = MISSING_COMMAND
+        else:
+            value_kind = kinds.get(head)
+            if value_kind is None:
+                reason = ATTRIBUTE_NOT_ALLOWED
+            else:
+                has_attribute = True
+                if value_kind == _FLOAT:
+                    # Values without a . are converted with int().
+                    if "." in data:
+                        if number(data) is None:
+                            reason = BAD_NUMBER
+                    elif integer(data) is None:
+                        reason = BAD_NUMBER
+                elif value_kind == _INT:
+                    # Values with a . are kept as text by the parser.
+                    if "." not in data and integer(data) is None:
+                        reason = BAD_NUMBER
+                elif value_kind == _BOOL:
+                    if data.lower() not in _BOOLEANS:
+                        reason = BAD_BOOLEAN
+                elif value_kind == _UNSUPPORTED:
+                    reason = UNSUPPORTED_TYPE
+
+        if reason is not None:
+            issues.append(
+                _new_issue(GcodeIssue, (line_number, token_column, token, reason))
+            )
+
+
+def iter_issues(
+    source: Union[str, os.PathLike, Iterable[Union[str, bytes]]]
+) -> Iterator[GcodeIssue]:
+    """
+    Lazily collect the problems in a gcode program.
+
+    Blank lines and comment lines (starting with ';') are skipped, like in
+    GcodeParser.parse_stream.
+
+    Parameters
+    ----------
+    source : str, os.PathLike or iterable
+        The path of a gcode file, an opened file object or any iterable of
+        str or bytes lines.
+
+    Yields
+    ------
+    GcodeIssue
+        The problems in program order.
+
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            yield from iter_issues(f)
+        return
+
+    commands = _get_tables().commands
+    issues = []
+    line_number = 0
+    for line in source:
+        line_number += 1
+        if not isinstance(line, str):
+            line = bytes(line).decode("utf-8", "replace")
+        stripped = line.strip()
+        if not stripped or stripped[0] == ";":
+            continue
+
+        _lint(stripped, line_number, 1, commands, issues)
+        if issues:
+            lead = len(line) - len(line.lstrip())
+            for issue in issues:
+                yield issue._replace(column=issue.column + lead) if lead else issue
+            issues.clear()
+
+
+def validate(
+    source: Union[str, os.PathLike, Iterable[Union[str, bytes]]],
+    max_issues: Optional[int] = None,
+) -> list:
+    """
+    Collect the problems in a gcode program.
+
+    Parameters
+    ----------
+    source : str, os.PathLike or iterable
+        The program, see iter_issues.
+    max_issues : int, optional
+        Stop after this many problems, all problems are collected if not given.
+
+    Returns
+    -------
+    list of GcodeIssue
+        The problems in program order, empty if the program is valid.
+
+    """
+    issues = []
+    for issue in iter_issues(source):
+        issues.append(issue)
+        if max_issues is not None and len(issues) >= max_issues:
+            break
+    return issues
@@ -1,17 +1,32 @@
-from typing import Union
+import copy
+import functools
+import hashlib
+import multiprocessing as mp
+import operator
+import os
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Union, Callable, Iterable, Iterator, Tuple, Optional
 
 try:
+    from . import accepted_gcode
     from .accepted_gcode import (
         ACCEPTED_COMMANDS,
         ACCEPTED_ATTRIBUTES,
         ACCEPTED_AXES,
     )
+    from .gcode_program import GcodeProgram
+    from .parsed_command import ParsedCommand
 except ImportError:
+    from . import accepted_gcode
     from .accepted_gcode import (
         ACCEPTED_COMMANDS,
         ACCEPTED_ATTRIBUTES,
         ACCEPTED_AXES,
     )
+    from .gcode_program import GcodeProgram
+    from .parsed_command import ParsedCommand
 
 
 class GcodeAttributeError(Exception):
@@ -28,6 +43,643 @@ class GcodeParsingError(Exception):
         self._msg = msg
 
 
+class GcodeChecksumError(GcodeParsingError):
+    """
+    Exception raised when the checksum of a line does not match.
+
+    The resend attribute is the N line number of the line, None if the line
+    has no line number.
+    """
+
+    def __init__(self, msg, resend=None):
+        super().__init__(msg)
+        self.args = (msg,)
+        self.resend = resend
+
+
+# Token kinds used by the lookup tables of the grammar.
+_AXIS = 1
+_ATTRIBUTE = 2
+
+
+def _convert_axis(data: str) -> Union[int, float]:
+    """Convert the value of a movement entry to an int or float."""
+    try:
+        if "." in data:
+            return float(data)
+        try:
+            return int(data)
+        except ValueError:
+            return float(data)
+    except ValueError:
+        raise _number_error(data) from None
+
+
+def _convert_axis_bytes(data: bytes) -> Union[int, float]:
+    """Convert the value of a movement entry to an int or float without decoding."""
+    try:
+        if 46 in data:  # ord("."), faster than b"." in data
+            return float(data)
+        try:
+            return int(data)
+        except ValueError:
+            return float(data)
+    except ValueError:
+        raise _number_error(data) from None
+
+
+def _text(entry: Union[str, bytes]) -> str:
+    """Get an entry as a string for error messages."""
+    if isinstance(entry, str):
+        return entry
+    return entry.decode("utf-8", "replace")
+
+
+def _number_error(data: Union[str, bytes]) -> GcodeAttributeError:
+    """Create the error of data that is not a valid number."""
+    return GcodeAttributeError("The data {} is not a valid number.".format(_text(data)))
+
+
+def _make_attribute_converter(types, text: bool = True) -> Callable:
+    """
+    Create the function converting the raw data of an attribute.
+
+    Parameters
+    ----------
+    types : list or set
+        The allowed data types of the attribute as given in accepted_gcode.py.
+    text : bool
+        True if the converter receives str data, False if it receives bytes.
+
+    Returns
+    -------
+    callable
+        Function converting the raw attribute data to the right type.
+
+    """
+    if text:
+        dot, zero, one, true, false = ".", "0", "1", "true", "false"
+    else:
+        dot, zero, one, true, false = 46, b"0", b"1", b"true", b"false"  # ord(".")
+
+    if int in types or float in types:
+        allow_float = float in types
+
+        def convert(data):
+            try:
+                if dot in data:
+                    # Data with a . stays a string when floats are not allowed.
+                    if allow_float:
+                        return float(data)
+                    return _text(data)
+                return int(data)
+            except ValueError:
+                raise _number_error(data) from None
+
+    elif bool in types:
+
+        def convert(data):
+            # Check if the data is given in text or numeric.
+            if data.isdigit():
+                if data == zero:
+                    return False
+                elif data == one:
+                    return True
+            elif data.lower() == true:
+                return True
+            elif data.lower() == false:
+                return False
+            raise GcodeAttributeError(
+                "The data {} is not a valid boolean.".format(_text(data))
+            )
+
+    elif bytes in types:
+
+        def convert(data):
+            return data.encode("utf-8") if text else bytes(data)
+
+    else:
+
+        def convert(data):
+            raise NotImplementedError(
+                "The data type {} is not implemented.".format(types)
+            )
+
+    return convert
+
+
+def _line_error(
+    error: Union[GcodeAttributeError, GcodeParsingError], line_number: int
+) -> Union[GcodeAttributeError, GcodeParsingError]:
+    """
+    Create a copy of a parsing error with the line number added.
+
+    Parameters
+    ----------
+    error : GcodeAttributeError or GcodeParsingError
+        The error raised while parsing the line.
+    line_number : int
+        The number of the line in the program.
+
+    Returns
+    -------
+    GcodeAttributeError or GcodeParsingError
+        Error of the same type and attributes (f.e. resend) with the line
+        number in the message and in the line_number attribute.
+
+    """
+    msg = str(error)
+    resend = getattr(error, "resend", None)
+    prefix = "Line N{}: ".format(resend)
+    if resend is not None and msg.startswith(prefix):
+        # Keep the N line number of a checksum error next to the line number.
+        msg = "Line {} (N{}): {}".format(line_number, resend, msg[len(prefix):])
+    else:
+        msg = "Line {}: {}".format(line_number, msg)
+    new_error = copy.copy(error)
+    new_error.args = (msg,)
+    new_error._msg = msg
+    new_error.line_number = line_number
+    return new_error
+
+
+def gcode_checksum(line: Union[str, bytes, bytearray]) -> int:
+    """
+    Get the Marlin checksum of a line, the xor of all its bytes.
+
+    Parameters
+    ----------
+    line : str, bytes or bytearray
+        The line up to the *, f.e. 'N12 G0 X1'.
+
+    Returns
+    -------
+    int
+        The checksum between 0 and 255.
+
+    """
+    if isinstance(line, str):
+        line = line.encode("utf-8")
+    return functools.reduce(operator.xor, line, 0)
+
+
+class _GcodeLexer:
+    """
+    Patterns splitting a line in words, compiled once for str or bytes lines.
+
+    The lexer handles the forms the split on single spaces does not: words
+    without spaces between them (G0X1Y2), repeated spaces and tabs, ';' and
+    '(...)' comments and Marlin N line numbers with a *checksum. Only chunks
+    made of number words are split, so chunks like Strue stay one word. E is
+    not a word letter, so numbers like X1E5 are not split.
+    """
+
+    __slots__ = (
+        "semicolon",
+        "star",
+        "parenthesis",
+        "comment",
+        "blank",
+        "checksum",
+        "chunk",
+        "words",
+        "word",
+        "line_number",
+    )
+
+    def __init__(self, text: bool) -> None:
+        """
+        Compile the patterns.
+
+        Parameters
+        ----------
+        text : bool
+            True for str lines, False for bytes lines.
+
+        """
+
+        def compile(pattern):
+            return re.compile(pattern if text else pattern.encode())
+
+        self.semicolon, self.star, self.parenthesis = (
+            (";", "*", "(") if text else (b";", b"*", b"(")
+        )
+        self.comment = compile(r"\([^)]*\)")
+        space = " " if text else b" "
+        # Comments are blanked out so the words keep their column.
+        self.blank = lambda match: space * len(match.group())
+        self.checksum = compile(r"\s*(\d+)\s*")
+        self.chunk = compile(r"\S+")
+        self.words = compile(r"(?:[A-DF-Z][-+]?(?:\d+\.?\d*|\.\d+))+")
+        self.word = compile(r"[A-DF-Z][-+]?(?:\d+\.?\d*|\.\d+)")
+        self.line_number = compile(r"N\d+")
+
+    def lex(self, line: Union[str, bytes]) -> Tuple[Optional[int], list, list]:
+        """
+        Split a line in words.
+
+        Parameters
+        ----------
+        line : str or bytes
+            The line, the type must match the lexer.
+
+        Raises
+        ------
+        GcodeChecksumError:
+            If the checksum does not match.
+        GcodeParsingError:
+            If the checksum is not a number or a comment is not closed. The
+            column attribute of the errors is the index of the problem.
+
+        Returns
+        -------
+        line_number : int or None
+            The N line number, None if the line has no line number.
+        words : list
+            The words of the line without comments and line number.
+        starts : list
+            The index of every word in the line.
+
+        """
+        end = line.find(self.semicolon)
+        if end >= 0:
+            line = line[:end]
+
+        star = line.find(self.star)
+        checksum = None
+        if star >= 0:
+            match = self.checksum.fullmatch(line, star + 1)
+            if match is None:
+                error = GcodeParsingError(
+                    "Checksum {} is not a number.".format(_text(line[star:].strip()))
+                )
+                error.column = star
+                raise error
+            checksum = int(match.group(1))
+            line = line[:star]
+            actual = gcode_checksum(line.lstrip())
+
+        if self.parenthesis in line:
+            line = self.comment.sub(self.blank, line)
+            if self.parenthesis in line:
+                error = GcodeParsingError(
+                    "Comment {} is not closed.".format(
+                        _text(line[line.find(self.parenthesis):].strip())
+                    )
+                )
+                error.column = line.find(self.parenthesis)
+                raise error
+
+        words = []
+        starts = []
+        for chunk_match in self.chunk.finditer(line):
+            chunk = chunk_match.group()
+            if self.words.fullmatch(chunk) is None:
+                words.append(chunk)
+                starts.append(chunk_match.start())
+                continue
+            offset = chunk_match.start()
+            for match in self.word.finditer(chunk):
+                words.append(match.group())
+                starts.append(offset + match.start())
+
+        line_number = None
+        if words and self.line_number.fullmatch(words[0]):
+            line_number = int(words[0][1:])
+            del words[0], starts[0]
+
+        if checksum is not None and checksum != actual:
+            msg = "Checksum {} does not match {}.".format(checksum, actual)
+            if line_number is not None:
+                msg = "Line N{}: {}".format(line_number, msg)
+            error = GcodeChecksumError(msg, line_number)
+            error.column = star
+            raise error
+        return line_number, words, starts
+
+
+_TEXT_LEXER = _GcodeLexer(True)
+_BYTES_LEXER = _GcodeLexer(False)
+
+
+def _split_lines(buffer: Union[bytes, bytearray, memoryview]) -> Iterator[bytes]:
+    """
+    Split a bytes buffer in lines, the line endings are kept.
+
+    Parameters
+    ----------
+    buffer : bytes, bytearray or memoryview
+        The buffer to split.
+
+    Yields
+    ------
+    bytes
+        The lines in the buffer.
+
+    """
+    if isinstance(buffer, memoryview):
+        buffer = buffer.tobytes()
+    find = buffer.find
+    size = len(buffer)
+    start = 0
+    while start < size:
+        end = find(b"\n", start) + 1
+        if end == 0:
+            end = size
+        yield buffer[start:end]
+        start = end
+
+
+def _chunk_bounds(source, size: int, n_chunks: int) -> list:
+    """
+    Get the start offsets of line aligned chunks of a program.
+
+    Parameters
+    ----------
+    source : bytes or binary file object
+        The program.
+    size : int
+        The size of the program in bytes.
+    n_chunks : int
+        The wanted number of chunks.
+
+    Returns
+    -------
+    list
+        The chunk boundaries, starting with 0 and ending with size.
+
+    """
+    bounds = [0]
+    for i in range(1, n_chunks):
+        target = size * i // n_chunks
+        if target <= bounds[-1]:
+            continue
+        if isinstance(source, bytes):
+            start = source.find(b"\n", target - 1) + 1
+        else:
+            source.seek(target - 1)
+            source.readline()
+            start = source.tell()
+        if bounds[-1] < start < size:
+            bounds.append(start)
+    bounds.append(size)
+    return bounds
+
+
+def _parse_chunk(task: tuple) -> tuple:
+    """
+    Parse one chunk of a program, runs in the worker processes.
+
+    Parameters
+    ----------
+    task : tuple
+        The path or bytes of the chunk, the start and end offset of the chunk
+        and whether to compile the chunk.
+
+    Returns
+    -------
+    tuple
+        The number of lines in the chunk, the chunk line number and the
+        error of the line (None if there was no error) and the parsed chunk.
+
+    """
+    source, start, end, compile = task
+    if isinstance(source, bytes):
+        data = source
+    else:
+        with open(source, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+
+    n_lines = data.count(b"\n")
+    if data and data[-1:] != b"\n":
+        n_lines += 1
+
+    try:
+        if compile:
+            parsed = GcodeParser.compile_program(data)
+        else:
+            parsed = list(GcodeParser.parse_buffer(data))
+    except (GcodeAttributeError, GcodeParsingError) as e:
+        return n_lines, (e.line_number, e.__cause__), None
+    return n_lines, None, parsed
+
+
+class _GcodeGrammar:
+    """
+    Lookup tables built once from the accepted_gcode definitions.
+
+    The tables allow the parser to classify and convert every entry with
+    a constant number of dict lookups instead of scanning the definitions.
+    Every table has a copy keyed on the bytes form of the symbols, so bytes
+    lines are parsed without decoding them first.
+
+    The version is a hash of the definitions, it changes whenever a command,
+    axis or attribute is added, removed, reordered or gets other types.
+    """
+
+    __slots__ = (
+        "source",
+        "version",
+        "commands",
+        "heads",
+        "bytes_commands",
+        "bytes_heads",
+    )
+
+    def __init__(
+        self, accepted_commands: dict, accepted_axes: tuple, accepted_attributes: tuple
+    ) -> None:
+        """
+        Build the lookup tables.
+
+        Parameters
+        ----------
+        accepted_commands : dict
+            The accepted commands and their attributes.
+        accepted_axes : tuple
+            The accepted movement axes.
+        accepted_attributes : tuple
+            The accepted attribute symbols.
+
+        """
+        self.source = accepted_commands
+        definitions = (
+            [
+                (
+                    command,
+                    [
+                        (attr, [getattr(t, "__name__", t) for t in types])
+                        for attr, types in spec.items()
+                    ],
+                )
+                for command, spec in accepted_commands.items()
+            ],
+            list(accepted_axes),
+            list(accepted_attributes),
+        )
+        self.version = hashlib.sha256(repr(definitions).encode()).hexdigest()[:16]
+
+        # Kind, symbol and value converter of an entry by its first letter.
+        self.heads = {}
+        self.bytes_heads = {}
+        for axis in accepted_axes:
+            self.heads[axis] = (_AXIS, axis, _convert_axis)
+            self.bytes_heads[axis.encode()] = (_AXIS, axis, _convert_axis_bytes)
+        for attr in accepted_attributes:
+            self.heads[attr] = (_ATTRIBUTE, attr, None)
+            self.bytes_heads[attr.encode()] = (_ATTRIBUTE, attr, None)
+
+        # Command id, allowed axes (None if movement is not allowed) and
+        # attribute converters.
+        self.commands = {}
+        self.bytes_commands = {}
+        for command, spec in accepted_commands.items():
+            axes = spec.get("ACCEPTED_AXES")
+            axes = frozenset(axes) if axes is not None else None
+            for text, table, key in (
+                (True, self.commands, command),
+                (False, self.bytes_commands, command.encode()),
+            ):
+                converters = {
+                    attr: _make_attribute_converter(types, text)
+                    for attr, types in spec.items()
+                    if attr != "ACCEPTED_AXES"
+                }
+                table[key] = (command, axes, converters)
+
+
+class GcodeParseCache:
+    """
+    Bounded least recently used cache of parsed gcode lines.
+
+    The cache is keyed on the raw line (str and bytes lines are cached
+    separately). The cached results are never handed out, every hit
+    returns a copy so callers can not change the cached commands.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        """
+        Initialize the cache.
+
+        Parameters
+        ----------
+        maxsize : int
+            The maximum number of lines in the cache.
+
+        Raises
+        ------
+        TypeError:
+            If the maxsize is not an integer.
+        ValueError:
+            If the maxsize is smaller than 1.
+
+        """
+        if not isinstance(maxsize, int):
+            raise TypeError(
+                "maxsize must be an integer, not type {}".format(type(maxsize))
+            )
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1, not {}".format(maxsize))
+
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def maxsize(self) -> int:
+        """The maximum number of lines in the cache."""
+        return self._maxsize
+
+    @property
+    def hits(self) -> int:
+        """The number of lookups that were found in the cache."""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """The number of lookups that were not found in the cache."""
+        return self._misses
+
+    @property
+    def evictions(self) -> int:
+        """The number of lines removed to make room for new lines."""
+        return self._evictions
+
+    def get(self, line: Union[str, bytes]) -> Optional[dict]:
+        """
+        Get a copy of the parsed commands of a line.
+
+        Parameters
+        ----------
+        line : str or bytes
+            The raw gcode line.
+
+        Returns
+        -------
+        commands : dict or None
+            A copy of the cached commands or None if the line is not cached.
+
+        """
+        with self._lock:
+            commands = self._entries.get(line)
+            if commands is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(line)
+            self._hits += 1
+        return {command: attrs.copy() for command, attrs in commands.items()}
+
+    def put(self, line: Union[str, bytes], commands: dict) -> ...:
+        """
+        Add the parsed commands of a line to the cache.
+
+        Parameters
+        ----------
+        line : str or bytes
+            The raw gcode line.
+        commands : dict
+            The parsed commands, stored as a copy.
+
+        """
+        commands = {command: attrs.copy() for command, attrs in commands.items()}
+        with self._lock:
+            self._entries[line] = commands
+            self._entries.move_to_end(line)
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self) -> ...:
+        """Remove all lines from the cache, the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def info(self) -> dict:
+        """
+        Get the statistics of the cache.
+
+        Returns
+        -------
+        dict
+            The hits, misses, evictions, current size and maxsize.
+
+        """
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "size": len(self._entries),
+            "maxsize": self._maxsize,
+        }
+
+
 class GcodeParser:
     """
     Class to manage the parsing of gcode lines from the main code.
@@ -35,24 +687,100 @@ class GcodeParser:
     Heavily inspired by marlin gcode https://marlinfw.org/meta/gcode/
     """
 
+    _grammar = _GcodeGrammar(ACCEPTED_COMMANDS, ACCEPTED_AXES, ACCEPTED_ATTRIBUTES)
+    _cache = None
+    _parallel_min_size = 1 << 20  # Smaller programs are parsed serially
+
+    @classmethod
+    def reload_grammar(cls) -> ...:
+        """
+        Rebuild the lookup tables from the accepted_gcode module.
+
+        A reload of the accepted_gcode module is picked up automatically, this
+        should be called after the accepted commands are changed in place.
+        Clears the parse cache.
+        """
+        cls._grammar = _GcodeGrammar(
+            accepted_gcode.ACCEPTED_COMMANDS,
+            accepted_gcode.ACCEPTED_AXES,
+            accepted_gcode.ACCEPTED_ATTRIBUTES,
+        )
+        if cls._cache is not None:
+            cls._cache.clear()
+
+    @classmethod
+    def grammar_version(cls) -> str:
+        """
+        Get the version of the accepted gcode grammar.
+
+        Returns
+        -------
+        str
+            A short hash of the accepted commands, axes and attributes, used to
+            invalidate compiled programs stored by an older grammar.
+
+        """
+        if cls._grammar.source is not accepted_gcode.ACCEPTED_COMMANDS:
+            cls.reload_grammar()  # The accepted_gcode module was reloaded
+        return cls._grammar.version
+
+    @classmethod
+    def enable_cache(cls, maxsize: int = 1024) -> GcodeParseCache:
+        """
+        Cache the results of parse_gcode_line.
+
+        Parameters
+        ----------
+        maxsize : int
+            The maximum number of lines in the cache.
+
+        Returns
+        -------
+        GcodeParseCache
+            The new cache, can be used to read the hit and miss counters.
+
+        """
+        cls._cache = GcodeParseCache(maxsize)
+        return cls._cache
+
     @classmethod
-    def parse_gcode_line(cls, line: Union[str, bytes]) -> dict:
+    def disable_cache(cls) -> ...:
+        """Stop caching the results of parse_gcode_line."""
+        cls._cache = None
+
+    @classmethod
+    def cache_info(cls) -> Optional[dict]:
+        """Get the cache statistics, None if the cache is disabled."""
+        if cls._cache is None:
+            return None
+        return cls._cache.info()
+
+    @classmethod
+    def parse_gcode_line(
+        cls, line: Union[str, bytes, bytearray, memoryview]
+    ) -> dict:
         """
         Parse the gcode command lines from the main process.
 
+        Bytes lines are parsed directly, without decoding them to a string.
+        The Marlin forms are accepted as well: words without spaces between
+        them (G0X1Y2), repeated spaces and tabs, ';' and '(...)' comments and
+        an N line number with a *checksum, see parse_numbered_line to get the
+        line number.
+
         Parameters
         ----------
-        line : str or bytes
+        line : str, bytes, bytearray or memoryview
             The gcode command line.
 
         Raises
         ------
+        GcodeChecksumError:
+            If the line has a checksum that does not match.
         GcodeParsingError:
             If the line is not a string or bytes or is empty.
         GcodeAttributeError:
             If the entry is not a valid command or attribute.
-        Exception:
-            If an unknown parsing error occurs.
 
         Returns
         -------
@@ -61,7 +789,9 @@ class GcodeParser:
 
         """
 
-        if not isinstance(
+        if isinstance(line, (bytearray, memoryview)):
+            line = bytes(line)
+        elif not isinstance(
             line, (str, bytes)
         ):  # Check that the line is not empty and a string or bytes.
             raise GcodeParsingError(
@@ -70,275 +800,815 @@ class GcodeParser:
                 )
             )
 
-        if isinstance(line, bytes):  # If the line is in bytes convert to string.
-            line = line.decode("utf-8")
+        if cls._grammar.source is not accepted_gcode.ACCEPTED_COMMANDS:
+            cls.reload_grammar()  # The accepted_gcode module was reloaded
 
-        content = line.split(" ")
-        if len(content) == 0:
-            raise GcodeParsingError("Line is empty.")
+        cache = cls._cache
+        if cache is not None:
+            commands = cache.get(line)
+            if commands is not None:
+                return commands
 
-        # Sort the commands so the right functions are called.
-        commands = {}
-        for cnt, command in enumerate(content):
-            # Check if the command is a known command.
-            if not cls._is_valid(command):
-                raise GcodeAttributeError(
-                    "Entry {} is not a valid command or attribute.".format(command)
+        grammar = cls._grammar
+        # Plain lines are split on single spaces, other lines (f.e. without
+        # spaces, with comments or a checksum) fail and go through the lexer.
+        if isinstance(line, str):
+            try:
+                commands = cls._parse_entries(
+                    line.split(" "), grammar.commands, grammar.heads
+                )
+            except (GcodeAttributeError, GcodeParsingError):
+                commands = None
+            if commands is None:
+                commands = cls._parse_lexed(line)[1]
+        else:
+            try:
+                commands = cls._parse_entries(
+                    line.split(b" "), grammar.bytes_commands, grammar.bytes_heads
                 )
+            except (GcodeAttributeError, GcodeParsingError):
+                commands = None
+            if commands is None:
+                commands = cls._parse_lexed(line)[1]
+        if cache is not None:
+            cache.put(line, commands)
+        return commands
 
-            # Check if the entry is an attribute.
-            if command[0] in ACCEPTED_ATTRIBUTES:
-                commands = cls._add_attribute(cnt, commands, content)
+    @classmethod
+    def parse_numbered_line(
+        cls, line: Union[str, bytes, bytearray, memoryview]
+    ) -> Tuple[Optional[int], dict]:
+        """
+        Parse a line that may have a Marlin N line number and *checksum.
 
-            # Check if the first letter corresponds to a command (movement commands).
-            elif command[0] in ACCEPTED_AXES:
-                commands = cls._add_movement(cnt, commands, content)
+        Parameters
+        ----------
+        line : str, bytes, bytearray or memoryview
+            The gcode command line, f.e. 'N12 G0 X1*97'.
 
-            # Check if the complete command corresponds to a command (f.e. M commands).
-            elif command in ACCEPTED_COMMANDS.keys():
-                if command not in commands.keys():
-                    commands[command] = {}
+        Raises
+        ------
+        GcodeChecksumError:
+            If the checksum does not match, the resend attribute is the line
+            number to ask again.
+        GcodeParsingError:
+            If the line is not a string or bytes or is empty.
+        GcodeAttributeError:
+            If the entry is not a valid command or attribute.
 
-            else:
-                raise Exception("This point should never be reached.")
+        Returns
+        -------
+        line_number : int or None
+            The N line number, None if the line has no line number.
+        commands : dict
+            The parsed gcode commands with the hardware id as the dict key.
 
-        return commands
+        """
+        if isinstance(line, (bytearray, memoryview)):
+            line = bytes(line)
+        if isinstance(line, (str, bytes)) and line.lstrip()[:1] in ("N", b"N"):
+            if cls._grammar.source is not accepted_gcode.ACCEPTED_COMMANDS:
+                cls.reload_grammar()  # The accepted_gcode module was reloaded
+            return cls._parse_lexed(line)
+        return None, cls.parse_gcode_line(line)
 
     @staticmethod
-    def _is_valid(entry: str) -> bool:
+    def frame_line(
+        line: Union[str, bytes], line_number: int
+    ) -> Union[str, bytes]:
         """
-        Check if the entry is a valid command or attribute.
+        Add a Marlin line number and checksum to a line.
 
-        Uses the definitions from the accepted_commands.py file in the configs folder
-        to check if the entry is a valid command or attribute.
+        Parameters
+        ----------
+        line : str or bytes
+            The gcode command line without line ending.
+        line_number : int
+            The N line number.
+
+        Returns
+        -------
+        str or bytes
+            The line as 'N<line number> <line>*<checksum>'.
+
+        """
+        if isinstance(line, str):
+            framed = "N{} {}".format(line_number, line.strip())
+            return "{}*{}".format(framed, gcode_checksum(framed))
+        framed = b"N%d %s" % (line_number, bytes(line).strip())
+        return b"%s*%d" % (framed, gcode_checksum(framed))
+
+    @classmethod
+    def validate(
+        cls,
+        source: Union[str, os.PathLike, Iterable[Union[str, bytes]]],
+        max_issues: Optional[int] = None,
+    ) -> list:
+        """
+        Collect every problem in a gcode program instead of raising.
+
+        See gcode_lint.validate for details.
 
         Parameters
         ----------
-        entry : str
-            The entry to check.
+        source : str, os.PathLike or iterable
+            The path of a gcode file, an opened file object or any iterable
+            of str or bytes lines.
+        max_issues : int, optional
+            Stop after this many problems.
 
         Returns
         -------
-        bool
-            True if the entry is a valid command or attribute, otherwise False.
+        list of GcodeIssue
+            The line, column, entry and reason of every problem.
 
         """
-        # Check if the entry is None or an empty string
-        if entry is None or entry == "":
-            return False
+        # Imported here, the linter uses the tables of this class.
+        from .gcode_lint import validate
 
-        # Check if the entry is a known command or attribute.
-        if (
-            entry not in ACCEPTED_COMMANDS.keys()
-            and entry[0] not in ACCEPTED_AXES
-            and entry[0] not in ACCEPTED_ATTRIBUTES
-        ):
-            return False
+        return validate(source, max_issues)
+
+    @classmethod
+    def parse_gcode_commands(
+        cls, line: Union[str, bytes, bytearray, memoryview]
+    ) -> list:
+        """
+        Parse a gcode line into compact ParsedCommand objects.
+
+        Parameters
+        ----------
+        line : str, bytes, bytearray or memoryview
+            The gcode command line.
+
+        Raises
+        ------
+        GcodeParsingError:
+            If the line is not a string or bytes or is empty.
+        GcodeAttributeError:
+            If the entry is not a valid command or attribute.
+
+        Returns
+        -------
+        list of ParsedCommand
+            The parsed commands in the order of the line.
+
+        """
+        from_words = ParsedCommand.from_words
+        return [
+            from_words(command, words)
+            for command, words in cls.parse_gcode_line(line).items()
+        ]
+
+    @classmethod
+    def parse_stream(
+        cls,
+        source: Union[str, os.PathLike, Iterable[Union[str, bytes]]],
+        offset: int = 0,
+        first_line: int = 1,
+    ) -> Iterator[Tuple[int, int, dict]]:
+        """
+        Lazily parse a gcode program line by line.
+
+        Only one line is held in memory at a time, so the first commands of
+        a program are available before the rest of the program is read.
+        Blank lines and lines without commands (only a ';' or '(...)'
+        comment) are skipped.
+
+        Parameters
+        ----------
+        source : str, os.PathLike or iterable
+            The path of a gcode file, an opened (text or binary) file object
+            or any iterable of str or bytes lines.
+        offset : int, optional
+            The byte offset of the first line, a file given by its path is
+            read from this offset without reading the lines before it.
+        first_line : int, optional
+            The line number of the first line.
+
+        Raises
+        ------
+        GcodeParsingError:
+            If a line can not be parsed, the line number is added to the message.
+        GcodeAttributeError:
+            If a line contains an invalid entry, the line number is added to
+            the message.
+
+        Yields
+        ------
+        line_number : int
+            The number of the line in the program, starting at 1.
+        byte_offset : int
+            The offset of the start of the line in bytes. Equals the position
+            in the file for paths and binary file objects.
+        commands : dict
+            The parsed gcode commands of the line.
+
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                if offset:
+                    f.seek(offset)
+                yield from cls._parse_lines(f, first_line, offset)
         else:
-            # Check if the movment commands and attributes have a value attached.
-            if entry[0] in ACCEPTED_AXES or entry[0] in ACCEPTED_ATTRIBUTES:
-                if len(entry) < 2:
-                    return False
+            yield from cls._parse_lines(source, first_line, offset)
 
-            return True
+    @classmethod
+    def parse_buffer(
+        cls, buffer: Union[bytes, bytearray, memoryview]
+    ) -> Iterator[Tuple[int, int, dict]]:
+        """
+        Lazily parse a gcode program held in a bytes buffer.
+
+        The buffer is split on line endings and every line is parsed without
+        decoding it. Behaves like parse_stream.
+
+        Parameters
+        ----------
+        buffer : bytes, bytearray or memoryview
+            The raw gcode program.
+
+        Yields
+        ------
+        tuple
+            The line number, byte offset and parsed commands of every line.
+
+        """
+        if isinstance(buffer, memoryview):
+            buffer = buffer.tobytes()
+        if cls._cache is not None:
+            # Go through parse_gcode_line so the cache is used.
+            yield from cls._parse_lines(_split_lines(buffer))
+            return
+
+        if cls._grammar.source is not accepted_gcode.ACCEPTED_COMMANDS:
+            cls.reload_grammar()  # The accepted_gcode module was reloaded
+        grammar = cls._grammar
+        parse_entries = cls._parse_entries
+        commands_table = grammar.bytes_commands
+        heads_table = grammar.bytes_heads
+
+        find = buffer.find
+        size = len(buffer)
+        start = 0
+        line_number = 0
+        while start < size:
+            end = find(b"\n", start) + 1
+            if end == 0:
+                end = size
+            line = bytes(buffer[start:end]).strip()
+            offset = start
+            line_number += 1
+            start = end
+            if not line or line[0] == 59:  # ord(";")
+                continue
+
+            try:
+                commands = parse_entries(line.split(b" "), commands_table, heads_table)
+            except (GcodeAttributeError, GcodeParsingError):
+                commands = None
+            if commands is None:
+                try:
+                    commands = cls._parse_lexed(line)[1]
+                except (GcodeAttributeError, GcodeParsingError) as e:
+                    raise _line_error(e, line_number) from e
+                if not commands:
+                    continue  # Only a '(...)' comment or a line number
+            yield line_number, offset, commands
+
+    @classmethod
+    def parse_parallel(
+        cls,
+        source: Union[str, os.PathLike, bytes],
+        workers: Optional[int] = None,
+        min_size: Optional[int] = None,
+    ) -> list:
+        """
+        Parse a large gcode program using a pool of processes.
+
+        The program is split in line aligned chunks that are parsed by the
+        workers, the results are put back in program order. Programs smaller
+        than min_size bytes or a single worker fall back to serial parsing.
+
+        Parameters
+        ----------
+        source : str, os.PathLike or bytes
+            The path of a gcode file or an in memory bytes buffer.
+        workers : int, optional
+            The number of worker processes, the number of cpus if not given.
+        min_size : int, optional
+            The minimum size of the program in bytes for parallel parsing,
+            1 MiB if not given.
+
+        Raises
+        ------
+        GcodeParsingError:
+            If a line can not be parsed, the absolute line number is added
+            to the message.
+        GcodeAttributeError:
+            If a line contains an invalid entry, the absolute line number is
+            added to the message.
+
+        Returns
+        -------
+        list
+            The line number, byte offset and parsed commands of every line,
+            as yielded by parse_stream.
+
+        """
+        if min_size is None:
+            min_size = cls._parallel_min_size
+        workers = cls._parallel_workers(source, workers, min_size)
+        if workers <= 1:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                return list(cls.parse_buffer(source))
+            return list(cls.parse_stream(source))
+
+        results = []
+        for start, line_base, parsed in cls._run_parallel(source, workers, False):
+            results.extend(
+                (line_base + n, start + offset, commands)
+                for n, offset, commands in parsed
+            )
+        return results
+
+    @staticmethod
+    def _parallel_workers(
+        source: Union[str, os.PathLike, bytes], workers: Optional[int], min_size: int
+    ) -> int:
+        """Get the number of workers to use, 1 for serial parsing."""
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if not isinstance(workers, int):
+            raise TypeError(
+                "workers must be an integer, not type {}".format(type(workers))
+            )
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            size = len(source)
+        else:
+            size = os.path.getsize(source)
+
+        # Small programs are not worth the overhead of the pool.
+        if size < min_size:
+            return 1
+        return workers
+
+    @classmethod
+    def _run_parallel(
+        cls, source: Union[str, os.PathLike, bytes], workers: int, compile: bool
+    ) -> Iterator[tuple]:
+        """
+        Parse the chunks of a program in a process pool, see parse_parallel.
+
+        Yields
+        ------
+        tuple
+            The byte offset of the chunk, the number of lines before the chunk
+            and the parsed chunk (a list or a GcodeProgram when compile is
+            True), in program order.
+
+        """
+        # Multiple chunks per worker so the workers stay busy until the end.
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = bytes(source)
+            bounds = _chunk_bounds(source, len(source), workers * 4)
+            tasks = [
+                (source[start:end], start, end, compile)
+                for start, end in zip(bounds, bounds[1:])
+            ]
+        else:
+            with open(source, "rb") as f:
+                bounds = _chunk_bounds(f, os.path.getsize(source), workers * 4)
+            tasks = [
+                (source, start, end, compile)
+                for start, end in zip(bounds, bounds[1:])
+            ]
+
+        with mp.Pool(workers) as pool:
+            yield from cls._collect_chunks(tasks, pool.imap(_parse_chunk, tasks))
 
     @staticmethod
-    def _add_attribute(cnt: int, command_dict: dict, content: list) -> dict:
+    def _collect_chunks(tasks: list, results: Iterable[tuple]) -> Iterator[tuple]:
+        """Add the line numbers of the previous chunks and raise chunk errors."""
+        line_base = 0
+        for task, (n_lines, error, parsed) in zip(tasks, results):
+            if error is not None:
+                line_number, cause = error
+                raise _line_error(cause, line_base + line_number) from cause
+            yield task[1], line_base, parsed
+            line_base += n_lines
+
+    @classmethod
+    def compile_program(
+        cls,
+        lines: Union[str, os.PathLike, bytes, Iterable[Union[str, bytes]]],
+        workers: int = 1,
+    ) -> GcodeProgram:
+        """
+        Parse a complete gcode program into a columnar GcodeProgram.
+
+        Parameters
+        ----------
+        lines : str, os.PathLike, bytes or iterable
+            The program in any form accepted by parse_stream, or an in memory
+            bytes buffer as accepted by parse_buffer.
+        workers : int, optional
+            The number of processes used to compile a path or bytes buffer,
+            see parse_parallel. None uses all cpus.
+
+        Raises
+        ------
+        GcodeParsingError:
+            If a line can not be parsed.
+        GcodeAttributeError:
+            If a line contains an invalid entry.
+
+        Returns
+        -------
+        GcodeProgram
+            The program with one row per parsed command.
+
+        """
+        is_buffer = isinstance(lines, (bytes, bytearray, memoryview))
+        if is_buffer or isinstance(lines, (str, os.PathLike)):
+            workers = cls._parallel_workers(lines, workers, cls._parallel_min_size)
+        if workers != 1 and (is_buffer or isinstance(lines, (str, os.PathLike))):
+            programs = []
+            for _, line_base, program in cls._run_parallel(lines, workers, True):
+                program.commands["line"] += line_base
+                programs.append(program)
+            return GcodeProgram.concatenate(programs)
+
+        if is_buffer:
+            parsed = cls.parse_buffer(lines)
+        else:
+            parsed = cls.parse_stream(lines)
+        return GcodeProgram.from_parsed(
+            parsed, command_names=accepted_gcode.ACCEPTED_COMMANDS.keys()
+        )
+
+    @classmethod
+    def _parse_lines(
+        cls, lines: Iterable[Union[str, bytes]], first_line: int = 1, offset: int = 0
+    ) -> Iterator[Tuple[int, int, dict]]:
+        """
+        Parse an iterable of raw lines, see parse_stream.
+
+        Parameters
+        ----------
+        lines : iterable
+            The raw str or bytes lines including their line endings.
+        first_line : int
+            The line number of the first line.
+        offset : int
+            The byte offset of the first line.
+
+        Yields
+        ------
+        tuple
+            The line number, byte offset and parsed commands of every line.
+
+        """
+        parse = cls.parse_gcode_line
+        line_number = first_line - 1
+        for line in lines:
+            line_number += 1
+            start = offset
+            if isinstance(line, str):
+                offset += len(line) if line.isascii() else len(line.encode("utf-8"))
+                line = line.strip()
+                if not line or line[0] == ";":
+                    continue
+            else:
+                offset += len(line)
+                line = bytes(line).strip()
+                if not line or line[0] == 59:  # ord(";")
+                    continue
+
+            try:
+                commands = parse(line)
+            except (GcodeAttributeError, GcodeParsingError) as e:
+                raise _line_error(e, line_number) from e
+            if not commands:
+                continue  # Only a '(...)' comment or a line number
+            yield line_number, start, commands
+
+    @classmethod
+    def _parse_lexed(cls, line: Union[str, bytes]) -> Tuple[Optional[int], dict]:
+        """
+        Parse a line split by the lexer, see parse_numbered_line.
+
+        Raises
+        ------
+        GcodeParsingError:
+            If the line is empty or has a bad checksum or comment.
+        GcodeAttributeError:
+            If the entry is not a valid command or attribute.
+
+        """
+        grammar = cls._grammar
+        if isinstance(line, str):
+            line_number, words, _ = _TEXT_LEXER.lex(line)
+            table, heads = grammar.commands, grammar.heads
+        else:
+            line_number, words, _ = _BYTES_LEXER.lex(line)
+            table, heads = grammar.bytes_commands, grammar.bytes_heads
+        if not words and not line.strip():
+            raise GcodeParsingError("Line is empty.")
+        return line_number, cls._parse_entries(words, table, heads)
+
+    @classmethod
+    def _parse_entries(
+        cls, content: list, grammar_commands: dict, heads: dict
+    ) -> dict:
         """
-        Add an attribute to the command dict.
+        Parse the entries of a command line in a single forward pass.
+
+        The command the entries belong to is kept as state, so every entry
+        is handled with a constant number of lookups in the grammar tables.
 
         Parameters
         ----------
-        cnt : int
-            The index of the command in the content list.
-        command_dict : dict
-            The command dict to add the attribute to.
         content : list
             The content of the command line split on ' '.
+        grammar_commands : dict
+            The command table of the grammar for the type of the entries.
+        heads : dict
+            The first letter table of the grammar for the type of the entries.
 
         Raises
         ------
         GcodeParsingError:
-            If the attribute does not follow the set rules for parsing.
+            If an attribute is given before any command.
         GcodeAttributeError:
-            If the attribute is not a valid attribute or follows a command that
-            does not allow for the attribute.
-        NotImplementedError:
-            If the attribute is of a datatype that is not implemented.
+            If the entry is not a valid command or attribute, or is not
+            allowed for the command it follows.
 
         Returns
         -------
-        command_dict : dict
-            The command dict with the attribute added.
+        commands : dict
+            The parsed gcode commands with the hardware id as the dict key.
 
         """
-        # Check if this is the first entry.
-        if len(command_dict.keys()) == 0:
-            raise GcodeParsingError(
-                "Entry {} is an attribute but is the first entry in the command.".format(
-                    content[cnt]
-                )
-            )
+        commands = {}
+        last_command = None
+        current = None  # The dict of the last command
+        allowed_axes = None
+        converters = None
+        has_attribute = False
 
-        # Check what the last added command was
-        i = 0
-        while True:
-            i += 1
-            if (
-                content[cnt - i][0] in ACCEPTED_ATTRIBUTES
-                or content[cnt - i][0] in ACCEPTED_AXES
-            ):
-                # Is also an attribute or a movement attribute
+        for entry in content:
+            spec = grammar_commands.get(entry)
+            if spec is not None:
+                # The complete entry is a command (f.e. M commands).
+                last_command, allowed_axes, converters = spec
+                current = commands.get(last_command)
+                if current is None:
+                    current = commands[last_command] = {}
+                has_attribute = False
                 continue
-            else:
-                break
-        last_command = content[cnt - i]
 
-        # Check if the last command allows the attribute.
-        if last_command[0] in ACCEPTED_AXES:
-            # Command is a movement command.
-            raise GcodeAttributeError(
-                "Movement commands ({}) are not allowed to have attributes. {}".format(
-                    last_command, content[cnt]
+            head_spec = heads.get(entry[:1])
+            if head_spec is None or len(entry) < 2:
+                raise GcodeAttributeError(
+                    "Entry {} is not a valid command or attribute.".format(
+                        _text(entry)
+                    )
                 )
-            )
 
-        elif content[cnt][0] not in ACCEPTED_COMMANDS[last_command].keys():
-            print(last_command, content[cnt])
-            # The attribute is not allowed for the last command.
-            raise GcodeAttributeError(
-                "The attribute {} is not allowed for the last command".format(
-                    content[cnt]
-                )
-            )
+            kind, head, convert_axis = head_spec
+            data = entry[1:]
+            if kind == _AXIS:
+                if current is None:
+                    convert_axis(data)
+                    raise GcodeAttributeError(
+                        "Movement {} does not follow a command.".format(_text(entry))
+                    )
+                if has_attribute or allowed_axes is None or head not in allowed_axes:
+                    convert = converters.get(head)
+                    if convert is not None:
+                        # The letter is an attribute of this command (f.e. J of G2).
+                        current[head] = convert(data)
+                        has_attribute = True
+                        continue
+                    convert_axis(data)
+                    if has_attribute:
+                        raise GcodeAttributeError(
+                            "Movement commands ({}) are not allowed to have "
+                            "attributes.".format(last_command)
+                        )
+                    if allowed_axes is None:
+                        raise GcodeAttributeError(
+                            "Command {} is not allowed to have movement "
+                            "attributes.".format(last_command)
+                        )
+                    raise GcodeAttributeError(
+                        "Movent attribute {} is not allowed for command {}.".format(
+                            _text(entry), last_command
+                        )
+                    )
+                data = convert_axis(data)
+                if head in current:
+                    raise GcodeAttributeError(
+                        "Movement command {} already exists.".format(head)
+                    )
+                current[head] = data
 
-        # Convert the attribute data to the right type.
-        attribute_id = content[cnt][0]
-        data = content[cnt][1:]
-
-        # TODO: #5 Convert the attribute to the right data type
-        # Get the allowed data types for the attribute.
-        types = ACCEPTED_COMMANDS[last_command][attribute_id]
-        if int in types or float in types:
-            # Try converting to int
-            # Check if there is a . in the numer
-            if "." in data:
-                if float in types:
-                    data = float(data)
             else:
-                data = int(data)
-        elif bool in types:
-            # Check if the data is given in text or numeric.
-            if data.isdigit():
-                if data == "0":
-                    data = False
-                elif data == "1":
-                    data = True
-                else:
+                if current is None:
+                    raise GcodeParsingError(
+                        "Entry {} is an attribute but is the first entry in the "
+                        "command.".format(_text(entry))
+                    )
+                convert = converters.get(head)
+                if convert is None:
+                    # The attribute is not allowed for the last command.
                     raise GcodeAttributeError(
-                        "The data {} is not a valid boolean.".format(data)
+                        "The attribute {} is not allowed for the last command".format(
+                            _text(entry)
+                        )
                     )
-            elif data.lower() == "true":
-                data = True
-            elif data.lower() == "false":
-                data = False
-            else:
-                raise GcodeAttributeError(
-                    "The data {} is not a valid boolean.".format(data)
+                current[head] = convert(data)
+                has_attribute = True
+
+        return commands
+
+    @classmethod
+    def _is_valid(cls, entry: str) -> bool:
+        """
+        Check if the entry is a valid command or attribute.
+
+        Uses the definitions from the accepted_commands.py file in the configs folder
+        to check if the entry is a valid command or attribute.
+
+        Parameters
+        ----------
+        entry : str
+            The entry to check.
+
+        Returns
+        -------
+        bool
+            True if the entry is a valid command or attribute, otherwise False.
+
+        """
+        # Check if the entry is None or an empty string
+        if entry is None or entry == "":
+            return False
+
+        if entry in cls._grammar.commands:
+            return True
+
+        # Check if the movment commands and attributes have a value attached.
+        return entry[0] in cls._grammar.heads and len(entry) >= 2
+
+
+class GcodeReceiveBuffer:
+    """
+    Buffer for gcode received in byte chunks from a serial port or socket.
+
+    Received chunks are collected until a line ending is found, the complete
+    lines are then parsed without decoding them. Incomplete lines stay in the
+    buffer until the rest of the line is received.
+    """
+
+    def __init__(self, max_line_length: int = 4096) -> None:
+        """
+        Initialize the receive buffer.
+
+        Parameters
+        ----------
+        max_line_length : int
+            The maximum number of bytes in an incomplete line.
+
+        """
+        if not isinstance(max_line_length, int):
+            raise TypeError(
+                "max_line_length must be an integer, not type {}".format(
+                    type(max_line_length)
                 )
-        elif bytes in types:
-            # Convert to bytes if allowed
-            data = bytes(data)
-        else:
-            raise NotImplementedError(
-                "The data type {} is not implemented.".format(types)
             )
+        self._max_line_length = max_line_length
+        self._buffer = bytearray()
+        self._pending = []
+        self._line_number = 0
+        self._offset = 0
+        self._skipping = False  # Skip the rest of a line that is too long
 
-        command_dict[last_command][attribute_id] = data
-        return command_dict
+    def __len__(self) -> int:
+        return len(self._buffer)
 
-    @staticmethod
-    def _add_movement(cnt: int, command_dict: dict, content: list) -> dict:
+    @property
+    def line_number(self) -> int:
+        """The number of the last complete line that was parsed."""
+        return self._line_number
+
+    def feed(self, chunk: Union[bytes, bytearray, memoryview]) -> list:
         """
-        Add a movement command to the command dict.
+        Add a received chunk and parse all completed lines.
+
+        When a line can not be parsed an exception is raised. The lines
+        parsed before it are returned by the next call and the lines after
+        it are parsed by the next call. The rest of a line longer than
+        max_line_length is skipped up to its line ending.
 
         Parameters
         ----------
-        cnt : int
-            The index of the command in the content list.
-        command_dict : dict
-            The command dict to add the attribute to.
-        content : list
-            The content of the command line.
+        chunk : bytes, bytearray or memoryview
+            The received data.
 
         Raises
         ------
         GcodeParsingError:
-            If the movement command is an invalid value.
+            If a line can not be parsed or the incomplete line is longer than
+            max_line_length, the line number is added to the message.
         GcodeAttributeError:
-            If the movement aready exists in the command dict, if the
-            movement follows a command that does not allow for movement
-            commands.
+            If a line contains an invalid entry, the line number is added to
+            the message.
 
         Returns
         -------
-        command_dict : dict
-            The command dict with the attribute added.
+        list
+            The line number, byte offset and parsed commands of every
+            completed line.
 
         """
-        # Convert the movement value to the right type.
-        data = content[cnt][1:]
+        buffer = self._buffer
+        buffer += chunk
+        if self._skipping:
+            skip = buffer.find(b"\n") + 1
+            if skip == 0:
+                self._offset += len(buffer)
+                buffer.clear()
+                return self._take_pending()
+            self._offset += skip
+            del buffer[:skip]
+            self._skipping = False
+        end = buffer.rfind(b"\n") + 1
+        if end == 0:
+            if len(buffer) > self._max_line_length:
+                self._offset += len(buffer)
+                self._line_number += 1
+                self._skipping = True
+                buffer.clear()
+                raise GcodeParsingError(
+                    "Line {}: Line is longer than {} bytes.".format(
+                        self._line_number, self._max_line_length
+                    )
+                )
+            return self._take_pending()
 
-        try:
-            data = int(data)
-        except ValueError:
-            data = float(data)
-        except:
-            raise GcodeParsingError(
-                "Movement command {} is not a valid value.".format(content[cnt][0])
-            )
+        complete = bytes(buffer[:end])
+        del buffer[:end]
+        return self._parse(complete)
 
-        # Look for the last non axis non attribute command.
-        i = 0
-        while True:
-            i -= 1
-            last_command = content[cnt + i]
+    def flush(self) -> list:
+        """
+        Parse the incomplete line at the end of the stream.
 
-            # Check if the command is an attribute
-            if last_command[0] in ACCEPTED_ATTRIBUTES:
-                raise GcodeAttributeError(
-                    "Movement commands ({}) are not allowed to have attributes.".format(
-                        last_command
-                    )
-                )
+        Returns
+        -------
+        list
+            The line number, byte offset and parsed commands of the remaining
+            lines.
 
-            # Check if the command is an axis command.
-            if last_command[0] in ACCEPTED_AXES:
-                continue
-            else:
-                break
+        """
+        remaining = bytes(self._buffer)
+        self._buffer.clear()
+        self._skipping = False  # The stream ended in a line that is too long
+        return self._parse(remaining)
 
-        # Check if the command is allowed to have a movement command.
-        try:
-            if content[cnt][0] not in ACCEPTED_COMMANDS[last_command]["ACCEPTED_AXES"]:
-                raise GcodeAttributeError(
-                    "Movent attribute {} is not allowed for command {}.".format(
-                        content[cnt], last_command
-                    )
-                )
-        except KeyError:
-            raise GcodeAttributeError(
-                "Command {} is not allowed to have movement attributes.".format(
-                    last_command
-                )
-            )
+    def _take_pending(self) -> list:
+        """Get and reset the lines parsed before the last error."""
+        results, self._pending = self._pending, []
+        return results
 
-        # Check if there already is a movement command with the same id.
-        if content[cnt][0] in command_dict[last_command].keys():
-            raise GcodeAttributeError(
-                "Movement command {} already exists.".format(content[cnt][0])
-            )
+    def _parse(self, data: bytes) -> list:
+        """Parse the lines in data, see feed."""
+        results = self._take_pending()
+        parse = GcodeParser.parse_gcode_line
+        find = data.find
+        size = len(data)
+        start = 0
+        while start < size:
+            end = find(b"\n", start) + 1
+            if end == 0:
+                end = size
+            line = data[start:end].strip()
+            offset = self._offset + start
+            self._line_number += 1
+            start = end
+            if not line or line[0] == 59:  # ord(";")
+                continue
+
+            try:
+                commands = parse(line)
+            except (GcodeAttributeError, GcodeParsingError) as e:
+                # Keep the results and the unparsed lines for the next call.
+                self._pending = results
+                self._buffer[:0] = data[start:]
+                self._offset += start
+                raise _line_error(e, self._line_number) from e
+            results.append((self._line_number, offset, commands))
 
-        # Add the movement command to the command dict.
-        command_dict[last_command][content[cnt][0]] = data
-        return command_dict
+        self._offset += size
+        return results
@@ -0,0 +1,466 @@
+"""
+Columnar representation of complete gcode programs.
+
+A compiled program stores one row per parsed command in a structured NumPy
+array with the command code, the line number and one float column per axis
+in ACCEPTED_AXES (NaN when the axis is not given). The attribute words are
+stored in a separate table pointing to the row they belong to.
+"""
+from typing import Union, Iterable, Tuple
+import os
+import numpy as np
+
+try:
+    from .accepted_gcode import ACCEPTED_COMMANDS, ACCEPTED_AXES
+except ImportError:
+    from .accepted_gcode import ACCEPTED_COMMANDS, ACCEPTED_AXES
+
+
+ATTRIBUTE_DTYPE = np.dtype([("row", "i8"), ("attribute", "U1"), ("value", "f8")])
+
+
+def command_dtype(axes: Tuple[str, ...] = ACCEPTED_AXES) -> np.dtype:
+    """
+    Get the dtype of the command table.
+
+    Parameters
+    ----------
+    axes : tuple of str
+        The axes that get a column in the table.
+
+    Returns
+    -------
+    np.dtype
+        Structured dtype with the command code, line number and axis columns.
+
+    """
+    return np.dtype(
+        [("command", "u2"), ("line", "i8")] + [(axis, "f8") for axis in axes]
+    )
+
+
+class GcodeProgram:
+    """
+    Compiled gcode program stored as NumPy arrays.
+
+    Use GcodeParser.compile_program to create a program from gcode lines.
+    Slicing and selecting return new programs that share the data with the
+    original program where NumPy allows it.
+    """
+
+    def __init__(
+        self,
+        commands: np.ndarray,
+        attributes: np.ndarray,
+        command_names: Iterable[str],
+        axes: Iterable[str] = ACCEPTED_AXES,
+    ) -> None:
+        """
+        Initialize the program from its tables.
+
+        Parameters
+        ----------
+        commands : np.ndarray
+            Structured array with the dtype given by command_dtype(axes).
+        attributes : np.ndarray
+            Structured array with the ATTRIBUTE_DTYPE.
+        command_names : iterable of str
+            The command name of every command code.
+        axes : iterable of str
+            The axes stored in the command table.
+
+        Raises
+        ------
+        TypeError:
+            If one of the tables does not have the right dtype.
+
+        """
+        self._axes = tuple(axes)
+        if commands.dtype != command_dtype(self._axes):
+            raise TypeError("Invalid command table dtype: {}".format(commands.dtype))
+        if attributes.dtype != ATTRIBUTE_DTYPE:
+            raise TypeError(
+                "Invalid attribute table dtype: {}".format(attributes.dtype)
+            )
+
+        self._commands = commands
+        self._attributes = attributes
+        self._command_names = tuple(command_names)
+        self._command_codes = {name: i for i, name in enumerate(self._command_names)}
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return "GcodeProgram(commands={}, attributes={})".format(
+            len(self._commands), len(self._attributes)
+        )
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def __getitem__(self, index: Union[slice, np.ndarray]) -> "GcodeProgram":
+        """
+        Get the program with only the selected rows.
+
+        Contiguous slices share the command table with this program, other
+        indices (boolean masks or row numbers) copy the selected rows. The
+        rows are always kept in program order.
+        """
+        if isinstance(index, slice) and index.step in (None, 1):
+            start, stop, _ = index.indices(len(self._commands))
+            stop = max(start, stop)
+            rows = self._attributes["row"]
+            attributes = self._attributes[(rows >= start) & (rows < stop)]
+            attributes["row"] -= start
+            return GcodeProgram(
+                self._commands[start:stop],
+                attributes,
+                self._command_names,
+                self._axes,
+            )
+
+        if isinstance(index, slice):
+            rows = np.arange(len(self._commands))[index]
+        else:
+            index = np.asarray(index)
+            if index.dtype == bool:
+                rows = np.flatnonzero(index)
+            else:
+                rows = np.arange(len(self._commands))[index]
+        return self._take(np.unique(rows))
+
+    # PROPERTIES
+    @property
+    def commands(self) -> np.ndarray:
+        """The structured command table."""
+        return self._commands
+
+    @property
+    def attributes(self) -> np.ndarray:
+        """The attribute table, the row column points into the command table."""
+        return self._attributes
+
+    @property
+    def command_names(self) -> Tuple[str, ...]:
+        """The command name of every command code."""
+        return self._command_names
+
+    @property
+    def axes(self) -> Tuple[str, ...]:
+        """The axes stored in the command table."""
+        return self._axes
+
+    @property
+    def lines(self) -> np.ndarray:
+        """The line number of every command."""
+        return self._commands["line"]
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes used by the tables."""
+        return self._commands.nbytes + self._attributes.nbytes
+
+    # PUBLIC FUNCTIONS
+    def axis(self, axis: str) -> np.ndarray:
+        """
+        Get the values of one axis, NaN where the axis is not given.
+
+        Parameters
+        ----------
+        axis : str
+            The axis symbol.
+
+        Returns
+        -------
+        np.ndarray
+            The column of the command table (a view, not a copy).
+
+        """
+        if axis not in self._axes:
+            raise KeyError("Axis {} is not in the program.".format(axis))
+        return self._commands[axis]
+
+    def positions(self, axes: Union[Iterable[str], None] = None) -> np.ndarray:
+        """
+        Get the values of multiple axes as a 2D float array.
+
+        Parameters
+        ----------
+        axes : iterable of str, optional
+            The axes to get, all axes if not given.
+
+        Returns
+        -------
+        np.ndarray
+            Array with shape (len(program), len(axes)).
+
+        """
+        axes = self._axes if axes is None else tuple(axes)
+        out = np.empty((len(self._commands), len(axes)), dtype="f8")
+        for i, axis in enumerate(axes):
+            out[:, i] = self.axis(axis)
+        return out
+
+    def command_code(self, command: str) -> int:
+        """Get the code of a command name."""
+        try:
+            return self._command_codes[command]
+        except KeyError:
+            raise KeyError("Command {} is not known.".format(command))
+
+    def mask(self, *commands: str) -> np.ndarray:
+        """
+        Get a boolean mask of the rows with one of the given commands.
+
+        Parameters
+        ----------
+        *commands : str
+            The command names to select.
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array with one value per row.
+
+        """
+        codes = [self.command_code(command) for command in commands]
+        return np.isin(self._commands["command"], codes)
+
+    def select(self, *commands: str) -> "GcodeProgram":
+        """Get the program with only the given commands."""
+        return self._take(np.flatnonzero(self.mask(*commands)))
+
+    def attribute(self, attribute: str) -> np.ndarray:
+        """
+        Get the values of one attribute per row, NaN where it is not given.
+
+        Parameters
+        ----------
+        attribute : str
+            The attribute symbol.
+
+        Returns
+        -------
+        np.ndarray
+            Float array with one value per row.
+
+        """
+        out = np.full(len(self._commands), np.nan)
+        table = self._attributes[self._attributes["attribute"] == attribute]
+        out[table["row"]] = table["value"]
+        return out
+
+    def to_dicts(self) -> list:
+        """
+        Convert the program back to the parse_stream form.
+
+        Returns
+        -------
+        list
+            The line number and the dict of the parsed commands of every line.
+            Rows repeating a command of the same line (f.e. the moves of an
+            expanded arc) start a new entry with the same line number.
+
+        """
+        names = self._command_names
+        axes = self._axes
+        attributes = {}
+        for row, attr, value in self._attributes.tolist():
+            attributes.setdefault(row, []).append((attr, value))
+
+        lines = []
+        last_line = None
+        for row, values in enumerate(self._commands.tolist()):
+            code, line = values[0], values[1]
+            command = {
+                axis: value
+                for axis, value in zip(axes, values[2:])
+                if value == value  # Skip NaN
+            }
+            command.update(attributes.get(row, ()))
+            name = names[code]
+            if line != last_line or name in lines[-1][1]:
+                lines.append((line, {}))
+                last_line = line
+            lines[-1][1][name] = command
+        return lines
+
+    def save(self, path: Union[str, os.PathLike]) -> ...:
+        """
+        Save the program to a .npz file.
+
+        Parameters
+        ----------
+        path : str or os.PathLike
+            The file to write.
+
+        """
+        np.savez(
+            path,
+            commands=self._commands,
+            attributes=self._attributes,
+            command_names=np.array(self._command_names, dtype="U"),
+            axes=np.array(self._axes, dtype="U"),
+        )
+
+    @classmethod
+    def load(cls, path: Union[str, os.PathLike]) -> "GcodeProgram":
+        """
+        Load a program saved with save.
+
+        Parameters
+        ----------
+        path : str or os.PathLike
+            The file to read.
+
+        Returns
+        -------
+        GcodeProgram
+            The loaded program.
+
+        """
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["commands"],
+                data["attributes"],
+                data["command_names"].tolist(),
+                data["axes"].tolist(),
+            )
+
+    @classmethod
+    def concatenate(cls, programs: Iterable["GcodeProgram"]) -> "GcodeProgram":
+        """
+        Join programs with the same command names and axes.
+
+        Parameters
+        ----------
+        programs : iterable of GcodeProgram
+            The programs to join, in order.
+
+        Raises
+        ------
+        ValueError:
+            If no programs are given or the programs do not have the same
+            command names and axes.
+
+        Returns
+        -------
+        GcodeProgram
+            The joined program.
+
+        """
+        programs = list(programs)
+        if not programs:
+            raise ValueError("No programs to concatenate.")
+        first = programs[0]
+        for program in programs[1:]:
+            if (
+                program.command_names != first.command_names
+                or program.axes != first.axes
+            ):
+                raise ValueError("Programs with different grammars can not be joined.")
+
+        sizes = np.array([len(program) for program in programs])
+        row_offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        attributes = np.concatenate([program.attributes for program in programs])
+        attributes["row"] += np.repeat(
+            row_offsets, [len(program.attributes) for program in programs]
+        )
+        return cls(
+            np.concatenate([program.commands for program in programs]),
+            attributes,
+            first.command_names,
+            first.axes,
+        )
+
+    @classmethod
+    def from_parsed(
+        cls,
+        parsed: Iterable[Tuple[int, dict]],
+        command_names: Iterable[str] = None,
+        axes: Iterable[str] = ACCEPTED_AXES,
+    ) -> "GcodeProgram":
+        """
+        Build a program from parsed lines.
+
+        Parameters
+        ----------
+        parsed : iterable
+            Tuples starting with the line number and ending with the dict of
+            parsed commands, f.e. the output of GcodeParser.parse_stream.
+        command_names : iterable of str, optional
+            The command names to give a code, the accepted commands if not given.
+        axes : iterable of str
+            The axes to store in the command table.
+
+        Returns
+        -------
+        GcodeProgram
+            The compiled program.
+
+        """
+        axes = tuple(axes)
+        if command_names is None:
+            command_names = tuple(ACCEPTED_COMMANDS.keys())
+        command_names = tuple(command_names)
+        codes = {name: i for i, name in enumerate(command_names)}
+        columns = {axis: i for i, axis in enumerate(axes)}
+
+        # Collect flat columns, the tables are filled in one go afterwards.
+        command_codes = []
+        line_numbers = []
+        axis_rows, axis_cols, axis_values = [], [], []
+        attr_rows, attr_names, attr_values = [], [], []
+        row = 0
+        for item in parsed:
+            line_number, commands = item[0], item[-1]
+            for command, words in commands.items():
+                command_codes.append(codes[command])
+                line_numbers.append(line_number)
+                for word, value in words.items():
+                    col = columns.get(word)
+                    if col is not None:
+                        axis_rows.append(row)
+                        axis_cols.append(col)
+                        axis_values.append(value)
+                    else:
+                        attr_rows.append(row)
+                        attr_names.append(word)
+                        attr_values.append(_to_float(value))
+                row += 1
+
+        values = np.full((row, len(axes)), np.nan)
+        values[axis_rows, axis_cols] = axis_values
+
+        table = np.empty(row, dtype=command_dtype(axes))
+        table["command"] = command_codes
+        table["line"] = line_numbers
+        for axis, col in columns.items():
+            table[axis] = values[:, col]
+
+        attributes = np.empty(len(attr_rows), dtype=ATTRIBUTE_DTYPE)
+        attributes["row"] = attr_rows
+        attributes["attribute"] = attr_names
+        attributes["value"] = attr_values
+        return cls(table, attributes, command_names, axes)
+
+    # PRIVATE FUNCTIONS
+    def _take(self, rows: np.ndarray) -> "GcodeProgram":
+        """Get the program with the given sorted and unique rows."""
+        keep = np.zeros(len(self._commands), dtype=bool)
+        keep[rows] = True
+        new_rows = np.cumsum(keep) - 1
+
+        attributes = self._attributes[keep[self._attributes["row"]]]
+        attributes["row"] = new_rows[attributes["row"]]
+        return GcodeProgram(
+            self._commands[rows], attributes, self._command_names, self._axes
+        )
+
+
+def _to_float(value: Union[int, float, bool, str, bytes]) -> float:
+    """Convert an attribute value to a float, NaN if it is not numeric."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
@@ -0,0 +1,385 @@
+"""
+Resumable execution of gcode jobs.
+
+The job runner reads a gcode file line by line, dispatches the commands and
+keeps the modal machine state. While running it regularly writes a small
+checkpoint file with the byte offset and line number of the next line and
+the modal state (positioning mode, positions and steps per unit). After an
+emergency stop (M112), an error or a power loss the job is resumed from the
+checkpoint by seeking to the byte offset, the lines before it are not read
+again, so resuming takes the same time anywhere in the file.
+"""
+from time import perf_counter
+from typing import Union, NamedTuple, Optional
+import json
+import os
+import tempfile
+
+try:
+    from .gcode_dispatch import GcodeDispatcher
+    from .gcode_parser import GcodeParser
+    from .machine_state import GcodeMachineState
+    from .macro_engine import MacroEngine
+except ImportError:
+    from .gcode_dispatch import GcodeDispatcher
+    from .gcode_parser import GcodeParser
+    from .machine_state import GcodeMachineState
+    from .macro_engine import MacroEngine
+
+
+# Version of the checkpoint file layout
+CHECKPOINT_VERSION = 1
+STOP_COMMAND = "M112"
+
+
+class JobCheckpoint(NamedTuple):
+    """The position in a job and the machine state before that position."""
+
+    path: str
+    """The absolute path of the gcode file."""
+    size: int
+    """The size of the gcode file in bytes."""
+    mtime_ns: int
+    """The modification time of the gcode file."""
+    line: int
+    """The line number of the next line to run."""
+    offset: int
+    """The byte offset of the next line to run."""
+    state: dict
+    """The modal machine state, see GcodeMachineState.to_dict."""
+
+
+class GcodeJobRunner:
+    """
+    Runs a gcode file and checkpoints its progress.
+
+    A checkpoint is written every checkpoint_lines lines or checkpoint_seconds
+    seconds, when the job stops for an M112 or max_lines and when running a
+    line raises an exception (the line is run again on resume). The
+    checkpoint is removed when the job is finished.
+
+    Examples
+    --------
+    >>> runner = GcodeJobRunner('job.gcode', dispatcher=dispatcher)
+    >>> runner.run()  # Stopped by an M112
+    >>> runner = GcodeJobRunner.resume('job.gcode.checkpoint', dispatcher=dispatcher)
+    >>> runner.run()
+
+    """
+
+    def __init__(
+        self,
+        path: Union[str, os.PathLike],
+        checkpoint_path: Union[str, os.PathLike, None] = None,
+        dispatcher: Optional[GcodeDispatcher] = None,
+        state: Optional[GcodeMachineState] = None,
+        macros: Optional[MacroEngine] = None,
+        checkpoint_lines: int = 1000,
+        checkpoint_seconds: float = 5.0,
+    ) -> None:
+        """
+        Initialize the runner at the start of the job.
+
+        Parameters
+        ----------
+        path : str or os.PathLike
+            The gcode file of the job.
+        checkpoint_path : str or os.PathLike, optional
+            The checkpoint file, the path of the job with .checkpoint added
+            if not given.
+        dispatcher : GcodeDispatcher, optional
+            The built dispatcher executing the commands, only the machine
+            state is updated if not given.
+        state : GcodeMachineState, optional
+            The state of the machine at the start, a new state if not given.
+        macros : MacroEngine, optional
+            The macros expanded before the lines are dispatched.
+        checkpoint_lines : int
+            The maximum number of lines between two checkpoints.
+        checkpoint_seconds : float
+            The maximum time between two checkpoints in seconds.
+
+        Raises
+        ------
+        ValueError:
+            If checkpoint_lines or checkpoint_seconds is not positive.
+
+        """
+        if checkpoint_lines < 1:
+            raise ValueError(
+                "checkpoint_lines must be at least 1, not {}".format(checkpoint_lines)
+            )
+        if checkpoint_seconds <= 0:
+            raise ValueError(
+                "checkpoint_seconds must be positive, not {}".format(checkpoint_seconds)
+            )
+
+        self._path = os.path.abspath(path)
+        if checkpoint_path is None:
+            checkpoint_path = self._path + ".checkpoint"
+        self._checkpoint_path = os.fspath(checkpoint_path)
+        self._dispatcher = dispatcher
+        self._state = GcodeMachineState() if state is None else state
+        self._macros = macros
+        self._checkpoint_lines = checkpoint_lines
+        self._checkpoint_seconds = checkpoint_seconds
+        self._line = 1
+        self._offset = 0
+        self._stopped = False
+        self._finished = False
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return "GcodeJobRunner(path={!r}, line={}, offset={})".format(
+            self._path, self._line, self._offset
+        )
+
+    # PROPERTIES
+    @property
+    def path(self) -> str:
+        """The absolute path of the gcode file."""
+        return self._path
+
+    @property
+    def checkpoint_path(self) -> str:
+        """The path of the checkpoint file."""
+        return self._checkpoint_path
+
+    @property
+    def state(self) -> GcodeMachineState:
+        """The modal machine state before the next line."""
+        return self._state
+
+    @property
+    def line(self) -> int:
+        """The line number of the next line to run."""
+        return self._line
+
+    @property
+    def offset(self) -> int:
+        """The byte offset of the next line to run."""
+        return self._offset
+
+    @property
+    def stopped(self) -> bool:
+        """True if the last run was stopped by an M112."""
+        return self._stopped
+
+    @property
+    def finished(self) -> bool:
+        """True if every line of the job is run."""
+        return self._finished
+
+    # PUBLIC FUNCTIONS
+    @classmethod
+    def resume(
+        cls,
+        checkpoint_path: Union[str, os.PathLike],
+        check_file: bool = True,
+        **kwargs
+    ) -> "GcodeJobRunner":
+        """
+        Create a runner continuing a job from its checkpoint.
+
+        Parameters
+        ----------
+        checkpoint_path : str or os.PathLike
+            The checkpoint file written by the runner of the job.
+        check_file : bool
+            Check the gcode file did not change since the checkpoint.
+        **kwargs
+            The other arguments of the runner, f.e. the dispatcher.
+
+        Raises
+        ------
+        ValueError:
+            If the gcode file changed since the checkpoint.
+
+        Returns
+        -------
+        GcodeJobRunner
+            The runner at the next line of the job with the restored state.
+
+        """
+        checkpoint = cls.load_checkpoint(checkpoint_path)
+        if check_file:
+            stat = os.stat(checkpoint.path)
+            expected = (checkpoint.size, checkpoint.mtime_ns)
+            if (stat.st_size, stat.st_mtime_ns) != expected:
+                raise ValueError(
+                    "The file {} changed since the checkpoint.".format(checkpoint.path)
+                )
+        runner = cls(
+            checkpoint.path,
+            checkpoint_path,
+            state=GcodeMachineState.from_dict(checkpoint.state),
+            **kwargs
+        )
+        runner._line = checkpoint.line
+        runner._offset = checkpoint.offset
+        return runner
+
+    @staticmethod
+    def load_checkpoint(checkpoint_path: Union[str, os.PathLike]) -> JobCheckpoint:
+        """
+        Read a checkpoint file.
+
+        Parameters
+        ----------
+        checkpoint_path : str or os.PathLike
+            The checkpoint file.
+
+        Raises
+        ------
+        ValueError:
+            If the file is not a checkpoint of this version.
+
+        Returns
+        -------
+        JobCheckpoint
+            The position in the job and the machine state.
+
+        """
+        with open(checkpoint_path) as f:
+            data = json.load(f)
+        if data.pop("version", None) != CHECKPOINT_VERSION:
+            raise ValueError(
+                "{} is not a version {} checkpoint.".format(
+                    checkpoint_path, CHECKPOINT_VERSION
+                )
+            )
+        return JobCheckpoint(**data)
+
+    def checkpoint(self) -> JobCheckpoint:
+        """
+        Write the checkpoint of the next line now.
+
+        The file is written next to the checkpoint file, flushed to disk and
+        then moved in place, so a power loss never leaves a partial file.
+
+        Returns
+        -------
+        JobCheckpoint
+            The written checkpoint.
+
+        """
+        stat = os.stat(self._path)
+        checkpoint = JobCheckpoint(
+            self._path,
+            stat.st_size,
+            stat.st_mtime_ns,
+            self._line,
+            self._offset,
+            self._state.to_dict(),
+        )
+        directory = os.path.dirname(os.path.abspath(self._checkpoint_path))
+        fd, temporary = tempfile.mkstemp(prefix=".checkpoint-", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(dict(checkpoint._asdict(), version=CHECKPOINT_VERSION), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self._checkpoint_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return checkpoint
+
+    def run(self, max_lines: Optional[int] = None) -> int:
+        """
+        Run the job from the next line.
+
+        Parameters
+        ----------
+        max_lines : int, optional
+            Stop after this number of lines and write a checkpoint.
+
+        Raises
+        ------
+        GcodeParsingError:
+            If a line can not be parsed, the last checkpoint is kept.
+        GcodeAttributeError:
+            If a line contains an invalid entry, the last checkpoint is kept.
+
+        Returns
+        -------
+        int
+            The number of lines that were run.
+
+        """
+        self._stopped = False
+        parsed = GcodeParser.parse_stream(self._path, self._offset, self._line)
+        if self._macros is not None:
+            parsed = self._macros.stream(parsed)
+        dispatch = None if self._dispatcher is None else self._dispatcher.execute
+        update_state = self._state.execute_parsed
+
+        n_lines = 0
+        since_checkpoint = 0
+        deadline = perf_counter() + self._checkpoint_seconds
+        current_offset = None
+        commands_run = 0  # Run parts of the current line, >1 for macros
+        stop = False
+        running = False
+        try:
+            for line_number, offset, commands in parsed:
+                if offset != current_offset:
+                    # A new line of the file, the lines before it are done.
+                    # The lines of a macro share the offset of the call.
+                    current_offset = offset
+                    commands_run = 0
+                    self._line = line_number
+                    self._offset = offset
+                    if stop or n_lines == max_lines:
+                        self.checkpoint()
+                        return n_lines
+                    since_checkpoint += 1
+                    if since_checkpoint > self._checkpoint_lines or (
+                        perf_counter() > deadline
+                    ):
+                        self.checkpoint()
+                        since_checkpoint = 1
+                        deadline = perf_counter() + self._checkpoint_seconds
+                    n_lines += 1
+
+                running = True
+                commands_run += 1
+                if STOP_COMMAND in commands:
+                    stop = self._stopped = True
+                if dispatch is not None:
+                    dispatch(commands)
+                update_state(commands)
+                running = False
+        except BaseException:
+            if running and stop:
+                # The stop raised, the job continues after the line of the stop.
+                if self._skip_line(parsed, current_offset):
+                    self.checkpoint()
+            elif running and commands_run == 1:
+                # The line is run again, the state is not changed by the line.
+                # Earlier macro lines of the call did change the state, then
+                # the last checkpoint is kept.
+                self.checkpoint()
+            raise
+
+        self._finish()
+        return n_lines
+
+    # PRIVATE FUNCTIONS
+    def _skip_line(self, parsed, current_offset: int) -> bool:
+        """Move to the next line of the file, False if the job is finished."""
+        for line_number, offset, _ in parsed:
+            if offset != current_offset:
+                self._line = line_number
+                self._offset = offset
+                return True
+        self._finish()
+        return False
+
+    def _finish(self) -> ...:
+        """Mark the job as finished and remove the checkpoint."""
+        self._finished = True
+        self._offset = os.path.getsize(self._path)
+        if os.path.exists(self._checkpoint_path):
+            os.remove(self._checkpoint_path)
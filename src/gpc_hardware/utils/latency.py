@@ -0,0 +1,450 @@
+"""
+Latency instrumentation of the gcode pipeline.
+
+The stream server takes monotonic nanosecond timestamps (perf_counter_ns)
+of every line when it is received, parsed, queued, dispatched and when the
+hardware calls returned. The differences are recorded per stage in
+log-linear histograms, like HdrHistogram: every power of two is split in
+a fixed number of sub-buckets, so the relative error of a recorded value is
+bounded (at most 1/16 with the default 5 precision bits) from nanoseconds to
+minutes, with a few hundred counters per histogram. Recording a value is an
+integer bit length, a shift and a list increment.
+
+The time of every hardware call is also recorded per command code. The
+histograms are exported as a JSON snapshot or in the Prometheus text format.
+"""
+import json
+from itertools import accumulate
+from typing import Iterable, Optional
+
+
+# Stages of a line, from the timestamps: received, parsed, queued,
+# dispatched and returned.
+STAGES = ("parse", "backpressure", "queue", "hardware", "total")
+# The quantiles in the snapshots
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+# The upper bounds in seconds of the buckets in the Prometheus export
+PROMETHEUS_BUCKETS = tuple(
+    scale * 10.0**exponent for exponent in range(-6, 1) for scale in (1, 2, 5)
+) + (10.0,)
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of durations in nanoseconds.
+
+    Values below 2**precision_bits are counted exactly, larger values in
+    2**(precision_bits - 1) sub-buckets per power of two.
+
+    Examples
+    --------
+    >>> histogram = LatencyHistogram()
+    >>> histogram.record(1500)
+    >>> histogram.record(1600)
+    >>> histogram.quantile(0.5)
+    1535
+
+    """
+
+    def __init__(self, precision_bits: int = 5, max_value: int = 60 * 10**9) -> None:
+        """
+        Initialize an empty histogram.
+
+        Parameters
+        ----------
+        precision_bits : int
+            The number of significant bits kept of every value.
+        max_value : int
+            The largest value in nanoseconds, larger values are counted as
+            this value.
+
+        Raises
+        ------
+        ValueError:
+            If precision_bits is less than 2 or max_value is not positive.
+
+        """
+        if precision_bits < 2:
+            raise ValueError(
+                "precision_bits must be at least 2, not {}".format(precision_bits)
+            )
+        if max_value < 1:
+            raise ValueError("max_value must be positive, not {}".format(max_value))
+        self._bits = precision_bits
+        self._max_value = max_value
+        self._counts = [0] * (self._index(max_value) + 1)
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = 0
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return "LatencyHistogram(count={}, buckets={})".format(
+            self._count, len(self._counts)
+        )
+
+    def __len__(self) -> int:
+        return self._count
+
+    # PROPERTIES
+    @property
+    def count(self) -> int:
+        """The number of recorded values."""
+        return self._count
+
+    @property
+    def total(self) -> int:
+        """The sum of the recorded values in nanoseconds."""
+        return self._total
+
+    @property
+    def min(self) -> Optional[int]:
+        """The smallest recorded value, None if nothing is recorded."""
+        return self._min
+
+    @property
+    def max(self) -> int:
+        """The largest recorded value, 0 if nothing is recorded."""
+        return self._max
+
+    @property
+    def mean(self) -> float:
+        """The mean of the recorded values, 0 if nothing is recorded."""
+        return self._total / self._count if self._count else 0.0
+
+    # PUBLIC FUNCTIONS
+    def record(self, value: int) -> ...:
+        """
+        Record a duration.
+
+        Parameters
+        ----------
+        value : int
+            The duration in nanoseconds, negative values are counted as 0.
+
+        """
+        if value < 0:
+            value = 0
+        elif value > self._max_value:
+            value = self._max_value
+        bits = self._bits
+        shift = value.bit_length() - bits
+        if shift <= 0:
+            self._counts[value] += 1
+        else:
+            self._counts[(shift << bits - 1) + (value >> shift)] += 1
+        self._count += 1
+        self._total += value
+        if value > self._max:
+            self._max = value
+        if self._min is None or value < self._min:
+            self._min = value
+
+    def quantile(self, q: float) -> int:
+        """
+        Get a quantile of the recorded values.
+
+        Parameters
+        ----------
+        q : float
+            The quantile, between 0 and 1.
+
+        Returns
+        -------
+        int
+            The upper bound of the bucket with the quantile in nanoseconds,
+            limited to the largest recorded value. 0 if nothing is recorded.
+
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1, not {}".format(q))
+        if not self._count:
+            return 0
+        rank = max(1, round(q * self._count))
+        for index, cumulative in enumerate(accumulate(self._counts)):
+            if cumulative >= rank:
+                return min(self._upper(index), self._max)
+        return self._max
+
+    def count_below(self, values: Iterable[int]) -> list:
+        """
+        Count the recorded values up to each of the given values.
+
+        Parameters
+        ----------
+        values : iterable of int
+            Increasing values in nanoseconds.
+
+        Returns
+        -------
+        list
+            The number of recorded values in the buckets with an upper bound
+            up to every value.
+
+        """
+        result = []
+        cumulative = 0
+        index = 0
+        counts = self._counts
+        for value in values:
+            while index < len(counts) and self._upper(index) <= value:
+                cumulative += counts[index]
+                index += 1
+            result.append(cumulative)
+        return result
+
+    def merge(self, other: "LatencyHistogram") -> ...:
+        """Add the values of a histogram with the same precision and range."""
+        if (other._bits, other._max_value) != (self._bits, self._max_value):
+            raise ValueError("Can only merge histograms with the same precision.")
+        self._counts = [a + b for a, b in zip(self._counts, other._counts)]
+        self._count += other._count
+        self._total += other._total
+        self._max = max(self._max, other._max)
+        if other._min is not None and (self._min is None or other._min < self._min):
+            self._min = other._min
+
+    def reset(self) -> ...:
+        """Remove the recorded values."""
+        self._counts = [0] * len(self._counts)
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = 0
+
+    def to_dict(self, quantiles: Iterable[float] = QUANTILES) -> dict:
+        """
+        Get the summary of the histogram in seconds.
+
+        Parameters
+        ----------
+        quantiles : iterable of float
+            The quantiles to add, f.e. 0.99 is added as 'p99'.
+
+        Returns
+        -------
+        dict
+            The count and the min, mean, max and quantiles in seconds.
+
+        """
+        summary = {
+            "count": self._count,
+            "min": (self._min or 0) * 1e-9,
+            "mean": self.mean * 1e-9,
+            "max": self._max * 1e-9,
+        }
+        for q in quantiles:
+            summary["p{:g}".format(q * 100).replace(".", "")] = self.quantile(q) * 1e-9
+        return summary
+
+    # PRIVATE FUNCTIONS
+    def _index(self, value: int) -> int:
+        """Get the bucket of a value."""
+        shift = value.bit_length() - self._bits
+        if shift <= 0:
+            return value
+        return (shift << self._bits - 1) + (value >> shift)
+
+    def _upper(self, index: int) -> int:
+        """Get the largest value in a bucket."""
+        exact = 1 << self._bits
+        if index < exact:
+            return index
+        half = exact >> 1
+        shift = (index - exact) // half + 1
+        return (((index - exact) % half + half + 1) << shift) - 1
+
+
+class PipelineLatency:
+    """
+    Latency histograms of the stages of the gcode pipeline and per command.
+
+    The stages are:
+
+    - parse: received until parsed.
+    - backpressure: parsed until queued, the time waiting for queue space.
+    - queue: queued until dispatched to the worker thread.
+    - hardware: dispatched until every handler of the line returned.
+    - total: received until every handler of the line returned.
+
+    Examples
+    --------
+    >>> latency = PipelineLatency()
+    >>> server = GcodeStreamServer(dispatcher, latency=latency)
+    >>> print(latency.to_prometheus())
+
+    """
+
+    def __init__(self, precision_bits: int = 5, max_seconds: float = 60.0) -> None:
+        """
+        Initialize the empty histograms.
+
+        Parameters
+        ----------
+        precision_bits : int
+            The number of significant bits kept of every duration.
+        max_seconds : float
+            The longest duration, longer durations are counted as this.
+
+        """
+        self._bits = precision_bits
+        self._max_value = int(max_seconds * 1e9)
+        self._stages = {stage: self._histogram() for stage in STAGES}
+        self._commands = {}
+        self.enabled = True
+        """Record the lines, the timestamps are not taken when False."""
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return "PipelineLatency(lines={}, commands={}, enabled={})".format(
+            self._stages["total"].count, len(self._commands), self.enabled
+        )
+
+    # PROPERTIES
+    @property
+    def stages(self) -> dict:
+        """The histogram of every stage."""
+        return dict(self._stages)
+
+    @property
+    def commands(self) -> dict:
+        """The histogram of the hardware calls of every command code."""
+        return dict(self._commands)
+
+    # PUBLIC FUNCTIONS
+    def record_line(
+        self, received: int, parsed: int, queued: int, dispatched: int, returned: int
+    ) -> ...:
+        """
+        Record the timestamps of a line.
+
+        Parameters
+        ----------
+        received, parsed, queued, dispatched, returned : int
+            The perf_counter_ns timestamps of the line.
+
+        """
+        stages = self._stages
+        stages["parse"].record(parsed - received)
+        stages["backpressure"].record(queued - parsed)
+        stages["queue"].record(dispatched - queued)
+        stages["hardware"].record(returned - dispatched)
+        stages["total"].record(returned - received)
+
+    def record_command(self, command: str, elapsed: int) -> ...:
+        """
+        Record the duration of the hardware call of a command.
+
+        Parameters
+        ----------
+        command : str
+            The command code, f.e. 'G0'.
+        elapsed : int
+            The duration of the call in nanoseconds.
+
+        """
+        histogram = self._commands.get(command)
+        if histogram is None:
+            histogram = self._commands[command] = self._histogram()
+        histogram.record(elapsed)
+
+    def reset(self) -> ...:
+        """Remove the recorded values."""
+        for histogram in self._stages.values():
+            histogram.reset()
+        self._commands.clear()
+
+    def snapshot(self, quantiles: Iterable[float] = QUANTILES) -> dict:
+        """
+        Get the summaries of the histograms.
+
+        Parameters
+        ----------
+        quantiles : iterable of float
+            The quantiles in the summaries.
+
+        Returns
+        -------
+        dict
+            The summary of every stage and command in seconds, see
+            LatencyHistogram.to_dict.
+
+        """
+        quantiles = tuple(quantiles)
+        return {
+            "stages": {
+                stage: histogram.to_dict(quantiles)
+                for stage, histogram in self._stages.items()
+            },
+            "commands": {
+                command: histogram.to_dict(quantiles)
+                for command, histogram in sorted(self._commands.items())
+            },
+        }
+
+    def to_json(self, **kwargs) -> str:
+        """Get the snapshot as JSON, the kwargs are passed to json.dumps."""
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(
+        self, prefix: str = "gcode", buckets: Iterable[float] = PROMETHEUS_BUCKETS
+    ) -> str:
+        """
+        Get the histograms in the Prometheus text exposition format.
+
+        Parameters
+        ----------
+        prefix : str
+            The prefix of the metric names.
+        buckets : iterable of float
+            The increasing upper bounds of the buckets in seconds.
+
+        Returns
+        -------
+        str
+            The histograms <prefix>_stage_latency_seconds with a stage label
+            and <prefix>_command_latency_seconds with a command label.
+
+        """
+        buckets = tuple(buckets)
+        lines = []
+        for name, label, histograms, description in (
+            ("stage", "stage", self._stages, "Latency of the gcode pipeline stages."),
+            (
+                "command",
+                "command",
+                dict(sorted(self._commands.items())),
+                "Latency of the hardware calls per command.",
+            ),
+        ):
+            metric = "{}_{}_latency_seconds".format(prefix, name)
+            lines.append("# HELP {} {}".format(metric, description))
+            lines.append("# TYPE {} histogram".format(metric))
+            for key, histogram in histograms.items():
+                counts = histogram.count_below(int(bound * 1e9) for bound in buckets)
+                for bound, count in zip(buckets, counts):
+                    lines.append(
+                        '{}_bucket{{{}="{}",le="{:g}"}} {}'.format(
+                            metric, label, key, bound, count
+                        )
+                    )
+                lines.append(
+                    '{}_bucket{{{}="{}",le="+Inf"}} {}'.format(
+                        metric, label, key, histogram.count
+                    )
+                )
+                lines.append(
+                    '{}_sum{{{}="{}"}} {:.9g}'.format(
+                        metric, label, key, histogram.total * 1e-9
+                    )
+                )
+                lines.append(
+                    '{}_count{{{}="{}"}} {}'.format(metric, label, key, histogram.count)
+                )
+        return "\n".join(lines) + "\n"
+
+    # PRIVATE FUNCTIONS
+    def _histogram(self) -> LatencyHistogram:
+        """Create an empty histogram with the precision of the pipeline."""
+        return LatencyHistogram(self._bits, self._max_value)
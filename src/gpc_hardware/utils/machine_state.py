@@ -0,0 +1,427 @@
+"""
+Modal state of a machine executing gcode.
+
+GcodeMachineState keeps track of the positioning mode (G90 absolute, G91
+relative), the position of every motion axis, the steps per unit (M92) and
+homing (G28). Single commands are executed one by one, complete compiled
+programs are converted to absolute positions and step targets in one go
+with NumPy cumulative sums. Arcs (G2, G3) move the arc axes to the end of
+the arc, use arc_expander to get the path along the arc.
+"""
+from typing import Union, Iterable, Mapping, NamedTuple, Optional
+import numpy as np
+
+try:
+    from .accepted_gcode import (
+        ACCEPTED_ARC_AXES,
+        ACCEPTED_LINEAR_AXES,
+        ACCEPTED_ROTATIONAL_AXES,
+    )
+    from .gcode_program import GcodeProgram
+except ImportError:
+    from .accepted_gcode import (
+        ACCEPTED_ARC_AXES,
+        ACCEPTED_LINEAR_AXES,
+        ACCEPTED_ROTATIONAL_AXES,
+    )
+    from .gcode_program import GcodeProgram
+
+
+MOTION_AXES = ACCEPTED_LINEAR_AXES + ACCEPTED_ROTATIONAL_AXES
+MOVE_COMMANDS = ("G0", "G1")
+ARC_COMMANDS = ("G2", "G3")
+
+
+class ProgramMoves(NamedTuple):
+    """The targets of the moves of a compiled program."""
+
+    rows: np.ndarray
+    """The row of every move in the command table of the program."""
+    lines: np.ndarray
+    """The line number of every move."""
+    positions: np.ndarray
+    """The absolute position after every move, shape (moves, axes)."""
+    steps: np.ndarray
+    """The absolute step target of every move, shape (moves, axes)."""
+    absolute: np.ndarray
+    """True for the moves with absolute positioning (G90)."""
+
+
+def move_starts(
+    program: GcodeProgram, moves: ProgramMoves, initial: np.ndarray
+) -> np.ndarray:
+    """
+    Get the position before every move of a program.
+
+    Parameters
+    ----------
+    program : GcodeProgram
+        The compiled program.
+    moves : ProgramMoves
+        The moves of the program, see GcodeMachineState.run_program.
+    initial : np.ndarray
+        The position before the program, in the order of the axes of moves.
+
+    Returns
+    -------
+    np.ndarray
+        The start position of every move, shape (moves, axes).
+
+    """
+    # The end of the previous move, or the origin if G28 was executed in
+    # between.
+    starts = np.empty_like(moves.positions)
+    if len(starts) == 0:
+        return starts
+    starts[0] = initial
+    starts[1:] = moves.positions[:-1]
+    if "G28" in program.command_names:
+        is_home = program.commands["command"] == program.command_code("G28")
+        last_home = np.maximum.accumulate(
+            np.where(is_home, np.arange(len(program)), -1)
+        )
+        previous_rows = np.concatenate(([-1], moves.rows[:-1]))
+        starts[last_home[moves.rows] > previous_rows] = 0
+    return starts
+
+
+class GcodeMachineState:
+    """
+    Executor keeping track of the modal state of a machine.
+
+    The position of every axis in MOTION_AXES starts at 0, the positioning
+    is absolute and every axis has 1 step per unit. M92 is accepted for
+    every axis of the parser, the axes without position are ignored.
+    """
+
+    def __init__(self, axes: Iterable[str] = MOTION_AXES) -> None:
+        """
+        Initialize the machine state.
+
+        Parameters
+        ----------
+        axes : iterable of str
+            The axes with a position.
+
+        """
+        self._axes = tuple(axes)
+        self._index = {axis: i for i, axis in enumerate(self._axes)}
+        self._absolute = True
+        self._position = np.zeros(len(self._axes))
+        self._steps_per_unit = np.ones(len(self._axes))
+        self._handlers = {
+            "G0": self._move,
+            "G1": self._move,
+            "G2": self._arc,
+            "G3": self._arc,
+            "G28": self._home,
+            "G90": self._set_absolute,
+            "G91": self._set_relative,
+            "M92": self._set_steps_per_unit,
+        }
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return "GcodeMachineState(absolute={}, position={})".format(
+            self._absolute, self.position
+        )
+
+    # PROPERTIES
+    @property
+    def axes(self) -> tuple:
+        """The axes with a position."""
+        return self._axes
+
+    @property
+    def absolute(self) -> bool:
+        """True for absolute positioning (G90), False for relative (G91)."""
+        return self._absolute
+
+    @property
+    def position(self) -> dict:
+        """The current position of every axis."""
+        return dict(zip(self._axes, self._position.tolist()))
+
+    @property
+    def position_vector(self) -> np.ndarray:
+        """The current position as an array in the order of axes (a copy)."""
+        return self._position.copy()
+
+    @property
+    def steps_per_unit(self) -> dict:
+        """The steps per unit of every axis."""
+        return dict(zip(self._axes, self._steps_per_unit.tolist()))
+
+    @property
+    def steps(self) -> dict:
+        """The current position of every axis in steps."""
+        steps = np.rint(self._position * self._steps_per_unit).astype(np.int64)
+        return dict(zip(self._axes, steps.tolist()))
+
+    # PUBLIC FUNCTIONS
+    def execute(self, command: str, values: Optional[dict] = None) -> ...:
+        """
+        Execute a single command.
+
+        Commands that do not change the modal state are ignored.
+
+        Parameters
+        ----------
+        command : str
+            The command id.
+        values : dict, optional
+            The axis and attribute values of the command.
+
+        Raises
+        ------
+        KeyError:
+            If a move contains an axis without position.
+        ValueError:
+            If M92 sets a steps per unit that is not positive.
+
+        """
+        handler = self._handlers.get(command)
+        if handler is not None:
+            handler(values or {})
+
+    def execute_parsed(self, parsed: Union[Mapping, Iterable]) -> ...:
+        """
+        Execute parsed commands in order.
+
+        Parameters
+        ----------
+        parsed : mapping or iterable of ParsedCommand
+            The output of GcodeParser.parse_gcode_line or a sequence of
+            ParsedCommand objects.
+
+        """
+        if isinstance(parsed, Mapping):
+            for command, values in parsed.items():
+                self.execute(command, values)
+        else:
+            for command in parsed:
+                self.execute(command.command, command.to_dict()[command.command])
+
+    def run_program(self, program: GcodeProgram) -> ProgramMoves:
+        """
+        Execute a compiled program and get the targets of its moves.
+
+        All rows are handled with vectorized NumPy operations, the modal
+        commands inside the program are taken into account. The state is
+        left as it is after the last command of the program.
+
+        Parameters
+        ----------
+        program : GcodeProgram
+            The compiled program.
+
+        Raises
+        ------
+        KeyError:
+            If an axis of the state is not stored in the program.
+        ValueError:
+            If M92 sets a steps per unit that is not positive.
+
+        Returns
+        -------
+        ProgramMoves
+            The absolute positions and step targets of the moves.
+
+        """
+        n_rows = len(program)
+        # The columns of the structured table are strided, the contiguous
+        # copies make all following operations a lot faster.
+        codes = np.ascontiguousarray(program.commands["command"])
+        rows = np.arange(n_rows)
+        names = program.command_names
+
+        def rows_of(*commands):
+            mask = np.zeros(n_rows, dtype=bool)
+            for command in commands:
+                if command in names:
+                    mask |= codes == program.command_code(command)
+            return mask
+
+        is_line = rows_of(*MOVE_COMMANDS)
+        is_arc = rows_of(*ARC_COMMANDS)
+        is_move = is_line | is_arc
+        is_home = rows_of("G28")
+        is_absolute = rows_of("G90")
+        is_mode = is_absolute | rows_of("G91")
+        is_scale = rows_of("M92")
+
+        for axis in program.axes:
+            # The words of arcs that are not an arc axis (f.e. J) are not moves.
+            moving = is_move if axis in ACCEPTED_ARC_AXES else is_line
+            if axis not in self._index and np.any(
+                moving & ~np.isnan(program.axis(axis))
+            ):
+                raise KeyError("Axis {} has no position.".format(axis))
+
+        # Forward fill the positioning mode from the last G90/G91.
+        last_mode = np.maximum.accumulate(np.where(is_mode, rows, -1))
+        absolute = np.where(last_mode >= 0, is_absolute[last_mode], self._absolute)
+
+        arc_moves = (is_move & absolute, is_move & ~absolute)
+        line_moves = (is_line & absolute, is_line & ~absolute)
+        any_home = bool(is_home.any())
+        move_rows = np.flatnonzero(is_move)
+        # Only the move rows are kept, the last row gives the final state.
+        positions = np.empty((len(move_rows), len(self._axes)))
+        steps = np.empty((len(move_rows), len(self._axes)), dtype=np.int64)
+        final_position = self._position.copy()
+        final_steps_per_unit = self._steps_per_unit.copy()
+        for i, axis in enumerate(self._axes):
+            values = np.ascontiguousarray(program.axis(axis))
+            given = ~np.isnan(values)
+            if axis in ACCEPTED_ARC_AXES:
+                moves_absolute, moves_relative = arc_moves
+            else:
+                moves_absolute, moves_relative = line_moves
+            if not any_home and not given.any():  # Axis not used in the program
+                positions[:, i] = self._position[i]
+                steps[:, i] = np.rint(self._position[i] * self._steps_per_unit[i])
+                continue
+
+            # Relative moves add up, absolute moves and homing set the
+            # position. Every row gets the last set value plus the sum of
+            # the relative moves after it.
+            total = np.cumsum(np.where(moves_relative & given, values, 0.0))
+            is_set = (moves_absolute & given) | is_home
+            if is_set.any():
+                set_value = np.where(is_home, 0.0, values)
+                last_set = np.maximum.accumulate(np.where(is_set, rows, -1))
+                has_set = last_set >= 0
+                base = np.where(has_set, set_value[last_set], self._position[i])
+                offset = np.where(has_set, total[last_set], 0.0)
+                position = base + total - offset
+            else:
+                position = self._position[i] + total
+
+            scale = is_scale & given
+            if scale.any():
+                if np.any(values[scale] <= 0):
+                    raise ValueError(
+                        "Steps per unit of axis {} must be positive.".format(axis)
+                    )
+                last_scale = np.maximum.accumulate(np.where(scale, rows, -1))
+                steps_per_unit = np.where(
+                    last_scale >= 0, values[last_scale], self._steps_per_unit[i]
+                )
+                final_steps_per_unit[i] = steps_per_unit[-1]
+                steps_per_unit = steps_per_unit[move_rows]
+            else:
+                steps_per_unit = self._steps_per_unit[i]
+
+            if n_rows:
+                final_position[i] = position[-1]
+            position = position[move_rows]
+            positions[:, i] = position
+            steps[:, i] = np.rint(position * steps_per_unit)
+
+        if n_rows:
+            self._absolute = bool(absolute[-1])
+        self._position = final_position
+        self._steps_per_unit = final_steps_per_unit
+        return ProgramMoves(
+            move_rows, program.lines[move_rows], positions, steps, absolute[move_rows]
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Get the modal state as a dict of built-in types.
+
+        Returns
+        -------
+        dict
+            The axes, the positioning mode and the position and steps per
+            unit of every axis, see from_dict.
+
+        """
+        return {
+            "axes": list(self._axes),
+            "absolute": self._absolute,
+            "position": self.position,
+            "steps_per_unit": self.steps_per_unit,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GcodeMachineState":
+        """
+        Create a machine state from the output of to_dict.
+
+        Parameters
+        ----------
+        data : dict
+            The axes, positioning mode, positions and steps per unit.
+
+        Raises
+        ------
+        KeyError:
+            If a position or steps per unit is given for an axis that is not
+            in the axes.
+
+        Returns
+        -------
+        GcodeMachineState
+            The restored machine state.
+
+        """
+        state = cls(data["axes"])
+        state._absolute = bool(data["absolute"])
+        for axis, value in data["position"].items():
+            state._position[state._axis_index(axis)] = value
+        for axis, value in data["steps_per_unit"].items():
+            state._steps_per_unit[state._axis_index(axis)] = value
+        return state
+
+    def reset(self) -> ...:
+        """Reset the machine to the initial state."""
+        self._absolute = True
+        self._position[:] = 0
+        self._steps_per_unit[:] = 1
+
+    # PRIVATE FUNCTIONS
+    def _axis_index(self, axis: str) -> int:
+        """Get the index of an axis in the state."""
+        try:
+            return self._index[axis]
+        except KeyError:
+            raise KeyError("Axis {} has no position.".format(axis))
+
+    def _move(self, values: dict) -> ...:
+        """G0 and G1: move to a position."""
+        for axis, value in values.items():
+            i = self._axis_index(axis)
+            if self._absolute:
+                self._position[i] = value
+            else:
+                self._position[i] += value
+
+    def _arc(self, values: dict) -> ...:
+        """G2 and G3: move the arc axes to the end of the arc."""
+        self._move({axis: values[axis] for axis in ACCEPTED_ARC_AXES if axis in values})
+
+    def _home(self, values: dict) -> ...:
+        """G28: move all axes to the origin."""
+        self._position[:] = 0
+
+    def _set_absolute(self, values: dict) -> ...:
+        """G90: absolute positioning."""
+        self._absolute = True
+
+    def _set_relative(self, values: dict) -> ...:
+        """G91: relative positioning."""
+        self._absolute = False
+
+    def _set_steps_per_unit(self, values: dict) -> ...:
+        """M92: set the steps per unit of the given axes with a position."""
+        for axis, value in values.items():
+            i = self._index.get(axis)
+            if i is None:
+                continue
+            if value <= 0:
+                raise ValueError(
+                    "Steps per unit of axis {} must be positive.".format(axis)
+                )
+            self._steps_per_unit[i] = value
@@ -0,0 +1,448 @@
+"""
+Expansion of the macro commands into gcode lines.
+
+The macro commands (MACRO_COMMANDS in accepted_gcode.py) are defined in the
+settings as a list of gcode lines. A word with the value {S} gets the value of
+the attribute S of the macro call, every attribute of the macro command can be
+used as parameter. With ``M814 = ['G91', 'G0 Z{S}', 'G90']`` the call
+``M814 S5`` runs ``G91``, ``G0 Z5`` and ``G90``.
+
+The definitions are parsed once when they are loaded. Macros calling other
+macros are inlined and recursive macros are rejected. Expanding a call only
+fills in the lines using a parameter, the other lines are parsed lines shared
+by every call, so the cost of a call does not depend on the length of the
+macro. The shared lines are read only mappings. A parameter value is
+converted to the type the parser gives the word it fills in, so the lines of
+a macro get the same values as the same lines in a program.
+"""
+import re
+from itertools import chain
+from types import MappingProxyType
+from typing import Union, Iterable, Iterator, Mapping, Optional, Sequence
+
+try:
+    from . import accepted_gcode
+    from .gcode_parser import GcodeAttributeError, GcodeParser, GcodeParsingError
+    from ..settings import Settings
+except ImportError:
+    from . import accepted_gcode
+    from .gcode_parser import GcodeAttributeError, GcodeParser, GcodeParsingError
+    from ..settings import Settings
+
+
+# A parameter is replaced by a unique integer while the line is parsed, the
+# integer is then looked up in the parsed values to find the parameter.
+_PARAMETER = re.compile(r"\{([A-Za-z])\}")
+_PLACEHOLDER = 7340000000
+
+
+class GcodeMacroError(Exception):
+    """Exception raised when a macro can not be loaded or expanded."""
+
+    def __init__(self, msg):
+        self._msg = msg
+
+
+def _convert_parameter(command: str, key: str, value: object) -> object:
+    """
+    Convert a parameter value like the parser converts the word key of command.
+    Raises a GcodeAttributeError if the value does not fit the word.
+    """
+    grammar = GcodeParser._grammar
+    types = grammar.source[command].get(key, (int, float))  # Axes are numbers
+    if type(value) in types:
+        return value
+    convert = grammar.commands[command][2].get(key) or grammar.heads[key][2]
+    # Other values are converted from their text, f.e. 1.5 for an int word
+    # stays the text '1.5' like the word I1.5 of a line.
+    return convert(value if isinstance(value, str) else repr(value))
+
+
+class _Parameter(str):
+    """The name of a parameter of the calling macro, used while inlining."""
+
+    __slots__ = ()
+
+
+class MacroEngine:
+    """
+    Expands the macro commands of parsed gcode lines.
+
+    Examples
+    --------
+    >>> macros = MacroEngine({'M814': ['G91', 'G0 Z{S}', 'G90']})
+    >>> for _, _, commands in macros.stream(GcodeParser.parse_stream(path)):
+    ...     dispatcher.execute(commands)
+
+    """
+
+    def __init__(
+        self,
+        macros: Optional[Mapping[str, Union[str, Sequence[str]]]] = None,
+        settings: Optional[Settings] = None,
+        section: str = "macros.DEFAULT",
+    ) -> None:
+        """
+        Load and parse the macro definitions.
+
+        Parameters
+        ----------
+        macros : mapping, optional
+            The gcode lines of every macro command, as a list of lines or a
+            string with one line per line. Read from the settings if not
+            given.
+        settings : Settings, optional
+            The settings with the macros, default.ini if not given.
+        section : str
+            The settings section, missing macros are read from macros.DEFAULT.
+
+        Raises
+        ------
+        GcodeMacroError:
+            If a command is not a macro command, a line can not be parsed,
+            a parameter is not an attribute of the macro command, a macro
+            calls a macro that is not defined or the macros are recursive.
+
+        """
+        if macros is None:
+            if settings is None:
+                settings = Settings()
+            macros = {}
+            for command in accepted_gcode.MACRO_COMMANDS:
+                try:
+                    macros[command] = settings.get(section, command)
+                except KeyError:
+                    continue
+
+        templates = {}
+        for command, lines in macros.items():
+            if command not in accepted_gcode.MACRO_COMMANDS:
+                raise GcodeMacroError("{} is not a macro command.".format(command))
+            if isinstance(lines, str):
+                lines = lines.splitlines()
+            templates[command] = self._parse_macro(command, lines)
+        self._check_calls(templates)
+
+        inlined = {}
+        for command in templates:
+            self._inline(command, templates, inlined)
+        self._macros = {
+            command: self._freeze(lines) for command, lines in inlined.items()
+        }
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return "MacroEngine(macros={})".format(", ".join(self._macros))
+
+    def __len__(self) -> int:
+        return len(self._macros)
+
+    def __contains__(self, command: str) -> bool:
+        return command in self._macros
+
+    # PROPERTIES
+    @property
+    def commands(self) -> tuple:
+        """The defined macro commands."""
+        return tuple(self._macros)
+
+    # PUBLIC FUNCTIONS
+    def expand(
+        self, command: str, values: Optional[Mapping[str, object]] = None
+    ) -> Iterator[Mapping]:
+        """
+        Expand a macro call.
+
+        Parameters
+        ----------
+        command : str
+            The macro command.
+        values : mapping, optional
+            The attribute values of the call, the parameters of the macro.
+
+        Raises
+        ------
+        GcodeMacroError:
+            If the macro is not defined or a parameter used by the macro is
+            not given or does not fit the word it fills in.
+
+        Returns
+        -------
+        iterator of mapping
+            The parsed commands of every line of the macro.
+
+        """
+        try:
+            segments = self._macros[command]
+        except KeyError:
+            raise GcodeMacroError("Macro {} is not defined.".format(command)) from None
+        if values is None:
+            values = {}
+
+        parts = []
+        for lines, commands, slots in segments:
+            if lines is not None:
+                parts.append(lines)
+                continue
+            try:
+                parts.append((self._fill(commands, slots, values)[0],))
+            except KeyError as e:
+                raise GcodeMacroError(
+                    "Macro {} needs the parameter {}.".format(command, e.args[0])
+                ) from None
+            except GcodeAttributeError as e:
+                raise GcodeMacroError("Macro {}: {}".format(command, e)) from e
+        return chain.from_iterable(parts)
+
+    def expand_line(self, commands: Mapping[str, Mapping]) -> Iterator[Mapping]:
+        """
+        Expand the macro calls of a parsed line.
+
+        The commands before and after a macro call stay in their own line,
+        macro commands without definition are not expanded.
+
+        Parameters
+        ----------
+        commands : mapping
+            The parsed commands of the line, f.e. the output of
+            GcodeParser.parse_gcode_line.
+
+        Raises
+        ------
+        GcodeMacroError:
+            If a parameter used by a macro is not given or does not fit the
+            word it fills in.
+
+        Returns
+        -------
+        iterator of mapping
+            The parsed commands of every line, the line itself if it does not
+            call a macro.
+
+        """
+        macros = self._macros
+        if macros.keys().isdisjoint(commands):
+            return iter((commands,))
+
+        parts = []
+        other = {}
+        for command, values in commands.items():
+            if command not in macros:
+                other[command] = values
+                continue
+            if other:
+                parts.append((other,))
+                other = {}
+            parts.append(self.expand(command, values))
+        if other:
+            parts.append((other,))
+        return chain.from_iterable(parts)
+
+    def stream(self, parsed: Iterable[tuple]) -> Iterator[tuple]:
+        """
+        Expand the macro calls of a stream of parsed lines.
+
+        Parameters
+        ----------
+        parsed : iterable of tuple
+            The line number, byte offset and parsed commands of every line,
+            f.e. the output of GcodeParser.parse_stream.
+
+        Raises
+        ------
+        GcodeMacroError:
+            If a parameter used by a macro is not given or does not fit the
+            word it fills in.
+
+        Yields
+        ------
+        tuple
+            The line number, byte offset and parsed commands of every line,
+            the lines of a macro get the line number and offset of the call.
+
+        """
+        macros = self._macros
+        for item in parsed:
+            line_number, offset, commands = item
+            if macros.keys().isdisjoint(commands):
+                yield item
+                continue
+            for line in self.expand_line(commands):
+                yield line_number, offset, line
+
+    # PRIVATE FUNCTIONS
+    @staticmethod
+    def _parse_macro(command: str, lines: Iterable[str]) -> list:
+        """Parse the lines of a macro into (commands, slots) templates."""
+        spec = accepted_gcode.ACCEPTED_COMMANDS[command]
+        parameters = [attr for attr in spec if attr != "ACCEPTED_AXES"]
+
+        templates = []
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line or line[0] == ";":
+                continue
+
+            names = []
+
+            def placeholder(match):
+                name = match.group(1)
+                if name not in parameters:
+                    raise GcodeMacroError(
+                        "Macro {} line {}: {} is not a parameter of {}.".format(
+                            command, line_number, match.group(0), command
+                        )
+                    )
+                names.append(name)
+                return str(_PLACEHOLDER + len(names) - 1)
+
+            try:
+                commands = GcodeParser.parse_gcode_line(
+                    _PARAMETER.sub(placeholder, line)
+                )
+            except (GcodeAttributeError, GcodeParsingError) as e:
+                raise GcodeMacroError(
+                    "Macro {} line {}: {}".format(command, line_number, e)
+                ) from e
+
+            slots = []
+            for name, values in commands.items():
+                for key, value in values.items():
+                    if type(value) is int and 0 <= value - _PLACEHOLDER < len(names):
+                        slots.append((name, key, names[value - _PLACEHOLDER]))
+            if len(slots) != len(names):
+                raise GcodeMacroError(
+                    "Macro {} line {}: a parameter must be the whole value of "
+                    "a word.".format(command, line_number)
+                )
+            templates.append((commands, tuple(slots)))
+        return templates
+
+    @staticmethod
+    def _check_calls(templates: dict) -> ...:
+        """Check every called macro is defined and no macro calls itself."""
+        calls = {
+            command: [
+                name
+                for commands, _ in lines
+                for name in commands
+                if name in accepted_gcode.MACRO_COMMANDS
+            ]
+            for command, lines in templates.items()
+        }
+        for command, called in calls.items():
+            for name in called:
+                if name not in templates:
+                    raise GcodeMacroError(
+                        "Macro {} calls {} which is not defined.".format(command, name)
+                    )
+
+        # Depth first search, a macro on the current path is a recursion.
+        finished = set()
+
+        def visit(command, path):
+            if command in path:
+                cycle = path[path.index(command):] + [command]
+                raise GcodeMacroError(
+                    "Recursive macros: {}.".format(" -> ".join(cycle))
+                )
+            if command in finished:
+                return
+            for name in calls[command]:
+                visit(name, path + [command])
+            finished.add(command)
+
+        for command in calls:
+            visit(command, [])
+
+    def _inline(self, command: str, templates: dict, inlined: dict) -> list:
+        """Get the lines of a macro with the called macros inlined."""
+        if command in inlined:
+            return inlined[command]
+
+        lines = []
+        for commands, slots in templates[command]:
+            other, other_slots = {}, []
+            for name, values in commands.items():
+                if name not in templates:
+                    other[name] = values
+                    other_slots.extend(slot for slot in slots if slot[0] == name)
+                    continue
+                if other:
+                    lines.append((other, tuple(other_slots)))
+                    other, other_slots = {}, []
+                # The parameters of this macro stay parameters of the call.
+                binding = dict(values)
+                for slot_command, key, parameter in slots:
+                    if slot_command == name:
+                        binding[key] = _Parameter(parameter)
+                for inner, inner_slots in self._inline(name, templates, inlined):
+                    try:
+                        lines.append(self._fill(inner, inner_slots, binding))
+                    except KeyError as e:
+                        raise GcodeMacroError(
+                            "Macro {} calls {} without the parameter {}.".format(
+                                command, name, e.args[0]
+                            )
+                        ) from None
+                    except GcodeAttributeError as e:
+                        raise GcodeMacroError(
+                            "Macro {} calls {}: {}".format(command, name, e)
+                        ) from e
+            if other:
+                lines.append((other, tuple(other_slots)))
+        inlined[command] = lines
+        return lines
+
+    @staticmethod
+    def _fill(commands: Mapping, slots: tuple, values: Mapping) -> tuple:
+        """
+        Fill in the parameters of a line, parameters given as _Parameter stay
+        a parameter. Raises a KeyError with the name of a missing parameter
+        and a GcodeAttributeError if a value does not fit its word.
+        """
+        if not slots:
+            return commands, slots
+        commands = {name: dict(words) for name, words in commands.items()}
+        remaining = []
+        for name, key, parameter in slots:
+            value = values[parameter]
+            if isinstance(value, _Parameter):
+                remaining.append((name, key, str(value)))
+            else:
+                try:
+                    commands[name][key] = _convert_parameter(name, key, value)
+                except GcodeAttributeError as e:
+                    raise GcodeAttributeError(
+                        "The parameter {} for {} {}: {}".format(parameter, name, key, e)
+                    ) from e
+        return commands, tuple(remaining)
+
+    @staticmethod
+    def _freeze(lines: list) -> tuple:
+        """
+        Group the lines of a macro into segments of (lines, commands, slots).
+
+        Lines without parameters are joined into one tuple of read only lines,
+        a line with parameters is a segment of its own with lines set to None.
+        """
+        segments = []
+        constant = []
+        for commands, slots in lines:
+            if not slots:
+                constant.append(
+                    MappingProxyType(
+                        {
+                            name: MappingProxyType(dict(words))
+                            for name, words in commands.items()
+                        }
+                    )
+                )
+                continue
+            if constant:
+                segments.append((tuple(constant), None, None))
+                constant = []
+            segments.append((None, commands, slots))
+        if constant:
+            segments.append((tuple(constant), None, None))
+        return tuple(segments)
@@ -0,0 +1,646 @@
+"""
+Look-ahead motion planning of gcode moves.
+
+The planner gives every move a trapezoidal velocity profile: it accelerates
+from its entry speed to a cruise speed and decelerates to its exit speed.
+The speed in the corner between two moves (the junction speed) depends on
+the angle between the moves, so moves on an almost straight path are joined
+without stopping. A look-ahead buffer makes sure the machine can always stop
+at the end of the buffered moves.
+
+All per-move math is vectorized over the buffer. The backward and forward
+passes over the speeds are written as prefix minimums of the squared speeds,
+see _plan_speeds.
+
+The planned moves are converted to stepperRATE/stepperMOVE commands for the
+DAQC2 stepper controller, every ramp is approximated by a few pieces with a
+constant rate.
+"""
+from time import perf_counter
+from typing import Union, Iterable, NamedTuple, Optional, Mapping
+import numpy as np
+
+try:
+    from .machine_state import MOTION_AXES, ProgramMoves
+    from ..settings import Settings
+except ImportError:
+    from .machine_state import MOTION_AXES, ProgramMoves
+    from ..settings import Settings
+
+
+class StepperCommand(NamedTuple):
+    """A stepper controller call, f.e. ('stepperMOVE', 'X', 120)."""
+
+    function: str
+    axis: str
+    value: int
+
+
+class PlannedMoves(NamedTuple):
+    """The velocity profiles of planned moves, all speeds in units/s."""
+
+    start_steps: np.ndarray
+    """The absolute step position before the first move, shape (axes,)."""
+    steps: np.ndarray
+    """The number of steps of every move per axis, shape (moves, axes)."""
+    lengths: np.ndarray
+    """The path length of every move."""
+    accelerations: np.ndarray
+    """The acceleration of every move in units/s^2."""
+    entry_speeds: np.ndarray
+    exit_speeds: np.ndarray
+    peak_speeds: np.ndarray
+    """The cruise speed of every move (or the top of a triangular profile)."""
+    times: np.ndarray
+    """The duration of every move in seconds."""
+
+
+class MotionPlanner:
+    """
+    Trapezoidal motion planner with a look-ahead buffer.
+
+    The limits are read from the settings, the values given to the
+    constructor take precedence.
+
+    Examples
+    --------
+    >>> state = GcodeMachineState()
+    >>> moves = state.run_program(GcodeParser.compile_program(lines))
+    >>> planner = MotionPlanner()
+    >>> commands = planner.commands(planner.plan(moves))
+
+    """
+
+    def __init__(
+        self,
+        settings: Optional[Settings] = None,
+        section: str = "planner.DEFAULT",
+        axes: Iterable[str] = MOTION_AXES,
+        acceleration: Union[float, Mapping[str, float], None] = None,
+        max_rate: Union[float, Mapping[str, float], None] = None,
+        look_ahead: Optional[int] = None,
+        junction_deviation: Optional[float] = None,
+        ramp_segments: Optional[int] = None,
+    ) -> None:
+        """
+        Initialize the planner.
+
+        Parameters
+        ----------
+        settings : Settings, optional
+            The settings with the limits, default.ini if not given.
+        section : str
+            The settings section, missing keys are read from planner.DEFAULT.
+        axes : iterable of str
+            The axes of the moves, in the order of the position columns.
+        acceleration : float or mapping, optional
+            The acceleration in units/s^2, one value or a value per axis.
+        max_rate : float or mapping, optional
+            The maximum step rate in steps/s, one value or a value per axis.
+        look_ahead : int, optional
+            The number of moves in the look-ahead buffer.
+        junction_deviation : float, optional
+            The allowed deviation from the path in corners, in units.
+        ramp_segments : int, optional
+            The number of constant rate pieces of a ramp.
+
+        Raises
+        ------
+        ValueError:
+            If a limit is not positive.
+        KeyError:
+            If a per axis limit is missing an axis.
+
+        """
+        self._axes = tuple(axes)
+        values = {
+            "acceleration": acceleration,
+            "max_rate": max_rate,
+            "look_ahead": look_ahead,
+            "junction_deviation": junction_deviation,
+            "ramp_segments": ramp_segments,
+        }
+        if any(value is None for value in values.values()):
+            if settings is None:
+                settings = Settings()
+            for key, value in values.items():
+                if value is None:
+                    values[key] = settings.get(section, key)
+
+        self._acceleration = self._per_axis("acceleration", values["acceleration"])
+        self._max_rate = self._per_axis("max_rate", values["max_rate"])
+        self._look_ahead = int(values["look_ahead"])
+        self._junction_deviation = float(values["junction_deviation"])
+        self._ramp_segments = int(values["ramp_segments"])
+        if self._look_ahead < 2:
+            raise ValueError("look_ahead must be at least 2.")
+        if self._junction_deviation < 0:
+            raise ValueError("junction_deviation can not be negative.")
+        if self._ramp_segments < 1:
+            raise ValueError("ramp_segments must be at least 1.")
+
+        # Streaming state
+        self._buffer = []
+        self._steps = np.zeros(len(self._axes), dtype=np.int64)
+        self._position = np.zeros(len(self._axes))
+        self._speed = 0.0
+
+        self._kept = 0  # Buffered moves used by the last _plan_buffer call
+
+        self._planned_moves = 0
+        self._planning_time = 0.0
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return "MotionPlanner(look_ahead={}, buffered={})".format(
+            self._look_ahead, len(self._buffer)
+        )
+
+    # PROPERTIES
+    @property
+    def axes(self) -> tuple:
+        """The axes of the moves."""
+        return self._axes
+
+    @property
+    def look_ahead(self) -> int:
+        """The number of moves in the look-ahead buffer."""
+        return self._look_ahead
+
+    @property
+    def planning_time(self) -> dict:
+        """The number of planned moves and the planning time in seconds."""
+        moves = self._planned_moves
+        return {
+            "moves": moves,
+            "total": self._planning_time,
+            "per_move": self._planning_time / moves if moves else 0.0,
+        }
+
+    # PUBLIC FUNCTIONS
+    def plan(self, moves: ProgramMoves) -> PlannedMoves:
+        """
+        Plan a batch of moves, the machine stops after the last move.
+
+        The moves are planned through the look-ahead buffer, so the result
+        is the same as adding the moves one by one and flushing. Moves that
+        are still in the buffer are planned first.
+
+        Parameters
+        ----------
+        moves : ProgramMoves
+            The absolute positions and step targets of the moves, f.e. from
+            GcodeMachineState.run_program.
+
+        Returns
+        -------
+        PlannedMoves
+            The velocity profiles of the moves with a length.
+
+        """
+        shape = (-1, len(self._axes))
+        positions = np.asarray(moves.positions, dtype=float).reshape(shape)
+        steps = np.asarray(moves.steps, dtype=np.int64).reshape(shape)
+        if self._buffer:  # Moves added with add_move go first
+            buffered_positions, buffered_steps = self._take_buffer()
+            positions = np.concatenate((buffered_positions, positions))
+            steps = np.concatenate((buffered_steps, steps))
+        return self._plan_buffer(positions, steps, final=True)
+
+    def estimate(
+        self,
+        moves: ProgramMoves,
+        start_position: Optional[Iterable[float]] = None,
+        start_steps: Optional[Iterable[int]] = None,
+    ) -> PlannedMoves:
+        """
+        Plan a batch of moves in one pass with an unlimited look-ahead.
+
+        All moves are planned at once without the windows of plan, which is
+        a lot faster for large programs. A shorter look-ahead can only lower
+        the speeds, so the times are a lower bound of the times given by
+        plan. The machine starts at rest, the buffer is not used and the
+        position of the planner is not changed.
+
+        Parameters
+        ----------
+        moves : ProgramMoves
+            The absolute positions and step targets of the moves.
+        start_position : iterable of float, optional
+            The position before the first move, the position of the planner
+            if not given.
+        start_steps : iterable of int, optional
+            The step position before the first move, the step position of
+            the planner if not given.
+
+        Returns
+        -------
+        PlannedMoves
+            The velocity profiles of the moves with a length.
+
+        """
+        shape = (-1, len(self._axes))
+        positions = np.asarray(moves.positions, dtype=float).reshape(shape)
+        steps = np.asarray(moves.steps, dtype=np.int64).reshape(shape)
+        if start_position is None:
+            start_position = self._position
+        if start_steps is None:
+            start_steps = self._steps
+        start_position = np.asarray(start_position, dtype=float)
+        start_steps = np.asarray(start_steps, dtype=np.int64)
+        _, step_deltas, lengths, accelerations, max_speeds, junctions = (
+            self._move_limits(positions, steps, start_position, start_steps)
+        )
+        if len(lengths):
+            entries, exits = _plan_speeds(0.0, junctions, 2 * accelerations * lengths)
+            entries, exits = np.sqrt(entries), np.sqrt(exits)
+        else:
+            entries = exits = np.zeros(0)
+        peaks, times = _trapezoids(lengths, accelerations, max_speeds, entries, exits)
+        return PlannedMoves(
+            start_steps.copy(),
+            step_deltas,
+            lengths,
+            accelerations,
+            entries,
+            exits,
+            peaks,
+            times,
+        )
+
+    def add_move(
+        self, position: Iterable[float], steps: Iterable[int]
+    ) -> Optional[PlannedMoves]:
+        """
+        Add a move to the look-ahead buffer.
+
+        Parameters
+        ----------
+        position : iterable of float
+            The absolute target position of the move per axis.
+        steps : iterable of int
+            The absolute step target of the move per axis.
+
+        Returns
+        -------
+        PlannedMoves or None
+            The moves with a final profile when the buffer is full.
+
+        """
+        self._buffer.append((tuple(position), tuple(steps)))
+        if len(self._buffer) < self._look_ahead:
+            return None
+        return self._plan_streaming(final=False)
+
+    def flush(self) -> Optional[PlannedMoves]:
+        """Plan all buffered moves, the machine stops after the last move."""
+        if not self._buffer:
+            return None
+        return self._plan_streaming(final=True)
+
+    def commands(self, planned: PlannedMoves) -> list:
+        """
+        Convert planned moves to stepper controller commands.
+
+        Every move is split into pieces with a constant speed: the
+        acceleration and deceleration ramps in ramp_segments pieces and the
+        cruise part. A piece gives a stepperRATE (only if the rate of the
+        axis changes) and a stepperMOVE command per moving axis. The steps
+        of the pieces add up exactly to the steps of the moves.
+
+        Parameters
+        ----------
+        planned : PlannedMoves
+            The planned moves.
+
+        Returns
+        -------
+        list of StepperCommand
+            The commands in execution order.
+
+        """
+        if len(planned.lengths) == 0:
+            return []
+        distances, speeds = self._pieces(planned)
+        lengths = planned.lengths[:, None]
+        ends = np.cumsum(distances, axis=1) / lengths
+        ends[:, -1] = 1.0  # The last piece ends exactly at the target
+
+        # Steps per piece from the rounded cumulative steps, shape
+        # (moves, pieces, axes).
+        total = np.rint(ends[:, :, None] * planned.steps[:, None, :]).astype(np.int64)
+        piece_steps = np.diff(total, axis=1, prepend=0)
+        steps_per_unit = np.abs(planned.steps) / lengths
+        rates = np.rint(speeds[:, :, None] * steps_per_unit[:, None, :])
+        rates = np.clip(rates, 1, self._max_rate).astype(np.int64)
+
+        commands = []
+        last_rate = {}
+        moving = np.nonzero(piece_steps)
+        for move, piece, axis, steps, rate in zip(
+            *moving,
+            piece_steps[moving].tolist(),
+            rates[moving].tolist(),
+        ):
+            axis = self._axes[axis]
+            if last_rate.get(axis) != rate:
+                commands.append(StepperCommand("stepperRATE", axis, rate))
+                last_rate[axis] = rate
+            commands.append(StepperCommand("stepperMOVE", axis, steps))
+        return commands
+
+    def stop_to_stop_times(self, planned: PlannedMoves) -> np.ndarray:
+        """
+        Get the duration of the moves when every move starts and ends at rest.
+
+        Parameters
+        ----------
+        planned : PlannedMoves
+            The planned moves.
+
+        Returns
+        -------
+        np.ndarray
+            The duration of every move in seconds.
+
+        """
+        zeros = np.zeros(len(planned.lengths))
+        max_speeds = self._max_speeds(planned.steps, planned.lengths)
+        _, times = _trapezoids(
+            planned.lengths, planned.accelerations, max_speeds, zeros, zeros
+        )
+        return times
+
+    def reset(self) -> ...:
+        """Clear the buffer and the planning statistics, the machine is at rest."""
+        self._buffer.clear()
+        self._steps[:] = 0
+        self._position[:] = 0
+        self._speed = 0.0
+        self._planned_moves = 0
+        self._planning_time = 0.0
+
+    # PRIVATE FUNCTIONS
+    def _per_axis(self, name: str, value: Union[float, Mapping[str, float]]):
+        """Get a limit as an array with a value per axis."""
+        if isinstance(value, Mapping):
+            try:
+                array = np.array([value[axis] for axis in self._axes], dtype=float)
+            except KeyError as e:
+                raise KeyError("{} is missing axis {}".format(name, e.args[0]))
+        else:
+            array = np.full(len(self._axes), float(value))
+        if np.any(array <= 0):
+            raise ValueError("{} must be positive.".format(name))
+        return array
+
+    def _plan_streaming(self, final: bool) -> PlannedMoves:
+        """Plan the moves in the buffer, keep the moves without final profile."""
+        positions, steps = self._take_buffer()
+        planned = self._plan_buffer(positions, steps, final)
+        self._buffer.extend(
+            zip(positions[self._kept :].tolist(), steps[self._kept :].tolist())
+        )
+        return planned
+
+    def _take_buffer(self) -> tuple:
+        """Empty the buffer and get the positions and step targets in it."""
+        positions = np.array([move[0] for move in self._buffer], dtype=float)
+        steps = np.array([move[1] for move in self._buffer], dtype=np.int64)
+        self._buffer.clear()
+        shape = (-1, len(self._axes))
+        return positions.reshape(shape), steps.reshape(shape)
+
+    def _plan_buffer(
+        self, positions: np.ndarray, steps: np.ndarray, final: bool
+    ) -> PlannedMoves:
+        """
+        Plan moves in windows of look_ahead moves.
+
+        Every window is planned with a stop at its end, only the first half
+        of the window is kept. The next window starts at the first move that
+        is not kept, so every kept move could still stop in time. If final is
+        not set the moves of the last window are not planned, the number of
+        moves kept is stored in _kept.
+        """
+        start = perf_counter()
+        start_steps = self._steps.copy()
+        move_index, step_deltas, lengths, accelerations, max_speeds, junctions = (
+            self._move_limits(positions, steps, self._position, self._steps)
+        )
+
+        n = len(lengths)
+        entries = np.empty(n)
+        exits = np.empty(n)
+        window = self._look_ahead
+        commit = window - window // 2
+        first = 0
+        speed2 = self._speed * self._speed
+        while first < n:
+            stop = min(first + window, n)
+            if stop == n and final:
+                count = n - first
+            elif stop - first == window:
+                count = commit
+            else:  # Wait for more moves
+                break
+            window_entries, window_exits = _plan_speeds(
+                speed2,
+                junctions[first : stop - 1],
+                accelerations[first:stop] * lengths[first:stop] * 2,
+            )
+            entries[first : first + count] = window_entries[:count]
+            exits[first : first + count] = window_exits[:count]
+            speed2 = window_exits[count - 1]
+            first += count
+
+        # Moves without length before the first kept move stay in the buffer.
+        self._kept = int(move_index[first - 1]) + 1 if first else 0
+        if final:
+            self._kept = len(positions)
+        if self._kept:
+            self._position = positions[self._kept - 1].copy()
+            self._steps = steps[self._kept - 1].copy()
+        self._speed = float(np.sqrt(speed2))
+
+        entries, exits = np.sqrt(entries[:first]), np.sqrt(exits[:first])
+        lengths, accelerations = lengths[:first], accelerations[:first]
+        peaks, times = _trapezoids(
+            lengths, accelerations, max_speeds[:first], entries, exits
+        )
+        self._planned_moves += first
+        self._planning_time += perf_counter() - start
+        return PlannedMoves(
+            start_steps,
+            step_deltas[:first],
+            lengths,
+            accelerations,
+            entries,
+            exits,
+            peaks,
+            times,
+        )
+
+    def _move_limits(
+        self,
+        positions: np.ndarray,
+        steps: np.ndarray,
+        start_position: np.ndarray,
+        start_steps: np.ndarray,
+    ) -> tuple:
+        """
+        Get the moves with a length and their limits.
+
+        Moves without length (f.e. repeated positions) do not move the
+        machine and are left out.
+
+        Returns
+        -------
+        tuple
+            The index of the moves with a length, their steps per axis,
+            lengths, accelerations, maximum speeds and the maximum squared
+            junction speeds.
+
+        """
+        deltas = np.diff(positions, axis=0, prepend=start_position[None, :])
+        step_deltas = np.diff(steps, axis=0, prepend=start_steps[None, :])
+        lengths = np.sqrt(np.einsum("ij,ij->i", deltas, deltas))
+        keep = lengths > 0
+        move_index = np.flatnonzero(keep)
+        deltas, step_deltas, lengths = deltas[keep], step_deltas[keep], lengths[keep]
+
+        units = deltas / lengths[:, None]
+        with np.errstate(divide="ignore"):
+            accelerations = np.min(self._acceleration / np.abs(units), axis=1)
+        max_speeds = self._max_speeds(step_deltas, lengths)
+        junctions = self._junction_speeds(units, accelerations, max_speeds)
+        return move_index, step_deltas, lengths, accelerations, max_speeds, junctions
+
+    def _max_speeds(self, step_deltas: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """Get the maximum speed of moves from the step rate limits."""
+        with np.errstate(divide="ignore"):
+            per_axis = self._max_rate * lengths[:, None] / np.abs(step_deltas)
+        return np.min(per_axis, axis=1)
+
+    def _junction_speeds(
+        self, units: np.ndarray, accelerations: np.ndarray, max_speeds: np.ndarray
+    ) -> np.ndarray:
+        """
+        Get the maximum squared speed in the corners between moves.
+
+        Uses the junction deviation model: the speed at which a circle with
+        the given deviation from the corner can be followed with the
+        acceleration of the moves.
+        """
+        if len(units) < 2:
+            return np.empty(0)
+        cos_theta = -np.einsum("ij,ij->i", units[:-1], units[1:])
+        sin_half = np.sqrt(np.clip(0.5 * (1 - cos_theta), 0, 1))
+        acceleration = np.minimum(accelerations[:-1], accelerations[1:])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            speed2 = acceleration * self._junction_deviation * sin_half / (1 - sin_half)
+        speed2 = np.where(sin_half >= 1, np.inf, np.nan_to_num(speed2))
+        limit = np.minimum(max_speeds[:-1], max_speeds[1:])
+        return np.minimum(speed2, limit * limit)
+
+    def _pieces(self, planned: PlannedMoves) -> tuple:
+        """
+        Split moves in pieces with a constant speed.
+
+        A ramp from v0 to v1 is split in pieces with an equal speed change,
+        the average speed of a piece is the mean of its start and end speed.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            The distance and speed of every piece, shape (moves, pieces).
+
+        """
+        r = self._ramp_segments
+        fractions = np.linspace(0, 1, r + 1)
+        a = planned.accelerations[:, None]
+        entries = planned.entry_speeds[:, None]
+        exits = planned.exit_speeds[:, None]
+        peak = planned.peak_speeds[:, None]
+
+        up = entries + (peak - entries) * fractions
+        down = peak + (exits - peak) * fractions
+        up_distance = np.diff(up * up, axis=1) / (2 * a)
+        down_distance = -np.diff(down * down, axis=1) / (2 * a)
+        cruise = planned.lengths[:, None] - up_distance.sum(axis=1, keepdims=True)
+        cruise -= down_distance.sum(axis=1, keepdims=True)
+
+        distances = np.hstack((up_distance, np.clip(cruise, 0, None), down_distance))
+        speeds = np.hstack(
+            ((up[:, 1:] + up[:, :-1]) / 2, peak, (down[:, 1:] + down[:, :-1]) / 2)
+        )
+        return distances, speeds
+
+
+def _plan_speeds(
+    start_speed2: float, junctions: np.ndarray, reach: np.ndarray
+) -> tuple:
+    """
+    Get the squared entry and exit speeds of a window of moves.
+
+    The backward pass limits every entry speed so the machine can still stop
+    at the end of the window: w[i] = min(J[i], w[i + 1] + c[i]) with c the
+    squared speed change possible over a move (2 * a * length). With the
+    prefix sums Q of c this is a reverse cumulative minimum:
+    w[i] = min(J[k] + Q[k] for k >= i) - Q[i]. The forward pass limits the
+    speeds to what can be reached from the entry speed of the window, which
+    is a cumulative minimum in the same way.
+
+    Parameters
+    ----------
+    start_speed2 : float
+        The squared entry speed of the first move.
+    junctions : np.ndarray
+        The maximum squared speed between the moves, len(reach) - 1 values.
+    reach : np.ndarray
+        The squared speed change possible over every move.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        The squared entry and exit speeds of the moves.
+
+    """
+    n = len(reach)
+    q = np.concatenate(([0.0], np.cumsum(reach)))
+    limits = np.concatenate(([np.inf], junctions, [0.0]))
+
+    backward = np.minimum.accumulate((limits + q)[::-1])[::-1] - q
+    backward[0] = start_speed2
+    forward = np.minimum.accumulate(backward - q) + q
+    speeds = np.clip(np.minimum(forward, backward), 0, None)
+    return speeds[:n], speeds[1:]
+
+
+def _trapezoids(
+    lengths: np.ndarray,
+    accelerations: np.ndarray,
+    max_speeds: np.ndarray,
+    entries: np.ndarray,
+    exits: np.ndarray,
+) -> tuple:
+    """
+    Get the peak speed and duration of trapezoidal velocity profiles.
+
+    If the cruise speed can not be reached the profile is a triangle.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        The peak speeds and the durations of the moves.
+
+    """
+    peak2 = (2 * accelerations * lengths + entries * entries + exits * exits) / 2
+    peaks = np.sqrt(np.minimum(peak2, max_speeds * max_speeds))
+    up = (peaks * peaks - entries * entries) / (2 * accelerations)
+    down = (peaks * peaks - exits * exits) / (2 * accelerations)
+    cruise = np.clip(lengths - up - down, 0, None)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cruise_time = np.where(cruise > 0, cruise / peaks, 0.0)
+    times = (2 * peaks - entries - exits) / accelerations + cruise_time
+    return peaks, times
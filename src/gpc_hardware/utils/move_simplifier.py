@@ -0,0 +1,445 @@
+"""
+Simplification of the moves of gcode programs.
+
+CAM programs contain many tiny moves on an (almost) straight line, every
+move becomes a separate command for the stepper controller. The simplifier
+merges consecutive moves of the same command and positioning mode and drops
+moves without length. Every dropped move ends within the positional
+tolerance of the simplified path, an optional angular tolerance keeps all
+corners that turn more than the given angle.
+
+Programs are simplified in batch with simplify_program, parsed lines are
+simplified while streaming with MoveSimplifier. Both select the moves with
+a vectorized Douglas-Peucker algorithm, see _douglas_peucker.
+"""
+import copy
+from typing import Iterable, Iterator, Optional, Tuple
+import numpy as np
+
+try:
+    from .gcode_program import GcodeProgram
+    from .machine_state import (
+        ARC_COMMANDS,
+        GcodeMachineState,
+        MOVE_COMMANDS,
+        move_starts,
+    )
+except ImportError:
+    from .gcode_program import GcodeProgram
+    from .machine_state import (
+        ARC_COMMANDS,
+        GcodeMachineState,
+        MOVE_COMMANDS,
+        move_starts,
+    )
+
+
+def simplify_program(
+    program: GcodeProgram,
+    tolerance: float,
+    angle: Optional[float] = None,
+    state: Optional[GcodeMachineState] = None,
+) -> Tuple[GcodeProgram, int]:
+    """
+    Merge the moves of a compiled program.
+
+    Only consecutive rows with the same move command and positioning mode
+    are merged. A merged move gets the axis values of all moves it replaces:
+    the target position in absolute mode and the sum of the moves in
+    relative mode.
+
+    Parameters
+    ----------
+    program : GcodeProgram
+        The compiled program.
+    tolerance : float
+        The maximum distance between a dropped move and the simplified path.
+    angle : float, optional
+        Keep the moves that change direction more than this angle (radians).
+    state : GcodeMachineState, optional
+        The state of the machine before the program (not changed), a new
+        state if not given.
+
+    Returns
+    -------
+    tuple
+        The simplified program and the number of moves eliminated.
+
+    """
+    _check_tolerances(tolerance, angle)
+    state = GcodeMachineState() if state is None else copy.deepcopy(state)
+    initial = state.position_vector
+    moves = state.run_program(program)
+    n_moves = len(moves.rows)
+    if n_moves == 0:
+        return program, 0
+
+    # Runs of moves that can be merged: consecutive rows with the same
+    # command and positioning mode. Every arc is a run of its own, so arcs
+    # are always kept as they are.
+    rows = moves.rows
+    codes = np.ascontiguousarray(program.commands["command"])[rows]
+    is_start = np.ones(n_moves, dtype=bool)
+    is_start[1:] = (
+        (rows[1:] != rows[:-1] + 1)
+        | (codes[1:] != codes[:-1])
+        | (moves.absolute[1:] != moves.absolute[:-1])
+    )
+    is_arc = np.zeros(n_moves, dtype=bool)
+    for command in ARC_COMMANDS:
+        if command in program.command_names:
+            is_arc |= codes == program.command_code(command)
+    is_start |= is_arc
+    before = move_starts(program, moves, initial)
+
+    # Polyline of all runs: the start position of the run before its moves.
+    point_of_move = np.arange(n_moves) + np.cumsum(is_start)
+    points = np.empty((n_moves + is_start.sum(), len(state.axes)))
+    points[point_of_move] = moves.positions
+    points[point_of_move[is_start] - 1] = before[is_start]
+    point_is_start = np.ones(len(points), dtype=bool)
+    point_is_start[point_of_move] = False
+
+    keep = _select_points(points, point_is_start, tolerance, angle)
+    keep[point_of_move[is_arc]] = True  # Full circles end at their start
+    kept_moves = keep[point_of_move]
+
+    # Axis values of the merged moves, from the moves between the previous
+    # kept point and the kept move.
+    given = np.zeros((len(points), len(state.axes)), dtype=bool)
+    deltas = np.zeros((len(points), len(state.axes)))
+    for i, axis in enumerate(state.axes):
+        values = program.axis(axis)[rows]
+        given[point_of_move, i] = ~np.isnan(values)
+        deltas[point_of_move, i] = np.nan_to_num(values)
+    kept_points = np.flatnonzero(keep)
+    group_starts = kept_points[:-1] + 1
+    ends = kept_points[1:]
+    merged_groups = np.flatnonzero((ends > group_starts) & ~point_is_start[ends])
+
+    row_mask = np.ones(len(program), dtype=bool)
+    row_mask[rows[~kept_moves]] = False
+    result = program[row_mask]
+    if len(merged_groups):
+        merged_moves = np.searchsorted(point_of_move, ends[merged_groups])
+        given = np.logical_or.reduceat(given, group_starts, axis=0)[merged_groups]
+        sums = np.add.reduceat(deltas, group_starts, axis=0)[merged_groups]
+        values = np.where(
+            moves.absolute[merged_moves][:, None], points[ends[merged_groups]], sums
+        )
+        values[~given] = np.nan
+        # The rows of the merged moves in the simplified program
+        new_rows = (np.cumsum(row_mask) - 1)[rows[merged_moves]]
+        table = result.commands
+        for i, axis in enumerate(state.axes):
+            table[axis][new_rows] = values[:, i]
+    return result, int(n_moves - kept_moves.sum())
+
+
+class MoveSimplifier:
+    """
+    Streaming simplifier of parsed gcode lines.
+
+    The moves of a run (consecutive moves with the same command and
+    positioning mode) are buffered. The buffer is simplified when the run
+    ends or when it holds look_ahead moves, all other commands are passed
+    through unchanged in program order.
+
+    Examples
+    --------
+    >>> simplifier = MoveSimplifier(tolerance=0.01)
+    >>> for line_number, commands in simplifier.simplify(
+    ...     GcodeParser.parse_stream('part.gcode')
+    ... ):
+    ...     ...
+
+    """
+
+    def __init__(
+        self,
+        tolerance: float,
+        angle: Optional[float] = None,
+        look_ahead: int = 256,
+        state: Optional[GcodeMachineState] = None,
+    ) -> None:
+        """
+        Initialize the simplifier.
+
+        Parameters
+        ----------
+        tolerance : float
+            The maximum distance between a dropped move and the simplified
+            path.
+        angle : float, optional
+            Keep the moves that change direction more than this angle
+            (radians).
+        look_ahead : int
+            The maximum number of buffered moves.
+        state : GcodeMachineState, optional
+            The state of the machine before the first line, it is updated
+            while simplifying. A new state if not given.
+
+        """
+        _check_tolerances(tolerance, angle)
+        if look_ahead < 2:
+            raise ValueError("look_ahead must be at least 2.")
+        self._tolerance = tolerance
+        self._angle = angle
+        self._look_ahead = look_ahead
+        self._state = GcodeMachineState() if state is None else state
+
+        self._run = []  # (line number, values, position) of the buffered moves
+        self._run_key = None  # (command, absolute) of the buffered moves
+        self._run_start = None  # The position before the buffered moves
+
+        self._moves = 0
+        self._removed = 0
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return "MoveSimplifier(tolerance={}, removed={}/{})".format(
+            self._tolerance, self._removed, self._moves
+        )
+
+    # PROPERTIES
+    @property
+    def moves(self) -> int:
+        """The number of moves read."""
+        return self._moves
+
+    @property
+    def removed(self) -> int:
+        """The number of moves eliminated."""
+        return self._removed
+
+    # PUBLIC FUNCTIONS
+    def feed(self, line_number: int, commands: dict) -> list:
+        """
+        Add the parsed commands of a line.
+
+        Parameters
+        ----------
+        line_number : int
+            The line number of the commands.
+        commands : dict
+            The parsed commands, f.e. from GcodeParser.parse_gcode_line.
+
+        Returns
+        -------
+        list
+            The line number and a dict with a single command of the
+            commands that are ready, in program order.
+
+        """
+        out = []
+        state = self._state
+        for command, values in commands.items():
+            if command not in MOVE_COMMANDS:
+                self._flush_run(out)
+                state.execute(command, values)
+                out.append((line_number, {command: values}))
+                continue
+
+            key = (command, state.absolute)
+            if key != self._run_key:
+                self._flush_run(out)
+                self._run_key = key
+            if not self._run:
+                self._run_start = state.position_vector
+            state.execute(command, values)
+            self._run.append((line_number, values, state.position_vector))
+            self._moves += 1
+            if len(self._run) >= self._look_ahead:
+                self._flush_run(out)
+        return out
+
+    def flush(self) -> list:
+        """Get the buffered moves, see feed."""
+        out = []
+        self._flush_run(out)
+        self._run_key = None
+        return out
+
+    def simplify(self, parsed: Iterable[tuple]) -> Iterator[tuple]:
+        """
+        Simplify parsed lines.
+
+        Parameters
+        ----------
+        parsed : iterable
+            Tuples starting with the line number and ending with the dict of
+            parsed commands, f.e. the output of GcodeParser.parse_stream.
+
+        Yields
+        ------
+        tuple
+            The line number and a dict with a single command.
+
+        """
+        for item in parsed:
+            yield from self.feed(item[0], item[-1])
+        yield from self.flush()
+
+    # PRIVATE FUNCTIONS
+    def _flush_run(self, out: list) -> ...:
+        """Simplify the buffered moves and add the remaining moves to out."""
+        run = self._run
+        if not run:
+            return
+        command, absolute = self._run_key
+        axes = self._state.axes
+        points = np.vstack([self._run_start] + [move[2] for move in run])
+        is_start = np.zeros(len(points), dtype=bool)
+        is_start[0] = True
+        keep = _select_points(points, is_start, self._tolerance, self._angle)
+
+        # Every kept move gets the axis values of the moves it replaces.
+        kept = 0
+        previous = 0
+        for i in np.flatnonzero(keep[1:]).tolist():
+            group = run[previous : i + 1]
+            values = group[0][1]
+            if len(group) > 1:
+                given = set().union(*(m[1] for m in group))
+                given = [axis for axis in axes if axis in given]
+                if absolute:
+                    position = points[i + 1].tolist()
+                    values = {axis: position[axes.index(axis)] for axis in given}
+                else:
+                    values = {
+                        axis: sum(m[1].get(axis, 0) for m in group) for axis in given
+                    }
+            out.append((run[i][0], {command: values}))
+            kept += 1
+            previous = i + 1
+
+        self._removed += len(run) - kept
+        self._run = []
+
+
+def _check_tolerances(tolerance: float, angle: Optional[float]) -> ...:
+    """Check the tolerances of the simplifier."""
+    if tolerance < 0:
+        raise ValueError("tolerance can not be negative.")
+    if angle is not None and angle < 0:
+        raise ValueError("angle can not be negative.")
+
+
+def _select_points(
+    points: np.ndarray, is_start: np.ndarray, tolerance: float, angle: Optional[float]
+) -> np.ndarray:
+    """
+    Select the points of a polyline that are kept.
+
+    Parameters
+    ----------
+    points : np.ndarray
+        The points of one or more runs, shape (points, axes). Every run
+        starts with the position before its first move.
+    is_start : np.ndarray
+        True for the first point of every run.
+    tolerance : float
+        The maximum distance between a dropped point and the simplified path.
+    angle : float, optional
+        Keep the points where the path turns more than this angle.
+
+    Returns
+    -------
+    np.ndarray
+        True for the kept points, the start points are always kept.
+
+    """
+    # Points equal to the previous point are moves without length.
+    duplicate = np.zeros(len(points), dtype=bool)
+    duplicate[1:] = np.all(points[1:] == points[:-1], axis=1) & ~is_start[1:]
+    index = np.flatnonzero(~duplicate)
+    points = points[index]
+    starts = is_start[index]
+
+    # The start and end of every run and the sharp corners are kept.
+    keep = starts.copy()
+    keep[:-1] |= starts[1:]
+    keep[-1] = True
+    if angle is not None and len(points) > 2:
+        incoming = points[1:-1] - points[:-2]
+        outgoing = points[2:] - points[1:-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cos_turn = np.einsum("ij,ij->i", incoming, outgoing) / (
+                np.linalg.norm(incoming, axis=1) * np.linalg.norm(outgoing, axis=1)
+            )
+        cos_turn = np.clip(np.nan_to_num(cos_turn, nan=1.0), -1, 1)
+        keep[1:-1] |= np.arccos(cos_turn) > angle
+
+    # Axes that do not move do not change the distances.
+    moving = np.ptp(points, axis=0) > 0 if len(points) else []
+    keep = _douglas_peucker(points[:, moving], keep, tolerance)
+    result = np.zeros(len(is_start), dtype=bool)
+    result[index[keep]] = True
+    return result
+
+
+def _douglas_peucker(
+    points: np.ndarray, keep: np.ndarray, tolerance: float
+) -> np.ndarray:
+    """
+    Keep the points needed to stay within the tolerance of a polyline.
+
+    All segments between kept points are handled at once: every pass keeps
+    the farthest point of every segment with a point outside the tolerance,
+    until all dropped points are within the tolerance of their segment.
+
+    Parameters
+    ----------
+    points : np.ndarray
+        The points of the polyline, shape (points, axes).
+    keep : np.ndarray
+        The points that must be kept, including the first and last point.
+    tolerance : float
+        The maximum distance between a dropped point and its segment.
+
+    Returns
+    -------
+    np.ndarray
+        True for the kept points.
+
+    """
+    keep = keep.copy()
+    # Only the points of segments that were split in the last pass can be
+    # kept in the next pass, the other segments are final.
+    index = np.arange(len(points))
+    while len(index):
+        sub_keep = keep[index]
+        kept = np.flatnonzero(sub_keep)
+        segment = np.cumsum(sub_keep) - 1
+        start = points[index[kept[segment]]]
+        end = points[index[kept[np.minimum(segment + 1, len(kept) - 1)]]]
+        distances = _segment_distances(points[index], start, end)
+        distances[sub_keep] = 0
+        farthest = np.maximum.reduceat(distances, kept)
+        split = farthest > tolerance
+        if not split.any():
+            break
+
+        candidates = np.flatnonzero(split[segment] & (distances == farthest[segment]))
+        _, first = np.unique(segment[candidates], return_index=True)
+        keep[index[candidates[first]]] = True
+
+        # The points of the split segments, including their end points
+        active = split[segment]
+        active[1:] |= split[segment[:-1]]
+        index = index[active]
+    return keep
+
+
+def _segment_distances(
+    points: np.ndarray, start: np.ndarray, end: np.ndarray
+) -> np.ndarray:
+    """Get the distance of every point to the segment from start to end."""
+    direction = end - start
+    offset = points - start
+    length2 = np.einsum("ij,ij->i", direction, direction)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.einsum("ij,ij->i", offset, direction) / length2
+    t = np.clip(np.nan_to_num(t), 0, 1)
+    offset -= t[:, None] * direction
+    return np.sqrt(np.einsum("ij,ij->i", offset, offset))
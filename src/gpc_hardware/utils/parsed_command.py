@@ -0,0 +1,168 @@
+"""
+Compact representation of a single parsed gcode command.
+
+A ParsedCommand is an immutable tuple with the command id, the attribute
+mapping and one field per axis in ACCEPTED_AXES (None when the axis is not
+given). It uses less memory and pickles smaller than the nested dicts
+returned by GcodeParser.parse_gcode_line.
+"""
+from operator import itemgetter
+from types import MappingProxyType
+from typing import Union, Optional, Mapping
+
+try:
+    from .accepted_gcode import ACCEPTED_AXES
+except ImportError:
+    from .accepted_gcode import ACCEPTED_AXES
+
+
+_EMPTY_ATTRIBUTES = MappingProxyType({})
+_N_AXES = len(ACCEPTED_AXES)
+_AXIS_INDEX = {axis: i + 2 for i, axis in enumerate(ACCEPTED_AXES)}
+
+
+class ParsedCommand(tuple):
+    """
+    A single parsed gcode command.
+
+    The axis values are available as attributes with the axis symbol as
+    name, f.e. ``command.X``.
+    """
+
+    __slots__ = ()
+    _fields = ("command", "attributes") + ACCEPTED_AXES
+
+    def __new__(
+        cls,
+        command: str,
+        attributes: Optional[Mapping[str, object]] = None,
+        **axes: Union[int, float]
+    ) -> "ParsedCommand":
+        """
+        Create a parsed command.
+
+        Parameters
+        ----------
+        command : str
+            The command id, f.e. 'G0'.
+        attributes : mapping, optional
+            The attribute symbols and their values.
+        **axes : int or float
+            The axis values with the axis symbol as keyword.
+
+        Raises
+        ------
+        KeyError:
+            If an axis is not in ACCEPTED_AXES.
+
+        """
+        values = [command, dict(attributes) if attributes else None]
+        values.extend([None] * _N_AXES)
+        for axis, value in axes.items():
+            try:
+                values[_AXIS_INDEX[axis]] = value
+            except KeyError:
+                raise KeyError("Axis {} is not an accepted axis.".format(axis))
+        return tuple.__new__(cls, values)
+
+    @classmethod
+    def from_words(cls, command: str, words: Mapping[str, object]) -> "ParsedCommand":
+        """
+        Create a parsed command from the dict form of parse_gcode_line.
+
+        Parameters
+        ----------
+        command : str
+            The command id.
+        words : mapping
+            The axis and attribute symbols of the command and their values.
+
+        Returns
+        -------
+        ParsedCommand
+            The parsed command.
+
+        """
+        values = [command, None]
+        values.extend([None] * _N_AXES)
+        attributes = None
+        for word, value in words.items():
+            index = _AXIS_INDEX.get(word)
+            if index is not None:
+                values[index] = value
+            else:
+                if attributes is None:
+                    attributes = {}
+                attributes[word] = value
+        values[1] = attributes
+        return tuple.__new__(cls, values)
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        parts = [repr(self[0])]
+        if self[1]:
+            parts.append("attributes={!r}".format(self[1]))
+        parts.extend(
+            "{}={!r}".format(axis, value) for axis, value in self.axes.items()
+        )
+        return "ParsedCommand({})".format(", ".join(parts))
+
+    def __reduce__(self) -> tuple:
+        # Trailing empty axes are not pickled to keep the pickles small.
+        end = len(self)
+        while end > 2 and self[end - 1] is None:
+            end -= 1
+        return (_make_parsed_command, tuple(self[:end]))
+
+    # PROPERTIES
+    command = property(itemgetter(0), doc="The command id.")
+
+    @property
+    def attributes(self) -> Mapping[str, object]:
+        """The attribute symbols and their values (read only)."""
+        attributes = self[1]
+        if attributes is None:
+            return _EMPTY_ATTRIBUTES
+        return MappingProxyType(attributes)
+
+    @property
+    def axes(self) -> dict:
+        """The given axes and their values."""
+        return {
+            axis: value
+            for axis, value in zip(ACCEPTED_AXES, self[2:])
+            if value is not None
+        }
+
+    # PUBLIC FUNCTIONS
+    def to_dict(self) -> dict:
+        """
+        Convert the command to the dict form of parse_gcode_line.
+
+        Returns
+        -------
+        dict
+            Dict with the command id as key and a dict of the axis and
+            attribute values as value.
+
+        """
+        words = self.axes
+        if self[1]:
+            words.update(self[1])
+        return {self[0]: words}
+
+
+def _make_parsed_command(*values) -> ParsedCommand:
+    """Create a parsed command from the field values, missing axes are None."""
+    return tuple.__new__(
+        ParsedCommand, values + (None,) * (_N_AXES + 2 - len(values))
+    )
+
+
+for _i, _axis in enumerate(ACCEPTED_AXES):
+    setattr(
+        ParsedCommand,
+        _axis,
+        property(itemgetter(_i + 2), doc="The value of axis {}.".format(_axis)),
+    )
+del _i, _axis
@@ -0,0 +1,229 @@
+"""
+Pre-flight checks of complete gcode programs.
+
+Before a job is started the whole program is executed on a copy of the
+machine state and planned in one vectorized pass. The check gives the
+bounding box of every axis, every line that moves an axis outside its soft
+limits or faster than its maximum speed, and an estimate of the job time.
+Arcs are followed along their chords, so an arc bulging outside the travel
+is found even if its end points are inside.
+"""
+import copy
+from typing import Union, Iterable, Mapping, NamedTuple, Optional, Tuple
+import numpy as np
+
+try:
+    from .arc_expander import expand_program
+    from .gcode_program import GcodeProgram
+    from .machine_state import ARC_COMMANDS, GcodeMachineState
+    from .motion_planner import MotionPlanner
+    from ..settings import Settings
+except ImportError:
+    from .arc_expander import expand_program
+    from .gcode_program import GcodeProgram
+    from .machine_state import ARC_COMMANDS, GcodeMachineState
+    from .motion_planner import MotionPlanner
+    from ..settings import Settings
+
+
+# Reasons of the issues
+BELOW_TRAVEL = "below soft limit"
+ABOVE_TRAVEL = "above soft limit"
+TOO_FAST = "above maximum speed"
+
+
+class PreflightIssue(NamedTuple):
+    """A line exceeding a limit, value is the worst value of the line."""
+
+    line: int
+    axis: str
+    value: float
+    limit: float
+    reason: str
+
+    def __str__(self) -> str:
+        return "{}: {} {}={:g} (limit {:g})".format(
+            self.line, self.reason, self.axis, self.value, self.limit
+        )
+
+
+class PreflightReport(NamedTuple):
+    """The result of the pre-flight check of a program."""
+
+    moves: int
+    """The number of moves, arcs are counted per chord."""
+    bounds: dict
+    """The (min, max) position of every axis, including the start position."""
+    issues: list
+    """The PreflightIssues sorted by line."""
+    job_time: float
+    """The estimated job time in seconds, see MotionPlanner.estimate."""
+
+    @property
+    def ok(self) -> bool:
+        """True if no limit is exceeded."""
+        return not self.issues
+
+
+_new_issue = tuple.__new__
+
+
+def preflight(
+    program: Union[GcodeProgram, Iterable[tuple]],
+    settings: Optional[Settings] = None,
+    section: str = "limits.DEFAULT",
+    travel: Optional[Mapping[str, Tuple[float, float]]] = None,
+    max_speed: Union[float, Mapping[str, float], None] = None,
+    arc_tolerance: Optional[float] = None,
+    state: Optional[GcodeMachineState] = None,
+    planner: Optional[MotionPlanner] = None,
+) -> PreflightReport:
+    """
+    Check a program against the limits of the machine.
+
+    The limits are read from the settings, the values given to this function
+    take precedence. Axes without a limit are not checked.
+
+    Parameters
+    ----------
+    program : GcodeProgram or iterable
+        The compiled program, or parsed lines as accepted by
+        GcodeProgram.from_parsed (f.e. the output of parse_stream).
+    settings : Settings, optional
+        The settings with the limits, default.ini if not given.
+    section : str
+        The settings section, missing keys are read from limits.DEFAULT.
+    travel : mapping, optional
+        The (min, max) position of the checked axes in units.
+    max_speed : float or mapping, optional
+        The maximum speed in units/s, one value or a value per checked axis.
+    arc_tolerance : float, optional
+        The chord tolerance used to follow the arcs.
+    state : GcodeMachineState, optional
+        The state of the machine before the program (not changed), a new
+        state if not given.
+    planner : MotionPlanner, optional
+        The planner giving the speeds and times, a planner with the same
+        settings if not given.
+
+    Raises
+    ------
+    KeyError:
+        If a limit is given for an axis without position.
+    ValueError:
+        If a maximum speed is not positive or an arc is not valid.
+
+    Returns
+    -------
+    PreflightReport
+        The bounding box, the issues and the estimated job time.
+
+    """
+    values = {"travel": travel, "max_speed": max_speed, "arc_tolerance": arc_tolerance}
+    if any(value is None for value in values.values()):
+        if settings is None:
+            settings = Settings()
+        for key, value in values.items():
+            if value is None:
+                values[key] = settings.get(section, key)
+    if planner is None:
+        planner = MotionPlanner(settings=settings)
+
+    if not isinstance(program, GcodeProgram):
+        program = GcodeProgram.from_parsed(program)
+    state = GcodeMachineState() if state is None else copy.deepcopy(state)
+    axes = state.axes
+    travel = _axis_limits(axes, values["travel"], "travel")
+    max_speed = values["max_speed"]
+    if not isinstance(max_speed, Mapping):
+        max_speed = dict.fromkeys(axes, max_speed)
+    max_speed = _axis_limits(axes, max_speed, "max_speed")
+    if any(limit <= 0 for limit in max_speed.values()):
+        raise ValueError("max_speed must be positive.")
+
+    arcs = [command for command in ARC_COMMANDS if command in program.command_names]
+    if arcs and program.mask(*arcs).any():
+        program, _ = expand_program(program, values["arc_tolerance"], state)
+    start_position = state.position_vector
+    start_steps = np.array(list(state.steps.values()), dtype=np.int64)
+    moves = state.run_program(program)
+    positions = moves.positions
+
+    path = np.vstack((start_position, positions))
+    deltas = np.diff(path, axis=0)
+    low, high = path.min(axis=0), path.max(axis=0)
+    bounds = dict(zip(axes, zip(low.tolist(), high.tolist())))
+
+    # Only the moves of the axis are flagged, not every move while the axis
+    # stays outside its limits.
+    lines = moves.lines
+    issues = []
+    for axis, (minimum, maximum) in travel.items():
+        i = axes.index(axis)
+        column = positions[:, i]
+        if low[i] < minimum:
+            exceeded = (column < minimum) & (deltas[:, i] != 0)
+            _add_issues(
+                issues, lines, column, exceeded, axis, minimum, BELOW_TRAVEL, np.minimum
+            )
+        if high[i] > maximum:
+            exceeded = (column > maximum) & (deltas[:, i] != 0)
+            _add_issues(
+                issues, lines, column, exceeded, axis, maximum, ABOVE_TRAVEL, np.maximum
+            )
+
+    planned = planner.estimate(moves, start_position, start_steps)
+    if max_speed and len(planned.lengths):
+        # The index of the planned moves, moves without length are left out.
+        moving = np.flatnonzero(np.einsum("ij,ij->i", deltas, deltas) > 0)
+        directions = np.abs(deltas[moving]) / planned.lengths[:, None]
+        for axis, limit in max_speed.items():
+            i = axes.index(axis)
+            speeds = planned.peak_speeds * directions[:, i]
+            if speeds.max() > limit:
+                _add_issues(
+                    issues,
+                    lines[moving],
+                    speeds,
+                    speeds > limit,
+                    axis,
+                    limit,
+                    TOO_FAST,
+                    np.maximum,
+                )
+
+    issues.sort(key=lambda issue: issue.line)
+    return PreflightReport(len(lines), bounds, issues, float(planned.times.sum()))
+
+
+def _axis_limits(axes: tuple, limits: Mapping, name: str) -> dict:
+    """Check that every limit belongs to an axis with a position."""
+    for axis in limits:
+        if axis not in axes:
+            raise KeyError(
+                "{} is given for axis {} without position.".format(name, axis)
+            )
+    return dict(limits)
+
+
+def _add_issues(
+    issues: list,
+    lines: np.ndarray,
+    values: np.ndarray,
+    exceeded: np.ndarray,
+    axis: str,
+    limit: float,
+    reason: str,
+    worst: np.ufunc,
+) -> ...:
+    """Add an issue with the worst value for every line exceeding a limit."""
+    index = np.flatnonzero(exceeded)
+    lines = lines[index]
+    # The moves of a line are consecutive (f.e. the chords of an arc).
+    starts = np.flatnonzero(np.concatenate(([True], lines[1:] != lines[:-1])))
+    worst_values = worst.reduceat(values[index], starts)
+    limit = float(limit)
+    issues.extend(
+        _new_issue(PreflightIssue, (line, axis, value, limit, reason))
+        for line, value in zip(lines[starts].tolist(), worst_values.tolist())
+    )
@@ -0,0 +1,406 @@
+"""
+On-disk cache of compiled gcode programs.
+
+Jobs that run many times do not need to be parsed again every run. The cache
+stores compiled programs in a directory with one entry per program, keyed on
+the hash of the program text and the version of the accepted gcode grammar,
+so a change of the text or of accepted_gcode never returns a stale program.
+
+Every entry holds the command and attribute tables as uncompressed .npy files
+and a small json file with the metadata. Cached programs are memory mapped,
+loading only reads the headers and the pages are read when they are used.
+The memory mapped tables are read only. The total size of the entries is
+kept below a cap by removing the least recently used entries.
+"""
+from threading import Lock
+from typing import Union, Iterable, Optional
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+
+try:
+    from .gcode_parser import GcodeParser
+    from .gcode_program import GcodeProgram
+except ImportError:
+    from .gcode_parser import GcodeParser
+    from .gcode_program import GcodeProgram
+
+
+# Version of the entry layout, entries with another version are not used
+FORMAT_VERSION = 1
+
+_COMMANDS = "commands.npy"
+_ATTRIBUTES = "attributes.npy"
+_METADATA = "metadata.json"
+_TEMPORARY_PREFIX = ".tmp-"
+_CHUNK_SIZE = 1 << 20
+
+
+class GcodeProgramCache:
+    """
+    Size bounded least recently used cache of compiled programs on disk.
+
+    The hit and miss counters are kept per cache object, the entries are
+    shared by every cache using the same directory (also across processes).
+    """
+
+    def __init__(
+        self, directory: Union[str, os.PathLike], max_bytes: int = 256 << 20
+    ) -> None:
+        """
+        Initialize the cache, the directory is created if it does not exist.
+
+        Parameters
+        ----------
+        directory : str or os.PathLike
+            The directory of the cache entries.
+        max_bytes : int
+            The maximum total size of the entries in bytes.
+
+        Raises
+        ------
+        TypeError:
+            If max_bytes is not an integer.
+        ValueError:
+            If max_bytes is smaller than 1.
+
+        """
+        if not isinstance(max_bytes, int):
+            raise TypeError(
+                "max_bytes must be an integer, not type {}".format(type(max_bytes))
+            )
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1, not {}".format(max_bytes))
+
+        self._directory = os.fspath(directory)
+        os.makedirs(self._directory, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    # DUNDER METHODS
+    def __len__(self) -> int:
+        return len(self._entries())
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.isfile(os.path.join(self._directory, key, _METADATA))
+
+    # PROPERTIES
+    @property
+    def directory(self) -> str:
+        """The directory of the cache entries."""
+        return self._directory
+
+    @property
+    def max_bytes(self) -> int:
+        """The maximum total size of the entries in bytes."""
+        return self._max_bytes
+
+    @property
+    def hits(self) -> int:
+        """The number of lookups that were found in the cache."""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """The number of lookups that were not found in the cache."""
+        return self._misses
+
+    @property
+    def evictions(self) -> int:
+        """The number of entries removed to stay below max_bytes."""
+        return self._evictions
+
+    # PUBLIC FUNCTIONS
+    @staticmethod
+    def key(
+        source: Union[str, os.PathLike, bytes, Iterable[Union[str, bytes]]]
+    ) -> str:
+        """
+        Get the cache key of a program.
+
+        Parameters
+        ----------
+        source : str, os.PathLike, bytes or iterable
+            The path of the program, the program as bytes buffer or the lines
+            of the program. The line endings of lines are ignored, so lines
+            give the key of a file with newline line endings.
+
+        Returns
+        -------
+        str
+            The content hash followed by the grammar version.
+
+        """
+        content = hashlib.sha256()
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                    content.update(chunk)
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            content.update(source)
+        else:
+            for line in source:
+                if isinstance(line, str):
+                    line = line.encode("utf-8")
+                content.update(bytes(line).rstrip(b"\r\n"))
+                content.update(b"\n")
+        return "{}-{}".format(content.hexdigest(), GcodeParser.grammar_version())
+
+    def get(self, key: str) -> Optional[GcodeProgram]:
+        """
+        Get a cached program, the tables are memory mapped.
+
+        Parameters
+        ----------
+        key : str
+            The key of the program, see key.
+
+        Returns
+        -------
+        GcodeProgram or None
+            The program with read only tables or None if the key is not
+            cached.
+
+        """
+        path = os.path.join(self._directory, key)
+        program = None
+        try:
+            metadata = self._read_metadata(path)
+            if metadata is not None:
+                program = GcodeProgram(
+                    np.load(os.path.join(path, _COMMANDS), mmap_mode="r"),
+                    np.load(os.path.join(path, _ATTRIBUTES), mmap_mode="r"),
+                    metadata["command_names"],
+                    metadata["axes"],
+                )
+                self._touch(path)
+        except FileNotFoundError:
+            program = None
+        except (OSError, ValueError, KeyError, TypeError):
+            # A damaged entry is removed and compiled again.
+            program = None
+            shutil.rmtree(path, ignore_errors=True)
+
+        with self._lock:
+            if program is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return program
+
+    def metadata(self, key: str) -> Optional[dict]:
+        """
+        Get the metadata of a cached program without counting a lookup.
+
+        Parameters
+        ----------
+        key : str
+            The key of the program, see key.
+
+        Returns
+        -------
+        dict or None
+            The command names, axes, number of rows, attributes and lines,
+            the number of rows per command and the compile time, or None if
+            the key is not cached.
+
+        """
+        try:
+            return self._read_metadata(os.path.join(self._directory, key))
+        except (OSError, ValueError):
+            return None
+
+    def put(
+        self, key: str, program: GcodeProgram, compile_time: float = 0.0
+    ) -> bool:
+        """
+        Add a program to the cache and remove the least recently used entries
+        to stay below max_bytes.
+
+        Parameters
+        ----------
+        key : str
+            The key of the program, see key.
+        program : GcodeProgram
+            The compiled program.
+        compile_time : float, optional
+            The time used to compile the program in seconds, stored in the
+            metadata.
+
+        Returns
+        -------
+        bool
+            False if the program is larger than max_bytes and is not stored.
+
+        """
+        commands = np.ascontiguousarray(program.commands)
+        attributes = np.ascontiguousarray(program.attributes)
+        if commands.nbytes + attributes.nbytes > self._max_bytes:
+            return False
+
+        codes = np.bincount(commands["command"], minlength=len(program.command_names))
+        metadata = {
+            "format": FORMAT_VERSION,
+            "command_names": list(program.command_names),
+            "axes": list(program.axes),
+            "rows": len(commands),
+            "attributes": len(attributes),
+            "lines": int(commands["line"].max()) if len(commands) else 0,
+            "counts": {
+                name: count
+                for name, count in zip(program.command_names, codes.tolist())
+                if count
+            },
+            "compile_time": compile_time,
+        }
+
+        # The entry is written next to the entries and moved in place at once,
+        # readers never see a partial entry.
+        temporary = tempfile.mkdtemp(prefix=_TEMPORARY_PREFIX, dir=self._directory)
+        try:
+            np.save(os.path.join(temporary, _COMMANDS), commands)
+            np.save(os.path.join(temporary, _ATTRIBUTES), attributes)
+            with open(os.path.join(temporary, _METADATA), "w") as f:
+                json.dump(metadata, f)
+            self._touch(temporary)
+        except BaseException:
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+        path = os.path.join(self._directory, key)
+        try:
+            os.replace(temporary, path)
+        except OSError:
+            try:
+                current = self._read_metadata(path) is not None
+            except (OSError, ValueError):
+                current = False
+            if not current:
+                # An entry of another format or a damaged entry is replaced.
+                shutil.rmtree(path, ignore_errors=True)
+                try:
+                    os.replace(temporary, path)
+                except OSError:
+                    pass
+            # The key is stored already, f.e. by another process.
+            shutil.rmtree(temporary, ignore_errors=True)
+        self._evict()
+        return True
+
+    def compile(
+        self,
+        source: Union[str, os.PathLike, bytes, Iterable[Union[str, bytes]]],
+        workers: int = 1,
+    ) -> GcodeProgram:
+        """
+        Get a program from the cache or compile and cache it.
+
+        Parameters
+        ----------
+        source : str, os.PathLike, bytes or iterable
+            The program as accepted by GcodeParser.compile_program.
+        workers : int, optional
+            The number of processes used to compile a path or bytes buffer,
+            see GcodeParser.compile_program.
+
+        Raises
+        ------
+        GcodeParsingError:
+            If a line can not be parsed.
+        GcodeAttributeError:
+            If a line contains an invalid entry.
+
+        Returns
+        -------
+        GcodeProgram
+            The program, with read only tables on a hit.
+
+        """
+        if not isinstance(source, (str, os.PathLike, bytes, bytearray, memoryview)):
+            source = list(source)
+        key = self.key(source)
+        program = self.get(key)
+        if program is None:
+            start = time.perf_counter()
+            program = GcodeParser.compile_program(source, workers)
+            self.put(key, program, time.perf_counter() - start)
+        return program
+
+    def clear(self) -> ...:
+        """Remove all entries from the cache, the counters are kept."""
+        for _, _, path in self._entries():
+            shutil.rmtree(path, ignore_errors=True)
+
+    def info(self) -> dict:
+        """
+        Get the statistics of the cache.
+
+        Returns
+        -------
+        dict
+            The hits, misses, evictions, current number of entries, their
+            total size in bytes and max_bytes.
+
+        """
+        entries = self._entries()
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "size": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self._max_bytes,
+        }
+
+    # PRIVATE FUNCTIONS
+    @staticmethod
+    def _read_metadata(path: str) -> Optional[dict]:
+        """Read the metadata of an entry, None if it has another format."""
+        with open(os.path.join(path, _METADATA)) as f:
+            metadata = json.load(f)
+        if metadata.get("format") != FORMAT_VERSION:
+            return None
+        return metadata
+
+    @staticmethod
+    def _touch(path: str) -> ...:
+        """
+        Mark an entry as used, the modification time of the metadata is the
+        last use. The time is set explicitly, file systems update the times
+        with a coarse clock otherwise.
+        """
+        now = time.time_ns()
+        os.utime(os.path.join(path, _METADATA), ns=(now, now))
+
+    def _entries(self) -> list:
+        """Get the (last use, size, path) of every entry, oldest first."""
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.name.startswith(_TEMPORARY_PREFIX) or not entry.is_dir():
+                continue
+            try:
+                last_use = os.stat(os.path.join(entry.path, _METADATA)).st_mtime_ns
+                size = sum(item.stat().st_size for item in os.scandir(entry.path))
+            except FileNotFoundError:
+                continue  # Removed or still being written
+            entries.append((last_use, size, entry.path))
+        entries.sort()
+        return entries
+
+    def _evict(self) -> ...:
+        """Remove the least recently used entries until below max_bytes."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self._max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self._evictions += 1
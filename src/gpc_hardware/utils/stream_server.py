@@ -0,0 +1,477 @@
+"""
+Asyncio server streaming gcode from several hosts to the machine.
+
+Hosts connect over TCP or a Unix socket and send newline delimited gcode
+lines, in any form accepted by GcodeParser (including Marlin N line numbers
+and checksums). Every line is parsed when it is received and put in a bounded
+execution queue. The commands are executed in order by a single worker
+thread, so slow hardware calls do not block the sockets.
+
+Like the flow control of Marlin every line is acknowledged with 'ok', but
+only when it has a place in the queue. A host that waits for the 'ok' of a
+line before sending the next one never overruns the queue, a host that does
+not is slowed down by TCP backpressure. Lines with a priority command (M112,
+M0) are acknowledged at once and executed before the queued lines, the
+emergency stop M112 also discards the queued lines and the lines received
+before it that are still waiting for space in the queue.
+
+Replies to the hosts:
+
+- ``ok`` for every received line, including blank and comment lines.
+- ``Error:<message>`` before the ``ok`` of a line that can not be parsed,
+  followed by ``Resend: <N>`` when the checksum of line N does not match.
+- ``Error:<message>`` when executing a line raises an exception.
+
+With a PipelineLatency the server records the time every line spends in
+each stage, from receiving it until its hardware calls returned.
+"""
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter_ns
+from typing import Union, Iterable, Optional
+
+try:
+    from .gcode_dispatch import GcodeDispatcher
+    from .gcode_parser import (
+        GcodeAttributeError,
+        GcodeChecksumError,
+        GcodeParser,
+        GcodeParsingError,
+    )
+    from .latency import PipelineLatency
+    from .machine_state import GcodeMachineState
+except ImportError:
+    from .gcode_dispatch import GcodeDispatcher
+    from .gcode_parser import (
+        GcodeAttributeError,
+        GcodeChecksumError,
+        GcodeParser,
+        GcodeParsingError,
+    )
+    from .latency import PipelineLatency
+    from .machine_state import GcodeMachineState
+
+
+PRIORITY_COMMANDS = ("M112", "M0")
+STOP_COMMANDS = ("M112",)
+
+_OK = b"ok\n"
+
+
+class GcodeStreamServer:
+    """
+    Receives gcode lines from socket clients and executes them in order.
+
+    Examples
+    --------
+    >>> server = GcodeStreamServer(dispatcher, queue_size=16)
+    >>> await server.start_tcp('0.0.0.0', 8888)
+    >>> await server.start_unix('/run/gcode.sock')
+    >>> await server.serve_forever()
+
+    """
+
+    def __init__(
+        self,
+        dispatcher: Optional[GcodeDispatcher] = None,
+        state: Optional[GcodeMachineState] = None,
+        queue_size: int = 16,
+        priority_commands: Iterable[str] = PRIORITY_COMMANDS,
+        stop_commands: Iterable[str] = STOP_COMMANDS,
+        max_line_length: int = 4096,
+        latency: Optional[PipelineLatency] = None,
+    ) -> None:
+        """
+        Initialize the server, no sockets are opened yet.
+
+        Parameters
+        ----------
+        dispatcher : GcodeDispatcher, optional
+            The built dispatcher executing the commands, only the machine
+            state is updated if not given.
+        state : GcodeMachineState, optional
+            The state of the machine, a new state if not given.
+        queue_size : int
+            The number of lines in the execution queue, the priority lines
+            are not counted.
+        priority_commands : iterable of str
+            The commands of the lines that jump the queue.
+        stop_commands : iterable of str
+            The priority commands that also discard the queued lines.
+        max_line_length : int
+            The maximum number of bytes in a line.
+        latency : PipelineLatency, optional
+            Record the latency of the lines, no timestamps are taken if not
+            given or not enabled.
+
+        Raises
+        ------
+        ValueError:
+            If queue_size or max_line_length is not positive.
+
+        """
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1, not {}".format(queue_size))
+        if max_line_length < 1:
+            raise ValueError(
+                "max_line_length must be at least 1, not {}".format(max_line_length)
+            )
+        self._dispatcher = dispatcher
+        self._state = GcodeMachineState() if state is None else state
+        self._queue_size = queue_size
+        self._priority_commands = frozenset(priority_commands)
+        self._stop_commands = frozenset(stop_commands)
+        self._max_line_length = max_line_length
+        self._latency = latency
+
+        self._lines = deque()
+        self._priority = deque()
+        self._servers = []
+        self._clients = {}  # The task serving every client writer
+        self._worker = None
+        self._runner = None
+        # Created in start, they belong to the event loop of the server.
+        self._space = None
+        self._ready = None
+        self._idle = None
+
+        self._received = 0
+        self._executed = 0
+        self._errors = 0
+        self._discarded = 0
+        self._stops = 0  # The number of stop lines, the lines before are discarded
+
+    # DUNDER METHODS
+    def __repr__(self) -> str:
+        return "GcodeStreamServer(clients={}, queued={}, queue_size={})".format(
+            len(self._clients), self.queued, self._queue_size
+        )
+
+    # PROPERTIES
+    @property
+    def state(self) -> GcodeMachineState:
+        """The modal machine state after the executed lines."""
+        return self._state
+
+    @property
+    def latency(self) -> Optional[PipelineLatency]:
+        """The latency recorder, None if the latency is not recorded."""
+        return self._latency
+
+    @property
+    def queued(self) -> int:
+        """The number of lines waiting to be executed."""
+        return len(self._lines) + len(self._priority)
+
+    @property
+    def sockets(self) -> list:
+        """The listening sockets, f.e. to get the port of a TCP server."""
+        return [sock for server in self._servers for sock in server.sockets]
+
+    # PUBLIC FUNCTIONS
+    async def start_tcp(self, host: Optional[str] = "127.0.0.1", port: int = 0) -> ...:
+        """
+        Listen for clients on a TCP port.
+
+        Parameters
+        ----------
+        host : str, optional
+            The address to listen on, all interfaces if None.
+        port : int
+            The port, a free port is picked if 0, see sockets.
+
+        """
+        self._start()
+        self._servers.append(
+            await asyncio.start_server(
+                self._serve_client, host, port, limit=self._max_line_length
+            )
+        )
+
+    async def start_unix(self, path: Union[str, os.PathLike]) -> ...:
+        """
+        Listen for clients on a Unix socket.
+
+        Parameters
+        ----------
+        path : str or os.PathLike
+            The path of the socket file.
+
+        """
+        self._start()
+        self._servers.append(
+            await asyncio.start_unix_server(
+                self._serve_client, os.fspath(path), limit=self._max_line_length
+            )
+        )
+
+    async def serve_forever(self) -> ...:
+        """Serve the clients until the server is closed."""
+        if not self._servers:
+            raise RuntimeError("The server is not started, see start_tcp.")
+        await asyncio.gather(*(server.serve_forever() for server in self._servers))
+
+    async def join(self) -> ...:
+        """Wait until every queued line is executed."""
+        if self._idle is not None:
+            await self._idle.wait()
+
+    async def close(self) -> ...:
+        """Stop listening, disconnect the clients and stop the execution."""
+        for server in self._servers:
+            server.close()
+        tasks = list(self._clients.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers.clear()
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self._worker is not None:
+            self._worker.shutdown(wait=True)
+            self._worker = None
+
+    def info(self) -> dict:
+        """
+        Get the server statistics.
+
+        Returns
+        -------
+        dict
+            The number of received, executed, failed and discarded lines,
+            the queued lines and the connected clients.
+
+        """
+        return {
+            "received": self._received,
+            "executed": self._executed,
+            "errors": self._errors,
+            "discarded": self._discarded,
+            "queued": self.queued,
+            "queue_size": self._queue_size,
+            "clients": len(self._clients),
+        }
+
+    # PRIVATE FUNCTIONS
+    def _start(self) -> ...:
+        """Start the execution of the queue in the running event loop."""
+        if self._runner is not None:
+            return
+        self._space = asyncio.Semaphore(self._queue_size)
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._worker = ThreadPoolExecutor(1, thread_name_prefix="gcode-stream")
+        self._runner = asyncio.ensure_future(self._run_queue())
+
+    async def _serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> ...:
+        """Read the lines of a client until it disconnects."""
+        self._clients[writer] = asyncio.current_task()
+        # The next normal line waits here for space in the queue, meanwhile
+        # the client is still read so its priority lines are not blocked.
+        pending = asyncio.Queue(1)
+        forward = asyncio.ensure_future(self._forward(pending, writer))
+        latency = self._latency
+        line_number = 0
+        try:
+            while True:
+                try:
+                    raw = await self._read_line(reader)
+                except ConnectionError:
+                    break
+                if raw is None:  # The line is longer than the limit
+                    line_number += 1
+                    self._received += 1
+                    self._errors += 1
+                    await pending.put(
+                        (
+                            "Error:Line {}: Line is longer than {} bytes.\nok\n".format(
+                                line_number, self._max_line_length
+                            ).encode(),
+                            None,
+                            self._stops,
+                        )
+                    )
+                    continue
+                if not raw:
+                    break
+                stamps = None
+                if latency is not None and latency.enabled:
+                    stamps = [perf_counter_ns()]
+                line_number += 1
+                self._received += 1
+                reply, commands = self._parse(raw, line_number)
+                if stamps is not None:
+                    stamps.append(perf_counter_ns())
+                if not commands:  # Blank, comment or invalid line
+                    await pending.put((reply, None, self._stops))
+                elif self._priority_commands.isdisjoint(commands):
+                    await pending.put(
+                        (reply, (writer, line_number, commands, stamps), self._stops)
+                    )
+                else:
+                    self._enqueue_priority((writer, line_number, commands, stamps))
+                    writer.write(reply)
+            await pending.put(None)
+            await forward
+        except asyncio.CancelledError:
+            pass  # The server is closed
+        finally:
+            forward.cancel()
+            self._clients.pop(writer, None)
+            writer.close()
+
+    @staticmethod
+    async def _read_line(reader: asyncio.StreamReader) -> Optional[bytes]:
+        """
+        Read a line of a client, None if it is longer than max_line_length.
+
+        The rest of a line that is too long is skipped up to its newline, also
+        when it is received later, so it is not read as another line.
+
+        """
+        try:
+            return await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            return e.partial  # The last line without a newline
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+        while True:
+            try:
+                await reader.readexactly(consumed)
+                await reader.readuntil(b"\n")
+                return None
+            except asyncio.IncompleteReadError:
+                return None
+            except asyncio.LimitOverrunError as e:
+                consumed = e.consumed
+
+    async def _forward(
+        self, pending: asyncio.Queue, writer: asyncio.StreamWriter
+    ) -> ...:
+        """
+        Put the normal lines of a client in the queue and acknowledge them.
+
+        A line received before a stop line is discarded instead, also when it
+        was waiting for space in the queue while the stop line was received.
+        It is still acknowledged, so the client stays in sync.
+
+        """
+        while True:
+            entry = await pending.get()
+            if entry is None:
+                return
+            reply, item, stops = entry
+            if item is not None and stops == self._stops:
+                await self._space.acquire()
+                if stops == self._stops:
+                    if item[3] is not None:
+                        item[3].append(perf_counter_ns())
+                    self._lines.append(item)
+                    self._idle.clear()
+                    self._ready.set()
+                else:  # Woken by the lines discarded by the stop line
+                    self._space.release()
+            if item is not None and stops != self._stops:
+                self._discarded += 1
+            if writer.is_closing():
+                continue
+            writer.write(reply)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    def _parse(self, raw: bytes, line_number: int) -> tuple:
+        """Parse a received line, returns the reply and the commands or None."""
+        line = raw.strip()
+        if not line or line[0] == 59:  # ord(";")
+            return _OK, None
+        try:
+            _, commands = GcodeParser.parse_numbered_line(line)
+        except GcodeChecksumError as e:
+            self._errors += 1
+            if e.resend is None:
+                return "Error:Line {}: {}\nok\n".format(line_number, e).encode(), None
+            return (
+                "Error:Line {}: {}\nResend: {}\nok\n".format(line_number, e, e.resend)
+            ).encode(), None
+        except (GcodeAttributeError, GcodeParsingError) as e:
+            self._errors += 1
+            return "Error:Line {}: {}\nok\n".format(line_number, e).encode(), None
+        return _OK, commands
+
+    def _enqueue_priority(self, item: tuple) -> ...:
+        """Put a priority line in front of the queued lines."""
+        if not self._stop_commands.isdisjoint(item[2]):
+            self._stops += 1
+            discarded = len(self._lines)
+            self._lines.clear()
+            for _ in range(discarded):
+                self._space.release()
+            self._discarded += discarded
+        if item[3] is not None:
+            item[3].append(item[3][-1])
+        self._priority.append(item)
+        self._idle.clear()
+        self._ready.set()
+
+    async def _run_queue(self) -> ...:
+        """Execute the queued lines in the worker thread, priority lines first."""
+        loop = asyncio.get_running_loop()
+        execute = self._execute
+        while True:
+            if self._priority:
+                item = self._priority.popleft()
+            elif self._lines:
+                item = self._lines.popleft()
+                self._space.release()
+            else:
+                self._idle.set()
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            writer, line_number, commands, stamps = item
+            try:
+                await loop.run_in_executor(self._worker, execute, commands, stamps)
+            except Exception as e:
+                self._errors += 1
+                if not writer.is_closing():
+                    writer.write(
+                        "Error:Line {}: {}\n".format(
+                            line_number, str(e) or type(e).__name__
+                        ).encode()
+                    )
+            else:
+                self._executed += 1
+
+    def _execute(self, commands: dict, stamps: Optional[list]) -> ...:
+        """Execute the commands of a line, runs in the worker thread."""
+        if stamps is None:
+            if self._dispatcher is not None:
+                self._dispatcher.execute(commands)
+            self._state.execute_parsed(commands)
+            return
+
+        latency = self._latency
+        dispatched = perf_counter_ns()
+        if self._dispatcher is not None:
+            dispatch = self._dispatcher.dispatch
+            for command, values in commands.items():
+                start = perf_counter_ns()
+                dispatch(command, values)
+                latency.record_command(command, perf_counter_ns() - start)
+        self._state.execute_parsed(commands)
+        latency.record_line(*stamps, dispatched, perf_counter_ns())
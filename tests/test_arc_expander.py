@@ -0,0 +1,140 @@
+import math
+import unittest
+import numpy as np
+from gpc_hardware.utils.arc_expander import ArcExpander, expand_program, linearize_arc
+from gpc_hardware.utils.gcode_lint import lint_line
+from gpc_hardware.utils.gcode_parser import GcodeAttributeError, GcodeParser
+from gpc_hardware.utils.machine_state import GcodeMachineState
+from gpc_hardware.utils.move_simplifier import simplify_program
+
+
+PROGRAM = [
+    'G0 X10 Y0',
+    'G3 X0 Y10 I-10 J0',
+    'M105',
+    'G91',
+    'G2 X10 Y-10 Z1 R10',
+    'G90',
+    'G2 X20 Y0 I0 J-10',
+    'G3 X20 Y0 Z2 I-5',
+]
+
+
+def _chord_deviation(start, points, center, radius):
+    # Distance between the middle of every chord and the circle
+    previous = np.vstack((start, points[:-1]))
+    middle = (previous[:, :2] + points[:, :2]) / 2
+    return np.max(radius - np.linalg.norm(middle - center, axis=1))
+
+
+class TestLinearizeArc(unittest.TestCase):
+
+    # Test the chords stay within the tolerance and end at the end
+    def test_tolerance(self):
+        for tolerance in (0.1, 0.01, 0.001):
+            points = linearize_arc((10, 0, 0), (0, 10, 0), tolerance, False, (-10, 0))
+            radii = np.linalg.norm(points[:, :2], axis=1)
+            np.testing.assert_allclose(radii, 10)
+            self.assertLessEqual(
+                _chord_deviation((10, 0, 0), points, (0, 0), 10), tolerance)
+            expected = math.ceil((math.pi / 2) / (2 * math.acos(1 - tolerance / 10)))
+            self.assertEqual(len(points), expected)
+            self.assertEqual(points[-1].tolist(), [0, 10, 0])
+
+    # Test the direction and the side of the center of R arcs
+    def test_radius(self):
+        for clockwise, radius, y_sign in (
+            (True, 5.0, 1), (False, 5.0, -1), (True, -8.0, 1), (False, -8.0, -1)
+        ):
+            points = linearize_arc((0, 0, 0), (10, 0, 0), 0.01, clockwise, radius=radius)
+            middle = points[len(points) // 2]
+            self.assertEqual(np.sign(middle[1]), y_sign)
+            if radius < 0:  # More than half a turn, the center is on the arc side
+                self.assertGreater(np.abs(points[:, 1]).max(), 8)
+        points = linearize_arc((0, 0, 0), (10, 0, 0), 0.01, True, radius=5)
+        np.testing.assert_allclose(np.linalg.norm(points[:, :2] - (5, 0), axis=1), 5)
+
+    # Test an arc ending at its start is a full circle with a linear helix
+    def test_full_circle(self):
+        points = linearize_arc((0, 0, 0), (0, 0, 4), 0.01, True, (5, 0))
+        angles = np.unwrap(np.arctan2(points[:, 1], points[:, 0] - 5))
+        self.assertTrue(np.all(np.diff(angles) < 0))
+        np.testing.assert_allclose(angles[-1] - angles[0], -2 * np.pi * (1 - 1 / len(points)))
+        np.testing.assert_allclose(np.diff(points[:, 2]), 4 / len(points))
+
+    # Test invalid arcs raise
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            linearize_arc((0, 0, 0), (10, 0, 0), 0.01, True, (5, 0), radius=5)
+        with self.assertRaises(ValueError):
+            linearize_arc((0, 0, 0), (10, 0, 0), 0.01, True)
+        with self.assertRaises(ValueError):
+            linearize_arc((0, 0, 0), (10, 0, 0), 0.01, True, radius=4)
+        with self.assertRaises(ValueError):
+            linearize_arc((0, 0, 0), (0, 0, 0), 0.01, True, radius=4)
+        with self.assertRaises(ValueError):
+            linearize_arc((0, 0, 0), (10, 0, 0), 0, True, radius=5)
+
+
+class TestExpandProgram(unittest.TestCase):
+
+    # Test arcs are parsed with their center or radius words
+    def test_parse(self):
+        self.assertEqual(GcodeParser.parse_gcode_line('G2 X10 Y0 I5 J0'),
+                         {'G2': {'X': 10, 'Y': 0, 'I': 5, 'J': 0}})
+        self.assertEqual(GcodeParser.parse_gcode_line(b'G3 X1.5 Z2 R-3'),
+                         {'G3': {'X': 1.5, 'Z': 2, 'R': -3}})
+        self.assertEqual(GcodeParser.parse_gcode_line('G0 X1 J2'), {'G0': {'X': 1, 'J': 2}})
+        with self.assertRaises(GcodeAttributeError):
+            GcodeParser.parse_gcode_line('G2 X10 I5 Y0')
+        self.assertEqual(lint_line('G2 X10 Y0 I5 J0'), [])
+        self.assertEqual(len(lint_line('G2 X10 I5 Y0')), 1)
+
+    # Test the arcs are replaced by moves ending at the arc ends
+    def test_expand(self):
+        program = GcodeParser.compile_program(PROGRAM)
+        expanded, moves = expand_program(program, 0.01)
+        self.assertEqual(len(expanded), len(program) - 4 + moves)
+        self.assertEqual(len(expanded.attributes), 0)
+        self.assertEqual(set(expanded.command_names[c] for c in expanded.commands['command']),
+                         {'G0', 'G90', 'G91', 'M105'})
+        state, expanded_state = GcodeMachineState(), GcodeMachineState()
+        ends = state.run_program(program).positions
+        positions = expanded_state.run_program(expanded).positions
+        np.testing.assert_allclose(state.position_vector, expanded_state.position_vector)
+        self.assertEqual(state.position['J'], 0)
+        # Every arc end is a move end of the expanded program
+        for end in ends:
+            self.assertTrue(np.any(np.all(np.abs(positions - end) < 1e-9, axis=1)))
+
+    # Test streaming gives the same moves as the batch expansion
+    def test_streaming_matches_batch(self):
+        expanded, moves = expand_program(GcodeParser.compile_program(PROGRAM), 0.01)
+        expander = ArcExpander(0.01)
+        streamed = list(expander.expand(GcodeParser.parse_stream(PROGRAM)))
+        self.assertEqual((expander.arcs, expander.moves), (4, moves))
+        batch = expanded.to_dicts()
+        self.assertEqual(len(streamed), len(batch))
+        for (line, commands), (batch_line, batch_commands) in zip(streamed, batch):
+            self.assertEqual(line, batch_line)
+            for command, values in commands.items():
+                self.assertEqual(values.keys(), batch_commands[command].keys())
+                np.testing.assert_allclose(
+                    list(values.values()), list(batch_commands[command].values()),
+                    atol=1e-12)
+
+    # Test the simplifier keeps the arcs and a program without arcs is kept
+    def test_other_commands(self):
+        program = GcodeParser.compile_program(['G0 X1', 'G0 X2', 'G2 X2 Y0 I1 J0'])
+        simplified, removed = simplify_program(program, 0.01)
+        self.assertEqual(removed, 1)
+        self.assertEqual(simplified.to_dicts()[-1][1],
+                         {'G2': {'X': 2.0, 'Y': 0.0, 'I': 1.0, 'J': 0.0}})
+        program = GcodeParser.compile_program(['G0 X1', 'M105'])
+        self.assertEqual(expand_program(program, 0.01), (program, 0))
+        with self.assertRaises(ValueError):
+            expand_program(GcodeParser.compile_program(['G2 X2 Y0']), 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
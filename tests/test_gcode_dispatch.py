@@ -0,0 +1,111 @@
+import unittest
+from gpc_hardware.apps.base_classes import BaseApp
+from gpc_hardware.utils.gcode_dispatch import GcodeDispatcher, GcodeDispatchError
+
+
+class _RecordingApp(BaseApp):
+    name = 'recorder'
+    version = '0.0'
+    gcode_commands = ('M140', 'M105')
+
+    def __init__(self):
+        self.calls = []
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def emergency_stop(self):
+        pass
+
+    def execute_command(self, cmd, *args, **kwargs):
+        self.calls.append((cmd, kwargs))
+        return cmd
+
+
+class TestGcodeDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.dispatcher = GcodeDispatcher()
+
+    def _move(self, **axes):
+        self.calls.append(axes)
+        return 'moved'
+
+    # Test a command is dispatched with its values as keyword arguments
+    def test_dispatch(self):
+        self.dispatcher.register('G0', self._move)
+        self.dispatcher.build()
+        self.assertEqual(self.dispatcher.dispatch('G0', {'X': 5, 'Y': 1.5}), 'moved')
+        self.assertEqual(self.calls, [{'X': 5, 'Y': 1.5}])
+
+    # Test the converter prepares the handler arguments
+    def test_converter(self):
+        self.dispatcher.register(
+            'M113', lambda interval: interval,
+            converter=lambda values: {'interval': values.get('S', 2)})
+        self.dispatcher.build()
+        self.assertEqual(self.dispatcher.dispatch('M113', {'S': 5}), 5)
+        self.assertEqual(self.dispatcher.dispatch('M113'), 2)
+
+    # Test a parsed line is executed in order, apps get the command id
+    def test_execute_line(self):
+        app = _RecordingApp()
+        self.dispatcher.register_app(app)
+        self.dispatcher.handles('G0')(self._move)
+        self.dispatcher.build()
+        results = self.dispatcher.execute_line('G0 X1 M140 S0.5 I2 M105')
+        self.assertEqual(results, ['moved', 'M140', 'M105'])
+        self.assertEqual(app.calls, [('M140', {'S': 0.5, 'I': 2}), ('M105', {})])
+
+    # Test mistakes in the registrations fail while registering
+    def test_registration_errors(self):
+        self.dispatcher.register('G0', self._move)
+        with self.assertRaises(GcodeDispatchError):
+            self.dispatcher.register('G0', self._move)
+        with self.assertRaises(GcodeDispatchError):
+            self.dispatcher.register('G4', self._move)
+        with self.assertRaises(TypeError):
+            self.dispatcher.register('G1', None)
+        with self.assertRaises(GcodeDispatchError):
+            self.dispatcher.build(require_all=True)
+        self.dispatcher.build()
+        with self.assertRaises(GcodeDispatchError):
+            self.dispatcher.register('G1', self._move)
+
+    # Test commands without handler fail when dispatched
+    def test_dispatch_errors(self):
+        self.dispatcher.register('G0', self._move)
+        with self.assertRaises(GcodeDispatchError):
+            self.dispatcher.dispatch('G0', {'X': 1})
+        self.dispatcher.build()
+        for command in ('G1', 'G2'):
+            with self.assertRaises(GcodeDispatchError):
+                self.dispatcher.dispatch(command)
+        self.assertEqual(self.calls, [])
+
+    # Test the latency of the dispatched commands is measured
+    def test_latency(self):
+        self.dispatcher.register('G0', self._move)
+        self.dispatcher.register('G28', lambda: None)
+        self.dispatcher.build()
+        for i in range(3):
+            self.dispatcher.dispatch('G0', {'X': i})
+        latency = self.dispatcher.latency()
+        self.assertEqual(list(latency), ['G0'])
+        self.assertEqual(latency['G0']['count'], 3)
+        self.assertGreaterEqual(latency['G0']['max'], latency['G0']['mean'])
+        self.dispatcher.reset_latency()
+        self.assertEqual(self.dispatcher.latency(), {})
+
+        dispatcher = GcodeDispatcher(measure_latency=False)
+        dispatcher.register('G0', self._move)
+        dispatcher.build().dispatch('G0', {'X': 1})
+        self.assertEqual(dispatcher.latency(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+from click.testing import CliRunner
+from gpc_hardware.gcode_cli import gcode
+from gpc_hardware.utils import gcode_lint
+from gpc_hardware.utils.gcode_lint import GcodeIssue, lint_line
+from gpc_hardware.utils.gcode_parser import (
+    GcodeParser,
+    GcodeAttributeError,
+    GcodeParsingError,
+)
+
+
+class TestGcodeLint(unittest.TestCase):
+
+    # Test a valid line has no issues
+    def test_valid_line(self):
+        self.assertEqual(lint_line('G0 X5 Y0 Z5.7 G1 L-5 M140 S0.6 I-2'), [])
+
+    # Test every problem in a line is reported
+    def test_all_problems_in_line(self):
+        issues = lint_line('G0 X1 X2 Q1 L1 Xa M140 S1 X1 R1', line_number=4)
+        self.assertEqual(issues, [
+            GcodeIssue(4, 7, 'X2', gcode_lint.DUPLICATE_AXIS),
+            GcodeIssue(4, 10, 'Q1', gcode_lint.UNKNOWN_COMMAND),
+            GcodeIssue(4, 13, 'L1', gcode_lint.AXIS_NOT_ALLOWED),
+            GcodeIssue(4, 16, 'Xa', gcode_lint.BAD_NUMBER),
+            GcodeIssue(4, 27, 'X1', gcode_lint.MOVEMENT_AFTER_ATTRIBUTE),
+            GcodeIssue(4, 30, 'R1', gcode_lint.ATTRIBUTE_NOT_ALLOWED),
+        ])
+
+    # Test problems with the order of the entries
+    def test_order_problems(self):
+        self.assertEqual(
+            [issue.reason for issue in lint_line('S1 M140 G28 X1 M999 S2')],
+            [gcode_lint.MISSING_COMMAND,
+             gcode_lint.MOVEMENT_NOT_ALLOWED, gcode_lint.BAD_BOOLEAN])
+
+    # Test lines in the Marlin forms
+    def test_marlin_lines(self):
+        self.assertEqual(lint_line('N5 G0X1Y2 ; move*'), [])
+        self.assertEqual(lint_line('G0X1\tX2 (twice)  Q1'), [
+            GcodeIssue(1, 6, 'X2', gcode_lint.DUPLICATE_AXIS),
+            GcodeIssue(1, 18, 'Q1', gcode_lint.UNKNOWN_COMMAND),
+        ])
+        self.assertEqual(lint_line('N5 G90*1'), [
+            GcodeIssue(1, 7, '*1', gcode_lint.BAD_CHECKSUM)])
+        self.assertEqual(lint_line('G0 (X1'), [
+            GcodeIssue(1, 4, '(X1', gcode_lint.UNCLOSED_COMMENT)])
+
+    # Test the linter agrees with the parser
+    def test_agrees_with_parser(self):
+        lines = ['M112', 'M140 S0.6 I-2', 'M140 I1.5', 'M140 I1e3', 'M140 S1e3', 'M999 STrue',
+                 'M999 Sx', 'G0 X1e3 Y.5', 'G0 Xinf', 'G0 X1.2.3', 'G1 L-5',
+                 'G0 X1 X1', 'G28 X0.0', 'X1 G0', 'S1 M140', 'G0 X1 S1',
+                 'G0  X1', 'G22222', 'M92 X1 P2 N3', 'G0X1Y2', 'G0X1X2',
+                 ' G90', 'G0 X1 ;c', 'G0 (c X1', 'N2 G90*9', 'N2 G90*x', 'G0X1.Y2',
+                 'G0 X1Ea', '(c)', 'M140 S1.5(c)I2']
+        for line in lines:
+            try:
+                GcodeParser.parse_gcode_line(line)
+                valid = True
+            except (GcodeAttributeError, GcodeParsingError, ValueError):
+                valid = False
+            self.assertEqual(lint_line(line) == [], valid, line)
+
+    # Test validating a program
+    def test_validate_program(self):
+        program = ['G90\n', '; G0 X1 X1\n', '\n', '  G0 X1 X1\n', b'M999 S3\n']
+        self.assertEqual(GcodeParser.validate(program), [
+            GcodeIssue(4, 9, 'X1', gcode_lint.DUPLICATE_AXIS),
+            GcodeIssue(5, 6, 'S3', gcode_lint.BAD_BOOLEAN),
+        ])
+        self.assertEqual(len(GcodeParser.validate(program, max_issues=1)), 1)
+
+
+class TestGcodeLintCli(unittest.TestCase):
+
+    def _run(self, program):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'program.gcode')
+            with open(path, 'w') as f:
+                f.write(program)
+            return CliRunner().invoke(gcode, ['validate', path])
+
+    # Test a valid program exits with zero
+    def test_valid_program(self):
+        result = self._run('G90\nG0 X1\n')
+        self.assertEqual(result.exit_code, 0)
+
+    # Test an invalid program exits non zero with a summary
+    def test_invalid_program(self):
+        result = self._run('G90\nG0 X1 X1\nG0 Q1\nG0 Y1 Y1\n')
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('3 issues on 3 lines', result.output)
+        self.assertIn('duplicate axis', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,18 @@
+import importlib
+import io
+import os
+import tempfile
 import unittest
-from gpc_hardware.utils.gcode_parser import GcodeParser, GcodeAttributeError
+from unittest import mock
+from gpc_hardware.utils.gcode_parser import (
+    GcodeParser,
+    GcodeAttributeError,
+    GcodeChecksumError,
+    GcodeParsingError,
+    GcodeReceiveBuffer,
+    gcode_checksum,
+)
+from gpc_hardware.utils import accepted_gcode
 
 
 class TestGcodeParser(unittest.TestCase):
@@ -122,8 +135,364 @@ class TestGcodeParser(unittest.TestCase):
             _ = GcodeParser().parse_gcode_line(gcode_line)
 
     # Test forbidden movement on linear axis
+    def test_forbidden_linear_movement(self):
+        gcode_line = 'G1 X1'
+        with self.assertRaises(GcodeAttributeError):
+            _ = GcodeParser().parse_gcode_line(gcode_line)
 
     # Test forbidden movement on rotational axis
+    def test_forbidden_rotational_movement(self):
+        gcode_line = 'G0 L1'
+        with self.assertRaises(GcodeAttributeError):
+            _ = GcodeParser().parse_gcode_line(gcode_line)
+
+    # Test multiple commands with movements on one line
+    def test_multiple_commands_with_movements(self):
+        expected = {'G0': {'X': 1.5, 'K': 6}, 'G1': {'L': 7},
+                    'M92': {'X': 1, 'P': 10}}
+        gcode_line = 'G0 X1.5 K6 G1 L7 M92 X1 P10'
+        parsed_commands = GcodeParser().parse_gcode_line(gcode_line)
+        self.assertEqual(parsed_commands, expected)
+
+    # Test bytes line
+    def test_bytes_line(self):
+        expected = {'M140': {'S': 0.6, 'I': -2}}
+        parsed_commands = GcodeParser().parse_gcode_line(b'M140 S0.6 I-2')
+        self.assertEqual(parsed_commands, expected)
+
+    # Test attribute as first entry
+    def test_attribute_first_entry(self):
+        with self.assertRaises(GcodeParsingError):
+            _ = GcodeParser().parse_gcode_line('S1 M140')
+
+    # Test movement as first entry
+    def test_movement_first_entry(self):
+        with self.assertRaises(GcodeAttributeError):
+            _ = GcodeParser().parse_gcode_line('X1 G0')
+
+    # Test attribute not allowed for command
+    def test_attribute_not_allowed(self):
+        with self.assertRaises(GcodeAttributeError):
+            _ = GcodeParser().parse_gcode_line('G0 X1 S1')
+
+    # Test movement after an attribute
+    def test_movement_after_attribute(self):
+        with self.assertRaises(GcodeAttributeError):
+            _ = GcodeParser().parse_gcode_line('M140 S1 X1')
+
+    # Test unknown entry
+    def test_unknown_entry(self):
+        with self.assertRaises(GcodeAttributeError):
+            _ = GcodeParser().parse_gcode_line('G0 X1 Q1')
+
+    # Test invalid boolean attribute
+    def test_invalid_boolean_attribute(self):
+        with self.assertRaises(GcodeAttributeError):
+            _ = GcodeParser().parse_gcode_line('M999 S2')
+
+    # Test invalid line type
+    def test_invalid_line_type(self):
+        with self.assertRaises(GcodeParsingError):
+            _ = GcodeParser().parse_gcode_line(None)
+
+    # Test parsing a stream of lines
+    def test_parse_stream_lines(self):
+        lines = ['G0 X1\n', '\n', '; comment\n', 'M140 S0.6 I-2\n', b'M105\r\n']
+        expected = [
+            (1, 0, {'G0': {'X': 1}}),
+            (4, 17, {'M140': {'S': 0.6, 'I': -2}}),
+            (5, 31, {'M105': {}}),
+        ]
+        self.assertEqual(list(GcodeParser.parse_stream(lines)), expected)
+
+    # Test parsing a file from a path and a binary file object
+    def test_parse_stream_file(self):
+        program = b'G90\r\nG0 X1 Y2\r\n\r\nG1 L-5\r\n'
+        expected = [
+            (1, 0, {'G90': {}}),
+            (2, 5, {'G0': {'X': 1, 'Y': 2}}),
+            (4, 17, {'G1': {'L': -5}}),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'program.gcode')
+            with open(path, 'wb') as f:
+                f.write(program)
+            self.assertEqual(list(GcodeParser.parse_stream(path)), expected)
+        self.assertEqual(
+            list(GcodeParser.parse_stream(io.BytesIO(program))), expected)
+
+    # Test the stream is parsed lazily
+    def test_parse_stream_is_lazy(self):
+        def lines():
+            yield 'M105'
+            raise AssertionError('Read past the first line')
+
+        stream = GcodeParser.parse_stream(lines())
+        self.assertEqual(next(stream), (1, 0, {'M105': {}}))
+
+    # Test errors in a stream contain the line number
+    def test_parse_stream_error_line_number(self):
+        with self.assertRaisesRegex(GcodeAttributeError, 'Line 3'):
+            list(GcodeParser.parse_stream(['M105', 'G90', 'G0 X1 X2']))
+        # Invalid numbers are attribute errors with the line number as well
+        for line in ('G0 X1.2.3', 'M140 S1.2.3', 'M140 Sx', b'G0 X1.2.3'):
+            with self.assertRaisesRegex(GcodeAttributeError, 'Line 2') as cm:
+                list(GcodeParser.parse_stream(['G90\n', line]))
+            self.assertEqual(cm.exception.line_number, 2)
+
+    # Test the bytes path gives the same results as the str path
+    def test_bytes_path_matches_str_path(self):
+        lines = ['M112 M113', 'M140 S0.6 I-2', 'M999 STrue', 'M999 S0',
+                 'G0 X5 Y0 Z5.7', 'G1 L-5', 'M92 X1e3 P.5', 'M140 I1.5',
+                 'G0 X1 G1 L2 G0 Y3']
+        for line in lines:
+            expected = GcodeParser.parse_gcode_line(line)
+            for raw in (line.encode(), bytearray(line.encode()),
+                        memoryview(line.encode())):
+                self.assertEqual(GcodeParser.parse_gcode_line(raw), expected)
+
+    # Test the bytes path raises the same errors as the str path
+    def test_bytes_path_errors(self):
+        with self.assertRaises(GcodeAttributeError):
+            GcodeParser.parse_gcode_line(b'G0 X1 X2')
+        with self.assertRaises(GcodeAttributeError):
+            GcodeParser.parse_gcode_line(b'M999 S2')
+        with self.assertRaises(GcodeParsingError):
+            GcodeParser.parse_gcode_line(b'S1 M140')
+
+    # Test parsing a bytes buffer
+    def test_parse_buffer(self):
+        program = b'G90\r\nG0 X1 Y2\n\n; comment\nG1 L-5'
+        expected = list(GcodeParser.parse_stream(io.BytesIO(program)))
+        self.assertEqual(list(GcodeParser.parse_buffer(program)), expected)
+        self.assertEqual(
+            list(GcodeParser.parse_buffer(memoryview(program))), expected)
+        with self.assertRaisesRegex(GcodeAttributeError, 'Line 3') as cm:
+            list(GcodeParser.parse_buffer(b'G90\n\nG0 X1 Y1.2.3\n'))
+        self.assertEqual(cm.exception.line_number, 3)
+
+
+class TestGcodeMarlinSyntax(unittest.TestCase):
+
+    # Test words without spaces and with repeated spaces or tabs
+    def test_spaceless(self):
+        expected = GcodeParser.parse_gcode_line('G0 X1 Y-2.5 M140 S0.6 I-2')
+        for line in ('G0X1Y-2.5M140S0.6I-2', 'G0  X1\tY-2.5 M140S0.6 I-2',
+                     ' G0 X1Y-2.5 M140 S0.6 I-2 ',
+                     b'G0X1Y-2.5 M140 S0.6I-2'):
+            self.assertEqual(GcodeParser.parse_gcode_line(line), expected, line)
+        # E is not a word letter, so exponents are not split
+        self.assertEqual(GcodeParser.parse_gcode_line('G0 X1E1'), {'G0': {'X': 10}})
+        with self.assertRaises(GcodeAttributeError):
+            GcodeParser.parse_gcode_line('G0X1Q1')
+
+    # Test ';' and '(...)' comments
+    def test_comments(self):
+        self.assertEqual(GcodeParser.parse_gcode_line('G0 X1 ; move (x)'),
+                         {'G0': {'X': 1}})
+        self.assertEqual(GcodeParser.parse_gcode_line('G0 (fast) X1(end)'),
+                         {'G0': {'X': 1}})
+        self.assertEqual(GcodeParser.parse_gcode_line(b'(only a comment)'), {})
+        with self.assertRaises(GcodeParsingError):
+            GcodeParser.parse_gcode_line('G0 (not closed X1')
+
+    # Test N line numbers and checksums
+    def test_numbered_lines(self):
+        framed = GcodeParser.frame_line('G0 X1 Y2', 12)
+        self.assertEqual(framed, 'N12 G0 X1 Y2*{}'.format(
+            gcode_checksum('N12 G0 X1 Y2')))
+        self.assertEqual(GcodeParser.frame_line(b'M105', 3),
+                         b'N3 M105*%d' % gcode_checksum(b'N3 M105'))
+        self.assertEqual(GcodeParser.parse_numbered_line(framed),
+                         (12, {'G0': {'X': 1, 'Y': 2}}))
+        self.assertEqual(GcodeParser.parse_numbered_line(framed.encode()),
+                         (12, {'G0': {'X': 1, 'Y': 2}}))
+        self.assertEqual(GcodeParser.parse_gcode_line(framed),
+                         {'G0': {'X': 1, 'Y': 2}})
+        self.assertEqual(GcodeParser.parse_numbered_line('N7G90'), (7, {'G90': {}}))
+        self.assertEqual(GcodeParser.parse_numbered_line('G90'), (None, {'G90': {}}))
+
+        with self.assertRaises(GcodeChecksumError) as context:
+            GcodeParser.parse_numbered_line(framed.replace('X1', 'X3'))
+        self.assertEqual(context.exception.resend, 12)
+        self.assertIn('N12', str(context.exception))
+        with self.assertRaises(GcodeParsingError):
+            GcodeParser.parse_gcode_line('N1 G90*x')
+
+    # Test lines with only a comment are skipped in streams and buffers
+    def test_comment_lines_skipped(self):
+        lines = ['(c)\n', '; c\n', ' (a) (b) ; c\n', 'G90\n']
+        expected = [(4, 21, {'G90': {}})]
+        self.assertEqual(list(GcodeParser.parse_stream(lines)), expected)
+        self.assertEqual(
+            list(GcodeParser.parse_buffer(''.join(lines).encode())), expected)
+
+    # Test the Marlin forms in streams and buffers
+    def test_stream_and_buffer(self):
+        program = b'N1 G90*{}\nG0X1Y2 ; move\n\n(setup)\nG1 L-5\n'.replace(
+            b'{}', str(gcode_checksum('N1 G90')).encode())
+        offsets = [0] + [i + 1 for i, c in enumerate(program) if c == 10]
+        expected = [(1, offsets[0], {'G90': {}}),
+                    (2, offsets[1], {'G0': {'X': 1, 'Y': 2}}),
+                    (5, offsets[4], {'G1': {'L': -5}})]
+        self.assertEqual(list(GcodeParser.parse_stream(io.BytesIO(program))),
+                         expected)
+        self.assertEqual(list(GcodeParser.parse_buffer(program)), expected)
+        with self.assertRaises(GcodeChecksumError) as context:
+            list(GcodeParser.parse_buffer(b'G90\nN2 G91*1\n'))
+        self.assertEqual(context.exception.line_number, 2)
+
+        # The resend line number is kept and the message has both numbers
+        for parsed in (lambda: GcodeParser.parse_stream(['N5 G90*1\n']),
+                       lambda: GcodeParser.parse_buffer(b'N5 G90*1\n')):
+            with self.assertRaises(GcodeChecksumError) as context:
+                list(parsed())
+            self.assertEqual(context.exception.resend, 5)
+            self.assertEqual(context.exception.line_number, 1)
+            self.assertTrue(str(context.exception).startswith('Line 1 (N5): Checksum'))
+        with self.assertRaises(GcodeChecksumError) as context:
+            list(GcodeParser.parse_stream(['G90\n', 'G91*1\n']))
+        self.assertIsNone(context.exception.resend)
+        self.assertTrue(str(context.exception).startswith('Line 2: Checksum'))
+
+
+class TestGcodeParserParallel(unittest.TestCase):
+
+    def setUp(self):
+        lines = []
+        for i in range(2000):
+            lines.append('G0 X{} Y{}.5'.format(i, i) if i % 3 else '; comment')
+        self.program = ('\n'.join(lines) + '\nM105').encode()
+
+    # Test the parallel results equal the serial results
+    def test_parse_parallel_matches_serial(self):
+        expected = list(GcodeParser.parse_buffer(self.program))
+        self.assertEqual(
+            GcodeParser.parse_parallel(self.program, workers=2, min_size=0),
+            expected)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'program.gcode')
+            with open(path, 'wb') as f:
+                f.write(self.program)
+            self.assertEqual(
+                GcodeParser.parse_parallel(path, workers=2, min_size=0),
+                expected)
+
+    # Test errors have the absolute line number
+    def test_parse_parallel_error_line_number(self):
+        program = self.program.replace(b'G0 X1501 Y1501.5', b'G0 X1 X1')
+        with self.assertRaisesRegex(GcodeAttributeError, 'Line 1502') as cm:
+            GcodeParser.parse_parallel(program, workers=2, min_size=0)
+        self.assertEqual(cm.exception.line_number, 1502)
+        program = self.program.replace(b'G0 X1801 Y1801.5', b'G0 X1.2.3')
+        with self.assertRaisesRegex(GcodeAttributeError, 'Line 1802') as cm:
+            GcodeParser.parse_parallel(program, workers=2, min_size=0)
+        self.assertEqual(cm.exception.line_number, 1802)
+
+    # Test small programs fall back to serial parsing
+    def test_parse_parallel_small_program(self):
+        self.assertEqual(GcodeParser.parse_parallel(b'M105\nG90', workers=4),
+                         [(1, 0, {'M105': {}}), (2, 5, {'G90': {}})])
+
+    # Test compiling in parallel
+    def test_compile_parallel(self):
+        expected = GcodeParser.compile_program(self.program)
+        with mock.patch.object(GcodeParser, '_parallel_min_size', 0):
+            program = GcodeParser.compile_program(self.program, workers=2)
+        self.assertEqual(program.commands.tobytes(), expected.commands.tobytes())
+
+
+class TestGcodeReceiveBuffer(unittest.TestCase):
+
+    # Test lines split over multiple chunks
+    def test_split_chunks(self):
+        buffer = GcodeReceiveBuffer()
+        self.assertEqual(buffer.feed(b'G0 X1'), [])
+        self.assertEqual(buffer.feed(b' Y2\r\nM10'),
+                         [(1, 0, {'G0': {'X': 1, 'Y': 2}})])
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.feed(b'5\n\nG90\n'),
+                         [(2, 10, {'M105': {}}), (4, 16, {'G90': {}})])
+        self.assertEqual(buffer.feed(b'G91'), [])
+        self.assertEqual(buffer.flush(), [(5, 20, {'G91': {}})])
+
+    # Test the lines around an invalid line are kept
+    def test_error_keeps_other_lines(self):
+        buffer = GcodeReceiveBuffer()
+        with self.assertRaisesRegex(GcodeAttributeError, 'Line 2'):
+            buffer.feed(b'G90\nG0 X1 X1\nG91\n')
+        self.assertEqual(buffer.feed(b''), [(1, 0, {'G90': {}}),
+                                            (3, 13, {'G91': {}})])
+
+    # Test a line that is too long
+    def test_line_too_long(self):
+        buffer = GcodeReceiveBuffer(max_line_length=8)
+        with self.assertRaises(GcodeParsingError):
+            buffer.feed(b'G0 X1 Y2 Z3')
+        self.assertEqual(len(buffer), 0)
+
+    # Test the rest of a line that is too long is skipped in the next chunks
+    def test_line_too_long_rest(self):
+        buffer = GcodeReceiveBuffer(max_line_length=64)
+        with self.assertRaises(GcodeParsingError):
+            buffer.feed(b'G90 ' * 50)
+        self.assertEqual(buffer.feed(b'G91 G0'), [])
+        self.assertEqual(buffer.feed(b' X55\nM105\n'), [(2, 211, {'M105': {}})])
+        self.assertEqual(buffer.feed(b'G0 X1\n'), [(3, 216, {'G0': {'X': 1}})])
+
+
+class TestGcodeParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = GcodeParser.enable_cache(maxsize=2)
+
+    def tearDown(self):
+        GcodeParser.disable_cache()
+
+    # Test hits and misses are counted
+    def test_hits_and_misses(self):
+        GcodeParser.parse_gcode_line('M105')
+        GcodeParser.parse_gcode_line('M105')
+        GcodeParser.parse_gcode_line(b'M105')
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(GcodeParser.cache_info()['size'], 2)
+
+    # Test the least recently used line is evicted
+    def test_eviction(self):
+        GcodeParser.parse_gcode_line('M105')
+        GcodeParser.parse_gcode_line('M114')
+        GcodeParser.parse_gcode_line('M105')
+        GcodeParser.parse_gcode_line('G90')
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertIsNotNone(self.cache.get('M105'))
+        self.assertIsNone(self.cache.get('M114'))
+
+    # Test changing a result does not change the cache
+    def test_defensive_copy(self):
+        first = GcodeParser.parse_gcode_line('G0 X1')
+        first['G0']['X'] = 100
+        second = GcodeParser.parse_gcode_line('G0 X1')
+        second['G0']['Y'] = 100
+        self.assertEqual(GcodeParser.parse_gcode_line('G0 X1'), {'G0': {'X': 1}})
+
+    # Test errors are not cached
+    def test_errors_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(GcodeAttributeError):
+                GcodeParser.parse_gcode_line('G0 X1 X1')
+        self.assertEqual(len(self.cache), 0)
+
+    # Test reloading the accepted commands clears the cache
+    def test_reload_clears_cache(self):
+        GcodeParser.parse_gcode_line('M105')
+        importlib.reload(accepted_gcode)
+        GcodeParser.parse_gcode_line('M105')
+        self.assertEqual(self.cache.hits, 0)
+
+        GcodeParser.parse_gcode_line('M105')
+        GcodeParser.reload_grammar()
+        self.assertEqual(len(self.cache), 0)
 
 
 if __name__ == '__main__':
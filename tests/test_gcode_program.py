@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from gpc_hardware.utils.gcode_parser import GcodeParser
+from gpc_hardware.utils.gcode_program import GcodeProgram
+
+
+PROGRAM = [
+    'G90',
+    'G0 X1 Y2',
+    'M140 S0.6 I-2',
+    '',
+    'G0 X3 Z4.5 G1 L-5',
+    'M999 S1',
+    'G0 Y7',
+]
+
+
+class TestGcodeProgram(unittest.TestCase):
+
+    def setUp(self):
+        self.program = GcodeParser.compile_program(PROGRAM)
+
+    # Test the command table
+    def test_command_table(self):
+        self.assertEqual(len(self.program), 7)
+        np.testing.assert_array_equal(self.program.lines, [1, 2, 3, 5, 5, 6, 7])
+        np.testing.assert_array_equal(
+            self.program.axis('X'), [np.nan, 1, np.nan, 3, np.nan, np.nan, np.nan])
+        np.testing.assert_array_equal(
+            self.program.axis('L'),
+            [np.nan, np.nan, np.nan, np.nan, -5, np.nan, np.nan])
+
+    # Test the attribute table
+    def test_attribute_table(self):
+        np.testing.assert_array_equal(
+            self.program.attribute('S'),
+            [np.nan, np.nan, 0.6, np.nan, np.nan, 1, np.nan])
+        np.testing.assert_array_equal(self.program.attributes['row'], [2, 2, 5])
+
+    # Test the program converts back to the parsed dicts
+    def test_to_dicts(self):
+        expected = [(n, c) for n, _, c in GcodeParser.parse_stream(PROGRAM)]
+        self.assertEqual(self.program.to_dicts(), expected)
+
+    # Test selecting commands
+    def test_select(self):
+        moves = self.program.select('G0')
+        self.assertEqual(len(moves), 3)
+        np.testing.assert_array_equal(moves.lines, [2, 5, 7])
+        self.assertEqual(len(moves.attributes), 0)
+
+        machine = self.program.select('M140', 'M999')
+        np.testing.assert_array_equal(machine.attributes['row'], [0, 0, 1])
+
+    # Test slicing shares the command table
+    def test_slice(self):
+        part = self.program[2:6]
+        self.assertTrue(np.shares_memory(part.commands, self.program.commands))
+        np.testing.assert_array_equal(part.lines, [3, 5, 5, 6])
+        np.testing.assert_array_equal(part.attributes['row'], [0, 0, 3])
+        self.assertEqual(part.to_dicts(), self.program.to_dicts()[2:5])
+
+        # The original attribute table is not changed by slicing.
+        np.testing.assert_array_equal(self.program.attributes['row'], [2, 2, 5])
+
+    # Test a boolean mask
+    def test_mask_index(self):
+        part = self.program[self.program.lines > 4]
+        np.testing.assert_array_equal(part.lines, [5, 5, 6, 7])
+
+    # Test saving and loading the program
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'program.npz')
+            self.program.save(path)
+            loaded = GcodeProgram.load(path)
+        self.assertEqual(loaded.commands.tobytes(), self.program.commands.tobytes())
+        np.testing.assert_array_equal(loaded.attributes, self.program.attributes)
+        self.assertEqual(loaded.to_dicts(), self.program.to_dicts())
+
+    # Test compiling a bytes buffer
+    def test_compile_buffer(self):
+        program = GcodeParser.compile_program('\n'.join(PROGRAM).encode())
+        self.assertEqual(program.commands.tobytes(), self.program.commands.tobytes())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import unittest
+from gpc_hardware.utils.gcode_dispatch import GcodeDispatcher
+from gpc_hardware.utils.gcode_parser import GcodeParser
+from gpc_hardware.utils.job_runner import GcodeJobRunner
+from gpc_hardware.utils.macro_engine import MacroEngine
+
+
+PROGRAM = [
+    'M92 X80 Y80',
+    'G91',
+    '; comment',
+    'G0 X1 Y2',
+    'G0 X1',
+    'M112',
+    '',
+    'G0 X1',
+    'G90',
+    'G0 Y10',
+]
+
+
+def _dispatcher(calls, fail=None):
+    dispatcher = GcodeDispatcher()
+
+    def handler(command):
+        def handle(**values):
+            if command == fail:
+                raise RuntimeError('failed {}'.format(command))
+            calls.append((command, values))
+        return handle
+
+    for command in ('G0', 'G90', 'G91', 'M92', 'M112', 'M105'):
+        dispatcher.register(command, handler(command))
+    return dispatcher.build()
+
+
+class TestGcodeJobRunner(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, 'job.gcode')
+        with open(self.path, 'w') as f:
+            f.write('\n'.join(PROGRAM) + '\n')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    # Test a job stopped by M112 resumes after the stop with the modal state
+    def test_stop_and_resume(self):
+        calls = []
+        runner = GcodeJobRunner(self.path, dispatcher=_dispatcher(calls))
+        self.assertEqual(runner.run(), 5)
+        self.assertTrue(runner.stopped)
+        self.assertFalse(runner.finished)
+        self.assertEqual(calls[-1], ('M112', {}))
+
+        checkpoint = GcodeJobRunner.load_checkpoint(runner.checkpoint_path)
+        self.assertEqual(checkpoint.line, 8)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read()[checkpoint.offset:].split(b'\n')[0], b'G0 X1')
+        self.assertFalse(checkpoint.state['absolute'])
+        self.assertEqual(checkpoint.state['position']['X'], 2)
+        self.assertEqual(checkpoint.state['steps_per_unit']['Y'], 80)
+
+        calls = []
+        resumed = GcodeJobRunner.resume(runner.checkpoint_path,
+                                        dispatcher=_dispatcher(calls))
+        self.assertEqual(resumed.run(), 3)
+        self.assertEqual([command for command, _ in calls], ['G0', 'G90', 'G0'])
+        self.assertTrue(resumed.finished)
+        self.assertEqual(resumed.state.position['X'], 3)
+        self.assertEqual(resumed.state.position['Y'], 10)
+        self.assertFalse(os.path.exists(runner.checkpoint_path))
+
+    # Test the periodic checkpoints and pausing after a number of lines
+    def test_checkpoints(self):
+        runner = GcodeJobRunner(self.path, checkpoint_lines=2)
+        self.assertEqual(runner.run(max_lines=3), 3)
+        checkpoint = GcodeJobRunner.load_checkpoint(runner.checkpoint_path)
+        self.assertEqual((checkpoint.line, checkpoint.offset),
+                         (runner.line, runner.offset))
+        self.assertEqual(checkpoint.line, 5)
+        self.assertEqual(runner.run(max_lines=1), 1)
+        self.assertEqual(runner.run(), 1)  # The M112
+        self.assertTrue(runner.stopped)
+        self.assertEqual(runner.run(), 3)
+        self.assertFalse(runner.stopped)
+        self.assertTrue(runner.finished)
+
+        with self.assertRaises(ValueError):
+            GcodeJobRunner(self.path, checkpoint_lines=0)
+
+    # Test a failing line is run again on resume
+    def test_error(self):
+        calls = []
+        runner = GcodeJobRunner(self.path,
+                                dispatcher=_dispatcher(calls, fail='G91'))
+        with self.assertRaises(RuntimeError):
+            runner.run()
+        checkpoint = GcodeJobRunner.load_checkpoint(runner.checkpoint_path)
+        self.assertEqual(checkpoint.line, 2)
+        self.assertTrue(checkpoint.state['absolute'])
+
+        # The checkpoint belongs to the file it was written for
+        with open(self.path, 'a') as f:
+            f.write('G0 X5\n')
+        with self.assertRaises(ValueError):
+            GcodeJobRunner.resume(runner.checkpoint_path)
+        runner = GcodeJobRunner.resume(runner.checkpoint_path, check_file=False)
+        self.assertEqual(runner.run(), 4)
+        self.assertEqual(runner.run(), 4)
+        self.assertTrue(runner.finished)
+
+        # A stop that raises continues after the line of the stop
+        runner = GcodeJobRunner(self.path,
+                                dispatcher=_dispatcher(calls, fail='M112'))
+        with self.assertRaises(RuntimeError):
+            runner.run()
+        self.assertTrue(runner.stopped)
+        self.assertEqual(GcodeJobRunner.load_checkpoint(runner.checkpoint_path).line, 8)
+
+    # Test the lines of a macro share the checkpoint of the call
+    def test_macros(self):
+        with open(self.path, 'w') as f:
+            f.write('G91\nM814 S2\nM814 S3\nM105\n')
+        macros = MacroEngine({'M814': ['G0 X{S}', 'G0 Y{S}', 'M112']})
+        runner = GcodeJobRunner(self.path, macros=macros)
+        self.assertEqual(runner.run(), 2)
+        self.assertTrue(runner.stopped)
+        self.assertEqual(runner.line, 3)
+        self.assertEqual(runner.state.position['Y'], 2)
+        resumed = GcodeJobRunner.resume(runner.checkpoint_path, macros=macros)
+        self.assertEqual(resumed.run(), 1)
+        self.assertEqual(resumed.state.position['X'], 5)
+
+    # Test parsing a file from a byte offset
+    def test_parse_offset(self):
+        parsed = list(GcodeParser.parse_stream(self.path))
+        line_number, offset, _ = parsed[4]
+        resumed = GcodeParser.parse_stream(self.path, offset, line_number)
+        self.assertEqual(list(resumed), parsed[4:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import unittest
+import numpy as np
+from gpc_hardware.utils.gcode_dispatch import GcodeDispatcher
+from gpc_hardware.utils.latency import LatencyHistogram, PipelineLatency, STAGES
+from gpc_hardware.utils.stream_server import GcodeStreamServer
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    # Test the quantiles are within the precision of the histogram
+    def test_quantiles(self):
+        values = np.random.default_rng(3).lognormal(10, 2, 20000).astype(int)
+        histogram = LatencyHistogram()
+        for value in values.tolist():
+            histogram.record(value)
+        self.assertEqual(histogram.count, len(values))
+        self.assertEqual(histogram.total, int(values.sum()))
+        self.assertEqual((histogram.min, histogram.max), (values.min(), values.max()))
+        for q in (0.1, 0.5, 0.9, 0.99):
+            expected = np.quantile(values, q, method='inverted_cdf')
+            self.assertLessEqual(expected, histogram.quantile(q))
+            self.assertLessEqual(histogram.quantile(q), expected * (1 + 1 / 16) + 1)
+
+    # Test small values are exact and large values are clipped
+    def test_range(self):
+        histogram = LatencyHistogram(precision_bits=3, max_value=1000)
+        for value in (-5, 0, 3, 7, 5000):
+            histogram.record(value)
+        self.assertEqual(histogram.quantile(0.2), 0)
+        self.assertEqual(histogram.quantile(0.6), 3)
+        self.assertEqual(histogram.quantile(0.8), 7)
+        self.assertEqual(histogram.max, 1000)
+        self.assertEqual(histogram.count_below([0, 7, 10000]), [2, 4, 5])
+
+        with self.assertRaises(ValueError):
+            LatencyHistogram(precision_bits=1)
+        with self.assertRaises(ValueError):
+            histogram.quantile(1.5)
+
+    # Test merging and resetting histograms
+    def test_merge(self):
+        first, second = LatencyHistogram(), LatencyHistogram()
+        first.record(100)
+        second.record(10**6)
+        first.merge(second)
+        self.assertEqual((first.count, first.min, first.max), (2, 100, 10**6))
+        first.reset()
+        self.assertEqual((first.count, first.min, first.quantile(0.5)), (0, None, 0))
+        with self.assertRaises(ValueError):
+            first.merge(LatencyHistogram(precision_bits=4))
+
+
+class TestPipelineLatency(unittest.TestCase):
+
+    def setUp(self):
+        self.latency = PipelineLatency()
+        self.latency.record_line(0, 1000, 1500, 4000, 104000)
+        self.latency.record_command('G0', 90000)
+        self.latency.record_command('M105', 2000)
+
+    # Test the JSON snapshot
+    def test_snapshot(self):
+        snapshot = json.loads(self.latency.to_json())
+        self.assertEqual(set(snapshot['stages']), set(STAGES))
+        self.assertEqual(snapshot['stages']['parse']['count'], 1)
+        self.assertAlmostEqual(snapshot['stages']['total']['max'], 104e-6)
+        self.assertAlmostEqual(snapshot['stages']['backpressure']['p99'], 500e-9)
+        self.assertEqual(list(snapshot['commands']), ['G0', 'M105'])
+
+    # Test the Prometheus text format
+    def test_prometheus(self):
+        text = self.latency.to_prometheus()
+        lines = text.splitlines()
+        self.assertIn('# TYPE gcode_stage_latency_seconds histogram', lines)
+        self.assertIn('gcode_stage_latency_seconds_bucket{stage="hardware",le="0.0001"} 0',
+                      lines)
+        self.assertIn('gcode_stage_latency_seconds_bucket{stage="hardware",le="0.0002"} 1',
+                      lines)
+        self.assertIn('gcode_stage_latency_seconds_count{stage="total"} 1', lines)
+        self.assertIn('gcode_command_latency_seconds_bucket{command="G0",le="+Inf"} 1',
+                      lines)
+        self.assertIn('gcode_command_latency_seconds_sum{command="M105"} 2e-06', lines)
+        self.assertTrue(text.endswith('\n'))
+
+    # Test the latency of the lines streamed to the server
+    def test_server(self):
+        dispatcher = GcodeDispatcher()
+        for command in ('G0', 'M0', 'M105'):
+            dispatcher.register(command, lambda **values: None)
+        dispatcher.build()
+
+        async def stream(latency):
+            server = GcodeStreamServer(dispatcher, latency=latency)
+            await server.start_tcp()
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'G0 X1\n; comment\nG0 X2 M105\nM0\n')
+            for _ in range(4):
+                await reader.readline()
+            await server.join()
+            writer.close()
+            await server.close()
+
+        latency = PipelineLatency()
+        asyncio.run(stream(latency))
+        snapshot = latency.snapshot()
+        self.assertEqual(snapshot['stages']['total']['count'], 3)
+        self.assertEqual({command: summary['count'] for command, summary
+                          in snapshot['commands'].items()},
+                         {'G0': 2, 'M105': 1, 'M0': 1})
+        for summary in snapshot['stages'].values():
+            self.assertLessEqual(summary['max'], snapshot['stages']['total']['max'])
+
+        latency = PipelineLatency()
+        latency.enabled = False
+        asyncio.run(stream(latency))
+        self.assertEqual(latency.snapshot()['stages']['total']['count'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import random
+import unittest
+import numpy as np
+from gpc_hardware.utils.gcode_parser import GcodeParser
+from gpc_hardware.utils.machine_state import GcodeMachineState
+
+
+class TestGcodeMachineState(unittest.TestCase):
+
+    # Test the modal commands update the state
+    def test_execute(self):
+        state = GcodeMachineState()
+        state.execute_parsed(GcodeParser.parse_gcode_line('G0 X5 Y2 M92 X100'))
+        self.assertEqual(state.position['X'], 5)
+        self.assertEqual(state.steps['X'], 500)
+        state.execute('G91')
+        state.execute_parsed(GcodeParser.parse_gcode_line('G0 X1.5 G1 L-2'))
+        self.assertFalse(state.absolute)
+        self.assertEqual(state.position['X'], 6.5)
+        self.assertEqual(state.position['L'], -2)
+        state.execute('M105')
+        state.execute('G28')
+        self.assertEqual(set(state.position.values()), {0})
+        self.assertEqual(state.steps_per_unit['X'], 100)
+
+    # Test invalid axes and steps per unit are refused
+    def test_execute_errors(self):
+        state = GcodeMachineState()
+        with self.assertRaises(KeyError):
+            state.execute('G0', {'N': 5})
+        with self.assertRaises(ValueError):
+            state.execute('M92', {'X': 0})
+        with self.assertRaises(ValueError):
+            state.run_program(GcodeParser.compile_program(['M92 X-1']))
+
+    # Test M92 ignores the accepted axes without position
+    def test_steps_per_unit_other_axes(self):
+        state = GcodeMachineState()
+        state.execute_parsed(GcodeParser.parse_gcode_line('M92 X1 P10'))
+        self.assertEqual(state.steps_per_unit['X'], 1)
+        self.assertNotIn('P', state.steps_per_unit)
+        state.execute('M92', {'X': 4, 'N': 3})
+        self.assertEqual(state.steps_per_unit['X'], 4)
+
+    # Test a compiled program with M92 for axes without position
+    def test_run_program_other_axes(self):
+        state = GcodeMachineState()
+        moves = state.run_program(
+            GcodeParser.compile_program(['G0 X1', 'M92 X2 N3', 'G0 X2']))
+        np.testing.assert_array_equal(moves.steps[:, 0], [1, 4])
+        self.assertEqual(state.steps_per_unit['X'], 2)
+        # A move of an axis without position is still refused
+        with self.assertRaises(KeyError):
+            GcodeMachineState(('X',)).run_program(
+                GcodeParser.compile_program(['M92 Y2', 'G0 Y1']))
+
+    # Test a compiled program gives the same targets as executing its lines
+    def test_run_program(self):
+        rng = random.Random(3)
+        lines = []
+        for _ in range(500):
+            r = rng.random()
+            if r < 0.05:
+                lines.append(rng.choice(['G90', 'G91', 'G28', 'M105']))
+            elif r < 0.1:
+                lines.append('M92 X{} Z{}'.format(rng.randint(1, 400), rng.randint(1, 80)))
+            elif r < 0.3:
+                lines.append('G1 L{:.2f}'.format(rng.uniform(-90, 90)))
+            else:
+                lines.append('G0 X{:.3f} Z{:.3f}'.format(rng.uniform(-5, 5), rng.uniform(0, 3)))
+
+        expected, expected_steps = [], []
+        state = GcodeMachineState()
+        for line in lines:
+            commands = GcodeParser.parse_gcode_line(line)
+            state.execute_parsed(commands)
+            if 'G0' in commands or 'G1' in commands:
+                expected.append(list(state.position.values()))
+                expected_steps.append(list(state.steps.values()))
+
+        batch = GcodeMachineState()
+        moves = batch.run_program(GcodeParser.compile_program(lines))
+        # The cumulative sums may round differently on exact half steps.
+        np.testing.assert_allclose(moves.positions, expected, atol=1e-9)
+        np.testing.assert_allclose(moves.steps, expected_steps, atol=1)
+        self.assertEqual(moves.lines[0], 1 + moves.rows[0])
+        np.testing.assert_allclose(
+            list(batch.position.values()), list(state.position.values()))
+        self.assertEqual(batch.absolute, state.absolute)
+        self.assertEqual(batch.steps_per_unit, state.steps_per_unit)
+
+    # Test a program continues from the current state
+    def test_run_program_continues(self):
+        state = GcodeMachineState()
+        state.execute('G91')
+        state.execute('G0', {'Y': 2})
+        moves = state.run_program(GcodeParser.compile_program(['G0 Y1', 'G0 X1']))
+        np.testing.assert_array_equal(moves.positions[:, 1], [3, 3])
+        self.assertEqual(state.position['X'], 1)
+        self.assertEqual(len(state.run_program(GcodeParser.compile_program([]))[0]), 0)
+
+    # Test the state is restored from its dict
+    def test_to_dict(self):
+        state = GcodeMachineState(('X', 'Y'))
+        state.execute_parsed(GcodeParser.parse_gcode_line('M92 Y40 G0 X1.5 Y-2 G91'))
+        data = state.to_dict()
+        self.assertEqual(data['axes'], ['X', 'Y'])
+        restored = GcodeMachineState.from_dict(data)
+        self.assertEqual(restored.to_dict(), data)
+        self.assertEqual(restored.steps, {'X': 2, 'Y': -80})
+        with self.assertRaises(KeyError):
+            GcodeMachineState.from_dict(dict(data, position={'Z': 1}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from gpc_hardware.utils.gcode_parser import GcodeParser
+from gpc_hardware.utils.macro_engine import GcodeMacroError, MacroEngine
+
+
+MACROS = {
+    'M814': ['G91', 'G0 Z{S} X{I}', 'G90', 'M140 S0.5 I{R}'],
+    'M815': ['M105', 'M814 S{S} I2 R3', 'G0 X{S}'],
+}
+
+
+class TestMacroEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.macros = MacroEngine(MACROS)
+
+    # Test the parameters are filled in
+    def test_expand(self):
+        lines = list(self.macros.expand('M814', {'S': 5, 'I': -1.5, 'R': 7}))
+        self.assertEqual(lines, [
+            {'G91': {}},
+            {'G0': {'Z': 5, 'X': -1.5}},
+            {'G90': {}},
+            {'M140': {'S': 0.5, 'I': 7}},
+        ])
+        with self.assertRaises(GcodeMacroError):
+            self.macros.expand('M814', {'S': 5})
+        with self.assertRaises(GcodeMacroError):
+            self.macros.expand('M816')
+
+    # Test the parameters get the types the parser gives the same words
+    def test_parameter_types(self):
+        macros = MacroEngine({'M814': ['M140 I{S} S{I}', 'G0 X{R}'],
+                              'M815': ['M814 S1.5 I1 R2']})
+        lines = list(macros.expand('M814', {'S': 1.5, 'I': 2, 'R': '3.5'}))
+        self.assertEqual(lines, [{'M140': {'I': '1.5', 'S': 2}}, {'G0': {'X': 3.5}}])
+        self.assertEqual(lines[0], GcodeParser.parse_gcode_line('M140 I1.5 S2'))
+        self.assertEqual(list(macros.expand('M815'))[0], {'M140': {'I': '1.5', 'S': 1}})
+        with self.assertRaisesRegex(GcodeMacroError,
+                                    'M814: The parameter S for M140 I'):
+            list(macros.expand('M814', {'S': True, 'I': 2, 'R': 3}))
+        with self.assertRaises(GcodeMacroError):
+            list(macros.expand('M814', {'S': 1, 'I': 2, 'R': 'far'}))
+
+    # Test the lines without parameters are shared and read only
+    def test_shared_lines(self):
+        first = list(self.macros.expand('M814', {'S': 1, 'I': 2, 'R': 3}))
+        second = list(self.macros.expand('M814', {'S': 4, 'I': 5, 'R': 6}))
+        self.assertIs(first[0], second[0])
+        self.assertIsNot(first[1], second[1])
+        with self.assertRaises(TypeError):
+            first[0]['G92'] = {}
+
+    # Test a macro calling a macro is inlined
+    def test_nested(self):
+        lines = list(self.macros.expand('M815', {'S': 9}))
+        self.assertEqual(lines, [
+            {'M105': {}},
+            {'G91': {}},
+            {'G0': {'Z': 9, 'X': 2}},
+            {'G90': {}},
+            {'M140': {'S': 0.5, 'I': 3}},
+            {'G0': {'X': 9}},
+        ])
+
+    # Test the macro calls of a stream are replaced by the macro lines
+    def test_stream(self):
+        program = ['G0 X1', 'G90 M815 S4 M105', 'M814 S1 I1 R1']
+        parsed = list(self.macros.stream(GcodeParser.parse_stream(program)))
+        self.assertEqual([line for line, _, _ in parsed], [1] + [2] * 8 + [3] * 4)
+        self.assertEqual([dict(c) for _, _, c in parsed[1:3]],
+                         [{'G90': {}}, {'M105': {}}])
+        self.assertEqual(parsed[-1][2], {'M140': {'S': 0.5, 'I': 1}})
+        self.assertEqual(parsed[-5][2], {'M105': {}})
+        self.assertEqual(parsed[2][1], parsed[8][1])
+
+        # Lines without macros and undefined macros are passed on as they are
+        line = GcodeParser.parse_gcode_line('G0 X1 M815 S2')
+        self.assertEqual(list(MacroEngine({}).expand_line(line)), [line])
+
+    # Test the definitions are checked when they are loaded
+    def test_errors(self):
+        invalid = [
+            {'M105': ['G90']},
+            {'M814': ['G0 Q{S}']},
+            {'M814': ['G0 X{Z}']},
+            {'M814': ['G0 X-{S}']},
+            {'M814': ['M815']},
+            {'M814': ['M815 S1'], 'M815': ['G90', 'M814 S{S}']},
+            {'M814': ['G0 X1', 'M814']},
+            {'M814': ['G0 X{I}'], 'M815': ['M814 S{S}']},
+        ]
+        for macros in invalid:
+            with self.assertRaises(GcodeMacroError, msg=macros):
+                MacroEngine(macros)
+        with self.assertRaisesRegex(GcodeMacroError, 'M814 -> M815 -> M814'):
+            MacroEngine(invalid[5])
+
+    # Test the macros are read from the settings
+    def test_settings(self):
+        macros = MacroEngine()
+        self.assertEqual(len(macros), 0)
+        macros = MacroEngine({'M814': 'G91\n; comment\n\nG0 Z{S}\nG90'})
+        self.assertEqual(len(list(macros.expand('M814', {'S': 1}))), 3)
+        self.assertEqual(macros.commands, ('M814',))
+
+
+if __name__ == '__main__':
+    unittest.main()
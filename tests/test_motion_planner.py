@@ -0,0 +1,105 @@
+import math
+import random
+import unittest
+import numpy as np
+from gpc_hardware.utils.gcode_parser import GcodeParser
+from gpc_hardware.utils.machine_state import GcodeMachineState
+from gpc_hardware.utils.motion_planner import MotionPlanner, _plan_speeds
+
+
+def _circle_moves(n=100, radius=10.0):
+    lines = ['M92 X80 Y80']
+    for i in range(n + 1):
+        angle = 2 * math.pi * i / n
+        lines.append('G0 X{:.4f} Y{:.4f}'.format(
+            radius * math.cos(angle), radius * math.sin(angle)))
+    lines.append('G0 X0 Y0')
+    return GcodeMachineState().run_program(GcodeParser.compile_program(lines))
+
+
+class TestMotionPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.planner = MotionPlanner(
+            acceleration=500, max_rate=4000, look_ahead=8,
+            junction_deviation=0.05, ramp_segments=3)
+
+    # Test the limits are read from the settings
+    def test_settings(self):
+        planner = MotionPlanner(look_ahead=4)
+        self.assertEqual(planner.look_ahead, 4)
+        with self.assertRaises(ValueError):
+            MotionPlanner(acceleration=0)
+        with self.assertRaises(KeyError):
+            MotionPlanner(max_rate={'X': 100})
+
+    # Test the vectorized speed passes match the sequential passes
+    def test_plan_speeds(self):
+        rng = random.Random(5)
+        for _ in range(200):
+            n = rng.randint(1, 12)
+            junctions = [rng.uniform(0, 100) for _ in range(n - 1)]
+            reach = [rng.uniform(0, 50) for _ in range(n)]
+            limits = [math.inf] + junctions + [0.0]
+            backward = [0.0] * (n + 1)
+            for i in range(n - 1, -1, -1):
+                backward[i] = min(limits[i], backward[i + 1] + reach[i])
+            start = rng.uniform(0, backward[0])
+            speeds = [start]
+            for i in range(1, n + 1):
+                speeds.append(min(backward[i], speeds[-1] + reach[i - 1]))
+
+            entries, exits = _plan_speeds(start, np.array(junctions), np.array(reach))
+            np.testing.assert_allclose(entries, speeds[:n])
+            np.testing.assert_allclose(exits, speeds[1:])
+
+    # Test the profiles respect the limits and beat stop-to-stop moves
+    def test_plan(self):
+        planned = self.planner.plan(_circle_moves())
+        self.assertEqual(planned.entry_speeds[0], 0)
+        self.assertEqual(planned.exit_speeds[-1], 0)
+        np.testing.assert_allclose(planned.entry_speeds[1:], planned.exit_speeds[:-1])
+        rates = planned.peak_speeds[:, None] * np.abs(planned.steps)
+        self.assertTrue(np.all(rates <= 4000 * planned.lengths[:, None] + 1e-6))
+        reach = 2 * planned.accelerations * planned.lengths + 1e-9
+        change = np.abs(planned.exit_speeds ** 2 - planned.entry_speeds ** 2)
+        self.assertTrue(np.all(change <= reach))
+        self.assertLess(
+            planned.times.sum(), self.planner.stop_to_stop_times(planned).sum() / 2)
+        self.assertEqual(self.planner.planning_time['moves'], len(planned.lengths))
+
+    # Test adding moves one by one gives the same plan as a batch
+    def test_streaming(self):
+        moves = _circle_moves()
+        batch = self.planner.plan(moves)
+        results = []
+        for position, steps in zip(moves.positions, moves.steps):
+            planned = self.planner.add_move(position, steps)
+            if planned is not None:
+                results.append(planned)
+        results.append(self.planner.flush())
+        self.assertIsNone(self.planner.flush())
+        np.testing.assert_allclose(
+            np.concatenate([r.entry_speeds for r in results]), batch.entry_speeds)
+        np.testing.assert_array_equal(
+            np.concatenate([r.steps for r in results]), batch.steps)
+
+    # Test the commands move every axis exactly to its target
+    def test_commands(self):
+        moves = _circle_moves()
+        commands = self.planner.commands(self.planner.plan(moves))
+        totals = {}
+        for function, axis, value in commands:
+            self.assertIn(function, ('stepperRATE', 'stepperMOVE'))
+            if function == 'stepperMOVE':
+                totals[axis] = totals.get(axis, 0) + value
+            else:
+                self.assertTrue(1 <= value <= 4000)
+        self.assertEqual(totals, {'X': 0, 'Y': 0})
+        self.assertEqual(commands[0][:2], ('stepperRATE', 'X'))
+        empty = type(moves)(*(array[:0] for array in moves))
+        self.assertEqual(self.planner.commands(self.planner.plan(empty)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
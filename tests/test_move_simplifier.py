@@ -0,0 +1,128 @@
+import math
+import random
+import unittest
+import numpy as np
+from gpc_hardware.utils.gcode_parser import GcodeParser
+from gpc_hardware.utils.gcode_program import GcodeProgram
+from gpc_hardware.utils.machine_state import GcodeMachineState
+from gpc_hardware.utils.move_simplifier import MoveSimplifier, simplify_program
+
+
+def _noisy_program(n=400, seed=2):
+    rng = random.Random(seed)
+    lines = ['G0 X0 Y0']
+    x = y = 0.0
+    for i in range(n):
+        if i % 97 == 50:
+            lines.append(rng.choice(['G91', 'G90', 'M105', 'G28']))
+            if lines[-1] == 'G28':
+                x = y = 0.0
+            continue
+        if i % 31 == 0:
+            lines.append(lines[-1] if lines[-1].startswith('G0') else 'G0 X0')
+            continue
+        step = (0.3, 0.1 * math.sin(i / 15) + rng.uniform(-0.002, 0.002))
+        if 'G91' in lines[-40:] and lines[-40:].count('G91') > lines[-40:].count('G90'):
+            lines.append('G0 X{:.4f} Y{:.4f}'.format(*step))
+        else:
+            x, y = x + step[0], y + step[1]
+            lines.append('G0 X{:.4f} Y{:.4f}'.format(x, y))
+    return lines
+
+
+def _path(program):
+    # The start position and the position after every move or homing
+    state = GcodeMachineState()
+    path = [(0, 0)]
+    for _, commands in program.to_dicts():
+        for command, values in commands.items():
+            state.execute(command, values)
+            if command in ('G0', 'G28'):
+                path.append((state.position['X'], state.position['Y']))
+    return np.array(path)
+
+
+def _max_deviation(points, path):
+    # Distance of every point to the closest segment of the path
+    start, end = path[:-1], path[1:]
+    direction = end - start
+    length2 = np.maximum((direction ** 2).sum(axis=1), 1e-300)
+    offset = points[:, None, :] - start[None, :, :]
+    t = np.clip((offset * direction).sum(axis=2) / length2, 0, 1)
+    distance = np.linalg.norm(offset - t[:, :, None] * direction, axis=2)
+    return distance.min(axis=1).max()
+
+
+class TestSimplifyProgram(unittest.TestCase):
+
+    # Test collinear and zero-length moves are removed
+    def test_collinear(self):
+        lines = ['G0 X{} Y{}'.format(i, 2 * i) for i in range(10)] + ['G0 X9 Y18']
+        simplified, removed = simplify_program(
+            GcodeParser.compile_program(lines), tolerance=1e-9)
+        self.assertEqual(removed, 10)
+        self.assertEqual(simplified.to_dicts(), [(10, {'G0': {'X': 9.0, 'Y': 18.0}})])
+
+    # Test the path stays within the tolerance and the end positions match
+    def test_tolerance(self):
+        program = GcodeParser.compile_program(_noisy_program())
+        for tolerance, angle in ((0.01, None), (0.05, None), (0.05, 0.05)):
+            simplified, removed = simplify_program(program, tolerance, angle)
+            self.assertGreater(removed, 0)
+            self.assertEqual(len(program) - len(simplified), removed)
+            original, path = _path(program), _path(simplified)
+            self.assertLessEqual(_max_deviation(original, path), tolerance + 1e-9)
+            np.testing.assert_allclose(original[-1], path[-1])
+        no_angle = simplify_program(program, 0.05)[1]
+        self.assertGreater(no_angle, simplify_program(program, 0.05, 0.001)[1])
+
+    # Test relative moves are replaced by their sum
+    def test_relative(self):
+        lines = ['G91', 'G0 X1', 'G0 X1 Y0', 'G0 Y1', 'G0 Y1', 'G90', 'G0 X0']
+        simplified, removed = simplify_program(
+            GcodeParser.compile_program(lines), tolerance=1e-9)
+        self.assertEqual(removed, 2)
+        self.assertEqual([line for line, _ in simplified.to_dicts()], [1, 3, 5, 6, 7])
+        self.assertEqual(simplified.to_dicts()[1][1], {'G0': {'X': 2.0, 'Y': 0.0}})
+        self.assertEqual(simplified.to_dicts()[2][1], {'G0': {'Y': 2.0}})
+
+    # Test a program without moves is returned as is
+    def test_no_moves(self):
+        program = GcodeParser.compile_program(['M105', 'G90'])
+        self.assertEqual(simplify_program(program, 0.1), (program, 0))
+        with self.assertRaises(ValueError):
+            simplify_program(program, -1)
+
+
+class TestMoveSimplifier(unittest.TestCase):
+
+    # Test streaming with a large look-ahead gives the batch result
+    def test_streaming_matches_batch(self):
+        lines = _noisy_program()
+        batch, removed = simplify_program(GcodeParser.compile_program(lines), 0.02)
+        simplifier = MoveSimplifier(0.02, look_ahead=1000)
+        out = list(simplifier.simplify(GcodeParser.parse_stream(lines)))
+        self.assertEqual(simplifier.removed, removed)
+        self.assertEqual(len(out), len(batch))
+        streamed = GcodeProgram.from_parsed(out)
+        np.testing.assert_allclose(_path(streamed), _path(batch))
+
+    # Test a small look-ahead bounds the buffer and keeps the tolerance
+    def test_bounded_look_ahead(self):
+        lines = _noisy_program(seed=4)
+        simplifier = MoveSimplifier(0.05, look_ahead=8)
+        out = []
+        for line_number, _, commands in GcodeParser.parse_stream(lines):
+            out.extend(simplifier.feed(line_number, commands))
+            self.assertLess(len(simplifier._run), 8)
+        out.extend(simplifier.flush())
+        self.assertGreater(simplifier.removed, 0)
+        self.assertEqual(simplifier.moves - simplifier.removed,
+                         sum('G0' in commands for _, commands in out))
+        original = _path(GcodeParser.compile_program(lines))
+        path = _path(GcodeProgram.from_parsed(out))
+        self.assertLessEqual(_max_deviation(original, path), 0.05 + 1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+import importlib
+import numpy as np
+import sys
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+
+class FakeGPIO:
+    """The interrupt line of the DAQC2, low while a trace is ready."""
+
+    FALLING = 'falling'
+
+    def __init__(self):
+        self._level = 1
+        self._changed = threading.Condition()
+        self.inputs = 0
+        self.waits = 0
+
+    def input(self, pin):
+        self.inputs += 1
+        return self._level
+
+    def wait_for_edge(self, pin, edge, timeout=None):
+        self.waits += 1
+        with self._changed:
+            if self._changed.wait_for(lambda: self._level == 0, timeout / 1000):
+                return pin
+            return None
+
+    def set_level(self, level):
+        with self._changed:
+            self._level = level
+            self._changed.notify_all()
+
+
+def _fake_daqc2():
+    daqc2 = types.ModuleType('piplates.DAQC2plate')
+    daqc2.GPIO = FakeGPIO()
+    daqc2.trace1 = [0] * 1024
+    daqc2.trace2 = [0] * 1024
+    daqc2.traces = 0
+    daqc2.VerifyADDR = lambda address: address == 0
+    for name in ('startOSC', 'stopOSC', 'setOSCchannel', 'setOSCtrigger',
+                 'setOSCsweep', 'intEnabled', 'runOSC'):
+        setattr(daqc2, name, lambda *args, **kwargs: None)
+
+    def get_traces(address):
+        # Every sample of a sweep is the sweep number, negative for channel two
+        daqc2.traces += 1
+        daqc2.trace1[:] = [daqc2.traces] * 1024
+        daqc2.trace2[:] = [-daqc2.traces] * 1024
+
+    daqc2.getINTflags = lambda address: daqc2.GPIO.set_level(1)
+    daqc2.getOSCtraces = get_traces
+    return daqc2
+
+
+class TestOscilloscopeSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.daqc2 = _fake_daqc2()
+        package = types.ModuleType('piplates')
+        package.DAQC2plate = self.daqc2
+        patcher = mock.patch.dict(
+            sys.modules, {'piplates': package, 'piplates.DAQC2plate': self.daqc2})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sys.modules.pop('gpc_hardware.apps.oscilloscope', None)
+        self.addCleanup(sys.modules.pop, 'gpc_hardware.apps.oscilloscope', None)
+        self.module = importlib.import_module('gpc_hardware.apps.oscilloscope')
+        self.scope = self.module.Oscilloscope(0)
+
+    def _wait_for(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return condition()
+
+    # Test a trace is read for every interrupt without polling the line
+    def test_interrupts(self):
+        self.scope.enable()
+        for n in range(1, 21):
+            self.daqc2.GPIO.set_level(0)
+            self.assertTrue(self._wait_for(lambda: self.daqc2.traces == n))
+        self.scope.disable()
+        self.assertEqual(self.daqc2.traces, 20)
+        # A check before and after every wait, and a few timeouts
+        self.assertLess(self.daqc2.GPIO.inputs, 3 * 20 + 20)
+
+    # Test a trace that is ready before the wait is read at once
+    def test_ready_before_wait(self):
+        self.daqc2.GPIO.set_level(0)
+        self.scope.enable()
+        self.assertTrue(self._wait_for(lambda: self.daqc2.traces == 1))
+        self.scope.disable()
+
+    # Test the sweeps are kept in the ring buffer
+    def test_ring_buffer(self):
+        scope = self.module.Oscilloscope(0, buffer_size=4)
+        nbytes = scope.latest_sweeps(3).traces.base.nbytes
+        self.assertEqual(len(scope.latest_sweeps(3).sequence), 0)
+        for _ in range(10):
+            self.daqc2.getOSCtraces(0)
+            scope._record_sweep()
+        self.assertEqual(scope.sweep_count, 10)
+        self.assertEqual(scope.dropped_sweeps, 6)
+
+        sweeps = scope.latest_sweeps(3)
+        np.testing.assert_array_equal(sweeps.sequence, [7, 8, 9])
+        np.testing.assert_array_equal(sweeps.traces[:, 0, 0], [8, 9, 10])
+        np.testing.assert_array_equal(sweeps.traces[:, -1, 1], [-8, -9, -10])
+        self.assertTrue(np.all(np.diff(sweeps.timestamps) >= 0))
+        self.assertEqual(sweeps.traces.shape, (3, 1024, 2))
+        # Views on the fixed size buffer, not copies
+        self.assertIs(sweeps.traces.base, scope.latest_sweeps(1).traces.base)
+        self.assertEqual(sweeps.traces.base.nbytes, nbytes)
+        with self.assertRaises(ValueError):
+            sweeps.traces[0, 0, 0] = 1
+
+        # Only the sweeps after the fetch count as dropped
+        for _ in range(5):
+            self.daqc2.getOSCtraces(0)
+            scope._record_sweep()
+        self.assertEqual(scope.dropped_sweeps, 7)
+        sweeps = scope.latest_sweeps(3)
+        np.testing.assert_array_equal(sweeps.sequence, [12, 13, 14])
+        # The slot of the next sweep is not part of the fetched sweeps
+        self.daqc2.getOSCtraces(0)
+        scope._record_sweep()
+        np.testing.assert_array_equal(sweeps.sequence, [12, 13, 14])
+        np.testing.assert_array_equal(sweeps.traces[:, 0, 0], [13, 14, 15])
+        with self.assertRaises(ValueError):
+            scope.latest_sweeps(4)
+        with self.assertRaises(ValueError):
+            scope.measure(4)
+
+    # Test the latest trace is swapped in without tearing or allocating
+    def test_latest_trace(self):
+        scope = self.module.Oscilloscope(0, buffer_size=2)
+        self.assertEqual(scope.latest_trace.sequence, -1)
+        self.daqc2.getOSCtraces(0)
+        scope._record_sweep()
+        latest = scope.latest_trace
+        self.assertIs(scope.latest_trace, latest)
+        self.assertIs(scope.trace1, latest.trace1)
+        self.assertIs(scope.channel_two_trace, latest.trace2)
+        self.assertEqual((latest.sequence, latest.trace1[0], latest.trace2[-1]),
+                         (0, 1, -1))
+        with self.assertRaises(ValueError):
+            latest.trace1[0] = 5
+
+        # The next sweep is written in the back buffer, then swapped in
+        self.daqc2.getOSCtraces(0)
+        scope._record_sweep()
+        self.assertTrue(np.all(latest.trace1 == 1))
+        self.assertEqual(scope.latest_trace.sequence, 1)
+        self.assertTrue(np.all(scope.trace1 == 2))
+        self.assertTrue(np.all(scope.trace2 == -2))
+        with self.assertRaises(ValueError):
+            self.module.Oscilloscope(0, buffer_size=1)
+
+    # Test both channels of the latest sweeps are measured in volts
+    def test_measure(self):
+        self.daqc2.trace1[:] = [0, 4095] * 512
+        self.daqc2.trace2[:] = [2000] * 1024
+        self.scope._record_sweep()
+        self.scope._record_sweep()
+        self.scope.sweep_rate = 3
+        self.assertEqual(self.scope.sample_period, 1e-3)
+        result = self.scope.measure(2)
+        self.assertEqual(result.vpp.shape, (2, 2))
+        np.testing.assert_allclose(result.vpp, [[12, 0], [12, 0]])
+        np.testing.assert_allclose(result.mean[:, 1], 2000 * 12 / 4095)
+        np.testing.assert_allclose(result.frequency[:, 0], 500)
+        self.assertTrue(np.all(np.isnan(result.frequency[:, 1])))
+
+    # Test the sweep listeners are called with every recorded sweep
+    def test_sweep_listener(self):
+        received = []
+        self.scope.add_sweep_listener(received.append)
+        for _ in range(2):
+            self.daqc2.getOSCtraces(0)
+            self.scope._record_sweep()
+        self.scope.remove_sweep_listener(received.append)
+        self.daqc2.getOSCtraces(0)
+        self.scope._record_sweep()
+        self.assertEqual([trace.sequence for trace in received], [0, 1])
+        self.assertEqual(received[1].trace2[0], -2)
+        with self.assertRaises(TypeError):
+            self.scope.add_sweep_listener(None)
+
+    # Test a failing sweep listener is counted and does not stop the others
+    def test_sweep_listener_error(self):
+        received = []
+
+        def failing(trace):
+            raise RuntimeError('listener failed')
+
+        self.scope.add_sweep_listener(failing)
+        self.scope.add_sweep_listener(received.append)
+        self.scope.enable()
+        for n in range(1, 4):
+            self.daqc2.GPIO.set_level(0)
+            self.assertTrue(self._wait_for(lambda: self.scope.sweep_count == n))
+        self.scope.disable()
+        self.assertEqual([trace.sequence for trace in received], [0, 1, 2])
+        self.assertEqual(self.scope.listener_errors, 3)
+
+    # Test the sweep thread records every sweep
+    def test_sweep_records(self):
+        self.scope.enable()
+        for n in range(1, 4):
+            self.daqc2.GPIO.set_level(0)
+            self.assertTrue(self._wait_for(lambda: self.scope.sweep_count == n))
+        self.scope.disable()
+        np.testing.assert_array_equal(self.scope.latest_sweeps(3).traces[:, 5, 0],
+                                      [1, 2, 3])
+
+    # Test disable returns promptly while waiting for an interrupt
+    def test_disable(self):
+        self.scope.enable()
+        self.assertTrue(self._wait_for(lambda: self.daqc2.GPIO.waits > 0))
+        start = time.monotonic()
+        self.scope.disable()
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(self.daqc2.traces, 0)
+        self.scope.disable()  # Already stopped
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import pickle
+import unittest
+from gpc_hardware.utils.gcode_parser import GcodeParser
+from gpc_hardware.utils.parsed_command import ParsedCommand
+
+
+class TestParsedCommand(unittest.TestCase):
+
+    # Test the fields of a parsed command
+    def test_fields(self):
+        command = ParsedCommand('G0', X=5, Z=5.7)
+        self.assertEqual(command.command, 'G0')
+        self.assertEqual(command.X, 5)
+        self.assertIsNone(command.Y)
+        self.assertEqual(command.Z, 5.7)
+        self.assertEqual(dict(command.attributes), {})
+        self.assertEqual(command.axes, {'X': 5, 'Z': 5.7})
+
+    # Test an unknown axis
+    def test_unknown_axis(self):
+        with self.assertRaises(KeyError):
+            ParsedCommand('G0', Q=1)
+
+    # Test the attributes are read only
+    def test_attributes_read_only(self):
+        command = ParsedCommand('M140', {'S': 0.6})
+        with self.assertRaises(TypeError):
+            command.attributes['S'] = 1
+
+    # Test parsing a line into parsed commands
+    def test_parse_gcode_commands(self):
+        line = 'G0 X1.5 K6 G1 L7 M140 S0.6 I-2'
+        commands = GcodeParser.parse_gcode_commands(line)
+        self.assertEqual([c.command for c in commands], ['G0', 'G1', 'M140'])
+        self.assertEqual(commands[2].attributes, {'S': 0.6, 'I': -2})
+
+        merged = {}
+        for command in commands:
+            merged.update(command.to_dict())
+        self.assertEqual(merged, GcodeParser.parse_gcode_line(line))
+
+    # Test pickling a parsed command
+    def test_pickle(self):
+        command = ParsedCommand('M140', {'S': 0.6}, X=1)
+        loaded = pickle.loads(pickle.dumps(command))
+        self.assertIsInstance(loaded, ParsedCommand)
+        self.assertEqual(loaded, command)
+        self.assertEqual(loaded.to_dict(), {'M140': {'S': 0.6, 'X': 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
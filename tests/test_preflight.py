@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from click.testing import CliRunner
+from gpc_hardware.gcode_cli import gcode
+from gpc_hardware.utils import preflight as preflight_module
+from gpc_hardware.utils.gcode_parser import GcodeParser
+from gpc_hardware.utils.machine_state import GcodeMachineState
+from gpc_hardware.utils.motion_planner import MotionPlanner
+from gpc_hardware.utils.preflight import preflight
+
+
+LIMITS = {
+    'travel': {'X': (0, 100), 'Y': (0, 100), 'Z': (-10, 0)},
+    'max_speed': {'X': 45, 'Y': 45, 'Z': 12},
+    'arc_tolerance': 0.01,
+}
+
+
+def _planner():
+    return MotionPlanner(acceleration=500, max_rate=4000, look_ahead=8,
+                         junction_deviation=0.05, ramp_segments=3)
+
+
+class TestPreflight(unittest.TestCase):
+
+    # Test the bounding box, the soft limits and the speed limits
+    def test_limits(self):
+        lines = [
+            'M92 X100 Y100 Z40',
+            'G0 X10 Y10',
+            'G0 X150 Y10',
+            'G0 X50 Y-5 Z-1',
+            'G0 Z-2',
+            'G0 X60',
+            'G0 Z-8',
+        ]
+        program = GcodeParser.compile_program(lines)
+        report = preflight(program, planner=_planner(), **LIMITS)
+        self.assertEqual(report.moves, 6)
+        self.assertEqual(report.bounds['X'], (0.0, 150.0))
+        self.assertEqual(report.bounds['Y'], (-5.0, 10.0))
+        self.assertEqual(report.bounds['H'], (0.0, 0.0))
+        self.assertFalse(report.ok)
+        issues = [issue[:2] + issue[3:] for issue in report.issues]
+        self.assertEqual(issues, [
+            (3, 'X', 100.0, preflight_module.ABOVE_TRAVEL),
+            (4, 'Y', 0.0, preflight_module.BELOW_TRAVEL),
+            (5, 'Z', 12.0, preflight_module.TOO_FAST),
+            (7, 'Z', 12.0, preflight_module.TOO_FAST),
+        ])
+        # Z at 40 steps/mm could move at 4000 / 40 = 100 mm/s, the 6 mm move
+        # accelerates to about sqrt(500 * 6) mm/s
+        self.assertTrue(50 < report.issues[-1].value < 100)
+        self.assertEqual(str(report.issues[0]),
+                         '3: above soft limit X=150 (limit 100)')
+        self.assertGreater(report.job_time, 0)
+
+    # Test arcs are checked along the arc and parsed lines are accepted
+    def test_arcs(self):
+        lines = ['M92 X100 Y100', 'G0 X10 Y50', 'G2 X30 Y50 I10 J0', 'G3 X50 Y50 I10 J0']
+        report = preflight(GcodeParser.parse_stream(lines), planner=_planner(), **LIMITS)
+        self.assertGreater(report.moves, 3)
+        self.assertEqual(report.issues, [])
+        # The second arc dips below Y0 while its ends are inside the travel
+        lines = ['M92 X100 Y100', 'G0 X5 Y4', 'G2 X15 Y4 I5 J0', 'G3 X25 Y4 I5 J0']
+        report = preflight(GcodeParser.compile_program(lines), planner=_planner(), **LIMITS)
+        self.assertEqual([issue[:2] for issue in report.issues], [(4, 'Y')])
+        self.assertAlmostEqual(report.issues[0].value, -1.0, delta=0.011)
+        self.assertAlmostEqual(report.bounds['Y'][0], -1.0, delta=0.011)
+
+    # Test the estimate matches planning with a long look-ahead
+    def test_job_time(self):
+        lines = ['M92 X80 Y80']
+        lines += ['G0 X{} Y{}'.format(i % 7 * 3, i % 5 * 4) for i in range(50)]
+        program = GcodeParser.compile_program(lines)
+        planner = MotionPlanner(acceleration=500, max_rate=4000, look_ahead=200,
+                                junction_deviation=0.05, ramp_segments=3)
+        report = preflight(program, planner=planner, travel={}, max_speed={},
+                           arc_tolerance=0.01)
+        planned = planner.plan(GcodeMachineState().run_program(program))
+        self.assertAlmostEqual(report.job_time, planned.times.sum())
+        self.assertTrue(report.ok)
+
+    # Test the limits are read from the settings and checked
+    def test_settings(self):
+        report = preflight(GcodeParser.compile_program(['G0 X310']))
+        self.assertEqual([issue.axis for issue in report.issues], ['X', 'X'])
+        with self.assertRaises(KeyError):
+            preflight(GcodeParser.compile_program(['G0 X1']), travel={'Q': (0, 1)})
+        with self.assertRaises(ValueError):
+            preflight(GcodeParser.compile_program(['G0 X1']), max_speed=0)
+
+    # Test the command line check
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'program.gcode')
+            with open(path, 'w') as f:
+                f.write('M92 X80 Y80 Z400\nG0 X10 Y10\nG0 X400\n')
+            result = CliRunner().invoke(gcode, ['preflight', path])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('3: above soft limit X=400 (limit 300)', result.output)
+        self.assertIn('2 moves', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from click.testing import CliRunner
+from gpc_hardware.gcode_cli import gcode
+from gpc_hardware.utils import accepted_gcode
+from gpc_hardware.utils.gcode_parser import GcodeParser
+from gpc_hardware.utils.program_cache import GcodeProgramCache
+
+
+PROGRAM = [
+    'G90',
+    'G0 X1 Y2',
+    'M140 S0.6 I-2',
+    '',
+    'G0 X3 Z4.5 G1 L-5',
+    'G2 X5 Y2 R1',
+]
+
+
+class TestGcodeProgramCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self._tmp.name, 'cache')
+        self.path = os.path.join(self._tmp.name, 'program.gcode')
+        with open(self.path, 'w') as f:
+            f.write('\n'.join(PROGRAM) + '\n')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    # Test a cached program is memory mapped and equal to the compiled program
+    def test_hit(self):
+        cache = GcodeProgramCache(self.directory)
+        compiled = cache.compile(self.path)
+        cached = GcodeProgramCache(self.directory).compile(self.path)
+        self.assertIsInstance(cached.commands, np.memmap)
+        self.assertIsInstance(cached.attributes, np.memmap)
+        self.assertFalse(cached.commands.flags.writeable)
+        self.assertEqual(cached.to_dicts(), compiled.to_dicts())
+        self.assertEqual(cached.command_names, compiled.command_names)
+        self.assertEqual(cache.compile(PROGRAM).to_dicts(), compiled.to_dicts())
+
+        info = cache.info()
+        self.assertEqual((info['hits'], info['misses'], info['size']), (1, 1, 1))
+        self.assertGreater(info['bytes'], 0)
+
+    # Test the key depends on the content and the grammar version
+    def test_key(self):
+        key = GcodeProgramCache.key(self.path)
+        self.assertEqual(GcodeProgramCache.key(PROGRAM), key)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(GcodeProgramCache.key(f.read()), key)
+        self.assertNotEqual(GcodeProgramCache.key(PROGRAM[:-1]), key)
+        self.assertTrue(key.endswith(GcodeParser.grammar_version()))
+        with mock.patch.object(GcodeParser, 'grammar_version', return_value='0'):
+            self.assertNotEqual(GcodeProgramCache.key(self.path), key)
+
+        cache = GcodeProgramCache(self.directory)
+        cache.compile(self.path)
+        self.assertIn(key, cache)
+        with mock.patch.object(GcodeParser, 'grammar_version', return_value='0'):
+            cache.compile(self.path)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 2, 2))
+
+    # Test the key follows a reload of the accepted gcode
+    def test_key_after_reload(self):
+        key = GcodeProgramCache.key(self.path)
+        commands = {name: spec for name, spec
+                    in accepted_gcode.ACCEPTED_COMMANDS.items() if name != 'M105'}
+        with mock.patch.object(accepted_gcode, 'ACCEPTED_COMMANDS', commands):
+            self.assertNotEqual(GcodeProgramCache.key(self.path), key)
+        self.assertEqual(GcodeProgramCache.key(self.path), key)
+
+    # Test an entry of another format is replaced
+    def test_other_format(self):
+        cache = GcodeProgramCache(self.directory)
+        cache.compile(self.path)
+        key = GcodeProgramCache.key(self.path)
+        with mock.patch('gpc_hardware.utils.program_cache.FORMAT_VERSION', 0):
+            self.assertIsNone(cache.get(key))
+            cache.compile(self.path)
+            self.assertEqual(cache.metadata(key)['format'], 0)
+            self.assertIsNotNone(cache.get(key))
+        self.assertEqual(len(cache), 1)
+
+    # Test the metadata of a cached program
+    def test_metadata(self):
+        cache = GcodeProgramCache(self.directory)
+        cache.compile(self.path)
+        metadata = cache.metadata(GcodeProgramCache.key(self.path))
+        self.assertEqual(metadata['rows'], 6)
+        self.assertEqual(metadata['attributes'], 3)
+        self.assertEqual(metadata['lines'], 6)
+        self.assertEqual(metadata['counts'],
+                         {'G0': 2, 'G1': 1, 'G2': 1, 'G90': 1, 'M140': 1})
+        self.assertIsNone(cache.metadata('missing'))
+        self.assertEqual(cache.misses, 1)
+
+    # Test the least recently used programs are removed
+    def test_eviction(self):
+        sources = [['G0 X{}'.format(i)] * 100 for i in range(4)]
+        keys = [GcodeProgramCache.key(lines) for lines in sources]
+        cache = GcodeProgramCache(self.directory)
+        cache.compile(sources[0])
+        entry_size = cache.info()['bytes']
+
+        cache = GcodeProgramCache(self.directory, max_bytes=3 * entry_size + 200)
+        cache.compile(sources[1])
+        cache.compile(sources[2])
+        cache.compile(sources[0])  # Used again, sources[1] is the oldest
+        cache.compile(sources[3])
+        self.assertEqual([key in cache for key in keys], [True, False, True, True])
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.info()['bytes'], cache.max_bytes)
+
+        # Programs larger than the cache are not stored
+        small = GcodeProgramCache(self.directory, max_bytes=100)
+        self.assertFalse(small.put('large', small.compile(sources[1])))
+        self.assertNotIn('large', small)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        with self.assertRaises(ValueError):
+            GcodeProgramCache(self.directory, max_bytes=0)
+
+    # Test a damaged entry is compiled again
+    def test_damaged(self):
+        cache = GcodeProgramCache(self.directory)
+        cache.compile(self.path)
+        key = GcodeProgramCache.key(self.path)
+        with open(os.path.join(self.directory, key, 'commands.npy'), 'wb') as f:
+            f.write(b'damaged')
+        self.assertEqual(len(cache.compile(self.path)), 6)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache.compile(self.path)), 6)
+        self.assertEqual(cache.hits, 1)
+
+    # Test the command line check uses the cache
+    def test_cli(self):
+        outputs = [
+            CliRunner().invoke(gcode, ['preflight', '--cache', self.directory,
+                                       self.path])
+            for _ in range(2)
+        ]
+        # Z moves faster than the default maximum speed
+        self.assertEqual([result.exit_code for result in outputs], [1, 1])
+        self.assertEqual(outputs[0].output.replace('miss', 'hit'), outputs[1].output)
+        self.assertIn('cache miss', outputs[0].output)
+        self.assertIn('cache hit', outputs[1].output)
+        self.assertEqual(len(GcodeProgramCache(self.directory)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from gpc_hardware.utils.gcode_dispatch import GcodeDispatcher
+from gpc_hardware.utils.gcode_parser import GcodeParser
+from gpc_hardware.utils.stream_server import GcodeStreamServer
+
+
+def _dispatcher(calls, hold=None):
+    dispatcher = GcodeDispatcher()
+
+    def handler(command):
+        def handle(**values):
+            if hold is not None and command == 'G0':
+                hold.wait(5)
+            if values.get('X') == 13:
+                raise RuntimeError('unlucky move')
+            calls.append((command, values))
+        return handle
+
+    for command in ('G0', 'G90', 'G91', 'M0', 'M112', 'M105'):
+        dispatcher.register(command, handler(command))
+    return dispatcher.build()
+
+
+async def _read_replies(reader, count, timeout=2.0):
+    replies = []
+    try:
+        while len(replies) < count:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if not line:
+                break
+            replies.append(line.decode().strip())
+    except asyncio.TimeoutError:
+        pass
+    return replies
+
+
+class TestGcodeStreamServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.calls = []
+        self.hold = threading.Event()
+        self.hold.set()
+        self.server = GcodeStreamServer(_dispatcher(self.calls, self.hold),
+                                        queue_size=2)
+        await self.server.start_tcp()
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.hold.set()
+        await self.server.close()
+
+    # Test every line is acknowledged and executed in order
+    async def test_lines(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        framed = GcodeParser.frame_line('G0 X2', 7)
+        writer.write(b'G91\nG0 X1 Y1\n\n; comment\nG0X1(spaceless)\n'
+                     + framed.encode() + b'\n')
+        self.assertEqual(await _read_replies(reader, 6), ['ok'] * 6)
+        await self.server.join()
+        self.assertEqual([command for command, _ in self.calls],
+                         ['G91', 'G0', 'G0', 'G0'])
+        self.assertEqual(self.server.state.position['X'], 4)
+
+        writer.write(b'G0 X1 X2\n' + framed.replace('X2', 'X3').encode() + b'\n'
+                     + b'G0 X13\nM105\n')
+        replies = await _read_replies(reader, 8)
+        self.assertTrue(replies[0].startswith('Error:Line 7:'))
+        self.assertEqual(replies[1], 'ok')
+        self.assertTrue(replies[2].startswith('Error:Line 8: Line N7:'))
+        self.assertEqual(replies[3:6], ['Resend: 7', 'ok', 'ok'])
+        self.assertIn('Error:Line 9: unlucky move', replies[6:])
+        await self.server.join()
+        self.assertEqual(self.calls[-1], ('M105', {}))
+        info = self.server.info()
+        self.assertEqual((info['received'], info['executed'], info['errors']),
+                         (10, 5, 3))
+        writer.close()
+
+    # Test the ok is held while the queue is full and M112 jumps the queue
+    async def test_flow_control(self):
+        self.hold.clear()
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(b''.join(b'G0 X%d\n' % i for i in range(1, 6)))
+        # One line is running, two are queued, the fourth waits for space.
+        self.assertEqual(await _read_replies(reader, 4, 0.3), ['ok'] * 3)
+        self.assertEqual(self.server.queued, 2)
+
+        writer.write(b'M112\n')
+        self.assertEqual(await _read_replies(reader, 3), ['ok'] * 3)
+        self.hold.set()
+        await self.server.join()
+        # The lines waiting for space are received before M112, so discarded
+        self.assertEqual(self.calls, [('G0', {'X': 1}), ('M112', {})])
+        self.assertEqual(self.server.info()['discarded'], 4)
+        writer.close()
+
+    # Test the lines of every client received before M112 are discarded
+    async def test_stop_discards_waiting(self):
+        self.hold.clear()
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        other_reader, other = await asyncio.open_connection('127.0.0.1', self.port)
+        # The queue is full and the forwarders of both clients are blocked
+        writer.write(b''.join(b'G0 X%d\n' % i for i in range(1, 7)))
+        self.assertEqual(await _read_replies(reader, 6, 0.3), ['ok'] * 3)
+        other.write(b'G0 Y1\nG0 Y2\n')
+        self.assertEqual(await _read_replies(other_reader, 2, 0.1), [])
+
+        other.write(b'M112\nG0 Y3\n')
+        self.assertEqual(await _read_replies(other_reader, 4), ['ok'] * 4)
+        self.assertEqual(await _read_replies(reader, 3), ['ok'] * 3)
+        writer.write(b'G0 X7\n')
+        self.assertEqual(await _read_replies(reader, 1), ['ok'])
+        self.hold.set()
+        await self.server.join()
+        self.assertEqual(self.calls, [('G0', {'X': 1}), ('M112', {}),
+                                      ('G0', {'Y': 3}), ('G0', {'X': 7})])
+        info = self.server.info()
+        self.assertEqual((info['received'], info['discarded']), (11, 7))
+        writer.close()
+        other.close()
+
+    # Test a line longer than the limit is skipped up to its newline
+    async def test_long_line(self):
+        server = GcodeStreamServer(_dispatcher(self.calls), max_line_length=64)
+        await server.start_tcp()
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'G90 ' * 50)
+        await writer.drain()
+        await asyncio.sleep(0.05)
+        writer.write(b'G0 X55\nM105\n' + b'G91 ' * 20 + b'\nG0 X2\n')
+        self.assertEqual(await _read_replies(reader, 7, 0.3), [
+            'Error:Line 1: Line is longer than 64 bytes.', 'ok', 'ok',
+            'Error:Line 3: Line is longer than 64 bytes.', 'ok', 'ok'])
+        await server.join()
+        self.assertEqual(self.calls, [('M105', {}), ('G0', {'X': 2})])
+        info = server.info()
+        self.assertEqual((info['received'], info['executed'], info['errors']),
+                         (4, 2, 2))
+        writer.close()
+        await server.close()
+
+    # Test several clients streaming at the same time
+    async def test_concurrent_clients(self):
+        async def client(i):
+            reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+            writer.write(b''.join(b'G0 Y%d\n' % j for j in range(100)))
+            replies = await _read_replies(reader, 100)
+            writer.close()
+            return replies
+
+        results = await asyncio.gather(*(client(i) for i in range(4)))
+        self.assertEqual([len(replies) for replies in results], [100] * 4)
+        await self.server.join()
+        self.assertEqual(len(self.calls), 400)
+        self.assertEqual(self.server.info()['received'], 400)
+
+    # Test a Unix socket with a plain blocking socket client
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'no Unix sockets')
+    async def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'gcode.sock')
+            await self.server.start_unix(path)
+
+            def client():
+                with socket.socket(socket.AF_UNIX) as sock:
+                    sock.settimeout(2)
+                    sock.connect(path)
+                    replies = []
+                    for line in (b'G90\n', b'G0 X5\n', b'M105\n'):
+                        sock.sendall(line)
+                        replies.append(sock.makefile('rb').readline())
+                    return replies
+
+            self.assertEqual(await asyncio.to_thread(client), [b'ok\n'] * 3)
+            await self.server.join()
+            self.assertEqual(self.server.state.position['X'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
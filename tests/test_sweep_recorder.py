@@ -0,0 +1,217 @@
+import os
+import tempfile
+import threading
+import time
+import types
+import unittest
+import numpy as np
+from unittest import mock
+from gpc_hardware.apps import sweep_recorder
+from gpc_hardware.apps.sweep_recorder import SweepRecorder
+
+
+class FakeScope:
+    """The settings and sweep listeners of an Oscilloscope."""
+
+    def __init__(self):
+        self.sweep_rate = 9
+        self.trigger_source = 1
+        self.trigger_type = 0
+        self.trigger_edge = 0
+        self.trigger_level = 0.0
+        self.channel_one_active = True
+        self.channel_two_active = False
+        self.listeners = []
+        self.sweeps = 0
+
+    def add_sweep_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_sweep_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def sweep(self, timestamp=None):
+        # Every sample of a sweep is the sequence, negative for channel two
+        sequence = self.sweeps
+        self.sweeps += 1
+        trace = types.SimpleNamespace(
+            sequence=sequence,
+            timestamp=sequence * 1000 if timestamp is None else timestamp,
+            trace1=np.full(1024, sequence, dtype=np.int16),
+            trace2=np.full(1024, -sequence, dtype=np.int16),
+        )
+        for listener in self.listeners:
+            listener(trace)
+
+
+class TestSweepRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.scope = FakeScope()
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def _record(self, recorder, n, **kwargs):
+        recorder.attach(self.scope)
+        for _ in range(n):
+            self.scope.sweep(**kwargs)
+        recorder.detach()
+        return [(np.load(sweeps), np.load(index)) for sweeps, index in recorder.files]
+
+    # Test the sweeps and settings are written to .npy files
+    def test_record(self):
+        recorder = SweepRecorder(self.directory, grow_sweeps=4)
+        self.scope.sweep()  # Not attached
+        self.scope.sweep_rate = 5
+        ((traces, index),) = self._record(recorder, 10)
+        self.assertEqual(self.scope.listeners, [])
+        self.assertEqual((recorder.written_sweeps, recorder.dropped_sweeps), (10, 0))
+        self.assertEqual(traces.shape, (10, 1024, 2))
+        self.assertEqual(traces.dtype, np.int16)
+        np.testing.assert_array_equal(traces[:, 7, 0], range(1, 11))
+        np.testing.assert_array_equal(traces[:, 7, 1], range(-1, -11, -1))
+        np.testing.assert_array_equal(index['sequence'], range(1, 11))
+        np.testing.assert_array_equal(index['timestamp'], range(1000, 11000, 1000))
+        self.assertTrue(np.all(index['sweep_rate'] == 5))
+        self.assertTrue(np.all(index['channel_one_active']))
+        self.assertFalse(np.any(index['channel_two_active']))
+        # Truncated to the written sweeps
+        self.assertEqual(os.path.getsize(recorder.files[0][0]), 512 + 10 * 4096)
+
+        # A new recording does not overwrite the files
+        recorder.attach(self.scope)
+        self.scope.sweep()
+        recorder.detach()
+        self.assertEqual(len(recorder.files), 2)
+        self.assertEqual(np.load(recorder.files[1][1])['sequence'].tolist(), [11])
+
+    # Test the files are rotated by size and by duration
+    def test_rotation(self):
+        recorder = SweepRecorder(self.directory, prefix='size', max_bytes=512 + 3 * 4096)
+        files = self._record(recorder, 8)
+        self.assertEqual([len(traces) for traces, _ in files], [3, 3, 2])
+        self.assertEqual(os.path.basename(recorder.files[2][0]), 'size_0002.npy')
+        self.assertEqual(os.path.basename(recorder.files[2][1]), 'size_0002.index.npy')
+
+        recorder = SweepRecorder(self.directory, prefix='time', max_seconds=2.5)
+        self.scope.sweeps = 0
+        recorder.attach(self.scope)
+        for second in range(6):
+            self.scope.sweep(timestamp=second * 10**9)
+        recorder.detach()
+        self.assertEqual([np.load(index)['sequence'].tolist()
+                          for _, index in recorder.files], [[0, 1, 2], [3, 4, 5]])
+
+        with self.assertRaises(ValueError):
+            SweepRecorder(self.directory, max_bytes=1024)
+
+    # Test a file never grows beyond max bytes while recording
+    def test_max_bytes_while_recording(self):
+        max_bytes = 512 + 3 * 4096
+        recorder = SweepRecorder(self.directory, max_bytes=max_bytes, grow_sweeps=256)
+        recorder.attach(self.scope)
+        self.scope.sweep()
+        deadline = time.monotonic() + 2
+        while recorder.written_sweeps < 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertEqual(os.path.getsize(recorder.files[0][0]), max_bytes)
+        for _ in range(3):
+            self.scope.sweep()
+        while recorder.written_sweeps < 4 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertEqual([os.path.getsize(sweeps) for sweeps, _ in recorder.files],
+                         [max_bytes, max_bytes])
+        recorder.detach()
+
+    # Test sweeps are dropped instead of waiting for a slow disk
+    def test_slow_disk(self):
+        written = threading.Event()
+        disk = threading.Event()
+        append = sweep_recorder._GrowableNpy.append
+
+        def slow_append(file, row, grow):
+            written.set()
+            disk.wait()
+            append(file, row, grow)
+
+        recorder = SweepRecorder(self.directory, queue_size=2)
+        with mock.patch.object(sweep_recorder._GrowableNpy, 'append', slow_append):
+            recorder.attach(self.scope)
+            self.scope.sweep()
+            self.assertTrue(written.wait(2))
+            start = time.monotonic()
+            for _ in range(9):
+                self.scope.sweep()
+            self.assertLess(time.monotonic() - start, 0.5)
+            self.assertEqual((recorder.queue_depth, recorder.dropped_sweeps), (2, 7))
+            disk.set()
+            recorder.detach()
+        self.assertEqual(recorder.written_sweeps, 3)
+        self.assertEqual(recorder.max_queue_depth, 2)
+        index = np.load(recorder.files[0][1])
+        np.testing.assert_array_equal(index['sequence'], [0, 1, 2])
+
+    # Test the files are readable while recording
+    def test_flush(self):
+        recorder = SweepRecorder(self.directory, flush_seconds=0.01)
+        recorder.attach(self.scope)
+        for _ in range(5):
+            self.scope.sweep()
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            if recorder.files and len(np.load(recorder.files[0][1])) == 5:
+                break
+            time.sleep(0.01)
+        traces = np.load(recorder.files[0][0], mmap_mode='r')
+        self.assertEqual(traces.shape, (5, 1024, 2))
+        self.assertEqual(int(traces[4, 0, 0]), 4)
+        del traces
+        recorder.detach()
+
+    # Test a failing disk is reported and the sweeps after it are dropped
+    def test_disk_error(self):
+        recorder = SweepRecorder(self.directory)
+        with mock.patch.object(sweep_recorder._GrowableNpy, 'append',
+                               side_effect=OSError('No space left on device')):
+            recorder.attach(self.scope)
+            self.scope.sweep()
+            deadline = time.monotonic() + 2
+            while recorder._error is None and time.monotonic() < deadline:
+                time.sleep(0.001)
+            self.scope.sweep()
+            with self.assertRaises(OSError):
+                recorder.detach()
+        self.assertEqual((recorder.written_sweeps, recorder.dropped_sweeps), (0, 1))
+        self.assertFalse(recorder.recording)
+
+    # Test any error of the writer is reported and the blocked sweeps dropped
+    def test_writer_error(self):
+        written = threading.Event()
+
+        def failing_append(file, row, grow):
+            written.wait(2)
+            raise ValueError('could not broadcast input array')
+
+        recorder = SweepRecorder(self.directory, queue_size=1, block=True)
+        with mock.patch.object(sweep_recorder._GrowableNpy, 'append', failing_append):
+            recorder.attach(self.scope)
+            self.scope.sweep()
+            self.scope.sweep()  # Waits in the queue while the writer fails
+            written.set()
+            deadline = time.monotonic() + 2
+            while recorder.dropped_sweeps < 1 and time.monotonic() < deadline:
+                time.sleep(0.001)
+            self.scope.sweep()
+            with self.assertRaises(ValueError):
+                recorder.detach()
+        self.assertEqual((recorder.written_sweeps, recorder.dropped_sweeps), (0, 2))
+        self.assertEqual((recorder._dropped_sweeps, recorder._writer_dropped_sweeps),
+                         (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+from gpc_hardware.apps.waveform_measurements import measure_waveforms
+
+
+def square_wave(period, duty_cycle, rise, low=1000, high=3000, n=1024, phase=3.0):
+    """A trapezoid wave with linear edges of rise samples from low to high."""
+    t = (np.arange(n) + phase) % period
+    up = np.clip(t / rise, 0, 1)
+    down = np.clip((t - duty_cycle * period) / rise, 0, 1)
+    return np.round(low + (high - low) * (up - down)).astype(np.int16)
+
+
+class TestWaveformMeasurements(unittest.TestCase):
+
+    # Test the levels of a sine wave
+    def test_sine(self):
+        t = np.arange(1024)
+        samples = 2000 + 1000 * np.sin(2 * np.pi * t / 102.4)  # 10 periods
+        result = measure_waveforms(samples, 1e-5, 12 / 4095)
+        self.assertAlmostEqual(result.maximum, 3000 * 12 / 4095, delta=0.01)
+        self.assertAlmostEqual(result.vpp, 2000 * 12 / 4095, delta=0.01)
+        self.assertAlmostEqual(result.mean, 2000 * 12 / 4095, delta=0.01)
+        self.assertAlmostEqual(result.rms, np.sqrt(2000**2 + 1000**2 / 2) * 12 / 4095,
+                               delta=0.01)
+        self.assertAlmostEqual(result.frequency, 1e5 / 102.4, delta=1)
+        self.assertAlmostEqual(result.duty_cycle, 0.5, delta=0.01)
+        # 10% to 90% of a sine is 2 * arcsin(0.8) / (2 pi) of the period
+        self.assertAlmostEqual(result.rise_time, np.arcsin(0.8) / np.pi * 1.024e-3,
+                               delta=1e-6)
+
+    # Test the timing of a square wave with edges between samples
+    def test_square(self):
+        samples = square_wave(period=37.5, duty_cycle=0.3, rise=5)
+        result = measure_waveforms(samples, 1e-6)
+        self.assertAlmostEqual(result.period, 37.5e-6, delta=0.05e-6)
+        self.assertAlmostEqual(result.frequency, 1e6 / 37.5, delta=50)
+        self.assertAlmostEqual(result.duty_cycle, 0.3, delta=0.02)
+        self.assertAlmostEqual(result.rise_time, 0.8 * 5e-6, delta=0.1e-6)
+        self.assertEqual((result.minimum, result.maximum), (1000, 3000))
+
+        # Noise within the hysteresis does not add edges
+        noisy = samples + np.random.default_rng(1).integers(-300, 300, len(samples))
+        self.assertAlmostEqual(measure_waveforms(noisy, 1e-6).period, 37.5e-6,
+                               delta=0.5e-6)
+
+    # Test traces without edges
+    def test_no_edges(self):
+        result = measure_waveforms(np.array([[5] * 100, list(range(100))]), 1e-6)
+        self.assertEqual(result.vpp.tolist(), [0, 99])
+        self.assertTrue(np.all(np.isnan(result.frequency)))
+        self.assertTrue(np.all(np.isnan(result.duty_cycle)))
+        self.assertTrue(np.isnan(result.rise_time[0]))
+        # One rising edge has a rise time, but no period
+        self.assertAlmostEqual(result.rise_time[1], 0.8 * 99e-6)
+        with self.assertRaises(ValueError):
+            measure_waveforms(np.array([1]), 1e-6)
+
+    # Test a batch is measured like every trace on its own
+    def test_batch(self):
+        batch = np.array([
+            [square_wave(20 + sweep, 0.5, 3), square_wave(50, 0.1 * (sweep + 1), 2)]
+            for sweep in range(5)
+        ])
+        result = measure_waveforms(batch, 2e-6, 12 / 4095)
+        self.assertEqual(result.period.shape, (5, 2))
+        for sweep in range(5):
+            for channel in range(2):
+                single = measure_waveforms(batch[sweep, channel], 2e-6, 12 / 4095)
+                for field, value in single._asdict().items():
+                    self.assertAlmostEqual(
+                        getattr(result, field)[sweep, channel], value, msg=field
+                    )
+        np.testing.assert_allclose(result.period[:, 0], np.arange(20, 25) * 2e-6,
+                                   rtol=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()